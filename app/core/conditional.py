@@ -0,0 +1,80 @@
+# app/core/conditional.py
+"""
+GET condicional (RFC 9110): ETag / Last-Modified + 304 Not Modified.
+
+Las rutas que el front consulta en loop (/tanks, /pumps, /alarms,
+/tanks/{id}/latest, configs) piden primero un token barato (repos/versions)
+y, si el cliente ya tiene esa versión (If-None-Match / If-Modified-Since),
+devuelven 304 sin correr la consulta ni serializar nada. Si no, la respuesta
+normal sale con ETag, Last-Modified y Cache-Control: no-cache (el navegador
+guarda el cuerpo y revalida cada vez: fetch() recibe el 200 cacheado).
+
+Uso en una ruta:
+
+    tok = versions.counters(["tanks"])
+    if (nm := conditional(request, response, tok)) is not None:
+        return nm
+    return repo.list_tanks()
+"""
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from app.core import metrics
+
+ENABLED = os.getenv("CONDITIONAL_GET", "1").lower() in ("1", "true", "yes", "on")
+
+
+def _etag(token: str) -> str:
+    return f'W/"{token}"'
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def validators(token: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    h = {"ETag": _etag(token), "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        h["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return h
+
+
+def is_fresh(request: Request, token: str, last_modified: Optional[datetime]) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:  # If-None-Match manda sobre If-Modified-Since
+        mine = _strip_weak(_etag(token))
+        return any(t.strip() == "*" or _strip_weak(t) == mine for t in inm.split(","))
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def conditional(
+    request: Request, response: Response, token: Optional[Tuple[str, Optional[datetime]]]
+) -> Optional[Response]:
+    """
+    304 listo para devolver si el cliente está al día; si no, setea los
+    validadores en `response` (la Response que inyecta FastAPI) y devuelve None.
+    """
+    if not ENABLED or token is None:
+        return None
+    tag, last_modified = token
+    headers = validators(tag, last_modified)
+    if is_fresh(request, tag, last_modified):
+        metrics.inc("http_not_modified_total", path=request.scope.get("route").path
+                    if request.scope.get("route") else request.url.path)
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
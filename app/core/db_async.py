@@ -0,0 +1,189 @@
+# app/core/db_async.py
+"""
+Pools asíncronos para las rutas calientes (ingest, latest, history, alarms),
+declaradas con `async def`: una query en vuelo no ocupa un thread del
+threadpool de Starlette (~40), solo una conexión del pool.
+
+- Mismo DSN y mismo split write/read que app.core.db (réplica incluida, con
+  el mismo ruteo de core/read_routing); timeouts, max_idle y max_lifetime
+  también se comparten (DB_POOL_*).
+- Los pools se crean cerrados y se abren en el startup de la app: necesitan
+  un event loop corriendo.
+- En Windows psycopg async requiere SelectorEventLoop (no Proactor).
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import psycopg
+
+from app.core import metrics, read_routing
+from app.core.profiler import AsyncProfiledCursor
+from app.core.db import (
+    CONNECT_TIMEOUT,
+    DSN,
+    POOL_MAX_IDLE,
+    POOL_MAX_LIFETIME,
+    POOL_MAX_WAITING,
+    READ_DSN,
+    READ_POOL_TIMEOUT,
+    REPLICA_ENABLED,
+    default_pool_max,
+)
+
+ASYNC_POOL_TIMEOUT = float(os.getenv("ASYNC_DB_POOL_TIMEOUT", "10"))
+# Máximos por default: presupuesto de conexiones por worker (ver app/core/db.py)
+ASYNC_POOL_SIZES = {
+    "write": (int(os.getenv("ASYNC_DB_POOL_MIN", "1")),
+              int(os.getenv("ASYNC_DB_POOL_MAX") or default_pool_max("async_write"))),
+    "read": (int(os.getenv("ASYNC_DB_READ_POOL_MIN", "1")),
+             int(os.getenv("ASYNC_DB_READ_POOL_MAX") or default_pool_max("async_read"))),
+}
+
+
+def _make_apool(name: str, conninfo: str, timeout: float = ASYNC_POOL_TIMEOUT):
+    from psycopg_pool import AsyncConnectionPool  # type: ignore
+    min_size, max_size = ASYNC_POOL_SIZES[name]
+    return AsyncConnectionPool(
+        conninfo=conninfo,
+        name=f"async_{name}",
+        min_size=min_size,
+        max_size=max_size,
+        max_idle=POOL_MAX_IDLE,
+        max_lifetime=POOL_MAX_LIFETIME,
+        max_waiting=POOL_MAX_WAITING,
+        timeout=timeout,
+        kwargs={"connect_timeout": CONNECT_TIMEOUT, "cursor_factory": AsyncProfiledCursor},
+        open=False,
+    )
+
+
+try:
+    apool: Optional[Any] = _make_apool("write", DSN)
+    aread_pool: Optional[Any] = _make_apool(
+        "read", READ_DSN, READ_POOL_TIMEOUT if REPLICA_ENABLED else ASYNC_POOL_TIMEOUT
+    )
+except Exception as e:
+    print(f"[DB] AsyncConnectionPool no disponible: {e}")
+    apool = None
+    aread_pool = None
+
+_opened = False
+
+
+async def open_async_pool() -> None:
+    """Abrir en el startup. No espera conexiones (wait=False): si la DB no está, la app arranca igual."""
+    global _opened
+    if apool is not None and not _opened:
+        await apool.open(wait=False)
+        await aread_pool.open(wait=False)
+        _opened = True
+
+
+async def close_async_pool() -> None:
+    global _opened
+    if apool is not None and _opened:
+        await apool.close()
+        await aread_pool.close()
+        _opened = False
+
+
+@asynccontextmanager
+async def _apooled(p, name: str) -> AsyncIterator[psycopg.AsyncConnection]:
+    from psycopg_pool import PoolTimeout, TooManyRequests  # type: ignore
+    t0 = time.perf_counter()
+    acquired = False
+    try:
+        async with p.connection() as conn:
+            acquired = True
+            metrics.observe("db_pool_wait_seconds", time.perf_counter() - t0, pool=name)
+            yield conn
+    except (PoolTimeout, TooManyRequests):
+        if not acquired:
+            metrics.inc("db_pool_timeouts_total", pool=name)
+        raise
+
+
+@asynccontextmanager
+async def get_aconn() -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Equivalente async de get_conn() (pool de escritura). Sin pool (o antes del
+    startup, p.ej. en scripts) abre una conexión suelta.
+    """
+    if apool is not None and _opened:
+        async with _apooled(apool, "async_write") as conn:
+            yield conn
+    else:
+        async with await psycopg.AsyncConnection.connect(
+            DSN, connect_timeout=CONNECT_TIMEOUT, cursor_factory=AsyncProfiledCursor
+        ) as conn:
+            yield conn
+
+
+async def _replica_fresh(conn) -> bool:
+    if read_routing.lag_check_due():
+        try:
+            cur = await conn.execute(read_routing.LAG_SQL)
+            read_routing.record_lag(float((await cur.fetchone())[0]))
+        except Exception:
+            read_routing.record_lag(None)
+            try:
+                await conn.rollback()
+            except Exception:
+                pass  # conexión rota (réplica caída): el pool la descarta
+    return read_routing.replica_ok()
+
+
+@asynccontextmanager
+async def get_read_aconn() -> AsyncIterator[psycopg.AsyncConnection]:
+    """Equivalente async de get_read_conn() (pool de lectura / réplica con fallback)."""
+    if aread_pool is None or not _opened:
+        async with await psycopg.AsyncConnection.connect(
+            READ_DSN, connect_timeout=CONNECT_TIMEOUT, cursor_factory=AsyncProfiledCursor
+        ) as conn:
+            yield conn
+        return
+    if not REPLICA_ENABLED:
+        async with _apooled(aread_pool, "async_read") as conn:
+            yield conn
+        return
+
+    from psycopg_pool import PoolTimeout, TooManyRequests  # type: ignore
+    reason = read_routing.skip_replica_reason()
+    if reason is None:
+        async with AsyncExitStack() as stack:
+            try:
+                conn = await stack.enter_async_context(_apooled(aread_pool, "async_read"))
+            except (PoolTimeout, TooManyRequests, psycopg.OperationalError):
+                read_routing.record_lag(None)
+                conn = None
+            if conn is not None and await _replica_fresh(conn):
+                yield conn
+                return
+        reason = "lag" if read_routing.replica_lag() is not None else "replica_down"
+
+    read_routing.count_fallback(reason)
+    async with get_aconn() as conn:
+        yield conn
+
+
+def async_pool_stats() -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for name, p in (("async_write", apool), ("async_read", aread_pool)):
+        if p is None:
+            out[name] = {"enabled": False}
+            continue
+        out[name] = {
+            "enabled": True,
+            "open": _opened,
+            "min_size": p.min_size,
+            "max_size": p.max_size,
+            "timeout": p.timeout,
+            "max_lifetime": p.max_lifetime,
+            "replica": name == "async_read" and REPLICA_ENABLED,
+            **p.get_stats(),
+        }
+    return out
@@ -0,0 +1,118 @@
+# app/core/idempotency.py
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Claves absurdamente largas no aportan nada y ensucian el índice
+MAX_KEY_LEN = 200
+MAX_BOOT_ID_LEN = 64
+
+
+def dedupe_key_for(
+    idempotency_key: Optional[str],
+    device_id: Optional[Any],
+    seq: Optional[int],
+    *,
+    boot_id: Optional[str] = None,
+    ts: Optional[datetime] = None,
+    client: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Clave de deduplicación para una lectura:
+      - Header Idempotency-Key (si vino) → 'idem:<device_id>:<key>': la misma
+        clave en dos devices son dos lecturas distintas. Sin device, con el
+        cliente (client_scope: API key o IP) → 'idem:@<client>:<key>'; sin
+        ninguno de los dos, sin dedupe (dos clientes anónimos con un contador
+        como clave se descartarían las lecturas entre sí)
+      - si no, seq del payload → 'seq:<device_id>:<boot_id>:<seq>' o, sin
+        boot_id, 'seq:<device_id>:<ts>:<seq>' (ts en epoch ms)
+      - sin ninguna de las dos → None (ingest sin dedupe, como siempre)
+
+    seq solo no alcanza: un ESP32 lo reinicia al rebootear y las lecturas
+    nuevas chocarían con las de antes durante toda la ventana del ledger. Sin
+    boot_id ni ts, seq no deduplica.
+    """
+    dev = "" if device_id is None else str(device_id)
+    key = (idempotency_key or "").strip()
+    if key:
+        if dev:
+            return f"idem:{dev}:{key[:MAX_KEY_LEN]}"
+        return f"idem:@{client}:{key[:MAX_KEY_LEN]}" if client else None
+    if seq is None or not dev:
+        return None
+    boot = (boot_id or "").strip()[:MAX_BOOT_ID_LEN]
+    if boot:
+        return f"seq:{dev}:{boot}:{int(seq)}"
+    if ts is not None:
+        return f"seq:{dev}:{int(ts.timestamp() * 1000)}:{int(seq)}"
+    return None
+
+
+def client_scope(auth: Optional[Dict[str, Any]], client_host: Optional[str]) -> Optional[str]:
+    """
+    Quién manda una lectura sin device_id, para dedupe_key_for: la API key
+    (hash corto: no se guarda en claro en el ledger) o, sin key, la IP.
+    """
+    api_key = (auth or {}).get("api_key")
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    return f"ip:{client_host}" if client_host else None
+
+
+_RESERVE_SQL = """
+    INSERT INTO public.ingest_dedupe (scope, dedupe_key, reading_id)
+    VALUES (%s, %s, nextval(pg_get_serial_sequence(%s, 'id')))
+    ON CONFLICT DO NOTHING
+    RETURNING reading_id;
+"""
+
+
+def _reading_id(row) -> Optional[int]:
+    if not row:
+        return None
+    return row["reading_id"] if isinstance(row, dict) else row[0]
+
+
+def reserve_key(cur, scope: str, dedupe_key: str, table: str) -> Optional[int]:
+    """
+    Reserva (scope, dedupe_key) en ingest_dedupe tomando el próximo id de la tabla
+    de lecturas `table`. Devuelve ese id (para usarlo en el INSERT de la lectura,
+    dentro de la MISMA transacción) o None si la clave ya estaba: reintento duplicado.
+    """
+    cur.execute(_RESERVE_SQL, (scope, dedupe_key, table))
+    return _reading_id(cur.fetchone())
+
+
+async def areserve_key(cur, scope: str, dedupe_key: str, table: str) -> Optional[int]:
+    """reserve_key para cursores async (app.core.db_async)."""
+    await cur.execute(_RESERVE_SQL, (scope, dedupe_key, table))
+    return _reading_id(await cur.fetchone())
+
+
+def reserve_keys(cur, scope: str, dedupe_keys: List[str], table: str) -> Dict[str, int]:
+    """
+    Versión batch de reserve_key: un solo statement para todas las claves.
+    Devuelve {clave: reading_id} SOLO para las claves nuevas; las que faltan en
+    el resultado son duplicados (incluso repetidas dentro del mismo batch).
+    """
+    if not dedupe_keys:
+        return {}
+    cur.execute(
+        """
+        INSERT INTO public.ingest_dedupe (scope, dedupe_key, reading_id)
+        SELECT %s, k, nextval(pg_get_serial_sequence(%s, 'id'))
+          FROM unnest(%s::text[]) AS k
+        ON CONFLICT DO NOTHING
+        RETURNING dedupe_key, reading_id;
+        """,
+        (scope, table, list(dedupe_keys)),
+    )
+    out: Dict[str, int] = {}
+    for row in cur.fetchall():
+        if isinstance(row, dict):
+            out[row["dedupe_key"]] = row["reading_id"]
+        else:
+            out[row[0]] = row[1]
+    return out
@@ -0,0 +1,68 @@
+# app/core/jsonresp.py
+"""
+Respuestas JSON rápidas (orjson).
+
+FastJSONResponse es la default_response_class de la app. Para listas grandes
+que salen de los repos (history, audit, alarms) las rutas devuelven
+FastJSONResponse(rows) directo: FastAPI no pasa el contenido por
+jsonable_encoder (que recorre y copia cada dict/celda en Python) y orjson
+serializa datetime/UUID/date nativo, en C.
+
+Formato igual al de antes: datetime → ISO 8601 con offset ("+00:00"),
+Decimal → float. Sin orjson instalado cae a json stdlib con el mismo default.
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+from app.core import profiler
+
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json stdlib
+    orjson = None
+
+# Nivel de GZipMiddleware (starlette usa 9 por default: caro en CPU y casi no
+# achica más que 5 para JSON) y tamaño mínimo para comprimir.
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime, date, time)):  # solo en el fallback stdlib
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode("utf-8", "replace")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson is not None:
+    _OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False,
+                          allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with profiler.phase("serialize"):  # Server-Timing (core/profiler)
+            return dumps(content)
@@ -0,0 +1,30 @@
+# app/core/logs.py
+"""
+Configuración de logging del proceso, en un solo lugar.
+
+Los servicios (alarms_eval, alarm_poller, alarm_listener, alarm_events,
+notify_alarm) solo piden su logger; el basicConfig lo hace main.py una vez al
+arrancar (o el CLI que lo necesite). Así el formato no depende de qué módulo
+se importó primero.
+
+LOG_LEVEL (default INFO), LOG_FORMAT (default: key=value como siempre).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+DEFAULT_FORMAT = "ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s"
+
+_configured = False
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """Idempotente: la segunda llamada no hace nada."""
+    global _configured
+    if _configured:
+        return
+    lvl = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(level=getattr(logging, lvl, logging.INFO), format=os.getenv("LOG_FORMAT", DEFAULT_FORMAT))
+    _configured = True
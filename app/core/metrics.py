@@ -0,0 +1,261 @@
+# app/core/metrics.py
+"""
+Contadores e histogramas en memoria (por proceso) para observar el hot-path sin
+depender de librerías externas. Thread-safe: los usan tanto los handlers
+(threadpool) como los hilos de fondo.
+
+Exposición:
+  - /__metrics           snapshot JSON (diagnóstico)
+  - /metrics             formato de texto de Prometheus (render_prometheus)
+
+Costo por evento: un lock + un dict lookup (+ bisect en histogramas), pocos µs;
+pensado para quedar prendido en producción.
+"""
+from __future__ import annotations
+
+import bisect
+import functools
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+# Buckets en segundos (límite superior inclusivo, como Prometheus)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)  # último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        cum, buckets = 0, []
+        for le, c in zip(list(self.bounds) + ["+Inf"], self.counts):
+            cum += c
+            buckets.append({"le": le, "count": cum})
+        return {"buckets": buckets, "sum": round(self.sum, 6), "count": self.count}
+
+
+_histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], _Histogram] = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name: str, value: float = 1.0, **labels: Any) -> None:
+    """Incrementa el contador `name` con las etiquetas dadas."""
+    k = _key(name, labels)
+    with _lock:
+        _counters[k] = _counters.get(k, 0.0) + value
+
+
+def get(name: str, **labels: Any) -> float:
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def snapshot() -> Dict[str, list]:
+    """
+    {nombre: [{"labels": {...}, "value": n}, ...]} — formato pensado para un
+    endpoint de diagnóstico en JSON.
+    """
+    out: Dict[str, list] = {}
+    with _lock:
+        items = list(_counters.items())
+    for (name, labels), value in sorted(items):
+        out.setdefault(name, []).append({"labels": dict(labels), "value": value})
+    return out
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: Any) -> None:
+    """Registra `value` (segundos, por convención) en el histograma `name`."""
+    k = _key(name, labels)
+    with _lock:
+        h = _histograms.get(k)
+        if h is None:
+            h = _histograms[k] = _Histogram(buckets)
+        h.observe(value)
+
+
+def histograms(prefix: str = "") -> Dict[str, list]:
+    """{nombre: [{"labels": {...}, "buckets": [...], "sum": s, "count": n}, ...]}"""
+    out: Dict[str, list] = {}
+    with _lock:
+        items = [(k, h.as_dict()) for k, h in _histograms.items() if k[0].startswith(prefix)]
+    for (name, labels), h in sorted(items, key=lambda x: x[0]):
+        out.setdefault(name, []).append({"labels": dict(labels), **h})
+    return out
+
+
+# -----------------------------
+# Gauges: se calculan al momento de exponer (pools, cola de ingest...)
+# -----------------------------
+GaugeSample = Tuple[str, Dict[str, Any], float]
+_collectors: List[Callable[[], Iterable[GaugeSample]]] = []
+
+
+def register_collector(fn: Callable[[], Iterable[GaugeSample]]) -> None:
+    """`fn()` devuelve [(nombre, labels, valor), ...]; se llama en cada scrape."""
+    _collectors.append(fn)
+
+
+# -----------------------------
+# Tiempo por función de repositorio
+# -----------------------------
+def db_timed(fn: Callable) -> Callable:
+    """
+    Decorador para funciones de app/repos: histograma db_query_seconds y
+    contador db_query_errors_total con fn="<módulo>.<función>". Sirve para
+    funciones sync y async.
+    """
+    label = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+    k = _key("db_query_seconds", {"fn": label})
+    ek = _key("db_query_errors_total", {"fn": label})
+
+    def _done(t0: float, failed: bool) -> None:
+        dt = time.perf_counter() - t0
+        with _lock:
+            h = _histograms.get(k)
+            if h is None:
+                h = _histograms[k] = _Histogram(DEFAULT_BUCKETS)
+            h.observe(dt)
+            if failed:
+                _counters[ek] = _counters.get(ek, 0.0) + 1
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def awrapper(*args, **kwargs):
+            t0, failed = time.perf_counter(), True
+            try:
+                out = await fn(*args, **kwargs)
+                failed = False
+                return out
+            finally:
+                _done(t0, failed)
+        return awrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0, failed = time.perf_counter(), True
+        try:
+            out = fn(*args, **kwargs)
+            failed = False
+            return out
+        finally:
+            _done(t0, failed)
+    return wrapper
+
+
+# -----------------------------
+# Latencia HTTP por ruta (middleware ASGI puro, sin BaseHTTPMiddleware)
+# -----------------------------
+class HTTPMetricsMiddleware:
+    """
+    http_request_duration_seconds{method, route, status}: `route` es el
+    template de FastAPI ("/tanks/{tank_id}/latest"), no el path real, para no
+    abrir una serie por id. Lo que no matchea ninguna ruta va como "other".
+    Mide hasta el último chunk del body (incluye serialización y gzip).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            observe(
+                "http_request_duration_seconds", time.perf_counter() - t0,
+                method=scope["method"], route=getattr(route, "path", "other"), status=status[0],
+            )
+
+
+# -----------------------------
+# Formato de texto de Prometheus (v0.0.4)
+# -----------------------------
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _esc(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Iterable[Tuple[str, str]]) -> str:
+    body = ",".join(f'{k}="{_esc(v)}"' for k, v in labels)
+    return "{" + body + "}" if body else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+def render_prometheus() -> str:
+    """Contadores, histogramas y gauges de los collectors, agrupados por nombre."""
+    with _lock:
+        counters = sorted(_counters.items())
+        hists = sorted(
+            ((k, h.bounds, list(h.counts), h.sum, h.count) for k, h in _histograms.items()),
+            key=lambda x: x[0],
+        )
+    lines: List[str] = []
+    last = None
+    for (name, labels), value in counters:
+        if name != last:
+            lines.append(f"# TYPE {name} counter")
+            last = name
+        lines.append(f"{name}{_labels(labels)} {_num(value)}")
+
+    for (name, labels), bounds, counts, total, n in hists:
+        if name != last:
+            lines.append(f"# TYPE {name} histogram")
+            last = name
+        cum = 0
+        for le, c in zip(list(bounds) + [float("inf")], counts):
+            cum += c
+            lines.append(f"{name}_bucket{_labels(labels + (('le', _num(le)),))} {cum}")
+        lines.append(f"{name}_sum{_labels(labels)} {_num(total)}")
+        lines.append(f"{name}_count{_labels(labels)} {n}")
+
+    gauges: Dict[str, List[str]] = {}
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception:
+            continue  # un collector roto no tira el scrape entero
+        for name, labels, value in samples:
+            lab = tuple(sorted((k, str(v)) for k, v in labels.items()))
+            gauges.setdefault(name, []).append(f"{name}{_labels(lab)} {_num(value)}")
+    for name in sorted(gauges):
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(gauges[name])
+    return "\n".join(lines) + "\n"
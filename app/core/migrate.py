@@ -0,0 +1,385 @@
+# app/core/migrate.py
+"""
+Runner de migraciones versionadas (app/migrations/NNNN_nombre.{sql,py}).
+
+  - schema_migrations guarda versión, nombre, checksum y duración de cada
+    migración aplicada; las pendientes se aplican en orden.
+  - .sql: el archivo entero en UNA transacción junto con su registro en
+    schema_migrations (falla → no queda nada a medias).
+  - .py: define up(m) y recibe un Migrator en autocommit. Ahí va lo que no
+    puede ir en una transacción o no conviene: CREATE INDEX CONCURRENTLY
+    (en tablas particionadas: por partición y después ATTACH), backfills por
+    lotes con commit por lote, conversiones de tabla online.
+  - Un advisory lock de sesión serializa el runner entre workers/réplicas
+    de la API: el primero migra, el resto espera y encuentra todo aplicado.
+  - Todo el DDL corre con lock_timeout (MIGRATE_LOCK_TIMEOUT_MS) y se
+    reintenta si no consigue el lock: un ALTER nunca queda encolado detrás de
+    una consulta larga bloqueando al resto del tráfico.
+
+Las migraciones son idempotentes (IF NOT EXISTS, chequeos de catálogo): en
+una DB que ya tenía el esquema aplicado a mano correrlas no cambia nada, y
+`baseline` permite marcarlas como aplicadas sin ejecutarlas.
+
+Uso:
+    python -m app.core.migrate status
+    python -m app.core.migrate up [--to N] [--dry-run]
+    python -m app.core.migrate baseline N
+
+En producción `up` es un paso del release, antes de levantar la API
+(servicio `migrate` de docker-compose). MIGRATE_ON_STARTUP=1 hace que la API
+lo corra al arrancar (dev); si falla, la API no arranca.
+
+Una migración aplicada cuyo archivo cambió (checksum distinto) frena `up`
+con MigrationError antes de aplicar nada: lo aplicado ya no es lo que dice
+el repo. `up --allow-changed` lo deja pasar con un warning, después de
+revisar el cambio a mano.
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import psycopg
+from psycopg import errors, sql
+from psycopg.pq import TransactionStatus
+
+from app.core.db import DSN
+
+log = logging.getLogger("migrate")
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0").lower() in ("1", "true", "yes", "on")
+LOCK_TIMEOUT_MS = int(os.getenv("MIGRATE_LOCK_TIMEOUT_MS", "5000"))
+LOCK_RETRIES = int(os.getenv("MIGRATE_LOCK_RETRIES", "10"))
+BATCH_ROWS = int(os.getenv("MIGRATE_BATCH_ROWS", "10000"))
+BATCH_PAUSE_SEC = float(os.getenv("MIGRATE_BATCH_PAUSE_SEC", "0.05"))
+
+_ADVISORY_KEY = 0x6D696772  # 'migr'
+
+
+class MigrationError(RuntimeError):
+    """El esquema no se puede llevar a la versión del repo sin intervención."""
+_FILE_RE = re.compile(r"^(\d{4})_([a-z0-9_]+)\.(sql|py)$")
+
+_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS public.schema_migrations(
+      version int PRIMARY KEY,
+      name text NOT NULL,
+      checksum text NOT NULL,
+      applied_at timestamptz NOT NULL DEFAULT now(),
+      duration_ms int
+    );
+"""
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def kind(self) -> str:
+        return self.path.suffix[1:]
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()[:16]
+
+
+def discover(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    out: List[Migration] = []
+    for p in sorted(directory.iterdir()):
+        m = _FILE_RE.match(p.name)
+        if m:
+            out.append(Migration(int(m.group(1)), m.group(2), p))
+    versions = [m.version for m in out]
+    dup = {v for v in versions if versions.count(v) > 1}
+    if dup:
+        raise RuntimeError(f"versiones de migración duplicadas: {sorted(dup)}")
+    return out
+
+
+# ---------------------------------------------------------------------------
+# API para migraciones .py
+# ---------------------------------------------------------------------------
+class Migrator:
+    """Conexión en autocommit + helpers para DDL online."""
+
+    def __init__(self, conn: psycopg.Connection):
+        self.conn = conn
+
+    # --- básicos -----------------------------------------------------------
+    def execute(self, query, params: Optional[Sequence[Any]] = None) -> Any:
+        """
+        Un statement con lock_timeout; fuera de una transacción reintenta si
+        no consigue el lock (adentro la transacción ya quedó abortada: ver
+        atomic()).
+        """
+        if self.conn.info.transaction_status != TransactionStatus.IDLE:
+            return self.conn.execute(query, params)
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                return self.conn.execute(query, params)
+            except errors.LockNotAvailable:
+                if attempt == LOCK_RETRIES:
+                    raise
+                log.warning("lock timeout (intento %s/%s), reintentando", attempt, LOCK_RETRIES)
+                time.sleep(min(0.5 * attempt, 5))
+
+    def atomic(self, fn: Callable[["Migrator"], Any]) -> Any:
+        """Corre fn(self) en una transacción; si algún lock no llega, la reintenta entera."""
+        for attempt in range(1, LOCK_RETRIES + 1):
+            try:
+                with self.conn.transaction():
+                    return fn(self)
+            except errors.LockNotAvailable:
+                if attempt == LOCK_RETRIES:
+                    raise
+                log.warning("lock timeout en transacción (intento %s/%s), reintentando", attempt, LOCK_RETRIES)
+                time.sleep(min(0.5 * attempt, 5))
+
+    def scalar(self, query, params: Optional[Sequence[Any]] = None) -> Any:
+        row = self.execute(query, params).fetchone()
+        return row[0] if row else None
+
+    def is_partitioned(self, table: str) -> bool:
+        return self.scalar("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)",
+                           (f"public.{table}",)) is True
+
+    def partitions(self, table: str) -> List[str]:
+        cur = self.execute("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname
+        """, (f"public.{table}",))
+        return [r[0] for r in cur.fetchall()]
+
+    # --- índices -----------------------------------------------------------
+    def _index_state(self, name: str) -> Optional[bool]:
+        """None = no existe; True/False = indisvalid."""
+        return self.scalar("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                           (f"public.{name}",))
+
+    def create_index(self, name: str, table: str, definition: str, *, unique: bool = False) -> None:
+        """
+        CREATE INDEX sin bloquear escrituras. `definition` es lo que va después
+        de `ON tabla`: "(a, b desc) include (c) where x", "using brin (ts)"...
+
+        En una tabla particionada CONCURRENTLY no existe: se crea el índice
+        del padre con ON ONLY (inválido, sin construir), cada partición con
+        CONCURRENTLY y se adjuntan con ATTACH PARTITION; el padre queda válido
+        cuando están todas. Las particiones nuevas lo heredan solas.
+        """
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        if not self.is_partitioned(table):
+            if self._index_state(name) is False:
+                # resto de un CONCURRENTLY que falló: inválido, no sirve
+                self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+            self.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON public.{table} {definition}")
+            return
+
+        if self._index_state(name) is True:
+            return
+        self.execute(f"CREATE {kind} IF NOT EXISTS {name} ON ONLY public.{table} {definition}")
+        for part in self.partitions(table):
+            child = f"{name}_{part[len(table) + 1:]}"[:63] if part.startswith(table + "_") else f"{part}_{name}"[:63]
+            attached = self.scalar("""
+                SELECT 1 FROM pg_inherits i JOIN pg_index x ON x.indexrelid = i.inhrelid
+                 WHERE i.inhparent = to_regclass(%s) AND x.indrelid = to_regclass(%s)
+            """, (f"public.{name}", f"public.{part}"))
+            if attached:
+                continue
+            if self._index_state(child) is False:
+                self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{child}")
+            self.execute(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {child} ON public.{part} {definition}")
+            self.execute(f"ALTER INDEX public.{name} ATTACH PARTITION public.{child}")
+            log.info("index %s: partición %s lista", name, part)
+
+    def drop_index(self, name: str) -> None:
+        if self.scalar("SELECT c.relkind = 'I' FROM pg_class c WHERE c.oid = to_regclass(%s)",
+                       (f"public.{name}",)):
+            # índice particionado: no admite CONCURRENTLY (lock corto en el padre)
+            self.execute(f"DROP INDEX IF EXISTS public.{name}")
+        else:
+            self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}")
+
+    # --- datos -------------------------------------------------------------
+    def backfill(self, table: str, set_sql: str, where_sql: str, *,
+                 key: str = "id", batch: int = BATCH_ROWS) -> int:
+        """
+        UPDATE por lotes de `batch` filas (por rango de `key`), un commit por
+        lote: locks de fila cortos y WAL repartido. `where_sql` tiene que
+        dejar de matchear las filas ya actualizadas (p. ej. "x IS NULL"), así
+        es re-ejecutable si se corta a mitad.
+        """
+        lo, hi = self.execute(sql.SQL("SELECT min({k}), max({k}) FROM public.{t}").format(
+            k=sql.Identifier(key), t=sql.Identifier(table))).fetchone()
+        if lo is None:
+            return 0
+        total = 0
+        q = sql.SQL("UPDATE public.{t} SET {s} WHERE {k} >= %s AND {k} < %s AND ({w})").format(
+            t=sql.Identifier(table), s=sql.SQL(set_sql), k=sql.Identifier(key), w=sql.SQL(where_sql))
+        start = lo
+        while start <= hi:
+            total += self.execute(q, (start, start + batch)).rowcount
+            start += batch
+            if BATCH_PAUSE_SEC:
+                time.sleep(BATCH_PAUSE_SEC)
+        log.info("backfill %s: %s filas", table, total)
+        return total
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+def _connect(dsn: str) -> psycopg.Connection:
+    conn = psycopg.connect(dsn, autocommit=True, application_name="migrate")
+    conn.execute(f"SET lock_timeout = {LOCK_TIMEOUT_MS}")
+    conn.execute("SET statement_timeout = 0")
+    return conn
+
+
+def _applied(conn: psycopg.Connection) -> Dict[int, Dict[str, Any]]:
+    conn.execute(_TABLE_SQL)
+    cur = conn.execute("SELECT version, name, checksum, applied_at, duration_ms FROM public.schema_migrations")
+    return {r[0]: {"name": r[1], "checksum": r[2], "applied_at": r[3], "duration_ms": r[4]}
+            for r in cur.fetchall()}
+
+
+def _record(conn: psycopg.Connection, m: Migration, duration_ms: Optional[int]) -> None:
+    conn.execute("""
+        INSERT INTO public.schema_migrations(version, name, checksum, duration_ms)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (version) DO UPDATE SET checksum = EXCLUDED.checksum
+    """, (m.version, m.name, m.checksum, duration_ms))
+
+
+def _apply(conn: psycopg.Connection, m: Migration) -> None:
+    t0 = time.perf_counter()
+    if m.kind == "sql":
+        body = m.path.read_text(encoding="utf-8")
+
+        def run(mg: Migrator) -> None:
+            mg.conn.execute(body)
+            _record(mg.conn, m, int((time.perf_counter() - t0) * 1000))
+
+        Migrator(conn).atomic(run)
+    else:
+        spec = importlib.util.spec_from_file_location(f"app.migrations.m{m.version:04d}", m.path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        mod.up(Migrator(conn))
+        _record(conn, m, int((time.perf_counter() - t0) * 1000))
+
+
+def status(dsn: str = DSN) -> List[Dict[str, Any]]:
+    with _connect(dsn) as conn:
+        applied = _applied(conn)
+    out = []
+    for m in discover():
+        a = applied.get(m.version)
+        out.append({
+            "version": m.version,
+            "name": m.name,
+            "kind": m.kind,
+            "applied_at": a["applied_at"].isoformat() if a else None,
+            "duration_ms": a["duration_ms"] if a else None,
+            "changed": bool(a and a["checksum"] != m.checksum),
+        })
+    return out
+
+
+def migrate(dsn: str = DSN, *, to: Optional[int] = None, dry_run: bool = False,
+            allow_changed: bool = False) -> List[int]:
+    """
+    Aplica las pendientes (hasta `to` inclusive). Devuelve las versiones aplicadas.
+    MigrationError si alguna aplicada cambió (salvo allow_changed).
+    """
+    done: List[int] = []
+    with _connect(dsn) as conn:
+        conn.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_KEY,))
+        try:
+            applied = _applied(conn)
+            migrations = discover()
+            changed = [f"{m.version:04d}_{m.name}" for m in migrations
+                       if m.version in applied and applied[m.version]["checksum"] != m.checksum]
+            if changed:
+                if not allow_changed:
+                    raise MigrationError("cambiaron después de aplicadas: " + ", ".join(changed))
+                log.warning("cambiaron después de aplicadas: %s", ", ".join(changed))
+            for m in migrations:
+                if m.version in applied:
+                    continue
+                if to is not None and m.version > to:
+                    break
+                if dry_run:
+                    log.info("pendiente %04d_%s (%s)", m.version, m.name, m.kind)
+                    done.append(m.version)
+                    continue
+                log.info("aplicando %04d_%s", m.version, m.name)
+                t0 = time.perf_counter()
+                _apply(conn, m)
+                log.info("%04d_%s aplicada en %.1fs", m.version, m.name, time.perf_counter() - t0)
+                done.append(m.version)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_KEY,))
+    return done
+
+
+def baseline(version: int, dsn: str = DSN) -> List[int]:
+    """Marca como aplicadas (sin correrlas) las migraciones <= version."""
+    marked: List[int] = []
+    with _connect(dsn) as conn:
+        applied = _applied(conn)
+        for m in discover():
+            if m.version <= version and m.version not in applied:
+                _record(conn, m, None)
+                marked.append(m.version)
+    return marked
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.core.migrate",
+                                 description="Migraciones de esquema (app/migrations)")
+    ap.add_argument("--dsn", default=DSN)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status")
+    up = sub.add_parser("up")
+    up.add_argument("--to", type=int)
+    up.add_argument("--dry-run", action="store_true")
+    up.add_argument("--allow-changed", action="store_true",
+                    help="seguir aunque una migración aplicada haya cambiado")
+    bl = sub.add_parser("baseline")
+    bl.add_argument("version", type=int)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.cmd == "status":
+        for r in status(args.dsn):
+            state = r["applied_at"] or "pendiente"
+            flag = "  (archivo modificado)" if r["changed"] else ""
+            print(f"{r['version']:04d}_{r['name']:<28} {r['kind']:<4} {state}{flag}")
+    elif args.cmd == "up":
+        try:
+            done = migrate(args.dsn, to=args.to, dry_run=args.dry_run, allow_changed=args.allow_changed)
+        except MigrationError as e:
+            log.error("%s", e)
+            return 1
+        print(("pendientes: " if args.dry_run else "aplicadas: ") + (", ".join(f"{v:04d}" for v in done) or "ninguna"))
+    else:
+        done = baseline(args.version, args.dsn)
+        print("marcadas: " + (", ".join(f"{v:04d}" for v in done) or "ninguna"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
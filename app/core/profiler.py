@@ -0,0 +1,247 @@
+# app/core/profiler.py
+"""
+Profiler de queries por request + slow-query log.
+
+Todas las conexiones de los pools (sync y async, ver core/db y core/db_async)
+usan ProfiledCursor / AsyncProfiledCursor: cada execute/executemany mide
+duración y filas y lo suma al RequestProfile del request en curso (contextvar:
+llega también al threadpool y a los BackgroundTasks).
+
+Qué sale:
+  - Header `Server-Timing` en cada respuesta (SERVER_TIMING=1, default):
+        db;dur=4.1;desc="3 queries", serialize;dur=0.6, alarm_eval;dur=2.3, app;dur=7.9
+    `alarm_eval` aparece solo si la evaluación corrió antes de responder (ver
+    abajo); `db` incluye también las queries de esa fase.
+  - Slow-query log: logger "db.slow" (WARNING) + db_slow_queries_total para
+    toda query por encima de DB_SLOW_QUERY_MS (default 500; 0 = apagado),
+    con o sin request.
+  - Modo debug por request: header `X-Profile: 1` (solo si PROFILER_DEBUG=1).
+    Agrega al Server-Timing una entrada por fingerprint (top 10 por tiempo),
+    loguea el detalle completo en "profiler" al terminar el request (incluidos
+    los BackgroundTasks) y el ingest de tanque evalúa alarmas antes de
+    responder para que `alarm_eval` quede en el header.
+
+En modo pipeline (hot.py) el execute solo encola: la duración se ve en el
+statement que sincroniza y las filas de los encolados cuentan 0.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psycopg
+
+from app.core import metrics
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1").lower() in ("1", "true", "yes", "on")
+DEBUG_ALLOWED = os.getenv("PROFILER_DEBUG", "0").lower() in ("1", "true", "yes", "on")
+SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+DEBUG_HEADER = b"x-profile"
+
+slow_log = logging.getLogger("db.slow")
+log = logging.getLogger("profiler")
+
+
+class RequestProfile:
+    __slots__ = ("route", "debug", "t0", "queries", "phases")
+
+    def __init__(self, route: str = "", debug: bool = False):
+        self.route = route
+        self.debug = debug
+        self.t0 = time.perf_counter()
+        # fingerprint -> [n, segundos, filas]
+        self.queries: Dict[str, List[float]] = {}
+        self.phases: Dict[str, float] = {}
+
+    def add_query(self, fp: str, dt: float, rows: int) -> None:
+        q = self.queries.get(fp)
+        if q is None:
+            self.queries[fp] = [1, dt, max(rows, 0)]
+        else:
+            q[0] += 1
+            q[1] += dt
+            q[2] += max(rows, 0)
+
+    def add_phase(self, name: str, dt: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + dt
+
+    def db_totals(self) -> Tuple[int, float]:
+        n = sum(int(q[0]) for q in self.queries.values())
+        return n, sum(q[1] for q in self.queries.values())
+
+    def server_timing(self) -> str:
+        n, db_s = self.db_totals()
+        parts = [f'db;dur={db_s * 1000:.1f};desc="{n} queries"']
+        for name, dt in self.phases.items():
+            parts.append(f"{name};dur={dt * 1000:.1f}")
+        parts.append(f"app;dur={(time.perf_counter() - self.t0) * 1000:.1f}")
+        if self.debug:
+            top = sorted(self.queries.items(), key=lambda kv: kv[1][1], reverse=True)[:10]
+            for i, (fp, (cnt, dt, rows)) in enumerate(top, 1):
+                desc = fp[:60].replace('"', "'")
+                parts.append(f'q{i};dur={dt * 1000:.1f};desc="{int(cnt)}x {int(rows)}r {desc}"')
+        return ", ".join(parts)
+
+    def as_dict(self) -> Dict[str, Any]:
+        n, db_s = self.db_totals()
+        return {
+            "route": self.route,
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 2),
+            "db_ms": round(db_s * 1000, 2),
+            "queries": n,
+            "phases_ms": {k: round(v * 1000, 2) for k, v in self.phases.items()},
+            "by_fingerprint": [
+                {"sql": fp, "calls": int(c), "ms": round(dt * 1000, 2), "rows": int(r)}
+                for fp, (c, dt, r) in sorted(self.queries.items(), key=lambda kv: kv[1][1], reverse=True)
+            ],
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+def debugging() -> bool:
+    """True si el request en curso pidió X-Profile (y PROFILER_DEBUG lo permite)."""
+    p = _current.get()
+    return p is not None and p.debug
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Suma el bloque a la fase `name` del request (si hay) y a <name>_seconds."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        metrics.observe(f"{name}_seconds", dt)
+        p = _current.get()
+        if p is not None:
+            p.add_phase(name, dt)
+
+
+# -----------------------------
+# Fingerprint: literales fuera, espacios colapsados (sirve de label/log)
+# -----------------------------
+_RE_STR = re.compile(r"'(?:[^']|'')*'")
+_RE_NUM = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_IN = re.compile(r"\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))+\s*\)")
+_RE_WS = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=512)
+def fingerprint(sql: str) -> str:
+    s = _RE_STR.sub("?", sql)
+    s = _RE_NUM.sub("?", s)
+    s = _RE_WS.sub(" ", s).strip().rstrip(";").rstrip()
+    s = _RE_IN.sub("(...)", s)
+    return s[:200]
+
+
+def _sql_text(query: Any, cur: Any) -> str:
+    if isinstance(query, str):
+        return query
+    if isinstance(query, bytes):
+        return query.decode("utf-8", "replace")
+    try:
+        return query.as_string(cur)  # psycopg.sql.Composed
+    except Exception:
+        return type(query).__name__
+
+
+def _record(cur: Any, query: Any, t0: float, many: bool = False) -> None:
+    dt = time.perf_counter() - t0
+    p = _current.get()
+    slow = SLOW_QUERY_MS > 0 and dt * 1000 >= SLOW_QUERY_MS
+    if p is None and not slow:
+        return
+    fp = fingerprint(_sql_text(query, cur))
+    rows = cur.rowcount
+    if p is not None:
+        p.add_query(fp, dt, rows)
+    if slow:
+        metrics.inc("db_slow_queries_total")
+        slow_log.warning("slow query ms=%.1f rows=%s many=%s route=%s sql=%s",
+                         dt * 1000, rows, many, p.route if p else "-", fp)
+
+
+class ProfiledCursor(psycopg.Cursor):
+    def execute(self, query, params=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            _record(self, query, t0)
+
+    def executemany(self, query, params_seq, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            _record(self, query, t0, many=True)
+
+
+class AsyncProfiledCursor(psycopg.AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            _record(self, query, t0)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            _record(self, query, t0, many=True)
+
+
+# -----------------------------
+# Middleware: un RequestProfile por request + Server-Timing
+# -----------------------------
+class ProfilerMiddleware:
+    """ASGI puro. Setea el contextvar antes de rutear y agrega Server-Timing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        debug = DEBUG_ALLOWED and any(
+            k == DEBUG_HEADER and v not in (b"", b"0") for k, v in scope.get("headers", ())
+        )
+        if not (SERVER_TIMING or debug):
+            await self.app(scope, receive, send)
+            return
+
+        prof = RequestProfile(scope.get("path", ""), debug)
+        token = _current.set(prof)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                prof.route = getattr(route, "path", prof.route)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", prof.server_timing().encode("latin-1", "replace")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _current.reset(token)
+            if debug:  # después de los BackgroundTasks: el detalle completo
+                log.info("request profile %s", prof.as_dict())
@@ -0,0 +1,270 @@
+# app/core/ratelimit.py
+"""
+Control de admisión delante de la DB:
+  - token bucket para /ingest/* (429 + Retry-After): con API key validada
+    (INGEST_REQUIRE_API_KEY=1) por key y por device dentro de la key; si no,
+    por IP del cliente y por device dentro de la IP. X-Device-Id sin key
+    validada solo elige el bucket de adentro: cambiarlo en cada request no
+    pasa el de la IP.
+  - token bucket para el long-poll GET /devices/{id}/commands/next, con las
+    mismas identidades: un device con comandos vuelve a pedir enseguida y el
+    bucket corta el que pide en loop
+  - tope global de requests concurrentes que tocan la DB (503 + Retry-After):
+    db_slot para rutas sync y adb_slot/adb_read_slot para las async
+
+Todo es en memoria y por proceso (con N workers el límite efectivo es N veces
+el configurado). Con rate=0 el bucket queda deshabilitado.
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request
+
+from app.core import metrics
+from app.core.db import POOL_SIZES
+from app.core.db_async import ASYNC_POOL_SIZES
+from app.core.security import device_id_dep
+
+INGEST_RATE_PER_DEVICE = float(os.getenv("INGEST_RATE_PER_DEVICE", "2"))     # lecturas/s sostenidas
+INGEST_BURST_PER_DEVICE = float(os.getenv("INGEST_BURST_PER_DEVICE", "10"))
+INGEST_RATE_PER_KEY = float(os.getenv("INGEST_RATE_PER_KEY", "50"))
+INGEST_BURST_PER_KEY = float(os.getenv("INGEST_BURST_PER_KEY", "100"))
+# Sin API key validada: detrás de una IP (NAT, gateway) puede haber muchos devices
+INGEST_RATE_PER_IP = float(os.getenv("INGEST_RATE_PER_IP", "200"))
+INGEST_BURST_PER_IP = float(os.getenv("INGEST_BURST_PER_IP", "400"))
+
+COMMAND_POLL_RATE_PER_DEVICE = float(os.getenv("COMMAND_POLL_RATE_PER_DEVICE", "1"))  # polls/s sostenidos
+COMMAND_POLL_BURST_PER_DEVICE = float(os.getenv("COMMAND_POLL_BURST_PER_DEVICE", "5"))
+COMMAND_POLL_RATE_PER_IP = float(os.getenv("COMMAND_POLL_RATE_PER_IP", "50"))
+COMMAND_POLL_BURST_PER_IP = float(os.getenv("COMMAND_POLL_BURST_PER_IP", "200"))
+
+# Por default, el max_size del pool (ya calculado con el presupuesto de
+# app/core/db.py): más requests que conexiones solo hacen cola adentro del pool
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY") or POOL_SIZES["write"][1])
+DB_SLOT_WAIT_SEC = float(os.getenv("DB_SLOT_WAIT_SEC", "0.5"))
+# Idem para las rutas async, uno por pool
+ADB_MAX_CONCURRENCY = int(os.getenv("ADB_MAX_CONCURRENCY") or ASYNC_POOL_SIZES["write"][1])
+ADB_READ_MAX_CONCURRENCY = int(os.getenv("ADB_READ_MAX_CONCURRENCY") or ASYNC_POOL_SIZES["read"][1])
+
+_MAX_BUCKETS = int(os.getenv("RATELIMIT_MAX_BUCKETS", "20000"))
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def take(self, now: float) -> Tuple[bool, float]:
+        """(admitido, segundos hasta que haya 1 token)."""
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True, 0.0
+        return False, (1.0 - self.tokens) / self.rate
+
+    def idle_full(self, now: float) -> bool:
+        return self.tokens + (now - self.last) * self.rate >= self.burst
+
+
+_lock = threading.Lock()
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+# Últimos limitados, para /__ratelimit (las métricas van solo por scope: un
+# label por device/IP no tiene techo)
+_recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+
+def _prune(now: float) -> None:
+    # Llamar con _lock tomado. Los buckets llenos equivalen a uno nuevo: se pueden tirar.
+    for k in [k for k, b in _buckets.items() if b.idle_full(now)]:
+        del _buckets[k]
+
+
+def _take(scope: str, ident: str, rate: float, burst: float) -> Tuple[bool, float]:
+    if rate <= 0:
+        return True, 0.0
+    now = time.monotonic()
+    with _lock:
+        b = _buckets.get((scope, ident))
+        if b is None:
+            if len(_buckets) >= _MAX_BUCKETS:
+                _prune(now)
+            b = _buckets[(scope, ident)] = TokenBucket(rate, burst)
+        return b.take(now)
+
+
+def _throttle(scope: str, ident: str, retry_after: float, metric: str = "ingest_throttled_total") -> HTTPException:
+    metrics.inc(metric, scope=scope)
+    _recent.append({"scope": scope, "key": ident, "at": time.time()})
+    return HTTPException(
+        status_code=429,
+        detail=f"rate limit exceeded ({scope})",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def ingest_rate_limit(request: Request, auth: Dict[str, Any] = Depends(device_id_dep)) -> None:
+    """
+    Dependencia para /ingest/*.
+      - API key validada: bucket por key y, adentro, por device
+        (X-Device-Id/?device_id=); rotar el device no pasa el de la key.
+      - Sin validar (modo permisivo): un bucket por IP del cliente
+        (INGEST_RATE_PER_IP) y, adentro, uno por IP+device
+        (INGEST_RATE_PER_DEVICE): un device que manda de más no se come el
+        cupo de los otros detrás del mismo NAT.
+    Es async (no bloquea: el lock se toma por microsegundos) para no pasar por el threadpool.
+    """
+    auth = auth or {}
+    api_key = auth.get("api_key") if auth.get("strict") else None
+    if not api_key:
+        ip = request.client.host if request.client else "unknown"
+        ok, wait = _take("ip", ip, INGEST_RATE_PER_IP, INGEST_BURST_PER_IP)
+        if not ok:
+            raise _throttle("ip", ip, wait)
+        device = auth.get("device_id")
+        if device:
+            ok, wait = _take("ip_device", f"{ip}:{device}", INGEST_RATE_PER_DEVICE, INGEST_BURST_PER_DEVICE)
+            if not ok:
+                raise _throttle("ip_device", f"{ip}:{device}", wait)
+        return
+
+    # No exponemos la key entera en /__ratelimit
+    ident = api_key[:6] + "…"
+    ok, wait = _take("api_key", api_key, INGEST_RATE_PER_KEY, INGEST_BURST_PER_KEY)
+    if not ok:
+        raise _throttle("api_key", ident, wait)
+    device = auth.get("device_id")
+    if device:
+        ok, wait = _take("device", f"{api_key}:{device}", INGEST_RATE_PER_DEVICE, INGEST_BURST_PER_DEVICE)
+        if not ok:
+            raise _throttle("device", f"{ident}:{device}", wait)
+
+
+async def command_poll_rate_limit(request: Request, auth: Dict[str, Any] = Depends(device_id_dep)) -> None:
+    """
+    Dependencia para el long-poll de comandos. Con API key validada, un bucket
+    por key+device (COMMAND_POLL_RATE_PER_DEVICE); si no, por IP del cliente.
+    """
+    auth = auth or {}
+    api_key = auth.get("api_key") if auth.get("strict") else None
+    if api_key:
+        scope, ident, raw = "poll_device", f"{api_key[:6]}…:{auth.get('device_id')}", f"{api_key}:{auth.get('device_id')}"
+        rate, burst = COMMAND_POLL_RATE_PER_DEVICE, COMMAND_POLL_BURST_PER_DEVICE
+    else:
+        scope = "poll_ip"
+        ident = raw = request.client.host if request.client else "unknown"
+        rate, burst = COMMAND_POLL_RATE_PER_IP, COMMAND_POLL_BURST_PER_IP
+    ok, wait = _take(scope, raw, rate, burst)
+    if not ok:
+        raise _throttle(scope, ident, wait, metric="command_poll_throttled_total")
+
+
+# -----------------------------
+# Concurrencia global hacia la DB
+# -----------------------------
+_db_sem: Optional[threading.BoundedSemaphore] = (
+    threading.BoundedSemaphore(DB_MAX_CONCURRENCY) if DB_MAX_CONCURRENCY > 0 else None
+)
+_db_inflight = 0
+_db_inflight_lock = threading.Lock()
+
+
+def _shed(request: Request) -> HTTPException:
+    route = request.scope.get("route")
+    metrics.inc("db_shed_total", route=getattr(route, "path", "other"))
+    return HTTPException(status_code=503, detail="server busy", headers={"Retry-After": "1"})
+
+
+def db_slot(request: Request):
+    """
+    Dependencia (con yield) para rutas que van a la DB: si no hay lugar en
+    DB_SLOT_WAIT_SEC, 503 en vez de encolar threads esperando al pool.
+    """
+    global _db_inflight
+    if _db_sem is None:
+        yield
+        return
+    if not _db_sem.acquire(timeout=DB_SLOT_WAIT_SEC):
+        raise _shed(request)
+    with _db_inflight_lock:
+        _db_inflight += 1
+    try:
+        yield
+    finally:
+        with _db_inflight_lock:
+            _db_inflight -= 1
+        _db_sem.release()
+
+
+class _AsyncSlot:
+    """Tope de concurrencia async (uno por pool): escrituras y lecturas no se pisan."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.sem = asyncio.Semaphore(limit) if limit > 0 else None
+        self.inflight = 0
+
+    async def acquire(self, request: Request):
+        if self.sem is None:
+            yield
+            return
+        try:
+            await asyncio.wait_for(self.sem.acquire(), timeout=DB_SLOT_WAIT_SEC)
+        except asyncio.TimeoutError:
+            raise _shed(request)
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self.sem.release()
+
+
+_adb_write = _AsyncSlot(ADB_MAX_CONCURRENCY)
+_adb_read = _AsyncSlot(ADB_READ_MAX_CONCURRENCY)
+
+# db_slot para rutas async: esperan en el event loop, sin ocupar un thread
+adb_slot = _adb_write.acquire
+adb_read_slot = _adb_read.acquire
+
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        n = len(_buckets)
+    snap = metrics.snapshot()
+    return {
+        "ingest": {
+            "per_device": {"rate": INGEST_RATE_PER_DEVICE, "burst": INGEST_BURST_PER_DEVICE},
+            "per_api_key": {"rate": INGEST_RATE_PER_KEY, "burst": INGEST_BURST_PER_KEY},
+            "per_ip": {"rate": INGEST_RATE_PER_IP, "burst": INGEST_BURST_PER_IP},
+            "buckets": n,
+        },
+        "command_poll": {
+            "per_device": {"rate": COMMAND_POLL_RATE_PER_DEVICE, "burst": COMMAND_POLL_BURST_PER_DEVICE},
+            "per_ip": {"rate": COMMAND_POLL_RATE_PER_IP, "burst": COMMAND_POLL_BURST_PER_IP},
+            "throttled": snap.get("command_poll_throttled_total", []),
+        },
+        "db": {
+            "max_concurrency": DB_MAX_CONCURRENCY,
+            "inflight": _db_inflight,
+            "wait_sec": DB_SLOT_WAIT_SEC,
+        },
+        "db_async": {
+            "write": {"max_concurrency": _adb_write.limit, "inflight": _adb_write.inflight},
+            "read": {"max_concurrency": _adb_read.limit, "inflight": _adb_read.inflight},
+        },
+        "throttled": snap.get("ingest_throttled_total", []),
+        "recent_throttled": list(_recent),
+        "shed": snap.get("db_shed_total", []),
+    }
@@ -0,0 +1,161 @@
+# app/core/read_routing.py
+"""
+Ruteo de lecturas a la réplica (READ_DATABASE_URL), con dos salvaguardas:
+
+  - read-your-writes: un cliente (API key / device / IP) que acaba de escribir
+    lee del primario durante READ_YOUR_WRITES_SEC. También se puede forzar por
+    request con el header 'X-Read-Consistency: primary'.
+  - staleness guard: cada REPLICA_LAG_CHECK_SEC se mide el lag de la réplica
+    (en la misma conexión que se usa para leer); si supera REPLICA_MAX_LAG_SEC,
+    o la medición falla, las lecturas van al primario hasta la próxima medición.
+
+Sin READ_DATABASE_URL no hace nada: el pool de lectura ya apunta al primario
+y main.py no instala ReadYourWritesMiddleware. El estado es por proceso.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+
+REPLICA_MAX_LAG_SEC = float(os.getenv("REPLICA_MAX_LAG_SEC", "5"))
+REPLICA_LAG_CHECK_SEC = float(os.getenv("REPLICA_LAG_CHECK_SEC", "2"))
+# >= REPLICA_MAX_LAG_SEC: pasada la ventana, la réplica ya tiene la escritura
+READ_YOUR_WRITES_SEC = float(os.getenv("READ_YOUR_WRITES_SEC", str(REPLICA_MAX_LAG_SEC)))
+_MAX_WRITERS = 50000
+
+# Lag de la réplica en segundos. 0 si está al día aunque el primario esté ocioso
+# (pg_last_xact_replay_timestamp solo avanza cuando hay escrituras).
+LAG_SQL = """
+    SELECT CASE
+      WHEN NOT pg_is_in_recovery() THEN 0
+      WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+      ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END::float8;
+"""
+
+_force_primary: ContextVar[bool] = ContextVar("force_primary", default=False)
+
+_lock = threading.Lock()
+_writers: Dict[str, float] = {}          # client_key → monotonic de la última escritura
+_lag: Optional[float] = None             # None = nunca medido / falló
+_lag_checked_at = 0.0
+
+
+# -----------------------------
+# Decisión por request
+# -----------------------------
+def prefer_primary() -> bool:
+    return _force_primary.get()
+
+
+def lag_check_due() -> bool:
+    return time.monotonic() - _lag_checked_at >= REPLICA_LAG_CHECK_SEC
+
+
+def record_lag(lag: Optional[float]) -> None:
+    global _lag, _lag_checked_at
+    _lag = lag
+    _lag_checked_at = time.monotonic()
+    if lag is None:
+        metrics.inc("db_replica_lag_check_failed_total")
+
+
+def replica_lag() -> Optional[float]:
+    return _lag
+
+
+def replica_ok() -> bool:
+    """True si la última medición de lag está dentro del umbral."""
+    return _lag is not None and _lag <= REPLICA_MAX_LAG_SEC
+
+
+def skip_replica_reason() -> Optional[str]:
+    """Motivo para NO ir a la réplica en este request (None = ir a la réplica)."""
+    if prefer_primary():
+        return "read_your_writes"
+    if not lag_check_due() and not replica_ok():
+        return "lag" if _lag is not None else "replica_down"
+    return None
+
+
+def count_fallback(reason: str) -> None:
+    metrics.inc("db_read_primary_total", reason=reason)
+
+
+# -----------------------------
+# Read-your-writes
+# -----------------------------
+def _client_key(scope: Dict[str, Any]) -> str:
+    headers = dict(scope.get("headers") or [])
+    for h in (b"x-api-key", b"authorization", b"x-device-id"):
+        v = headers.get(h)
+        if v:
+            return h.decode() + ":" + v.decode("latin-1")
+    client = scope.get("client")
+    return "ip:" + (client[0] if client else "unknown")
+
+
+def mark_write(key: str) -> None:
+    now = time.monotonic()
+    with _lock:
+        if len(_writers) >= _MAX_WRITERS:
+            for k in [k for k, t in _writers.items() if now - t > READ_YOUR_WRITES_SEC]:
+                del _writers[k]
+        _writers[key] = now
+
+
+def wrote_recently(key: str) -> bool:
+    with _lock:
+        t = _writers.get(key)
+    return t is not None and time.monotonic() - t < READ_YOUR_WRITES_SEC
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI puro (no envuelve el body). Antes del handler decide si el request
+    lee del primario; después de una escritura exitosa marca al cliente.
+    """
+
+    _WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        key = _client_key(scope)
+        headers = dict(scope.get("headers") or [])
+        forced = headers.get(b"x-read-consistency", b"").lower() == b"primary"
+        token = _force_primary.set(forced or wrote_recently(key))
+        is_write = scope.get("method") in self._WRITE_METHODS
+
+        async def _send(message):
+            if is_write and message["type"] == "http.response.start" and message["status"] < 400:
+                mark_write(key)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _force_primary.reset(token)
+
+
+def status() -> Dict[str, Any]:
+    with _lock:
+        n = len(_writers)
+    return {
+        "max_lag_sec": REPLICA_MAX_LAG_SEC,
+        "lag_check_sec": REPLICA_LAG_CHECK_SEC,
+        "read_your_writes_sec": READ_YOUR_WRITES_SEC,
+        "lag_sec": _lag,
+        "replica_ok": replica_ok(),
+        "recent_writers": n,
+        "primary_reads": metrics.snapshot().get("db_read_primary_total", []),
+    }
@@ -0,0 +1,94 @@
+# app/core/reading_ts.py
+"""
+Validación del ts que manda el device (lecturas guardadas offline y
+reenviadas al reconectar). Se acepta dentro de
+
+    [max(now - INGEST_TS_MAX_AGE_DAYS, inicio de la partición más vieja),
+     now + INGEST_TS_MAX_FUTURE_SEC]
+
+y fuera de eso las rutas responden 400 ANTES de insertar o encolar, igual en
+todos los caminos (tanque y bomba, sync y cola). Antes el camino sync
+devolvía 400 recién cuando el INSERT no encontraba partición y la cola
+aceptaba con 202 y descartaba después, en el writer.
+
+  - futuro: reloj del device sin sincronizar; una lectura "del mes que viene"
+    quedaría como la última del tanque hasta esa fecha
+  - más viejo que la retención del crudo (RETENTION_RAW_DAYS por default):
+    la retención la borraría en la próxima pasada
+  - más viejo que la partición más vieja: no hay partición DEFAULT, el
+    INSERT fallaría. El límite se lee del catálogo y se cachea FLOOR_TTL_SEC.
+    Si la consulta falla (pool agotado, DB caída) se usa el último valor leído
+    o, si nunca se leyó, solo el límite por edad: validar el ts no puede
+    convertir una caída de la DB en 500 antes de que la cola la absorba
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from app.core import metrics
+from app.core.db_async import get_aconn
+
+log = logging.getLogger("ingest")
+
+MAX_FUTURE_SEC = float(os.getenv("INGEST_TS_MAX_FUTURE_SEC", "120"))
+MAX_AGE_DAYS = int(os.getenv("INGEST_TS_MAX_AGE_DAYS", os.getenv("RETENTION_RAW_DAYS", "90")))  # 0 = sin límite
+FLOOR_TTL_SEC = 300.0
+FLOOR_RETRY_SEC = 10.0  # tras un error, cuánto esperar para volver a consultar
+
+# Cota inferior de la partición más vieja (FROM ('...') de relpartbound)
+_FLOOR_SQL = r"""
+    SELECT min((regexp_match(pg_get_expr(c.relpartbound, c.oid), 'FROM \(''([^'']+)''\)'))[1]::timestamptz)
+      FROM pg_inherits i
+      JOIN pg_class c ON c.oid = i.inhrelid
+     WHERE i.inhparent = to_regclass(%s);
+"""
+
+_floor: Dict[str, Tuple[float, Optional[datetime]]] = {}
+
+
+async def partition_floor(table: str) -> Optional[datetime]:
+    """Inicio de la partición más vieja de `table` (None si no está particionada o no se pudo leer)."""
+    hit = _floor.get(table)
+    if hit and time.monotonic() - hit[0] < FLOOR_TTL_SEC:
+        return hit[1]
+    try:
+        async with get_aconn() as conn, conn.cursor() as cur:
+            await cur.execute(_FLOOR_SQL, (f"public.{table}",))
+            row = await cur.fetchone()
+    except Exception as e:
+        floor = hit[1] if hit else None
+        log.warning("partition floor lookup failed table=%s err=%s (using %s)", table, e, floor)
+        metrics.inc("ingest_ts_floor_errors_total", table=table)
+        _floor[table] = (time.monotonic() - FLOOR_TTL_SEC + FLOOR_RETRY_SEC, floor)
+        return floor
+    floor = row[0] if row else None
+    _floor[table] = (time.monotonic(), floor)
+    return floor
+
+
+async def check_reading_ts(ts: Optional[datetime], kind: str) -> Optional[str]:
+    """
+    None si el ts es aceptable (o no vino: la DB usa now()); si no, el motivo
+    para el 400. kind: 'tank' | 'pump'. Un ts sin zona se toma como UTC.
+    """
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    now = datetime.now(timezone.utc)
+    if ts > now + timedelta(seconds=MAX_FUTURE_SEC):
+        metrics.inc("ingest_ts_rejected_total", kind=kind, reason="future")
+        return f"ts is in the future (more than {MAX_FUTURE_SEC:.0f}s ahead of server time)"
+
+    floor = now - timedelta(days=MAX_AGE_DAYS) if MAX_AGE_DAYS > 0 else None
+    part = await partition_floor(f"{kind}_readings")
+    if part is not None and (floor is None or part > floor):
+        floor = part
+    if floor is not None and ts < floor:
+        metrics.inc("ingest_ts_rejected_total", kind=kind, reason="too_old")
+        return f"ts is older than the oldest accepted reading ({floor.isoformat()})"
+    return None
@@ -46,7 +46,7 @@ def _extract_api_key_and_device(
 
     return api_key, device_id
 
-def device_id_dep(
+async def device_id_dep(
     request: Request,
     x_api_key: Optional[str] = Header(None),
     authorization: Optional[str] = Header(None),
@@ -58,6 +58,7 @@ def device_id_dep(
       - device_id desde X-Device-Id o ?device_id=
       - En modo estricto (INGEST_REQUIRE_API_KEY=1), 401 si falta api_key o no está permitida.
     Devuelve un dict con {"api_key", "device_id", "ts"}.
+    Es async (no hace I/O): así no consume un thread del threadpool por request.
     """
     api_key, device_id = _extract_api_key_and_device(request, x_api_key, authorization, x_device_id)
 
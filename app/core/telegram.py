@@ -1,9 +1,11 @@
-import httpx, json
+import json, time
 from .config import BOT, CHAT, ENABLED
+from . import metrics
 
 async def send_telegram(text: str, chat_id: str | int = CHAT):
     if not ENABLED:
         print("[tg] disabled: TELEGRAM_ENABLED != true")
+        metrics.inc("telegram_sends_total", sender="async", result="disabled")
         return {"ok": False, "reason": "disabled"}
 
     url = f"https://api.telegram.org/bot{BOT}/sendMessage"
@@ -14,15 +16,22 @@ async def send_telegram(text: str, chat_id: str | int = CHAT):
         "disable_web_page_preview": True
     }
 
+    import httpx  # diferido: ~0.2 s de import que el arranque no necesita
+
+    t0 = time.perf_counter()
     try:
         async with httpx.AsyncClient(timeout=10) as cli:
             r = await cli.post(url, json=payload)
+        metrics.observe("telegram_send_seconds", time.perf_counter() - t0, sender="async")
         if r.status_code != 200:
+            metrics.inc("telegram_sends_total", sender="async", result="http_error")
             print(f"[tg] HTTP {r.status_code}: {r.text}")
             return {"ok": False, "status": r.status_code, "body": r.text}
         data = r.json()
+        metrics.inc("telegram_sends_total", sender="async", result="ok")
         print("[tg] sent ok:", json.dumps({"to": str(chat_id), "text": text[:60]}, ensure_ascii=False))
         return data
     except Exception as e:
+        metrics.inc("telegram_sends_total", sender="async", result="exception")
         print("[tg] EXC:", repr(e))
         return {"ok": False, "exception": repr(e)}
@@ -1,12 +1,13 @@
 # app/main.py
 import os
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi import Body
 
 # --- Config centralizada con fallback a .env ---
 try:
@@ -49,7 +50,131 @@ TRUSTED_HOSTS = [h.strip() for h in _trusted_hosts_raw.split(",") if h.strip()]
 APP_TITLE = _get_env("APP_TITLE", "ESP32 Tank/Pump API")
 APP_VERSION = _get_env("APP_VERSION", "") or _get_env("RENDER_GIT_COMMIT", "")[:8]
 
-app = FastAPI(title=APP_TITLE, version=APP_VERSION or None)
+# Rutas de test/diagnóstico (app/routes/diag.py): apagadas por default
+DIAG_ROUTES = _get_env("DIAG_ROUTES", "0").lower() in ("1", "true", "yes", "on")
+# LISTEN/NOTIFY → Telegram (app/services/alarm_listener.py), como job del líder
+ALARM_LISTENER = _get_env("ALARM_LISTENER_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+# Logging del proceso: una sola vez, antes de importar servicios (app/core/logs.py)
+from app.core.logs import setup_logging
+setup_logging()
+
+# orjson por default; las rutas de listados grandes además devuelven la
+# respuesta armada (sin jsonable_encoder). Ver app/core/jsonresp.py
+from app.core.jsonresp import FastJSONResponse, GZIP_LEVEL, GZIP_MIN_SIZE
+
+
+# ===== Arranque / apagado =====
+def _startup_migrations():
+    from app.core import migrate as schema_migrate
+    if not schema_migrate.ON_STARTUP:
+        return
+    # Sin try: si migrar falla (o una aplicada cambió) la API no arranca con
+    # un esquema que no corresponde al código
+    done = schema_migrate.migrate()
+    print(f"[migrate] aplicadas: {done or 'ninguna'}")
+
+
+def _register_leader_jobs():
+    """Jobs que corren en un solo proceso (app/services/leader.py)."""
+    from app.services import leader
+    from app.services.partitions import start_partition_maintenance, stop_partition_maintenance
+    from app.services.retention import start_retention, stop_retention
+    from app.services.command_expiry import start_command_expiry, stop_command_expiry
+
+    leader.register("partitions", start_partition_maintenance, stop_partition_maintenance)
+    leader.register("retention", start_retention, stop_retention)  # incluye los rollups 1m/1h
+    leader.register("command_expiry", start_command_expiry, stop_command_expiry)
+    try:
+        from app.services.alarm_poller import start_alarm_poller, stop_alarm_poller
+        leader.register("alarm_poller", start_alarm_poller, stop_alarm_poller)
+    except Exception as e:
+        print(f"⚠️ alarm-poller no disponible: {e}")
+    if ALARM_LISTENER:
+        from app.services.alarm_listener import start_alarm_listener, stop_alarm_listener
+        leader.register("alarm_listener", start_alarm_listener, stop_alarm_listener)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Arranque en orden; el apagado es el inverso (AsyncExitStack):
+      migraciones → pools sync/async → binding de alarms_eval → writer del
+      ingest → sync de presencia WS → conexiones WS (keepalives + push de
+      comandos) → elección de líder.
+
+    Particiones, retención, vencimiento de comandos, alarm poller y listener
+    corren solo en el proceso líder, así que se puede usar --workers N.
+    Los servicios se importan acá y no al importar el módulo: `import app.main`
+    queda en lo mínimo para rutear. Los pools no esperan conexiones
+    (wait=False), así /health responde aunque la DB todavía no esté.
+    """
+    from app.core import db
+    from app.core.db_async import open_async_pool, close_async_pool
+    from app.routes.ingest import bind_eval_fn
+    from app.services import leader
+    from app.services.ingest_queue import start_ingest_writer, stop_ingest_writer
+    from app.services import ws_manager
+    from app.services.presence_store import start_presence_sync, stop_presence_sync
+
+    async with AsyncExitStack() as stack:
+        # Primero: partitions/retention ya arrancan con el esquema al día
+        _startup_migrations()
+
+        db.open_pools()
+        stack.callback(db.close_pools)
+        await open_async_pool()
+        print("[db-async] pool opened")
+
+        async def _close_async():
+            await close_async_pool()
+            print("[db-async] pool closed")
+        stack.push_async_callback(_close_async)
+
+        # Una vez por proceso (antes: importlib en cada ingest)
+        await run_in_threadpool(bind_eval_fn)
+
+        start_ingest_writer()
+        print("[ingest-writer] started")
+
+        def _stop_ingest_writer():
+            # Drena la cola: lo aceptado con 202 se escribe antes de salir
+            stop_ingest_writer()
+            print("[ingest-writer] stopped")
+        stack.callback(_stop_ingest_writer)
+
+        start_presence_sync()
+        print("[presence] sync started")
+
+        def _stop_presence():
+            # Último flush: las desconexiones del apagado llegan a los otros workers
+            stop_presence_sync()
+            print("[presence] sync stopped")
+        stack.callback(_stop_presence)
+
+        await ws_manager.start()
+        print("[ws] manager started")
+
+        async def _stop_ws():
+            await ws_manager.stop()
+            print("[ws] manager stopped")
+        stack.push_async_callback(_stop_ws)
+
+        _register_leader_jobs()
+        leader.start_leader_election()
+        print("[leader] election started")
+
+        def _stop_leader():
+            # Si era líder para sus jobs y suelta el lock: otro worker los toma
+            leader.stop_leader_election()
+            print("[leader] election stopped")
+        stack.callback(_stop_leader)
+
+        yield
+
+
+app = FastAPI(title=APP_TITLE, version=APP_VERSION or "dev", default_response_class=FastJSONResponse,
+              lifespan=lifespan)
 
 # Logs de arranque
 print("[CORS] allow_all          =", ALLOW_ALL_ORIGINS)
@@ -72,7 +197,21 @@ app.add_middleware(
     allow_headers=ALLOW_HEADERS,
 )
 
-app.add_middleware(GZipMiddleware, minimum_size=1024)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+# Lecturas a réplica (READ_DATABASE_URL): quien acaba de escribir lee del primario.
+# Sin réplica todo se lee del primario: no hace falta marcar escritores
+from app.core.db import REPLICA_ENABLED
+if REPLICA_ENABLED:
+    from app.core.read_routing import ReadYourWritesMiddleware
+    app.add_middleware(ReadYourWritesMiddleware)
+
+# Latencia por ruta (/metrics). Último en agregarse = más externo: mide todo,
+# gzip y CORS incluidos
+from app.core.metrics import HTTPMetricsMiddleware
+from app.core.profiler import ProfilerMiddleware
+app.add_middleware(ProfilerMiddleware)  # Server-Timing + X-Profile (core/profiler)
+app.add_middleware(HTTPMetricsMiddleware)
 
 # ===== Routers principales =====
 from app.routes.ingest import router as ingest_tank_router
@@ -86,13 +225,11 @@ from app.routes.latest_pump import router as latest_pump_router
 from app.routes.history_pump import router as history_pump_router
 from app.routes.configs_pump import router as configs_pump_router
 from app.routes.commands_pumps import router as commands_pump_router
+from app.routes.device_commands import router as device_commands_router
 
 from app.routes.alarms import router as alarms_router
 from app.routes.audit import router as audit_router
 
-from app.routes.diag_listener import router as diag_listener_router
-app.include_router(diag_listener_router)
-
 # Router opcional: CRUD de metadatos de tanques
 try:
     from app.routes.tanks import router as tanks_router
@@ -111,52 +248,52 @@ else:
     print(f"⚠️ /ui deshabilitado: no existe {WEB_DIR}")
 
 # ===== Incluir Routers =====
+# Admisión: rate limit por device/API key en ingest + tope de concurrencia hacia la DB
+from fastapi import Depends
+from app.core.ratelimit import ingest_rate_limit, db_slot, adb_slot, adb_read_slot
+
+DB_DEPS = [Depends(db_slot)]
+# Rutas async (ingest, latest, history, alarms) → pools async (app.core.db_async):
+# ingest contra el de escritura, dashboards contra el de lectura
+ADB_READ_DEPS = [Depends(adb_read_slot)]
+INGEST_DEPS = [Depends(ingest_rate_limit), Depends(adb_slot)]
+
 # Tanques
-app.include_router(ingest_tank_router)
-app.include_router(latest_tank_router)
-app.include_router(history_tank_router)
-app.include_router(configs_tank_router)
-app.include_router(commands_tank_router)
+app.include_router(ingest_tank_router, dependencies=INGEST_DEPS)
+app.include_router(latest_tank_router, dependencies=ADB_READ_DEPS)
+app.include_router(history_tank_router, dependencies=ADB_READ_DEPS)
+app.include_router(configs_tank_router, dependencies=DB_DEPS)
+app.include_router(commands_tank_router, dependencies=DB_DEPS)
 
 # Bombas
-app.include_router(ingest_pump_router)
-app.include_router(latest_pump_router)
-app.include_router(history_pump_router)
-app.include_router(configs_pump_router)
-app.include_router(commands_pump_router)
+app.include_router(ingest_pump_router, dependencies=INGEST_DEPS)
+app.include_router(latest_pump_router, dependencies=DB_DEPS)
+app.include_router(history_pump_router, dependencies=DB_DEPS)
+app.include_router(configs_pump_router, dependencies=DB_DEPS)
+app.include_router(commands_pump_router, dependencies=DB_DEPS)
+
+# Long-poll de comandos de devices: toma adb_slot solo alrededor de cada UPDATE
+app.include_router(device_commands_router)
 
 # CRUD Tanques (opcional)
 if tanks_router:
-    app.include_router(tanks_router)
+    app.include_router(tanks_router, dependencies=DB_DEPS)
 
 # Alarmas / Auditoría
-app.include_router(alarms_router)
-app.include_router(audit_router)
+app.include_router(alarms_router)  # topes por ruta (lectura/escritura) en routes/alarms.py
+app.include_router(audit_router, dependencies=DB_DEPS)
 
-# 🔧 Routers de test / diagnóstico
-try:
-    from app.routes.test_telegram import router as test_telegram_router
-    app.include_router(test_telegram_router)
-except Exception as e:
-    print(f"⚠️ test_telegram router no disponible: {e}")
-
-try:
-    from app.routes.test_alarm import router as test_alarm_router
-    app.include_router(test_alarm_router)
-except Exception as e:
-    print(f"⚠️ test_alarm router no disponible: {e}")
-
-try:
-    from app.routes.debug_alarm import router as debug_alarm_router
-    app.include_router(debug_alarm_router)
-except Exception as e:
-    print(f"⚠️ debug_alarm router no disponible: {e}")
+# 🔧 Routers de test / diagnóstico (DIAG_ROUTES=1)
+if DIAG_ROUTES:
+    from app.routes.diag import include_diag_routes
+    include_diag_routes(app)
 
 # 🔌 WebSocket
 app.include_router(ws_router)
 
 # ===== Endpoints utilitarios =====
 from app.core.db import get_conn
+from app.core import metrics
 
 @app.get("/")
 def root():
@@ -178,13 +315,80 @@ def health():
 
 @app.get("/health/db")
 def health_db():
+    """SELECT 1 por cada pool sync + ocupación (clientes esperando / conexiones libres)."""
+    from app.core.db import get_read_conn, pool_stats
     try:
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("SELECT 1")
-            cur.fetchone()
-        return {"ok": True, "db": "up"}
+        for conn_fn in (get_conn, get_read_conn):
+            with conn_fn() as conn, conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
     except Exception as e:
         raise HTTPException(500, f"DB error: {e}")
+    pools = {
+        name: {k: st.get(k, 0) for k in ("pool_size", "pool_available", "requests_waiting")}
+        for name, st in pool_stats().items() if st.get("enabled")
+    }
+    return {"ok": True, "db": "up", "pools": pools}
+
+@app.get("/__metrics")
+def metrics_snapshot():
+    """Contadores en memoria de ESTE proceso (ingest, duplicados, etc.)."""
+    return metrics.snapshot()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_prometheus():
+    """Formato de texto de Prometheus: contadores, histogramas y gauges de pools/cola."""
+    from fastapi.responses import PlainTextResponse
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+def _pool_gauges():
+    from app.core.db import pool_stats
+    from app.core.db_async import async_pool_stats
+    for name, st in {**pool_stats(), **async_pool_stats()}.items():
+        if not st.get("enabled"):
+            continue
+        for k in ("pool_size", "pool_available", "requests_waiting"):
+            yield f"db_pool_{k.removeprefix('pool_')}", {"pool": name}, st.get(k, 0)
+
+def _ingest_queue_gauges():
+    from app.services import ingest_queue
+    yield "ingest_queue_depth", {}, ingest_queue.depth()
+
+metrics.register_collector(_pool_gauges)
+metrics.register_collector(_ingest_queue_gauges)
+
+@app.get("/__ratelimit")
+def ratelimit_status():
+    """Config de admisión, buckets vivos y quién está siendo limitado."""
+    from app.core import ratelimit
+    return ratelimit.status()
+
+@app.get("/__db_pools")
+def db_pools_status():
+    """
+    Stats de cada pool (sync write/read, async write/read): tamaño, clientes
+    esperando, uso, errores de conexión, timeouts, y el histograma de espera
+    por una conexión (db_pool_wait_seconds).
+    """
+    from app.core import db
+    from app.core.db_async import async_pool_stats
+    snap = metrics.snapshot()
+    from app.core import read_routing
+    pools = {**db.pool_stats(), **async_pool_stats()}
+    return {
+        "pools": pools,
+        "budget": {
+            "workers": db.WORKERS,
+            "max_connections": db.MAX_CONNECTIONS,
+            "reserved": db.RESERVED_CONNECTIONS,
+            "per_worker": db.PER_WORKER_BUDGET,
+            "pools_max_per_worker": sum(p.get("max_size", 0) for p in pools.values() if p.get("enabled")),
+            "dedicated_per_worker": db.DEDICATED_PER_WORKER,
+        },
+        "replica": read_routing.status(),
+        "timeouts": snap.get("db_pool_timeouts_total", []),
+        "wait_seconds": metrics.histograms("db_pool_wait_seconds").get("db_pool_wait_seconds", []),
+    }
 
 @app.get("/__config")
 def cfg_echo():
@@ -199,49 +403,55 @@ def cfg_echo():
         "version": APP_VERSION or None,
     }
 
-@app.get("/__tg_env")
-def tg_env():
-    token = _get_env("TELEGRAM_BOT_TOKEN", "")
-    return {
-        "ENABLED": _get_env("TELEGRAM_ENABLED", ""),
-        "BOT_head": (token[:8] + "...") if token else "",
-        "CHAT": _get_env("TELEGRAM_CHAT_ID", ""),
-    }
-
-# ===== Conexión (diagnóstico) =====
+# ===== Conexión del tanque (presencia WS + última lectura) =====
 try:
     from app.routes.conn import router as conn_router
     app.include_router(conn_router)
 except Exception as e:
     print(f"⚠️ conn router no disponible: {e}")
 
-# ===== Alarm Poller (sin LISTEN/NOTIFY) =====
-try:
-    from app.services.alarm_poller import start_alarm_poller, stop_alarm_poller
-    _HAS_ALARM_POLLER = True
-except Exception as e:
-    print(f"⚠️ alarm-poller no disponible: {e}")
-    start_alarm_poller = None
-    stop_alarm_poller = None
-    _HAS_ALARM_POLLER = False
-
-@app.on_event("startup")
-def _startup_listeners():
-    if _HAS_ALARM_POLLER and callable(start_alarm_poller):
-        try:
-            start_alarm_poller()
-            print("[alarm-poller] started")
-        except Exception as e:
-            print(f"⚠️ error al iniciar alarm-poller: {e}")
-
-@app.on_event("shutdown")
-def _shutdown_listeners():
-    if _HAS_ALARM_POLLER and callable(stop_alarm_poller):
-        try:
-            stop_alarm_poller()
-            print("[alarm-poller] stopped")
-        except Exception as e:
-            print(f"⚠️ error al detener alarm-poller: {e}")
+@app.get("/__migrations")
+def migrations_status():
+    from app.core import migrate as schema_migrate
+    return schema_migrate.status()
+
+@app.get("/__ingest_queue")
+def ingest_queue_status():
+    from app.services import ingest_queue
+    return ingest_queue.status()
+
+@app.get("/__partitions")
+def partitions_status():
+    from app.services import partitions
+    return {**partitions.status(), "partitions": partitions.list_partitions()}
+
+@app.get("/__retention")
+def retention_status():
+    from app.services import retention
+    return retention.status()
+
+@app.get("/__command_expiry")
+def command_expiry_status():
+    from app.services import command_expiry
+    return command_expiry.status()
+
+@app.get("/__leader")
+def leader_status():
+    """Si este proceso es el líder de los jobs de fondo, quién lo es si no, y sus jobs."""
+    from app.services import leader
+    return leader.status()
+
+@app.get("/__presence")
+def presence_status():
+    """Cache de presencia WS de este worker y su sync con device_presence."""
+    from app.services import presence_store
+    return presence_store.status()
+
+@app.get("/__ws")
+def ws_status():
+    """Conexiones WS de este worker, colas de salida y push de comandos."""
+    from app.services import ws_manager
+    return ws_manager.status()
 
 # ===== Endpoints de diagnóstico del poller =====
 @app.get("/__alarm_poller_status")
@@ -262,63 +472,3 @@ def poller_status():
         "sleep_empty": sleep_empty,
         "sleep_busy": sleep_busy,
     }
-
-@app.post("/__alarm_poller_stop")
-def poller_stop():
-    if _HAS_ALARM_POLLER and callable(stop_alarm_poller):
-        try:
-            stop_alarm_poller()
-            return {"stopped": True}
-        except Exception as e:
-            return {"stopped": False, "error": str(e)}
-    return {"stopped": False, "error": "poller no disponible"}
-
-# ===== Qué versión de alarms_eval está cargada =====
-@app.get("/__which_alarms_eval")
-def which_alarms_eval():
-    import importlib
-    try:
-        mod = importlib.import_module("app.services.alarms_eval")
-        return {
-            "file": getattr(mod, "__file__", None),
-            "version": getattr(mod, "__VERSION__", None),
-            "has_eval": hasattr(mod, "eval_tank_alarm"),
-            "is_callable": callable(getattr(mod, "eval_tank_alarm", None)),
-        }
-    except Exception as e:
-        return {"error": str(e)}
-
-# ===== Qué versión de alarm_events está cargada =====
-@app.get("/__which_alarm_events")
-def which_alarm_events():
-    import importlib, inspect
-    try:
-        mod = importlib.import_module("app.services.alarm_events")
-        try:
-            src = inspect.getsource(mod._notify)
-            uses_pg = "pg_notify(" in src
-            preview = src.strip().splitlines()[:5]
-        except Exception:
-            uses_pg = None
-            preview = ["<no source>"]
-        return {
-            "file": getattr(mod, "__file__", None),
-            "version": getattr(mod, "__VERSION__", None),
-            "uses_pg_notify": uses_pg,
-            "notify_src_preview": preview
-        }
-    except Exception as e:
-        return {"error": str(e)}
-
-@app.post("/__diag_publish")
-def __diag_publish(payload: dict = Body(...)):
-    """
-    Empuja un evento a alarm_events._notify(payload).
-    Útil para probar el template de Telegram sin depender de otros módulos.
-    """
-    try:
-        from app.services import alarm_events
-        alarm_events._notify(payload)
-        return {"ok": True, "published": payload}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"publish failed: {e}")
@@ -0,0 +1,127 @@
+-- 0001: esquema que el código ya asumía y que initdb/01-schema.sql no crea
+-- (se había agregado a mano en prod). Idempotente: en una DB que ya lo tiene
+-- no cambia nada.
+do $$ begin
+  if not exists (select 1 from pg_type where typname = 'tank_material') then
+    create type tank_material as enum ('plastico', 'hormigon', 'acero', 'fibra', 'otro');
+  end if;
+end $$;
+
+alter table tanks add column if not exists capacity_m3 numeric;
+alter table tanks add column if not exists height_m numeric;
+alter table tanks add column if not exists diameter_m numeric;
+alter table tanks add column if not exists material tank_material;
+alter table tanks add column if not exists fluid text;
+alter table tanks add column if not exists install_year int;
+update tanks set capacity_m3 = capacity_liters / 1000.0 where capacity_m3 is null and capacity_liters is not null;
+
+alter table pump_readings add column if not exists control_mode text;
+alter table pump_readings add column if not exists manual_lockout boolean;
+
+-- device_id lógico (string) en lecturas
+do $$ begin
+  if (select data_type from information_schema.columns
+       where table_schema = 'public' and table_name = 'tank_readings' and column_name = 'device_id') = 'bigint' then
+    alter table tank_readings drop constraint if exists tank_readings_device_id_fkey;
+    alter table tank_readings alter column device_id type text using device_id::text;
+  end if;
+  if (select data_type from information_schema.columns
+       where table_schema = 'public' and table_name = 'pump_readings' and column_name = 'device_id') = 'bigint' then
+    alter table pump_readings drop constraint if exists pump_readings_device_id_fkey;
+    alter table pump_readings alter column device_id type text using device_id::text;
+  end if;
+end $$;
+
+create table if not exists tank_config(
+  tank_id bigint primary key references tanks(id) on delete cascade,
+  low_pct numeric,
+  low_low_pct numeric,
+  high_pct numeric,
+  high_high_pct numeric,
+  updated_by bigint,
+  updated_at timestamptz not null default now()
+);
+
+create or replace view v_tanks_with_config as
+select t.id, t.name, t.capacity_m3, t.height_m, t.diameter_m, t.location_text, t.created_at,
+       c.low_pct, c.low_low_pct, c.high_pct, c.high_high_pct
+  from tanks t
+  left join tank_config c on c.tank_id = t.id;
+
+create table if not exists pump_config(
+  pump_id bigint primary key references pumps(id) on delete cascade,
+  drive_type text check (drive_type in ('direct', 'soft', 'vfd')),
+  remote_enabled boolean not null default false,
+  vfd_min_speed_pct int check (vfd_min_speed_pct between 0 and 100),
+  vfd_max_speed_pct int check (vfd_max_speed_pct between 0 and 100),
+  vfd_default_speed_pct int check (vfd_default_speed_pct between 0 and 100),
+  updated_at timestamptz not null default now()
+);
+
+create or replace view v_pumps_with_config as
+select p.id, p.name, p.model, p.max_flow_lpm,
+       coalesce(c.drive_type, 'direct') as drive_type,
+       coalesce(c.remote_enabled, false) as remote_enabled,
+       c.vfd_min_speed_pct, c.vfd_max_speed_pct, c.vfd_default_speed_pct
+  from pumps p
+  left join pump_config c on c.pump_id = p.id;
+
+create table if not exists alarms(
+  id bigserial primary key,
+  asset_type text not null,
+  asset_id bigint not null,
+  code text not null,
+  severity text not null check (severity in ('critical', 'warning', 'info')),
+  message text,
+  ts_raised timestamptz not null default now(),
+  ts_cleared timestamptz,
+  ack_by text,
+  ts_ack timestamptz,
+  is_active boolean not null default true,
+  extra jsonb,
+  telegram boolean not null default true,
+  tg_notified_at timestamptz
+);
+
+create table if not exists audit_events(
+  id bigserial primary key,
+  ts timestamptz not null default now(),
+  "user" text,
+  role text,
+  action text,
+  asset text,
+  details jsonb,
+  result text,
+  domain text,
+  asset_type text,
+  asset_id bigint,
+  code text,
+  severity text,
+  state text
+);
+
+create table if not exists tank_commands(
+  id bigserial primary key,
+  tank_id bigint not null references tanks(id) on delete cascade,
+  cmd text not null check (cmd in ('SET_VALVE','SET_LEAK','SET_NOISE','SET_TANK_LEVEL','SCENARIO','SET_PERIODS')),
+  payload jsonb,
+  status text not null default 'queued' check (status in ('queued','sent','acked','failed','expired')),
+  requested_by text,
+  ts_created timestamptz not null default now(),
+  ts_sent timestamptz,
+  ts_acked timestamptz,
+  error text
+);
+
+create table if not exists pump_commands(
+  id bigserial primary key,
+  pump_id bigint not null references pumps(id) on delete cascade,
+  cmd text not null check (cmd in ('START','STOP','AUTO','MAN','SPEED')),
+  payload jsonb,
+  status text not null default 'queued' check (status in ('queued','sent','acked','failed','expired')),
+  requested_by text,
+  ts_created timestamptz not null default now(),
+  ts_sent timestamptz,
+  ts_acked timestamptz,
+  error text
+);
@@ -0,0 +1,13 @@
+-- Ingest idempotente: registro de claves ya procesadas.
+-- Cada lectura que llega con Idempotency-Key o (device_id, seq) reserva su clave
+-- acá en el MISMO statement que inserta la lectura (ON CONFLICT DO NOTHING), así
+-- un reintento del device no duplica filas en tank_readings/pump_readings.
+-- La tabla es chica (solo lecturas con clave) y se puede podar por ts_first.
+create table if not exists ingest_dedupe(
+  scope text not null,            -- 'tank' | 'pump'
+  dedupe_key text not null,       -- 'idem:<Idempotency-Key>' | 'seq:<device_id>:<seq>'
+  reading_id bigint not null,
+  ts_first timestamptz not null default now(),
+  primary key (scope, dedupe_key)
+);
+create index if not exists idx_ingest_dedupe_ts on ingest_dedupe(ts_first);
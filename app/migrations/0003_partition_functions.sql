@@ -0,0 +1,67 @@
+-- Particionado mensual por rango de ts para tank_readings y pump_readings:
+-- funciones de mantenimiento. La conversión de las tablas la hace 0004.
+--
+-- - Una partición por mes (UTC): <tabla>_yYYYYmMM, rango [1° del mes, 1° del mes siguiente).
+-- - Sin partición DEFAULT a propósito: con DEFAULT el planner no puede usar
+--   "ordered append" y el ORDER BY ts DESC LIMIT de latest/history deja de
+--   cortar en la partición más nueva. app/services/partitions.py crea los
+--   meses futuros (PARTITION_MONTHS_AHEAD) al arrancar y periódicamente.
+-- - La PK pasa a (id, ts): en una tabla particionada la PK tiene que incluir
+--   la clave de partición. id sigue saliendo de la misma secuencia.
+-- - Retención: drop_monthly_partitions_before() hace DETACH + DROP de meses
+--   enteros (sin DELETE fila a fila, sin bloat, sin vacuum).
+
+create or replace function public.month_partition_name(p_parent regclass, p_month date)
+returns text language sql stable as $$
+  select (select relname from pg_class where oid = p_parent) || '_y' || to_char(p_month, 'YYYY') || 'm' || to_char(p_month, 'MM');
+$$;
+
+-- Crea (si faltan) las particiones mensuales que cubren [p_from, p_to].
+-- Devuelve cuántas creó.
+create or replace function public.ensure_monthly_partitions(p_parent regclass, p_from date, p_to date)
+returns int language plpgsql as $$
+declare
+  m date := date_trunc('month', p_from)::date;
+  part text;
+  created int := 0;
+  nsp text;
+begin
+  select n.nspname into nsp from pg_class c join pg_namespace n on n.oid = c.relnamespace where c.oid = p_parent;
+  while m <= p_to loop
+    part := public.month_partition_name(p_parent, m);
+    if to_regclass(format('%I.%I', nsp, part)) is null then
+      execute format(
+        'create table %I.%I partition of %s for values from (%L) to (%L)',
+        nsp, part, p_parent, m::timestamp at time zone 'UTC', (m + interval '1 month')::timestamp at time zone 'UTC'
+      );
+      created := created + 1;
+    end if;
+    m := (m + interval '1 month')::date;
+  end loop;
+  return created;
+end $$;
+
+-- DETACH + DROP de los meses que terminan antes de p_cutoff. Devuelve los nombres.
+create or replace function public.drop_monthly_partitions_before(p_parent regclass, p_cutoff timestamptz)
+returns setof text language plpgsql as $$
+declare
+  r record;
+  month_start date;
+begin
+  for r in
+    select c.oid::regclass as part, c.relname
+      from pg_inherits i
+      join pg_class c on c.oid = i.inhrelid
+     where i.inhparent = p_parent
+       and c.relname ~ '_y[0-9]{4}m[0-9]{2}$'
+     order by c.relname
+  loop
+    month_start := make_date(substring(r.relname from '_y([0-9]{4})m[0-9]{2}$')::int,
+                             substring(r.relname from '_y[0-9]{4}m([0-9]{2})$')::int, 1);
+    if month_start + interval '1 month' <= p_cutoff then
+      execute format('alter table %s detach partition %s', p_parent, r.part);
+      execute format('drop table %s', r.part);
+      return next r.relname;
+    end if;
+  end loop;
+end $$;
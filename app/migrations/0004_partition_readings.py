@@ -0,0 +1,110 @@
+# app/migrations/0004_partition_readings.py
+"""
+Convierte tank_readings / pump_readings en particionadas por mes sin cortar
+el ingest:
+
+  1. crea <tabla>_part (misma forma, PK (id, ts), FKs, índices, particiones
+     desde el mes más viejo hasta MONTHS_AHEAD adelante)
+  2. copia por lotes de id con un commit por lote; lecturas y escrituras
+     siguen contra la tabla original (si se corta, retoma desde max(id))
+  3. transacción corta: LOCK EXCLUSIVE (bloquea escrituras, no lecturas),
+     copia lo que entró durante el paso 2, pasa la secuencia, DROP de la
+     original y renombra _part → <tabla> (tabla, particiones, índices, constraints)
+
+Las lecturas son append-only (nadie hace UPDATE), así que la copia por rango
+de id más el repaso final bajo lock no pierde nada.
+"""
+from __future__ import annotations
+
+import logging
+import re
+import time
+
+from app.core.migrate import BATCH_PAUSE_SEC, BATCH_ROWS, Migrator
+
+log = logging.getLogger("migrate")
+
+TABLES = ("tank_readings", "pump_readings")
+MONTHS_AHEAD = 3
+
+
+def _prepare(m: Migrator, table: str, part: str) -> None:
+    fks = [r[0] for r in m.execute("""
+        SELECT pg_get_constraintdef(oid) FROM pg_constraint
+         WHERE conrelid = to_regclass(%s) AND contype = 'f'
+    """, (f"public.{table}",)).fetchall()]
+    idx = m.execute("""
+        SELECT c.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+         WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary
+    """, (f"public.{table}",)).fetchall()
+
+    m.execute(f"CREATE TABLE public.{part} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+              f"PARTITION BY RANGE (ts)")
+    m.execute(f"ALTER TABLE public.{part} ADD PRIMARY KEY (id, ts)")
+    for d in fks:
+        m.execute(f"ALTER TABLE public.{part} ADD {d}")
+    for name, d in idx:
+        d = d.replace(f"INDEX {name} ON ", f"INDEX {name}_part ON ", 1)
+        m.execute(re.sub(r" ON (ONLY )?public\.\S+ ", f" ON public.{part} ", d, count=1))
+    m.execute(f"""
+        SELECT public.ensure_monthly_partitions('public.{part}'::regclass,
+                 COALESCE((SELECT min(ts) FROM public.{table}), now())::date,
+                 (now() + make_interval(months => {MONTHS_AHEAD}))::date)
+    """)
+
+
+def _swap(m: Migrator, table: str, part: str, copied: int) -> None:
+    seq = m.scalar("SELECT pg_get_serial_sequence(%s, 'id')", (f"public.{table}",))
+    m.execute(f"LOCK TABLE public.{table} IN EXCLUSIVE MODE")
+    # El lock espera a los INSERT en vuelo: ya está todo commiteado. Se repasa
+    # también el último lote por si algún id <= copied commiteó después de
+    # copiarlo (nextval se asigna antes del commit).
+    n = m.execute(f"INSERT INTO public.{part} SELECT * FROM public.{table} WHERE id > %s ON CONFLICT DO NOTHING",
+                  (max(copied - BATCH_ROWS, 0),)).rowcount
+    log.info("%s: %s filas nuevas copiadas bajo lock", table, n)
+    if seq:
+        m.execute(f"ALTER SEQUENCE {seq} OWNED BY public.{part}.id")
+    m.execute(f"DROP TABLE public.{table}")
+    m.execute(f"ALTER TABLE public.{part} RENAME TO {table}")
+
+    for p in m.partitions(table):
+        if p.startswith(part + "_"):
+            m.execute(f"ALTER TABLE public.{p} RENAME TO {table}{p[len(part):]}")
+    for (con,) in m.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) "
+                            "AND contype IN ('p', 'f')", (f"public.{table}",)).fetchall():
+        if con.startswith(part + "_"):
+            m.execute(f"ALTER TABLE public.{table} RENAME CONSTRAINT {con} TO {table}{con[len(part):]}")
+    for (name,) in m.execute("SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                             "WHERE i.indrelid = to_regclass(%s) AND NOT i.indisprimary",
+                             (f"public.{table}",)).fetchall():
+        if name.endswith("_part"):
+            m.execute(f"ALTER INDEX public.{name} RENAME TO {name[:-len('_part')]}")
+
+
+def _convert(m: Migrator, table: str) -> None:
+    if m.is_partitioned(table):
+        return
+    part = f"{table}_part"
+    if m.scalar("SELECT to_regclass(%s) IS NULL", (f"public.{part}",)):
+        m.atomic(lambda mg: _prepare(mg, table, part))
+
+    copied = m.scalar(f"SELECT COALESCE(max(id), 0) FROM public.{part}")
+    hi = m.scalar(f"SELECT COALESCE(max(id), 0) FROM public.{table}")
+    t0 = time.perf_counter()
+    while copied < hi:
+        upto = min(copied + BATCH_ROWS, hi)
+        m.execute(f"INSERT INTO public.{part} SELECT * FROM public.{table} WHERE id > %s AND id <= %s",
+                  (copied, upto))
+        copied = upto
+        if BATCH_PAUSE_SEC:
+            time.sleep(BATCH_PAUSE_SEC)
+    log.info("%s: copia por lotes hasta id %s en %.1fs", table, hi, time.perf_counter() - t0)
+
+    m.atomic(lambda mg: _swap(mg, table, part, copied))
+    m.execute(f"ANALYZE public.{table}")
+    log.info("%s: particionada", table)
+
+
+def up(m: Migrator) -> None:
+    for table in TABLES:
+        _convert(m, table)
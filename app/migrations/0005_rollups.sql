@@ -0,0 +1,77 @@
+-- Rollups de telemetría + progreso del job de retención (app/services/retention.py).
+--
+-- Escalera de retención (configurable por env):
+--   crudo (tank_readings / pump_readings)  → RETENTION_RAW_DAYS   (90 d)
+--   agregados de 1 minuto (*_1m)           → RETENTION_1M_DAYS    (2 años)
+--   agregados de 1 hora   (*_1h)           → RETENTION_1H_DAYS    (0 = para siempre)
+--
+-- Los agregados se recalculan completos por bucket (ON CONFLICT DO UPDATE), así
+-- que re-procesar una ventana es idempotente. Promedios del 1h = promedio de
+-- los 1m ponderado por n.
+
+create table if not exists tank_readings_1m(
+  tank_id bigint not null references tanks(id) on delete cascade,
+  bucket timestamptz not null,
+  n int not null,
+  level_avg double precision,
+  level_min double precision,
+  level_max double precision,
+  volume_avg double precision,
+  temperature_avg double precision,
+  primary key (tank_id, bucket)
+);
+create index if not exists idx_tank_readings_1m_bucket on tank_readings_1m(bucket);
+
+create table if not exists tank_readings_1h(
+  tank_id bigint not null references tanks(id) on delete cascade,
+  bucket timestamptz not null,
+  n int not null,
+  level_avg double precision,
+  level_min double precision,
+  level_max double precision,
+  volume_avg double precision,
+  temperature_avg double precision,
+  primary key (tank_id, bucket)
+);
+
+create table if not exists pump_readings_1m(
+  pump_id bigint not null references pumps(id) on delete cascade,
+  bucket timestamptz not null,
+  n int not null,
+  on_ratio double precision,          -- fracción de muestras con is_on
+  flow_avg double precision,
+  flow_max double precision,
+  pressure_avg double precision,
+  pressure_max double precision,
+  voltage_avg double precision,
+  current_avg double precision,
+  current_max double precision,
+  primary key (pump_id, bucket)
+);
+create index if not exists idx_pump_readings_1m_bucket on pump_readings_1m(bucket);
+
+create table if not exists pump_readings_1h(
+  pump_id bigint not null references pumps(id) on delete cascade,
+  bucket timestamptz not null,
+  n int not null,
+  on_ratio double precision,
+  flow_avg double precision,
+  flow_max double precision,
+  pressure_avg double precision,
+  pressure_max double precision,
+  voltage_avg double precision,
+  current_avg double precision,
+  current_max double precision,
+  primary key (pump_id, bucket)
+);
+
+-- Marca de agua por job: todo lo anterior a watermark ya está compactado.
+create table if not exists retention_progress(
+  job text primary key,               -- 'tank_readings:1m', 'tank_readings_1m:1h', ...
+  watermark timestamptz,
+  rows_total bigint not null default 0,
+  updated_at timestamptz not null default now()
+);
+
+-- Borrado por lotes de audit_events por antigüedad (heartbeats incluidos)
+create index if not exists idx_audit_events_ts on audit_events(ts);
@@ -0,0 +1,38 @@
+# app/migrations/0006_indexes.py
+"""
+Índices a medida de las consultas calientes. bench/plan_check.py verifica que
+los planes los sigan usando.
+
+Todos se crean online (Migrator.create_index): CONCURRENTLY en las tablas
+comunes y, en las particionadas (lecturas), partición por partición con
+CONCURRENTLY + ATTACH al índice del padre.
+"""
+from app.core.migrate import Migrator
+
+
+def up(m: Migrator) -> None:
+    # --- Lecturas ---------------------------------------------------------
+    # latest/history ordenan por (ts DESC, id DESC): con id en la clave el
+    # LIMIT sale directo del índice, sin Incremental Sort.
+    m.create_index("idx_tank_readings_latest", "tank_readings", "(tank_id, ts desc, id desc)")
+    m.drop_index("idx_tank_readings_tank_ts")
+
+    # BRIN sobre ts: rangos de tiempo sin filtrar por tanque (rollups de
+    # retención, exports). Ocupa KB por partición; sirve porque ts crece con
+    # la inserción (orden físico ≈ orden temporal).
+    m.create_index("brin_tank_readings_ts", "tank_readings", "using brin (ts) with (pages_per_range = 32)")
+    m.create_index("brin_pump_readings_ts", "pump_readings", "using brin (ts) with (pages_per_range = 32)")
+
+    # --- Alarmas (parciales: solo las activas / pendientes, que son pocas) --
+    # Estado de alarmas de un tanque en el ingest (repos/hot ACTIVE_ALARMS_SQL):
+    # cubriente, el SELECT sale por Index Only Scan.
+    m.create_index("idx_alarms_asset_active", "alarms",
+                   "(asset_type, asset_id, ts_raised desc, id desc) include (code, severity, message) where is_active")
+    # GET /alarms (activas por ts_raised)
+    m.create_index("idx_alarms_active_ts", "alarms", "(ts_raised desc) where is_active")
+    # alarm_poller: pendientes de Telegram
+    m.create_index("idx_alarms_tg_pending", "alarms", "(ts_raised) where tg_notified_at is null and telegram")
+
+    # --- Auditoría (repos/audit.list_audit filtra por asset y ordena por ts) --
+    m.create_index("idx_audit_events_asset_ts", "audit_events", "(asset_type, asset_id, ts desc, id desc)")
+    m.create_index("idx_audit_events_code_ts", "audit_events", "(code, ts desc) where code is not null")
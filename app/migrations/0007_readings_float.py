@@ -0,0 +1,102 @@
+# app/migrations/0007_readings_float.py
+"""
+Métricas de lecturas de numeric a real / double precision.
+
+numeric ocupa 5-12 bytes por valor según los dígitos (los devices mandan
+floats con 13-15 decimales) y cada lectura vuelve como Decimal; real ocupa 4
+fijos y double 8, y psycopg los devuelve como float sin conversión.
+
+  - level_percent, temperature_c, métricas de bomba: real (~7 dígitos
+    significativos, sobra para sensores)
+  - volume_l: double precision (volúmenes de 10^6 l con decimales)
+
+ALTER COLUMN TYPE reescribiría todas las particiones bajo ACCESS EXCLUSIVE
+(ingest y lecturas parados lo que dure). En su lugar, online:
+
+  1. columnas <col>__new con el tipo nuevo (ADD COLUMN sin default: solo
+     catálogo) y un trigger BEFORE INSERT OR UPDATE que las completa en cada
+     lectura que entra mientras tanto
+  2. backfill partición por partición, por lotes de id con commit por lote
+     (re-ejecutable: solo toca filas con <col>__new sin completar)
+  3. transacción corta: DROP de las columnas viejas, RENAME de las nuevas y
+     DROP del trigger; solo catálogo, el lock dura milisegundos
+
+El espacio de las columnas viejas no se libera (DROP COLUMN no reescribe):
+se va con las particiones que vence la retención. Idempotente: solo toca las
+columnas que siguen en numeric.
+"""
+import logging
+
+from app.core.migrate import Migrator
+
+log = logging.getLogger("migrate")
+
+TYPES = {
+    "tank_readings": {
+        "level_percent": "real",
+        "volume_l": "double precision",
+        "temperature_c": "real",
+    },
+    "pump_readings": {
+        "flow_lpm": "real",
+        "pressure_bar": "real",
+        "voltage_v": "real",
+        "current_a": "real",
+    },
+}
+
+
+def _pending(m: Migrator, table: str, cols) -> list:
+    return [r[0] for r in m.execute("""
+        SELECT column_name FROM information_schema.columns
+         WHERE table_schema = 'public' AND table_name = %s
+           AND column_name = ANY(%s) AND data_type = 'numeric'
+         ORDER BY ordinal_position
+    """, (table, list(cols))).fetchall()]
+
+
+def _prepare(m: Migrator, table: str, pending: list, types: dict) -> None:
+    fn = f"public.{table}_float_sync"
+    adds = ", ".join(f"ADD COLUMN IF NOT EXISTS {c}__new {types[c]}" for c in pending)
+    sets = "\n".join(f"    NEW.{c}__new := NEW.{c};" for c in pending)
+
+    def run(mg: Migrator) -> None:
+        mg.execute(f"ALTER TABLE public.{table} {adds}")
+        mg.execute(f"""
+            CREATE OR REPLACE FUNCTION {fn}() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+            {sets}
+                RETURN NEW;
+            END $$
+        """)
+        mg.execute(f"DROP TRIGGER IF EXISTS trg_{table}_float_sync ON public.{table}")
+        mg.execute(f"CREATE TRIGGER trg_{table}_float_sync BEFORE INSERT OR UPDATE ON public.{table} "
+                   f"FOR EACH ROW EXECUTE FUNCTION {fn}()")
+
+    m.atomic(run)
+
+
+def _swap(m: Migrator, table: str, pending: list) -> None:
+    def run(mg: Migrator) -> None:
+        mg.execute(f"DROP TRIGGER IF EXISTS trg_{table}_float_sync ON public.{table}")
+        mg.execute(f"ALTER TABLE public.{table} " + ", ".join(f"DROP COLUMN {c}" for c in pending))
+        for c in pending:
+            mg.execute(f"ALTER TABLE public.{table} RENAME COLUMN {c}__new TO {c}")
+        mg.execute(f"DROP FUNCTION IF EXISTS public.{table}_float_sync()")
+
+    m.atomic(run)
+
+
+def up(m: Migrator) -> None:
+    for table, cols in TYPES.items():
+        pending = _pending(m, table, cols)
+        if not pending:
+            continue
+        _prepare(m, table, pending, cols)
+        set_sql = ", ".join(f"{c}__new = {c}" for c in pending)
+        where_sql = " OR ".join(f"({c} IS NOT NULL AND {c}__new IS NULL)" for c in pending)
+        for part in m.partitions(table) or [table]:
+            m.backfill(part, set_sql, where_sql)
+        _swap(m, table, pending)
+        m.execute(f"ANALYZE public.{table}")
+        log.info("%s: %s → float", table, ", ".join(pending))
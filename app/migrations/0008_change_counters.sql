@@ -0,0 +1,40 @@
+-- Contadores de cambios para GET condicional (ETag / 304, app/core/conditional.py).
+--
+-- Un trigger por fila en cada tabla "de catálogo" incrementa la versión de su
+-- scope en la misma transacción que el cambio: la API compara el ETag del
+-- cliente contra esta versión (una fila, PK) sin correr la consulta completa.
+-- Por fila y no por statement: un UPDATE que no toca filas (p. ej. el poller
+-- de alarmas sin pendientes) no invalida nada.
+-- Las lecturas NO llevan trigger (camino caliente del ingest): su token es el
+-- id de la última lectura del tanque, que sale del índice (tank_id, ts, id).
+
+create table if not exists change_counters(
+  scope text primary key,
+  version bigint not null default 0,
+  updated_at timestamptz not null default now()
+);
+
+insert into change_counters(scope)
+values ('alarms'), ('tanks'), ('tank_config'), ('pumps'), ('pump_config')
+on conflict (scope) do nothing;
+
+create or replace function public.bump_change_counter()
+returns trigger language plpgsql as $$
+begin
+  update public.change_counters
+     set version = version + 1, updated_at = now()
+   where scope = TG_ARGV[0];
+  return null;
+end $$;
+
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['alarms', 'tanks', 'tank_config', 'pumps', 'pump_config'] loop
+    execute format('drop trigger if exists trg_%s_changes on public.%I', t, t);
+    execute format(
+      'create trigger trg_%s_changes after insert or update or delete on public.%I '
+      'for each row execute function public.bump_change_counter(%L)', t, t, t);
+  end loop;
+end $$;
@@ -0,0 +1,16 @@
+-- Presencia de devices por WebSocket compartida entre workers/instancias
+-- (app/services/presence_store.py). Cada proceso escribe las conexiones que
+-- tiene abiertas en lotes (upsert, gana el last_seen más nuevo) y lee los
+-- cambios de los demás por updated_at.
+--
+-- UNLOGGED: no genera WAL (un heartbeat por device cada pocos segundos) y se
+-- vacía si Postgres se cae; es estado efímero que los sockets reconstruyen
+-- solos. Tampoco llega a las réplicas: se lee siempre del primario.
+create unlogged table if not exists device_presence(
+  device_id text primary key,
+  online boolean not null,
+  last_seen timestamptz not null,
+  worker text,                           -- host:pid que tiene (o tuvo) el socket
+  updated_at timestamptz not null default now()
+);
+create index if not exists idx_device_presence_updated on device_presence(updated_at);
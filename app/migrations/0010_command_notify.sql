@@ -0,0 +1,27 @@
+-- Aviso de comandos nuevos a los workers (app/services/ws_manager.py).
+--
+-- Un trigger por fila en tank_commands / pump_commands publica
+-- pg_notify('device_commands', {"kind", "id", "asset_id"}) en la misma
+-- transacción que el INSERT: el aviso sale recién en el commit, cualquiera
+-- sea el camino que encoló el comando (API, SQL a mano, scripts). El worker
+-- que tiene conectado al device lo reclama (queued → sent) y lo empuja por
+-- el WebSocket. El payload lleva solo ids: el comando se lee de la tabla.
+
+create or replace function public.notify_device_command()
+returns trigger language plpgsql as $$
+begin
+  perform pg_notify('device_commands', json_build_object(
+    'kind', TG_ARGV[0],
+    'id', NEW.id,
+    'asset_id', (to_jsonb(NEW) ->> (TG_ARGV[0] || '_id'))::bigint
+  )::text);
+  return null;
+end $$;
+
+drop trigger if exists trg_tank_commands_notify on public.tank_commands;
+create trigger trg_tank_commands_notify after insert on public.tank_commands
+  for each row execute function public.notify_device_command('tank');
+
+drop trigger if exists trg_pump_commands_notify on public.pump_commands;
+create trigger trg_pump_commands_notify after insert on public.pump_commands
+  for each row execute function public.notify_device_command('pump');
@@ -0,0 +1,30 @@
+# app/migrations/0011_command_ttl.py
+"""
+Vencimiento de comandos (tank_commands / pump_commands).
+
+  - expires_at: hasta cuándo el comando puede entregarse y confirmarse. La
+    API lo fija por comando (ttl_sec o COMMAND_TTL_SEC); el default de la
+    columna cubre los INSERT a mano. Se agrega sin default y el default se
+    pone aparte: ADD COLUMN con un default volátil (now()) reescribiría la
+    tabla. Los pendientes de antes vencen a los 10 min de creados.
+  - Índices parciales solo sobre pendientes (queued/sent), que son pocos: no
+    crecen con el histórico.
+      *_pending  (asset, status, ts_created): GET /tanks|pumps/{id}/commands?status=queued
+      *_expiry   (expires_at): el barrido de services/command_expiry.py y los
+                 reclamos del push / long-poll
+"""
+from app.core.migrate import Migrator
+
+TABLES = {"tank_commands": "tank_id", "pump_commands": "pump_id"}
+PENDING = "status in ('queued', 'sent')"
+
+
+def up(m: Migrator) -> None:
+    for table, asset in TABLES.items():
+        m.execute(f"ALTER TABLE public.{table} ADD COLUMN IF NOT EXISTS expires_at timestamptz")
+        m.execute(f"ALTER TABLE public.{table} ALTER COLUMN expires_at SET DEFAULT now() + interval '10 minutes'")
+        m.backfill(table, "expires_at = ts_created + interval '10 minutes'",
+                   f"expires_at IS NULL AND {PENDING}")
+
+        m.create_index(f"idx_{table}_pending", table, f"({asset}, status, ts_created) where {PENDING}")
+        m.create_index(f"idx_{table}_expiry", table, f"(expires_at) where {PENDING}")
@@ -0,0 +1,26 @@
+# app/migrations/0012_alarms_active_unique.py
+"""
+Una sola alarma activa por (asset_type, asset_id, code).
+
+alarms_eval lee las activas junto con el insert de la lectura y decide
+después, en background: dos lecturas seguidas fuera de rango podían ver las
+dos "ninguna activa" y levantar dos alarmas (y dos mensajes de Telegram). Con
+este índice el segundo INSERT ... ON CONFLICT DO NOTHING no inserta nada.
+
+Antes de crearlo se limpian los duplicados que ya existan: queda activa la
+primera (menor id) de cada grupo, las demás pasan a limpias con el mismo
+ts_raised como ts_cleared.
+"""
+from app.core.migrate import Migrator
+
+_CLEAR_DUPLICATES = """
+    UPDATE public.alarms a SET is_active = false, ts_cleared = a.ts_raised
+      FROM (SELECT id, row_number() OVER (PARTITION BY asset_type, asset_id, code ORDER BY id) AS n
+              FROM public.alarms WHERE is_active) d
+     WHERE a.id = d.id AND d.n > 1
+"""
+
+
+def up(m: Migrator) -> None:
+    m.execute(_CLEAR_DUPLICATES)
+    m.create_index("uq_alarms_active_code", "alarms", "(asset_type, asset_id, code) where is_active", unique=True)
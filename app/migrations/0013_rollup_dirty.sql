@@ -0,0 +1,44 @@
+-- Lecturas tardías en los rollups (app/services/retention.py).
+--
+-- El rollup 1m avanza una marca de agua hasta now() - RETENTION_ROLLUP_DELAY_MIN:
+-- una lectura que llega después con un ts anterior a la marca (store-and-forward
+-- de un device que estuvo offline) no la vería nunca, y a los 90 días la poda
+-- del crudo la borraría sin compactar. Un trigger marca la hora de esas
+-- lecturas en rollup_dirty y el job la vuelve a agregar (el upsert recalcula
+-- buckets completos, así que re-procesar es idempotente); al hacerlo marca la
+-- misma hora para el rollup 1h.
+--
+-- El WHEN filtra en el trigger mismo, sin llamar a la función: las lecturas al
+-- día (casi todas) no pagan nada. El umbral (5 min) tiene que ser <= al delay
+-- del rollup; retention.py no acepta un delay menor.
+-- DO UPDATE y no DO NOTHING: toma el lock de la fila, así una marca que el job
+-- está consumiendo no se pierde (el INSERT espera y la vuelve a crear).
+
+create table if not exists rollup_dirty(
+  src text not null,                  -- tabla fuente del rollup: 'tank_readings', 'tank_readings_1m', ...
+  bucket timestamptz not null,        -- hora a re-agregar
+  marked_at timestamptz not null default now(),
+  primary key (src, bucket)
+);
+
+create or replace function public.mark_rollup_dirty()
+returns trigger language plpgsql as $$
+begin
+  insert into public.rollup_dirty(src, bucket)
+  values (TG_ARGV[0], date_trunc('hour', NEW.ts))
+  on conflict (src, bucket) do update set marked_at = excluded.marked_at;
+  return null;
+end $$;
+
+do $$
+declare
+  t text;
+begin
+  foreach t in array array['tank_readings', 'pump_readings'] loop
+    execute format('drop trigger if exists trg_%s_late on public.%I', t, t);
+    execute format(
+      'create trigger trg_%s_late after insert on public.%I for each row '
+      'when (NEW.ts < now() - interval ''5 minutes'') '
+      'execute function public.mark_rollup_dirty(%L)', t, t, t);
+  end loop;
+end $$;
@@ -0,0 +1,14 @@
+# app/migrations/0014_audit_code_id.py
+"""
+idx_audit_events_code_ts cubría (code, ts desc), pero list_audit ordena por
+ts DESC, id DESC: con el filtro por code el planner prefería recorrer
+idx_audit_events_ts entero y ordenar de nuevo (Incremental Sort). El índice
+nuevo agrega id desc, igual que idx_audit_events_asset_ts; el viejo sobra.
+Lo detectó bench/plan_check.py (tests/test_query_plans.py).
+"""
+from app.core.migrate import Migrator
+
+
+def up(m: Migrator) -> None:
+    m.create_index("idx_audit_events_code_ts_id", "audit_events", "(code, ts desc, id desc) where code is not null")
+    m.drop_index("idx_audit_events_code_ts")
@@ -0,0 +1,17 @@
+-- Aviso también cuando un comando VUELVE a 'queued' (app/services/ws_manager.py).
+--
+-- 0010 avisa solo en el INSERT. Un comando que se devolvió a 'queued' (envío
+-- fallido, conexión cortada sin ack) quedaba esperando al próximo catch-up
+-- (reconexión del device o del LISTEN). Con este trigger el aviso sale en el
+-- commit del UPDATE, con el mismo payload, y el worker que tiene conectado al
+-- device lo vuelve a reclamar.
+
+drop trigger if exists trg_tank_commands_requeue_notify on public.tank_commands;
+create trigger trg_tank_commands_requeue_notify after update of status on public.tank_commands
+  for each row when (NEW.status = 'queued' and OLD.status is distinct from 'queued')
+  execute function public.notify_device_command('tank');
+
+drop trigger if exists trg_pump_commands_requeue_notify on public.pump_commands;
+create trigger trg_pump_commands_requeue_notify after update of status on public.pump_commands
+  for each row when (NEW.status = 'queued' and OLD.status is distinct from 'queued')
+  execute function public.notify_device_command('pump');
@@ -0,0 +1,28 @@
+# app/migrations/0016_latest_covering.py
+"""
+Índices de latest/history cubrientes, con INCLUDE de las columnas que leen.
+
+  - tanque: idx_tank_readings_latest (0006) tenía solo la clave (tank_id,
+    ts desc, id desc); el nuevo agrega nivel, volumen, temperatura y
+    device_id. El historial en columnas (gráficos) sale por Index Only Scan;
+    latest sigue yendo al heap por raw_json, pero una sola fila.
+  - bomba: no había índice de latest en las migraciones (solo BRIN sobre ts);
+    idx_pump_readings_pump_ts existía en algunas bases de antes del baseline,
+    sin id en la clave. El nuevo cubre el historial de bombas y el token de
+    GET /pumps/{id}/latest (repos/versions).
+
+Online (Migrator.create_index, partición por partición); los viejos se
+borran después de crear los nuevos.
+"""
+from app.core.migrate import Migrator
+
+
+def up(m: Migrator) -> None:
+    m.create_index("idx_tank_readings_latest_cov", "tank_readings",
+                   "(tank_id, ts desc, id desc) include (level_percent, volume_l, temperature_c, device_id)")
+    m.drop_index("idx_tank_readings_latest")
+
+    m.create_index("idx_pump_readings_latest", "pump_readings",
+                   "(pump_id, ts desc, id desc) include (is_on, flow_lpm, pressure_bar, voltage_v, current_a,"
+                   " control_mode, manual_lockout, device_id)")
+    m.drop_index("idx_pump_readings_pump_ts")
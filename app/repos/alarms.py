@@ -4,15 +4,45 @@ from typing import Optional, Any, Dict
 from types import SimpleNamespace as NS
 from psycopg.rows import dict_row
 from app.core.db import get_conn
+from app.core.metrics import db_timed
 
 ALARM_COLS = (
     "id","asset_type","asset_id","code","severity","message",
     "ts_raised","ts_cleared","ack_by","ts_ack","is_active","extra"
 )
 
+# GET /alarms (routes/alarms); con ?active= sale de idx_alarms_active_ts
+LIST_ALL_SQL = """
+    SELECT id, asset_type, asset_id, code, severity, message,
+           ts_raised, ts_cleared, ack_by, ts_ack, is_active
+    FROM alarms
+    ORDER BY ts_raised DESC
+"""
+LIST_BY_STATE_SQL = """
+    SELECT id, asset_type, asset_id, code, severity, message,
+           ts_raised, ts_cleared, ack_by, ts_ack, is_active
+    FROM alarms
+    WHERE is_active = %s
+    ORDER BY ts_raised DESC
+"""
+
+def pending_sql(only_active: bool = True) -> str:
+    """Pendientes de Telegram para services/alarm_poller (idx_alarms_tg_pending)."""
+    return f"""
+        select id, asset_type, asset_id, code, severity, message, ts_raised
+        from public.alarms
+        where telegram = true
+          and {"is_active = true and" if only_active else ""}
+              tg_notified_at is null
+        order by ts_raised asc
+        limit %s
+        for update skip locked
+    """
+
 def _obj(row: Dict[str, Any]) -> NS:
     return NS(**row)
 
+@db_timed
 def get_active(*, asset_type: str, asset_id: int, code: str) -> Optional[NS]:
     """
     Devuelve la alarma ACTIVA más reciente para ese asset+code (o None).
@@ -29,26 +59,31 @@ def get_active(*, asset_type: str, asset_id: int, code: str) -> Optional[NS]:
         row = cur.fetchone()
         return _obj(row) if row else None
 
+@db_timed
 def create(
     *, asset_type: str, asset_id: int, code: str,
     severity: str, message: str, ts_raised,  # datetime (UTC)
     is_active: bool = True, extra: Optional[Dict[str, Any]] = None
-) -> NS:
+) -> Optional[NS]:
     """
     Inserta una alarma (activa por defecto). OJO: tu tabla valida 'severity'
     en minúscula ('critical'/'warning'/'info'); mantenelo en lower-case.
+    None si ya hay una activa con el mismo (asset_type, asset_id, code).
     """
     sql = f"""
       INSERT INTO public.alarms
         (asset_type,asset_id,code,severity,message,ts_raised,is_active,extra)
       VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+      ON CONFLICT (asset_type, asset_id, code) WHERE is_active DO NOTHING
       RETURNING {','.join(ALARM_COLS)};
     """
     with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, (asset_type, asset_id, code, severity, message, ts_raised, is_active, extra))
         conn.commit()
-        return _obj(cur.fetchone())
+        row = cur.fetchone()
+        return _obj(row) if row else None
 
+@db_timed
 def clear(alarm_id: int, *, ts_cleared):
     """
     Marca la alarma como inactiva y setea ts_cleared.
@@ -1,13 +1,15 @@
 # app/repos/audit.py  (agregar)
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
 from psycopg.rows import dict_row
-from app.core.db import get_conn
+from app.core.db import get_read_conn
+from app.core.metrics import db_timed
 
 _TABLE = "public.audit_events"
-_COLS = ("id","ts","user","role","action","asset","details","result",
+# "user" va entre comillas: sin ellas Postgres devuelve current_user, no la columna
+_COLS = ("id","ts",'"user"',"role","action","asset","details","result",
          "domain","asset_type","asset_id","code","severity","state")
 
-def list_audit(
+def list_audit_sql(
     asset_type: Optional[str] = None,
     asset_id: Optional[int] = None,
     code: Optional[str] = None,
@@ -15,7 +17,8 @@ def list_audit(
     since: Optional[str] = None,   # ISO-8601 o 'YYYY-MM-DD'
     until: Optional[str] = None,   # idem
     limit: int = 100,
-) -> List[Dict[str, Any]]:
+) -> Tuple[str, List[Any]]:
+    """SQL + params de list_audit (también lo usa bench/plan_check.py)."""
     sql = f"SELECT {','.join(_COLS)} FROM {_TABLE} WHERE 1=1"
     params: List[Any] = []
 
@@ -34,7 +37,19 @@ def list_audit(
 
     sql += " ORDER BY ts DESC, id DESC LIMIT %s"
     params.append(limit)
+    return sql, params
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+@db_timed
+def list_audit(
+    asset_type: Optional[str] = None,
+    asset_id: Optional[int] = None,
+    code: Optional[str] = None,
+    state: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    sql, params = list_audit_sql(asset_type, asset_id, code, state, since, until, limit)
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, tuple(params))
         return cur.fetchall()
@@ -0,0 +1,60 @@
+# app/repos/device_commands.py
+"""
+Comandos pendientes de un device (tank_commands + pump_commands), para el
+long-poll GET /devices/{id}/commands/next.
+
+Qué comandos son de un device (misma regla que el push por WebSocket,
+services/ws_manager.py): los de los assets cuyas últimas lecturas mandó ese
+device. ?tank_id= / ?pump_id= acotan a esos assets pero no suman otros:
+declarar un asset que reporta otro device no alcanza para llevarse sus comandos.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Sequence
+
+from app.core.db_async import get_aconn
+
+_TABLES = {"tank": ("tank_commands", "tank_readings"), "pump": ("pump_commands", "pump_readings")}
+
+# FOR UPDATE SKIP LOCKED: dos requests del mismo device (o un push por WS en
+# otro worker) nunca se llevan el mismo comando y no se esperan entre sí.
+_CLAIM_SQL = """
+    WITH picked AS (
+        SELECT c.id FROM {table} c
+         WHERE c.status = 'queued' AND (c.expires_at IS NULL OR c.expires_at > now())
+           AND {match}
+         ORDER BY c.id
+         LIMIT %(limit)s
+           FOR UPDATE SKIP LOCKED
+    )
+    UPDATE {table} t SET status = 'sent', ts_sent = now(), error = NULL
+      FROM picked
+     WHERE t.id = picked.id
+    RETURNING t.id, t.{kind}_id, t.cmd, t.payload, t.ts_created, t.expires_at
+"""
+
+_MATCH_DECLARED = "c.{kind}_id = ANY(%(ids)s) AND "
+_MATCH_REPORTER = """(SELECT r.device_id FROM {readings} r
+                       WHERE r.{kind}_id = c.{kind}_id ORDER BY r.ts DESC LIMIT 1) = %(device_id)s"""
+
+
+async def claim_next(device_id: str, tanks: Sequence[int], pumps: Sequence[int], limit: int) -> List[Dict[str, Any]]:
+    """Pasa a 'sent' hasta `limit` comandos en 'queued' del device y los devuelve (por id)."""
+    declared = {"tank": list(tanks), "pump": list(pumps)}
+    any_declared = bool(tanks or pumps)
+    out: List[Dict[str, Any]] = []
+    async with get_aconn() as conn:
+        for kind, (table, readings) in _TABLES.items():
+            if len(out) >= limit or (any_declared and not declared[kind]):
+                continue
+            match = ((_MATCH_DECLARED if any_declared else "") + _MATCH_REPORTER).format(kind=kind, readings=readings)
+            cur = await conn.execute(
+                _CLAIM_SQL.format(table=table, kind=kind, match=match),
+                {"limit": limit - len(out), "ids": declared[kind], "device_id": device_id},
+            )
+            for cmd_id, asset_id, cmd, payload, ts_created, expires_at in await cur.fetchall():
+                out.append({"kind": kind, "id": cmd_id, "asset_id": asset_id, "cmd": cmd,
+                            "payload": payload, "ts_created": ts_created, "expires_at": expires_at})
+        await conn.commit()
+    out.sort(key=lambda c: c["ts_created"])
+    return out
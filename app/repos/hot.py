@@ -0,0 +1,257 @@
+# app/repos/hot.py
+"""
+Consultas del hot-path (ingest de tanque + evaluación de alarmas) con SQL fijo:
+
+  - siempre el mismo texto y tipos explícitos → el server las prepara una vez
+    por conexión (prepare=True) y después solo viaja el Bind/Execute.
+    DB_PREPARE=0 lo apaga (PgBouncer en modo transaction anterior a 1.21).
+  - los flujos de varios statements van en pipeline y en autocommit: un solo
+    round trip (el BEGIN/COMMIT implícitos de psycopg cuestan round trips
+    propios). Cada statement es atómico por sí solo (el dedupe va en el mismo
+    INSERT), así que no hace falta una transacción explícita.
+    ingest + config + alarmas activas + última lectura = 1 round trip (antes ~8).
+
+Las funciones reciben una conexión ya tomada del pool (sync o async); no
+abren conexiones propias.
+"""
+from __future__ import annotations
+
+import os
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+from psycopg.types.json import Json
+
+from app.core.metrics import db_timed
+from app.repos.tanks import LATEST_READING_SQL, READING_COLS
+
+PREPARE = os.getenv("DB_PREPARE", "1").lower() in ("1", "true", "yes")
+
+ALARM_COLS = (
+    "id", "asset_type", "asset_id", "code", "severity", "message",
+    "ts_raised", "ts_cleared", "ack_by", "ts_ack", "is_active", "extra",
+)
+
+# Reserva de la clave de dedupe + insert en UN statement (CTE). Sin clave
+# inserta siempre; con clave repetida no inserta y no devuelve filas.
+INSERT_READING_SQL = f"""
+    WITH k AS (
+        INSERT INTO public.ingest_dedupe (scope, dedupe_key, reading_id)
+        SELECT 'tank', %(dedupe_key)s::text, nextval(pg_get_serial_sequence('public.tank_readings', 'id'))
+         WHERE %(dedupe_key)s::text IS NOT NULL
+        ON CONFLICT DO NOTHING
+        RETURNING reading_id
+    )
+    INSERT INTO public.tank_readings
+        (id, tank_id, level_percent, ts, device_id, volume_l, temperature_c, raw_json)
+    SELECT COALESCE((SELECT reading_id FROM k), nextval(pg_get_serial_sequence('public.tank_readings', 'id'))),
+           %(tank_id)s::bigint, %(level_percent)s::real, COALESCE(%(ts)s::timestamptz, now()),
+           %(device_id)s::text, %(volume_l)s::float8, %(temperature_c)s::real, %(raw_json)s::jsonb
+     WHERE %(dedupe_key)s::text IS NULL OR EXISTS (SELECT 1 FROM k)
+    RETURNING {",".join(READING_COLS)};
+"""
+
+THRESHOLDS_SQL = """
+    SELECT low_low_pct, low_pct, high_pct, high_high_pct
+      FROM public.tank_config
+     WHERE tank_id = %s::bigint;
+"""
+
+ACTIVE_ALARMS_SQL = """
+    SELECT id, code, severity, COALESCE(message, '') AS message
+      FROM public.alarms
+     WHERE asset_type = 'tank' AND asset_id = %s::bigint AND is_active = true
+     ORDER BY ts_raised DESC, id DESC;
+"""
+
+CREATE_ALARM_SQL = f"""
+    INSERT INTO public.alarms
+        (asset_type, asset_id, code, severity, message, ts_raised, is_active, extra)
+    VALUES (%s::text, %s::bigint, %s::text, %s::text, %s::text, %s::timestamptz, true, %s::jsonb)
+    ON CONFLICT (asset_type, asset_id, code) WHERE is_active DO NOTHING
+    RETURNING {",".join(ALARM_COLS)};
+"""
+
+# Lectura más nueva del tanque (la recién insertada incluida): si es más
+# nueva que la insertada, la insertada llegó tarde y no se evalúa
+NEWEST_TS_SQL = """
+    SELECT ts FROM public.tank_readings
+     WHERE tank_id = %s::bigint
+     ORDER BY ts DESC, id DESC
+     LIMIT 1;
+"""
+
+# De (tanque, ts) los tanques que ya tienen una lectura más nueva que ts
+LATE_TANKS_SQL = """
+    SELECT t.id
+      FROM unnest(%s::bigint[], %s::timestamptz[]) AS t(id, ts)
+     WHERE EXISTS (SELECT 1 FROM public.tank_readings r WHERE r.tank_id = t.id AND r.ts > t.ts);
+"""
+
+CLEAR_ALARM_SQL = """
+    UPDATE public.alarms
+       SET is_active = false, ts_cleared = %s::timestamptz
+     WHERE id = %s::bigint AND is_active = true
+    RETURNING id;
+"""
+
+MARK_NOTIFIED_SQL = "UPDATE public.alarms SET tg_notified_at = now() WHERE id = %s::bigint;"
+
+
+@contextmanager
+def _autocommit(conn) -> Iterator[None]:
+    """Autocommit mientras dure el bloque; la conexión vuelve al pool como vino."""
+    prev = conn.autocommit
+    conn.autocommit = True
+    try:
+        yield
+    finally:
+        conn.autocommit = prev
+
+
+@asynccontextmanager
+async def _aautocommit(aconn) -> AsyncIterator[None]:
+    prev = aconn.autocommit
+    await aconn.set_autocommit(True)
+    try:
+        yield
+    finally:
+        await aconn.set_autocommit(prev)
+
+
+def reading_params(
+    tank_id: int,
+    level_percent: float,
+    *,
+    ts: Any = None,
+    device_id: Optional[str] = None,
+    volume_l: Optional[float] = None,
+    temperature_c: Optional[float] = None,
+    raw_json: Optional[dict] = None,
+    dedupe_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    return {
+        "tank_id": tank_id,
+        "level_percent": level_percent,
+        "ts": ts,
+        "device_id": device_id,
+        "volume_l": volume_l,
+        "temperature_c": temperature_c,
+        "raw_json": Json(raw_json) if raw_json is not None else None,
+        "dedupe_key": dedupe_key,
+    }
+
+
+# =======================
+# Sync
+# =======================
+@db_timed
+def insert_tank_reading(conn, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Un statement preparado (dentro de la transacción del caller; no hace commit). {} si duplicado."""
+    with conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(INSERT_READING_SQL, params, prepare=PREPARE)
+        return cur.fetchone() or {}
+
+
+@db_timed
+def latest_reading(conn, tank_id: int) -> Dict[str, Any]:
+    with conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(LATEST_READING_SQL, (tank_id,), prepare=PREPARE)
+        return cur.fetchone() or {}
+
+
+@db_timed
+def eval_state(conn, tank_id: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """(umbrales crudos de tank_config, alarmas activas del tanque) en un round trip."""
+    with _autocommit(conn), conn.pipeline():
+        c_cfg = conn.cursor(row_factory=dict_row)
+        c_act = conn.cursor(row_factory=dict_row)
+        c_cfg.execute(THRESHOLDS_SQL, (tank_id,), prepare=PREPARE)
+        c_act.execute(ACTIVE_ALARMS_SQL, (tank_id,), prepare=PREPARE)
+    return c_cfg.fetchone() or {}, c_act.fetchall()
+
+
+@db_timed
+def ingest_with_eval_state(conn, params: Dict[str, Any]):
+    """
+    Insert (commiteado) + umbrales + alarmas activas + ts más nuevo del tanque
+    en UN round trip. Devuelve (lectura insertada o {} si duplicado, umbrales,
+    alarmas activas, ts de la lectura más nueva).
+    """
+    with _autocommit(conn), conn.pipeline():
+        c_ins = conn.cursor(row_factory=dict_row)
+        c_cfg = conn.cursor(row_factory=dict_row)
+        c_act = conn.cursor(row_factory=dict_row)
+        c_new = conn.cursor()
+        c_ins.execute(INSERT_READING_SQL, params, prepare=PREPARE)
+        c_cfg.execute(THRESHOLDS_SQL, (params["tank_id"],), prepare=PREPARE)
+        c_act.execute(ACTIVE_ALARMS_SQL, (params["tank_id"],), prepare=PREPARE)
+        c_new.execute(NEWEST_TS_SQL, (params["tank_id"],), prepare=PREPARE)
+    newest = c_new.fetchone()
+    return c_ins.fetchone() or {}, c_cfg.fetchone() or {}, c_act.fetchall(), newest[0] if newest else None
+
+
+@db_timed
+def late_tanks(conn, newest: Dict[int, Any]) -> List[int]:
+    """De {tank_id: ts}, los tanques con una lectura más nueva que ese ts (un statement)."""
+    if not newest:
+        return []
+    ids = list(newest)
+    with conn.cursor() as cur:
+        cur.execute(LATE_TANKS_SQL, (ids, [newest[i] for i in ids]), prepare=PREPARE)
+        return [r[0] for r in cur.fetchall()]
+
+
+@db_timed
+def clear_alarms(conn, alarm_ids: List[int], ts_cleared) -> List[int]:
+    """Limpia varias alarmas en un round trip. Devuelve las que seguían activas."""
+    if not alarm_ids:
+        return []
+    with _autocommit(conn), conn.pipeline():
+        curs = []
+        for aid in alarm_ids:
+            c = conn.cursor()
+            c.execute(CLEAR_ALARM_SQL, (ts_cleared, aid), prepare=PREPARE)
+            curs.append(c)
+    return [r[0] for c in curs for r in c.fetchall()]
+
+
+@db_timed
+def create_alarm(conn, *, asset_id: int, code: str, severity: str, message: str,
+                 ts_raised, extra: Optional[dict] = None) -> Dict[str, Any]:
+    """Alarma nueva, o {} si ya había una activa con ese code (uq_alarms_active_code)."""
+    with _autocommit(conn), conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(
+            CREATE_ALARM_SQL,
+            ("tank", asset_id, code, severity, message, ts_raised,
+             Json(extra) if extra is not None else None),
+            prepare=PREPARE,
+        )
+        return cur.fetchone() or {}
+
+
+@db_timed
+def mark_notified(conn, alarm_id: int) -> None:
+    with _autocommit(conn):
+        conn.execute(MARK_NOTIFIED_SQL, (alarm_id,), prepare=PREPARE)
+
+
+# =======================
+# Async (rutas async)
+# =======================
+@db_timed
+async def aingest_with_eval_state(aconn, params: Dict[str, Any]):
+    """Igual que ingest_with_eval_state, sobre una AsyncConnection."""
+    async with _aautocommit(aconn), aconn.pipeline():
+        c_ins = aconn.cursor(row_factory=dict_row)
+        c_cfg = aconn.cursor(row_factory=dict_row)
+        c_act = aconn.cursor(row_factory=dict_row)
+        c_new = aconn.cursor()
+        await c_ins.execute(INSERT_READING_SQL, params, prepare=PREPARE)
+        await c_cfg.execute(THRESHOLDS_SQL, (params["tank_id"],), prepare=PREPARE)
+        await c_act.execute(ACTIVE_ALARMS_SQL, (params["tank_id"],), prepare=PREPARE)
+        await c_new.execute(NEWEST_TS_SQL, (params["tank_id"],), prepare=PREPARE)
+    newest = await c_new.fetchone()
+    return ((await c_ins.fetchone()) or {}, (await c_cfg.fetchone()) or {}, await c_act.fetchall(),
+            newest[0] if newest else None)
@@ -4,7 +4,9 @@
 from typing import Optional
 from datetime import datetime, timezone
 from app.core.db import get_conn
+from app.core.metrics import db_timed
 
+@db_timed
 def bump_presence(asset_type: str = "system", asset_id: Optional[int] = None, ts: Optional[float] = None) -> None:
     now = datetime.fromtimestamp(ts, tz=timezone.utc) if ts else datetime.now(tz=timezone.utc)
     with get_conn() as conn, conn.cursor() as cur:
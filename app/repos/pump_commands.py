@@ -1,22 +1,25 @@
 from app.core.db import get_conn
+from app.core.metrics import db_timed
 from psycopg.types.json import Json
 
-def enqueue_pump_command(pump_id: int, cmd: str, payload: dict | None, user: str) -> dict:
+@db_timed
+def enqueue_pump_command(pump_id: int, cmd: str, payload: dict | None, user: str, ttl_sec: int) -> dict:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO pump_commands (pump_id, cmd, payload, requested_by)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, pump_id, cmd, status, payload, ts_created
-        """, (pump_id, cmd, Json(payload) if payload else None, user))
+            INSERT INTO pump_commands (pump_id, cmd, payload, requested_by, expires_at)
+            VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+            RETURNING id, pump_id, cmd, status, payload, ts_created, expires_at
+        """, (pump_id, cmd, Json(payload) if payload else None, user, ttl_sec))
         row = cur.fetchone(); conn.commit()
-    cols = ["id","pump_id","cmd","status","payload","ts_created"]
+    cols = ["id","pump_id","cmd","status","payload","ts_created","expires_at"]
     return dict(zip(cols, row))
 
+@db_timed
 def list_pump_commands(pump_id: int, status: str | None, limit: int):
     with get_conn() as conn, conn.cursor() as cur:
         if status:
             cur.execute("""
-                SELECT id, pump_id, cmd, payload, status, ts_created, ts_sent, ts_acked, error
+                SELECT id, pump_id, cmd, payload, status, ts_created, ts_sent, ts_acked, expires_at, error
                 FROM pump_commands
                 WHERE pump_id=%s AND status=%s
                 ORDER BY ts_created ASC
@@ -24,7 +27,7 @@ def list_pump_commands(pump_id: int, status: str | None, limit: int):
             """, (pump_id, status, limit))
         else:
             cur.execute("""
-                SELECT id, pump_id, cmd, payload, status, ts_created, ts_sent, ts_acked, error
+                SELECT id, pump_id, cmd, payload, status, ts_created, ts_sent, ts_acked, expires_at, error
                 FROM pump_commands
                 WHERE pump_id=%s
                 ORDER BY ts_created DESC
@@ -34,12 +37,14 @@ def list_pump_commands(pump_id: int, status: str | None, limit: int):
         cols = [d[0] for d in cur.description]
     return [dict(zip(cols, r)) for r in rows]
 
+@db_timed
 def get_command_status(cmd_id: int, pump_id: int):
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("SELECT status FROM pump_commands WHERE id=%s AND pump_id=%s", (cmd_id, pump_id))
         r = cur.fetchone()
     return r[0] if r else None
 
+@db_timed
 def mark_sent(cmd_id: int):  # idem tanques
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
@@ -50,6 +55,7 @@ def mark_sent(cmd_id: int):  # idem tanques
         row = cur.fetchone(); conn.commit()
     cols = [d[0] for d in cur.description]; return dict(zip(cols, row))
 
+@db_timed
 def mark_acked(cmd_id: int):
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
@@ -60,6 +66,7 @@ def mark_acked(cmd_id: int):
         row = cur.fetchone(); conn.commit()
     cols = [d[0] for d in cur.description]; return dict(zip(cols, row))
 
+@db_timed
 def mark_other(cmd_id: int, status: str, error: str | None):
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
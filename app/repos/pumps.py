@@ -1,43 +1,111 @@
-from app.core.db import get_conn
+from app.core.db import get_conn, get_read_conn
+from app.core.metrics import db_timed
+from app.core.idempotency import reserve_key, reserve_keys
 import json
 
-def insert_pump_reading(device_id: int, payload) -> int:
+# Compartido con el batch de ingest_queue y con repos/pumps_async
+PUMP_READING_INSERT_SQL = """
+    INSERT INTO pump_readings (
+        id, pump_id, device_id, ts,
+        is_on, flow_lpm, pressure_bar, voltage_v, current_a,
+        control_mode, manual_lockout, raw_json
+    )
+    VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('public.pump_readings', 'id'))),
+            %s, %s, COALESCE(%s, now()),
+            %s, %s, %s, %s, %s,
+            %s, %s, %s)
+"""
+
+def pump_reading_params(reading_id, device_id, payload, ts=None) -> tuple:
+    return (
+        reading_id, payload.pump_id, device_id, payload.ts or ts,
+        payload.is_on, payload.flow_lpm, payload.pressure_bar,
+        payload.voltage_v, payload.current_a,
+        payload.control_mode, payload.manual_lockout,
+        json.dumps(payload.extra) if payload.extra else None,
+    )
+
+@db_timed
+def insert_pump_reading(device_id: int, payload, *, dedupe_key: str | None = None) -> int | None:
+    """
+    Con dedupe_key la lectura es idempotente (ver tanks.insert_tank_reading):
+    devuelve None si la clave ya existía y no inserta nada.
+    """
     with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            INSERT INTO pump_readings (
-                pump_id, device_id, ts,
-                is_on, flow_lpm, pressure_bar, voltage_v, current_a,
-                control_mode, manual_lockout, raw_json
-            )
-            VALUES (%s, %s, COALESCE(%s, now()),
-                    %s, %s, %s, %s, %s,
-                    %s, %s, %s)
-            RETURNING id
-            """,
-            (payload.pump_id, device_id, payload.ts,
-             payload.is_on, payload.flow_lpm, payload.pressure_bar,
-             payload.voltage_v, payload.current_a,
-             payload.control_mode, payload.manual_lockout,
-             json.dumps(payload.extra) if payload.extra else None)
-        )
+        reading_id = None
+        if dedupe_key:
+            reading_id = reserve_key(cur, "pump", dedupe_key, "public.pump_readings")
+            if reading_id is None:
+                conn.rollback()
+                return None
+        cur.execute(PUMP_READING_INSERT_SQL + " RETURNING id",
+                    pump_reading_params(reading_id, device_id, payload))
         new_id = cur.fetchone()[0]
         conn.commit()
     return new_id
 
-def latest_pump_row(pump_id: int):
+@db_timed
+def insert_pump_readings_batch(rows: list[dict]) -> list[dict]:
+    """
+    Versión batch (una transacción) para services/ingest_queue. Cada row trae
+    device_id, payload (PumpPayload) y dedupe_key opcional. Devuelve las insertadas.
+    """
+    keys = [r["dedupe_key"] for r in rows if r.get("dedupe_key")]
+    with get_conn() as conn, conn.cursor() as cur:
+        fresh = reserve_keys(cur, "pump", keys, "public.pump_readings")
+        inserted, params = [], []
+        for r in rows:
+            rid = None
+            if r.get("dedupe_key"):
+                rid = fresh.pop(r["dedupe_key"], None)
+                if rid is None:
+                    continue
+            params.append(pump_reading_params(rid, r.get("device_id"), r["payload"], r.get("ts")))
+            inserted.append(r)
+        if params:
+            cur.executemany(PUMP_READING_INSERT_SQL, params)
+        conn.commit()
+    return inserted
+
+# Solo si la lectura sigue guardada: sin ella (retención), None
+PUMP_READING_BY_KEY_SQL = """
+    SELECT r.id
+      FROM public.ingest_dedupe k
+      JOIN public.pump_readings r ON r.id = k.reading_id
+     WHERE k.scope = 'pump' AND k.dedupe_key = %s
+"""
+
+@db_timed
+def get_pump_reading_id_by_key(dedupe_key: str) -> int | None:
     with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, ts, is_on, flow_lpm, pressure_bar, voltage_v, current_a,
-                   control_mode, manual_lockout, raw_json
-            FROM pump_readings
-            WHERE pump_id=%s
-            ORDER BY ts DESC
-            LIMIT 1
-            """,
-            (pump_id,)
-        )
+        cur.execute(PUMP_READING_BY_KEY_SQL, (dedupe_key,))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+# latest/history de bombas (idx_pump_readings_latest, migración 0016;
+# bench/plan_check.py verifica el plan)
+LATEST_PUMP_SQL = """
+    SELECT id, ts, is_on, flow_lpm, pressure_bar, voltage_v, current_a,
+           control_mode, manual_lockout, raw_json
+    FROM pump_readings
+    WHERE pump_id=%s
+    ORDER BY ts DESC, id DESC
+    LIMIT 1
+"""
+
+PUMP_HISTORY_SQL = """
+    SELECT ts, is_on, flow_lpm, pressure_bar, voltage_v, current_a,
+           control_mode, manual_lockout
+    FROM pump_readings
+    WHERE pump_id=%s
+    ORDER BY ts DESC, id DESC
+    LIMIT %s
+"""
+
+@db_timed
+def latest_pump_row(pump_id: int):
+    with get_read_conn() as conn, conn.cursor() as cur:
+        cur.execute(LATEST_PUMP_SQL, (pump_id,))
         row = cur.fetchone()
     if not row:
         return None
@@ -56,19 +124,10 @@ def latest_pump_row(pump_id: int):
         "reading_id": rid,
     }
 
+@db_timed
 def pump_history_rows(pump_id: int, limit: int):
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT ts, is_on, flow_lpm, pressure_bar, voltage_v, current_a,
-                   control_mode, manual_lockout
-            FROM pump_readings
-            WHERE pump_id=%s
-            ORDER BY ts DESC
-            LIMIT %s
-            """,
-            (pump_id, limit)
-        )
+    with get_read_conn() as conn, conn.cursor() as cur:
+        cur.execute(PUMP_HISTORY_SQL, (pump_id, limit))
         rows = cur.fetchall()
     rows = rows[::-1]
     return [
@@ -77,14 +136,16 @@ def pump_history_rows(pump_id: int, limit: int):
         for r in rows
     ]
 
+@db_timed
 def list_pumps():
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_read_conn() as conn, conn.cursor() as cur:
         cur.execute("SELECT id, name, model, max_flow_lpm FROM pumps ORDER BY id")
         rows = cur.fetchall()
     return [{"id": r[0], "name": r[1], "model": r[2], "max_flow_lpm": r[3]} for r in rows]
 
+@db_timed
 def list_pumps_with_config():
-    with get_conn() as conn, conn.cursor() as cur:
+    with get_read_conn() as conn, conn.cursor() as cur:
         cur.execute("""
             SELECT id, name, model, max_flow_lpm,
                    drive_type, remote_enabled,
@@ -96,6 +157,7 @@ def list_pumps_with_config():
         cols = [d[0] for d in cur.description]
     return [dict(zip(cols, r)) for r in rows]
 
+@db_timed
 def upsert_pump_config(pump_id: int, body) -> dict:
     from fastapi import HTTPException
     with get_conn() as conn, conn.cursor() as cur:
@@ -133,6 +195,7 @@ def upsert_pump_config(pump_id: int, body) -> dict:
             "vfd_min_speed_pct","vfd_max_speed_pct","vfd_default_speed_pct","updated_at"]
     return dict(zip(cols, row))
 
+@db_timed
 def get_normalized_pump_config(pump_id: int):
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
@@ -143,6 +206,7 @@ def get_normalized_pump_config(pump_id: int):
         """, (pump_id,))
         return cur.fetchone()
 
+@db_timed
 def get_last_pump_reading(pump_id: int):
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
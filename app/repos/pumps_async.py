@@ -0,0 +1,31 @@
+# app/repos/pumps_async.py
+"""Versión async del ingest de bombas (mismo SQL que repos/pumps)."""
+from app.core.db_async import get_aconn
+from app.core.metrics import db_timed
+from app.core.idempotency import areserve_key
+from app.repos.pumps import PUMP_READING_BY_KEY_SQL, PUMP_READING_INSERT_SQL, pump_reading_params
+
+
+@db_timed
+async def insert_pump_reading(device_id, payload, *, dedupe_key: str | None = None) -> int | None:
+    """Igual que pumps.insert_pump_reading: None si dedupe_key ya existía."""
+    async with get_aconn() as conn, conn.cursor() as cur:
+        reading_id = None
+        if dedupe_key:
+            reading_id = await areserve_key(cur, "pump", dedupe_key, "public.pump_readings")
+            if reading_id is None:
+                await conn.rollback()
+                return None
+        await cur.execute(PUMP_READING_INSERT_SQL + " RETURNING id",
+                          pump_reading_params(reading_id, device_id, payload))
+        new_id = (await cur.fetchone())[0]
+        await conn.commit()
+    return new_id
+
+
+@db_timed
+async def get_pump_reading_id_by_key(dedupe_key: str) -> int | None:
+    async with get_aconn() as conn, conn.cursor() as cur:
+        await cur.execute(PUMP_READING_BY_KEY_SQL, (dedupe_key,))
+        row = await cur.fetchone()
+    return row[0] if row else None
@@ -1,24 +1,27 @@
 from app.core.db import get_conn
+from app.core.metrics import db_timed
 from psycopg.types.json import Json
 from typing import Optional
 
-def enqueue_tank_command(tank_id: int, cmd: str, payload: dict | None, user: str) -> dict:
+@db_timed
+def enqueue_tank_command(tank_id: int, cmd: str, payload: dict | None, user: str, ttl_sec: int) -> dict:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
-            INSERT INTO tank_commands (tank_id, cmd, payload, requested_by)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id, tank_id, cmd, status, payload, ts_created
-        """, (tank_id, cmd, Json(payload) if payload else None, user))
+            INSERT INTO tank_commands (tank_id, cmd, payload, requested_by, expires_at)
+            VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+            RETURNING id, tank_id, cmd, status, payload, ts_created, expires_at
+        """, (tank_id, cmd, Json(payload) if payload else None, user, ttl_sec))
         row = cur.fetchone()
         conn.commit()
-    cols = ["id","tank_id","cmd","status","payload","ts_created"]
+    cols = ["id","tank_id","cmd","status","payload","ts_created","expires_at"]
     return dict(zip(cols, row))
 
+@db_timed
 def list_tank_commands(tank_id: int, status: str | None, limit: int):
     with get_conn() as conn, conn.cursor() as cur:
         if status:
             cur.execute("""
-                SELECT id, tank_id, cmd, payload, status, ts_created, ts_sent, ts_acked, error
+                SELECT id, tank_id, cmd, payload, status, ts_created, ts_sent, ts_acked, expires_at, error
                   FROM tank_commands
                  WHERE tank_id=%s AND status=%s
               ORDER BY ts_created ASC
@@ -26,7 +29,7 @@ def list_tank_commands(tank_id: int, status: str | None, limit: int):
             """, (tank_id, status, limit))
         else:
             cur.execute("""
-                SELECT id, tank_id, cmd, payload, status, ts_created, ts_sent, ts_acked, error
+                SELECT id, tank_id, cmd, payload, status, ts_created, ts_sent, ts_acked, expires_at, error
                   FROM tank_commands
                  WHERE tank_id=%s
               ORDER BY ts_created DESC
@@ -36,12 +39,14 @@ def list_tank_commands(tank_id: int, status: str | None, limit: int):
         cols = [d[0] for d in cur.description]
     return [dict(zip(cols, r)) for r in rows]
 
+@db_timed
 def get_command_status(jid: int, tank_id: int) -> Optional[str]:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("SELECT status FROM tank_commands WHERE id=%s AND tank_id=%s", (jid, tank_id))
         r = cur.fetchone()
     return r[0] if r else None
 
+@db_timed
 def mark_sent(jid: int) -> dict:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
@@ -54,6 +59,7 @@ def mark_sent(jid: int) -> dict:
     cols = [d[0] for d in cur.description]
     return dict(zip(cols, row))
 
+@db_timed
 def mark_acked(jid: int) -> dict:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
@@ -66,6 +72,7 @@ def mark_acked(jid: int) -> dict:
     cols = [d[0] for d in cur.description]
     return dict(zip(cols, row))
 
+@db_timed
 def mark_other(jid: int, status: str, error: str | None) -> dict:
     with get_conn() as conn, conn.cursor() as cur:
         cur.execute("""
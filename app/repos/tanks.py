@@ -1,8 +1,11 @@
 # app/repos/tanks.py
 from typing import Any, Dict, List, Optional, Sequence
 from psycopg.rows import dict_row
+from psycopg.types.json import Json
 
-from app.core.db import get_conn
+from app.core.db import get_conn, get_read_conn
+from app.core.metrics import db_timed
+from app.core.idempotency import reserve_key, reserve_keys
 
 # =======================
 # Constantes de columnas
@@ -20,6 +23,7 @@ READING_COLS: Sequence[str] = (
 # =======================
 # Tanks (metadatos)
 # =======================
+@db_timed
 def list_tanks(user_id: Optional[int] = None) -> List[Dict[str, Any]]:
     base = f"""
         SELECT {",".join(TANK_COLS)}
@@ -28,23 +32,25 @@ def list_tanks(user_id: Optional[int] = None) -> List[Dict[str, Any]]:
         ORDER BY id;
     """
     where = "WHERE user_id = %s" if user_id is not None else ""
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         if user_id is not None:
             cur.execute(base.format(where=where), (user_id,))
         else:
             cur.execute(base.format(where=where))
         return cur.fetchall()
 
+@db_timed
 def get_tank(tank_id: int) -> Dict[str, Any]:
     sql_q = f"""
         SELECT {",".join(TANK_COLS)}
         FROM public.tanks
         WHERE id = %s;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql_q, (tank_id,))
         return cur.fetchone() or {}
 
+@db_timed
 def create_tank(data: Dict[str, Any]) -> Dict[str, Any]:
     sql_q = f"""
         INSERT INTO public.tanks
@@ -69,6 +75,7 @@ def create_tank(data: Dict[str, Any]) -> Dict[str, Any]:
         conn.commit()
         return cur.fetchone() or {}
 
+@db_timed
 def update_tank(tank_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
     sql_q = f"""
         UPDATE public.tanks SET
@@ -102,6 +109,7 @@ def update_tank(tank_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
 # =======================
 # Configs (tank_config)
 # =======================
+@db_timed
 def get_tank_config(tank_id: int) -> Dict[str, Any]:
     sql_q = """
         SELECT tank_id, low_pct, low_low_pct, high_pct, high_high_pct, updated_by, updated_at
@@ -112,6 +120,7 @@ def get_tank_config(tank_id: int) -> Dict[str, Any]:
         cur.execute(sql_q, (tank_id,))
         return cur.fetchone() or {}
 
+@db_timed
 def upsert_tank_config(
     tank_id: int,
     low_pct: Optional[float] = None,
@@ -142,6 +151,7 @@ def upsert_tank_config(
         conn.commit()
         return cur.fetchone() or {}
 
+@db_timed
 def list_tanks_with_config_view() -> List[Dict[str, Any]]:
     """
     Usa la vista v_tanks_with_config (no trae material/fluid/install_year salvo que
@@ -153,10 +163,11 @@ def list_tanks_with_config_view() -> List[Dict[str, Any]]:
         FROM public.v_tanks_with_config
         ORDER BY id;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql_q)
         return cur.fetchall()
 
+@db_timed
 def list_tanks_with_config() -> List[Dict[str, Any]]:
     """
     JOIN directo tanks + tank_config → incluye material, fluid, install_year para la ficha técnica.
@@ -171,10 +182,11 @@ def list_tanks_with_config() -> List[Dict[str, Any]]:
         LEFT JOIN public.tank_config c ON c.tank_id = t.id
         ORDER BY t.id;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql_q)
         return cur.fetchall()
 
+@db_timed
 def get_tank_with_config(tank_id: int) -> Dict[str, Any]:
     """
     Una sola fila de tank + config (útil si querés la ficha técnica de un tanque puntual).
@@ -189,7 +201,7 @@ def get_tank_with_config(tank_id: int) -> Dict[str, Any]:
         LEFT JOIN public.tank_config c ON c.tank_id = t.id
         WHERE t.id = %s;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql_q, (tank_id,))
         return cur.fetchone() or {}
 
@@ -200,6 +212,7 @@ _ALLOWED_READING_COLS = {
     "tank_id", "level_percent", "ts", "device_id", "volume_l", "temperature_c", "raw_json"
 }
 
+@db_timed
 def insert_tank_reading(
     tank_id: int,
     level_percent: float,
@@ -209,115 +222,206 @@ def insert_tank_reading(
     volume_l: Optional[float] = None,
     temperature_c: Optional[float] = None,
     raw_json: Optional[dict] = None,
+    dedupe_key: Optional[str] = None,    # ver ingest_dedupe (migrations/0002_ingest_dedupe.sql)
 ) -> Dict[str, Any]:
     """
     Inserta lectura en public.tank_readings. Solo incluye columnas provistas (lista blanca).
     Si 'ts' no se incluye, debe existir DEFAULT en la columna (NOW() AT TIME ZONE 'UTC').
+
+    Con dedupe_key la lectura es idempotente: se reserva la clave en ingest_dedupe
+    (ON CONFLICT DO NOTHING) en la misma transacción. Si la clave ya existía NO se
+    inserta nada y se devuelve {} (usar get_tank_reading_by_key para la original).
     """
+    cols, vals = reading_cols_vals(
+        tank_id, level_percent, ts=ts, device_id=device_id,
+        volume_l=volume_l, temperature_c=temperature_c, raw_json=raw_json,
+    )
+    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        if dedupe_key:
+            reading_id = reserve_key(cur, "tank", dedupe_key, "public.tank_readings")
+            if reading_id is None:
+                conn.rollback()
+                return {}
+            cols.insert(0, "id")
+            vals.insert(0, reading_id)
+
+        cur.execute(reading_insert_sql(cols), tuple(vals))
+        row = cur.fetchone() or {}
+        conn.commit()
+        return row
+
+def reading_cols_vals(tank_id: int, level_percent: float, **maybe: Any):
+    """Columnas/valores para el INSERT de una lectura (compartido con tanks_async)."""
     cols: List[str] = ["tank_id", "level_percent"]
     vals: List[Any] = [tank_id, level_percent]
-
-    maybe = {
-        "ts": ts,
-        "device_id": device_id,
-        "volume_l": volume_l,
-        "temperature_c": temperature_c,
-        "raw_json": raw_json,
-    }
+    if maybe.get("raw_json") is not None:
+        maybe["raw_json"] = Json(maybe["raw_json"])
     for k, v in maybe.items():
         if v is not None and k in _ALLOWED_READING_COLS:
             cols.append(k)
             vals.append(v)
+    return cols, vals
 
-    placeholders = ",".join(["%s"] * len(vals))
-    sql_q = f"""
+def reading_insert_sql(cols: Sequence[str]) -> str:
+    return f"""
         INSERT INTO public.tank_readings ({",".join(cols)})
-        VALUES ({placeholders})
+        VALUES ({",".join(["%s"] * len(cols))})
         RETURNING {",".join(READING_COLS)};
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql_q, tuple(vals))
+
+_BATCH_READING_SQL = """
+    INSERT INTO public.tank_readings
+        (id, tank_id, level_percent, ts, device_id, volume_l, temperature_c, raw_json)
+    VALUES (COALESCE(%s, nextval(pg_get_serial_sequence('public.tank_readings', 'id'))),
+            %s, %s, COALESCE(%s, now()), %s, %s, %s, %s);
+"""
+
+@db_timed
+def insert_tank_readings_batch(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Inserta varias lecturas en UNA transacción (usada por el writer de
+    services/ingest_queue). Cada row: tank_id, level_percent y opcionales ts,
+    device_id, volume_l, temperature_c, raw_json, dedupe_key.
+    Devuelve las rows efectivamente insertadas (sin los duplicados).
+    """
+    keys = [r["dedupe_key"] for r in rows if r.get("dedupe_key")]
+    with get_conn() as conn, conn.cursor() as cur:
+        fresh = reserve_keys(cur, "tank", keys, "public.tank_readings")
+        inserted: List[Dict[str, Any]] = []
+        params = []
+        for r in rows:
+            rid = None
+            if r.get("dedupe_key"):
+                rid = fresh.pop(r["dedupe_key"], None)
+                if rid is None:
+                    continue  # duplicado (contra la DB o dentro del mismo batch)
+            raw = r.get("raw_json")
+            params.append((
+                rid, r["tank_id"], r["level_percent"], r.get("ts"), r.get("device_id"),
+                r.get("volume_l"), r.get("temperature_c"), Json(raw) if raw is not None else None,
+            ))
+            inserted.append(r)
+        if params:
+            cur.executemany(_BATCH_READING_SQL, params)
         conn.commit()
+    return inserted
+
+READING_BY_KEY_SQL = f"""
+    SELECT {",".join("r." + c for c in READING_COLS)}
+    FROM public.ingest_dedupe k
+    JOIN public.tank_readings r ON r.id = k.reading_id
+    WHERE k.scope = 'tank' AND k.dedupe_key = %s;
+"""
+
+@db_timed
+def get_tank_reading_by_key(dedupe_key: str) -> Dict[str, Any]:
+    """Lectura original asociada a una clave de idempotencia (o {})."""
+    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(READING_BY_KEY_SQL, (dedupe_key,))
         return cur.fetchone() or {}
 
+# SELECT común de latest/history (también lo usa repos/tanks_async)
+_READING_SELECT = """
+    SELECT
+      r.id, r.tank_id, r.ts, r.level_percent, r.temperature_c, r.device_id, r.raw_json,
+      COALESCE(
+        r.volume_l,
+        CASE
+          WHEN t.capacity_m3 IS NOT NULL THEN (r.level_percent * (t.capacity_m3 * 1000.0) / 100.0)
+          ELSE NULL
+        END
+      ) AS volume_l,
+      CASE
+        WHEN r.volume_l IS NOT NULL THEN 'measured'
+        WHEN t.capacity_m3 IS NOT NULL THEN 'computed'
+        ELSE NULL
+      END AS volume_source
+    FROM public.tank_readings r
+    LEFT JOIN public.tanks t ON t.id = r.tank_id
+    WHERE r.tank_id = %s
+"""
+
+LATEST_READING_SQL = _READING_SELECT + " ORDER BY r.ts DESC, r.id DESC LIMIT 1;"
+
+@db_timed
 def latest_tank_row(tank_id: int) -> Dict[str, Any]:
     """
     Última lectura por tiempo (ts DESC) y como desempate id DESC.
     Calcula volume_l al LEER si no fue medido (usando capacity_m3 del tanque).
     """
-    sql_q = """
-        SELECT
-          r.id, r.tank_id, r.ts, r.level_percent, r.temperature_c, r.device_id, r.raw_json,
-          COALESCE(
-            r.volume_l,
-            CASE
-              WHEN t.capacity_m3 IS NOT NULL THEN (r.level_percent * (t.capacity_m3 * 1000.0) / 100.0)
-              ELSE NULL
-            END
-          ) AS volume_l,
-          CASE
-            WHEN r.volume_l IS NOT NULL THEN 'measured'
-            WHEN t.capacity_m3 IS NOT NULL THEN 'computed'
-            ELSE NULL
-          END AS volume_source
-        FROM public.tank_readings r
-        LEFT JOIN public.tanks t ON t.id = r.tank_id
-        WHERE r.tank_id = %s
-        ORDER BY r.ts DESC, r.id DESC
-        LIMIT 1;
-    """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(sql_q, (tank_id,))
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(LATEST_READING_SQL, (tank_id,))
         return cur.fetchone() or {}
 
-def history_tank_rows(
+def history_sql(
     tank_id: int,
-    date_from: Optional[str] = None,  # 'YYYY-MM-DD' o ISO 8601
+    date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     limit: int = 500,
     offset: int = 0,
-) -> List[Dict[str, Any]]:
+):
     """
-    Historial con volume_l calculado al LEER si no fue medido (capacity_m3 del tanque).
-    """
-    base = """
-        SELECT
-          r.id, r.tank_id, r.ts, r.level_percent, r.temperature_c, r.device_id, r.raw_json,
-          COALESCE(
-            r.volume_l,
-            CASE
-              WHEN t.capacity_m3 IS NOT NULL THEN (r.level_percent * (t.capacity_m3 * 1000.0) / 100.0)
-              ELSE NULL
-            END
-          ) AS volume_l,
-          CASE
-            WHEN r.volume_l IS NOT NULL THEN 'measured'
-            WHEN t.capacity_m3 IS NOT NULL THEN 'computed'
-            ELSE NULL
-          END AS volume_source
-        FROM public.tank_readings r
-        LEFT JOIN public.tanks t ON t.id = r.tank_id
-        WHERE r.tank_id = %s
+    (sql, params) del historial; compartido entre la versión sync y la async.
+    Los filtros van sobre r.ts (clave de partición): con rango solo se leen
+    los meses que lo cubren; sin rango el ORDER BY ts DESC LIMIT corta en el
+    mes más nuevo (ordered append).
     """
+    return _history_tail(_READING_SELECT, tank_id, date_from, date_to, limit, offset)
+
+def _history_tail(base: str, tank_id: int, date_from, date_to, limit: int, offset: int):
     params: List[Any] = [tank_id]
     if date_from:
-        base += " AND r.ts >= %s"
+        base += " AND r.ts >= %s::timestamptz"
         params.append(date_from)
     if date_to:
-        base += " AND r.ts < %s"
+        base += " AND r.ts < %s::timestamptz"
         params.append(date_to)
     base += " ORDER BY r.ts DESC, r.id DESC LIMIT %s OFFSET %s;"
     params.extend([limit, offset])
+    return base, tuple(params)
 
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-        cur.execute(base, tuple(params))
+# Historial en columnas (gráficos): solo las series, ts en epoch ms y volumen
+# sin estimar (lo estima la ruta, vectorizado). Filas como tuplas: sin dicts.
+HISTORY_COLUMNS = ("ts", "level_percent", "volume_l", "temperature_c")
+_COLUMNS_SELECT = """
+    SELECT (extract(epoch FROM r.ts) * 1000)::bigint, r.level_percent, r.volume_l, r.temperature_c
+      FROM public.tank_readings r
+     WHERE r.tank_id = %s
+"""
+
+def history_columns_sql(
+    tank_id: int,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 500,
+    offset: int = 0,
+):
+    """(sql, params) del historial en columnas; mismos filtros/orden que history_sql."""
+    return _history_tail(_COLUMNS_SELECT, tank_id, date_from, date_to, limit, offset)
+
+@db_timed
+def history_tank_rows(
+    tank_id: int,
+    date_from: Optional[str] = None,  # 'YYYY-MM-DD' o ISO 8601
+    date_to: Optional[str] = None,
+    limit: int = 500,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Historial con volume_l calculado al LEER si no fue medido (capacity_m3 del tanque).
+    """
+    sql_q, params = history_sql(tank_id, date_from, date_to, limit, offset)
+    with get_read_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        cur.execute(sql_q, params)
         return cur.fetchall()
 
 # --- Extra: capacidad del tanque ---
+CAPACITY_SQL = "SELECT capacity_m3 FROM public.tanks WHERE id = %s;"
+
+@db_timed
 def get_tank_capacity_m3(tank_id: int) -> Optional[float]:
-    sql_q = "SELECT capacity_m3 FROM public.tanks WHERE id = %s;"
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(sql_q, (tank_id,))
+    with get_read_conn() as conn, conn.cursor() as cur:
+        cur.execute(CAPACITY_SQL, (tank_id,))
         row = cur.fetchone()
         if not row:
             return None
@@ -327,6 +431,7 @@ def get_tank_capacity_m3(tank_id: int) -> Optional[float]:
 # =======================
 # Shim: get_config_by_id
 # =======================
+@db_timed
 def get_config_by_id(tank_id: int) -> Dict[str, Any]:
     """
     DEVUELVE UMBRALES para el tanque.
@@ -0,0 +1,110 @@
+# app/repos/tanks_async.py
+"""
+Versión async (AsyncConnectionPool) de las lecturas calientes de repos/tanks.
+El SQL es el mismo: se importa de repos/tanks para no duplicarlo.
+Ingest → pool de escritura; latest/history/capacity → pool de lectura.
+El ingest usa el statement fijo/preparado de repos/hot (dedupe incluido).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg.rows import dict_row
+
+from app.core.db_async import get_aconn, get_read_aconn
+from app.core.metrics import db_timed
+from app.repos import hot
+from app.repos.tanks import (
+    CAPACITY_SQL,
+    HISTORY_COLUMNS,
+    LATEST_READING_SQL,
+    READING_BY_KEY_SQL,
+    history_columns_sql,
+    history_sql,
+)
+
+
+@db_timed
+async def insert_tank_reading_with_state(
+    tank_id: int,
+    level_percent: float,
+    *,
+    ts: Optional[str] = None,
+    device_id: Optional[str] = None,
+    volume_l: Optional[float] = None,
+    temperature_c: Optional[float] = None,
+    raw_json: Optional[dict] = None,
+    dedupe_key: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Tuple[Dict[str, Any], List[Dict[str, Any]]], Any]:
+    """
+    Insert (con dedupe) + umbrales + alarmas activas en un round trip
+    (repos/hot). Devuelve (lectura o {} si dedupe_key ya existía, estado para
+    alarms_eval.eval_tank_alarm, ts de la lectura más nueva del tanque).
+    """
+    params = hot.reading_params(
+        tank_id, level_percent, ts=ts, device_id=device_id, volume_l=volume_l,
+        temperature_c=temperature_c, raw_json=raw_json, dedupe_key=dedupe_key,
+    )
+    async with get_aconn() as conn:
+        saved, cfg, active, newest = await hot.aingest_with_eval_state(conn, params)
+    return saved, (cfg, active), newest
+
+
+@db_timed
+async def insert_tank_reading(tank_id: int, level_percent: float, **kw: Any) -> Dict[str, Any]:
+    """Igual que tanks.insert_tank_reading: {} si dedupe_key ya existía."""
+    saved, _, _ = await insert_tank_reading_with_state(tank_id, level_percent, **kw)
+    return saved
+
+
+@db_timed
+async def get_tank_reading_by_key(dedupe_key: str) -> Dict[str, Any]:
+    async with get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(READING_BY_KEY_SQL, (dedupe_key,), prepare=hot.PREPARE)
+        return await cur.fetchone() or {}
+
+
+@db_timed
+async def latest_tank_row(tank_id: int) -> Dict[str, Any]:
+    async with get_read_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(LATEST_READING_SQL, (tank_id,), prepare=hot.PREPARE)
+        return await cur.fetchone() or {}
+
+
+@db_timed
+async def history_tank_rows(
+    tank_id: int,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 500,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    sql_q, params = history_sql(tank_id, date_from, date_to, limit, offset)
+    async with get_read_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute(sql_q, params)
+        return await cur.fetchall()
+
+
+@db_timed
+async def get_tank_capacity_m3(tank_id: int) -> Optional[float]:
+    async with get_read_aconn() as conn, conn.cursor() as cur:
+        await cur.execute(CAPACITY_SQL, (tank_id,), prepare=hot.PREPARE)
+        row = await cur.fetchone()
+        if not row or row[0] is None:
+            return None
+        return float(row[0])
+
+
+@db_timed
+async def history_tank_columns(
+    tank_id: int,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 500,
+    offset: int = 0,
+) -> Dict[str, List[Any]]:
+    """Historial como {"ts": [...], "level_percent": [...], ...} (orden DESC)."""
+    sql_q, params = history_columns_sql(tank_id, date_from, date_to, limit, offset)
+    async with get_read_aconn() as conn, conn.cursor() as cur:
+        await cur.execute(sql_q, params, prepare=hot.PREPARE)
+        rows = await cur.fetchall()
+    cols = list(zip(*rows)) if rows else [()] * len(HISTORY_COLUMNS)
+    return {name: list(col) for name, col in zip(HISTORY_COLUMNS, cols)}
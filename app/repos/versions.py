@@ -0,0 +1,101 @@
+# app/repos/versions.py
+"""
+Tokens de versión baratos para GET condicional (ver core/conditional.py y
+migrations/0008_change_counters.sql). Cada función es UNA consulta por PK o
+por índice; se llaman ANTES de leer los datos, así el token nunca es más
+nuevo que el cuerpo (a lo sumo hay un 200 de más, nunca un 304 de menos).
+
+Devuelven (token, last_modified) o None si no se puede calcular (tabla de
+contadores todavía sin migrar, etc.): en ese caso la ruta responde normal.
+"""
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from app.core.db import get_read_conn
+from app.core.metrics import db_timed
+from app.core.db_async import get_read_aconn
+from app.repos import hot
+
+Token = Optional[Tuple[str, Optional[datetime]]]
+
+COUNTERS_SQL = """
+    SELECT string_agg(scope || '.' || version, '-' ORDER BY scope), max(updated_at)
+      FROM public.change_counters WHERE scope = ANY(%s);
+"""
+
+# Última lectura (id, ts) + versión de tanks (capacity_m3 cambia el volumen estimado)
+LATEST_TANK_TOKEN_SQL = """
+    SELECT c.version, r.id, GREATEST(r.ts, c.updated_at)
+      FROM public.change_counters c
+      LEFT JOIN LATERAL (
+        SELECT id, ts FROM public.tank_readings
+         WHERE tank_id = %s ORDER BY ts DESC, id DESC LIMIT 1
+      ) r ON true
+     WHERE c.scope = 'tanks';
+"""
+
+LATEST_PUMP_TOKEN_SQL = """
+    SELECT id, ts FROM public.pump_readings
+     WHERE pump_id = %s ORDER BY ts DESC LIMIT 1;
+"""
+
+TANK_CONFIG_TOKEN_SQL = "SELECT updated_at FROM public.tank_config WHERE tank_id = %s;"
+
+
+@db_timed
+def counters(scopes: Sequence[str]) -> Token:
+    try:
+        with get_read_conn() as conn, conn.cursor() as cur:
+            cur.execute(COUNTERS_SQL, (list(scopes),), prepare=hot.PREPARE)
+            tag, ts = cur.fetchone()
+    except Exception:
+        return None
+    return (tag, ts) if tag else None
+
+
+@db_timed
+async def acounters(scopes: Sequence[str]) -> Token:
+    try:
+        async with get_read_aconn() as conn, conn.cursor() as cur:
+            await cur.execute(COUNTERS_SQL, (list(scopes),), prepare=hot.PREPARE)
+            tag, ts = await cur.fetchone()
+    except Exception:
+        return None
+    return (tag, ts) if tag else None
+
+
+@db_timed
+async def latest_tank(tank_id: int) -> Token:
+    try:
+        async with get_read_aconn() as conn, conn.cursor() as cur:
+            await cur.execute(LATEST_TANK_TOKEN_SQL, (tank_id,), prepare=hot.PREPARE)
+            row = await cur.fetchone()
+    except Exception:
+        return None
+    if row is None:
+        return None
+    ver, rid, ts = row
+    return f"t{tank_id}.{rid or 0}.{ver}", ts
+
+
+@db_timed
+def latest_pump(pump_id: int) -> Token:
+    try:
+        with get_read_conn() as conn, conn.cursor() as cur:
+            cur.execute(LATEST_PUMP_TOKEN_SQL, (pump_id,), prepare=hot.PREPARE)
+            row = cur.fetchone()
+    except Exception:
+        return None
+    return (f"p{pump_id}.{row[0]}", row[1]) if row else None
+
+
+@db_timed
+def tank_config(tank_id: int) -> Token:
+    try:
+        with get_read_conn() as conn, conn.cursor() as cur:
+            cur.execute(TANK_CONFIG_TOKEN_SQL, (tank_id,), prepare=hot.PREPARE)
+            row = cur.fetchone()
+    except Exception:
+        return None
+    # sin fila la ruta devuelve defaults con updated_at=now(): no cacheable
+    return (f"c{tank_id}.{row[0].timestamp():.6f}", row[0]) if row else None
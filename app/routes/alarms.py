@@ -1,9 +1,14 @@
 # app/routes/alarms.py
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Query
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import Optional
 from psycopg.types.json import Json
-from app.core.db import get_conn
+from app.core.conditional import conditional
+from app.core.db_async import get_aconn, get_read_aconn
+from app.core.jsonresp import FastJSONResponse
+from app.core.ratelimit import adb_read_slot, adb_slot
+from app.repos import versions
+from app.repos.alarms import LIST_ALL_SQL, LIST_BY_STATE_SQL
 from app.services.notify_alarm import notify_ack  # ya lo tenés en tu proyecto
 
 router = APIRouter(prefix="/alarms", tags=["alarms"])
@@ -12,33 +17,28 @@ class AckIn(BaseModel):
     user: str
     note: Optional[str] = None
 
-@router.get("")
-def list_alarms(active: Optional[bool] = True):
-    with get_conn() as conn, conn.cursor() as cur:
+# Tope de concurrencia por ruta (no por router): el listado va al pool de
+# lectura y el ACK al de escritura
+@router.get("", dependencies=[Depends(adb_read_slot)], response_class=FastJSONResponse)
+async def list_alarms(request: Request, response: Response, active: Optional[bool] = True):
+    # El front lo consulta en loop: si no cambió ninguna alarma (raise/clear/ack
+    # suben change_counters.alarms por trigger), 304 sin correr el listado
+    if (nm := conditional(request, response, await versions.acounters(["alarms"]))) is not None:
+        return nm
+    async with get_read_aconn() as conn, conn.cursor() as cur:
         if active is None:
-            cur.execute("""
-                SELECT id, asset_type, asset_id, code, severity, message,
-                       ts_raised, ts_cleared, ack_by, ts_ack, is_active
-                FROM alarms
-                ORDER BY ts_raised DESC
-            """)
+            await cur.execute(LIST_ALL_SQL)
         else:
-            cur.execute("""
-                SELECT id, asset_type, asset_id, code, severity, message,
-                       ts_raised, ts_cleared, ack_by, ts_ack, is_active
-                FROM alarms
-                WHERE is_active = %s
-                ORDER BY ts_raised DESC
-            """, (active,))
-        rows = cur.fetchall()
+            await cur.execute(LIST_BY_STATE_SQL, (active,))
+        rows = await cur.fetchall()
         cols = [d[0] for d in cur.description]
-    return [dict(zip(cols, r)) for r in rows]
+    return FastJSONResponse([dict(zip(cols, r)) for r in rows], headers=dict(response.headers))
 
-@router.post("/{alarm_id}/ack")
-def ack_alarm(alarm_id: int, body: AckIn, background_tasks: BackgroundTasks):
-    with get_conn() as conn, conn.cursor() as cur:
+@router.post("/{alarm_id}/ack", dependencies=[Depends(adb_slot)])
+async def ack_alarm(alarm_id: int, body: AckIn, background_tasks: BackgroundTasks):
+    async with get_aconn() as conn, conn.cursor() as cur:
         # marcar ACK solo si sigue activa
-        cur.execute("""
+        await cur.execute("""
             UPDATE alarms
                SET ack_by = %s,
                    ts_ack = COALESCE(ts_ack, now())
@@ -47,7 +47,7 @@ def ack_alarm(alarm_id: int, body: AckIn, background_tasks: BackgroundTasks):
              RETURNING id, asset_type, asset_id, code, severity, message,
                        ts_raised, ts_cleared, ack_by, ts_ack, is_active
         """, (body.user, alarm_id))
-        row = cur.fetchone()
+        row = await cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Alarma no activa o inexistente")
 
@@ -57,7 +57,7 @@ def ack_alarm(alarm_id: int, body: AckIn, background_tasks: BackgroundTasks):
         # auditoría
         asset_type, asset_id, code, severity = row[1], row[2], row[3], row[4]
         asset_label = f"TK-{asset_id}" if asset_type == "tank" else f"PU-{asset_id}"
-        cur.execute("""
+        await cur.execute("""
             INSERT INTO audit_events(
                 ts,"user",role,action,asset,details,result,
                 domain,asset_type,asset_id,code,severity,state
@@ -71,7 +71,7 @@ def ack_alarm(alarm_id: int, body: AckIn, background_tasks: BackgroundTasks):
         """, (body.user, asset_label, Json({"note": body.note}),
               asset_type, asset_id, code, severity))
 
-        conn.commit()
+        await conn.commit()
 
     # notificación async (telegram, etc.)
     background_tasks.add_task(notify_ack, alarm_dict, body.user)
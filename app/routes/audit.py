@@ -1,11 +1,12 @@
 # app/routes/audit.py
 from fastapi import APIRouter, Query
 from datetime import datetime
+from app.core.jsonresp import FastJSONResponse
 from app.repos import audit as repo
 
 router = APIRouter(prefix="/audit", tags=["audit"])
 
-@router.get("")
+@router.get("", response_class=FastJSONResponse)
 def audit_list(
     asset_type: str | None = Query(None),
     asset_id: int | None = Query(None),
@@ -15,4 +16,4 @@ def audit_list(
     until: datetime | None = Query(None),
     limit: int = Query(200, ge=1, le=5000),
 ):
-    return repo.list_audit(asset_type, asset_id, code, state, since, until, limit)
+    return FastJSONResponse(repo.list_audit(asset_type, asset_id, code, state, since, until, limit))
@@ -8,7 +8,7 @@ router = APIRouter(prefix="/pumps", tags=["commands:pumps"])
 
 @router.post("/{pump_id}/command", status_code=201)
 def queue_pump_command(pump_id: int, body: PumpCommandIn):
-    return svc.queue_command(pump_id, body.cmd, body.user, body.speed_pct)
+    return svc.queue_command(pump_id, body.cmd, body.user, body.speed_pct, body.ttl_sec)
 
 @router.get("/{pump_id}/commands")
 def list_pump_commands(
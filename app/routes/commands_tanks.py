@@ -3,12 +3,14 @@ from app.schemas.tanks import TankCommandIn
 from app.schemas.common import StatusLit, CommandStatusIn
 from app.repos import tank_commands as repo
 from app.services import commands as svc
+from app.services.command_expiry import DEFAULT_TTL_SEC
 
 router = APIRouter(prefix="/tanks", tags=["commands:tanks"])
 
 @router.post("/{tank_id}/command", status_code=201)
 def queue_tank_command(tank_id: int, body: TankCommandIn):
-    inserted = repo.enqueue_tank_command(tank_id, body.cmd, body.payload, body.user)
+    inserted = repo.enqueue_tank_command(tank_id, body.cmd, body.payload, body.requested_by,
+                                         body.ttl_sec or DEFAULT_TTL_SEC)
     return inserted
 
 @router.get("/{tank_id}/commands")
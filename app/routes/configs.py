@@ -1,20 +1,27 @@
 # app/routes/configs.py
-from fastapi import APIRouter, Depends, Path, Body
+from fastapi import APIRouter, Depends, Path, Body, Request, Response
 from datetime import datetime
+from app.core.conditional import conditional
 from app.core.security import device_id_dep
-from app.repos import tanks as repo
+from app.repos import tanks as repo, versions
 from app.schemas.configs import TankConfigIn, TankConfigOut
 
 router = APIRouter(prefix="/tanks", tags=["config"])
 
 # 1) LISTA TODAS LAS CONFIGS (usa la vista v_tanks_with_config)
 @router.get("/config")
-def list_configs(_=Depends(device_id_dep)):
+def list_configs(request: Request, response: Response, _=Depends(device_id_dep)):
+    tok = versions.counters(["tanks", "tank_config"])
+    if (nm := conditional(request, response, tok)) is not None:
+        return nm
     return repo.list_tanks_with_config()
 
 # 2) LEE UNA CONFIG
 @router.get("/{tank_id}/config", response_model=TankConfigOut)
-def get_config(tank_id: int = Path(..., ge=1), _=Depends(device_id_dep)):
+def get_config(request: Request, response: Response, tank_id: int = Path(..., ge=1),
+               _=Depends(device_id_dep)):
+    if (nm := conditional(request, response, versions.tank_config(tank_id))) is not None:
+        return nm
     cfg = repo.get_tank_config(tank_id)
     if not cfg:
         return {
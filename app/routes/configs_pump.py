@@ -1,15 +1,21 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
+from app.core.conditional import conditional
 from app.schemas.pumps import PumpConfigIn
-from app.repos import pumps as repo
+from app.repos import pumps as repo, versions
 
 router = APIRouter(tags=["config"])
 
 @router.get("/pumps")
-def list_pumps():
+def list_pumps(request: Request, response: Response):
+    if (nm := conditional(request, response, versions.counters(["pumps"]))) is not None:
+        return nm
     return repo.list_pumps()
 
 @router.get("/pumps/config")
-def list_pumps_with_config():
+def list_pumps_with_config(request: Request, response: Response):
+    tok = versions.counters(["pumps", "pump_config"])
+    if (nm := conditional(request, response, tok)) is not None:
+        return nm
     return repo.list_pumps_with_config()
 
 @router.post("/pumps/{pump_id}/config")
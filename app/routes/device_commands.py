@@ -0,0 +1,79 @@
+# app/routes/device_commands.py
+"""
+GET /devices/{device_id}/commands/next?wait=30: long-poll de comandos para
+devices que no mantienen un WebSocket.
+
+Reclama (queued → sent, FOR UPDATE SKIP LOCKED) los comandos pendientes del
+device y los devuelve; si no hay, espera hasta `wait` s a que el LISTEN
+"device_commands" avise de uno suyo (services/ws_manager.Waiter) y vuelve a
+intentar. 204 si se venció la espera sin comandos: el device reintenta de
+inmediato. La confirmación sigue siendo POST /tanks|pumps/{id}/commands/{cmd}/status.
+
+Solo para el propio device: 403 si el {device_id} del path no es el de
+X-Device-Id / ?device_id=, y solo comandos de assets que ese device reporta
+(repos/device_commands). `wait` tiene piso MIN_WAIT_SEC y la ruta pasa por
+command_poll_rate_limit: un device no puede pedir en loop sin esperar.
+
+El slot de DB (adb_slot) se toma solo alrededor de cada UPDATE: un long-poll
+esperando no ocupa conexión ni cupo de concurrencia.
+"""
+from __future__ import annotations
+
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from app.core import metrics
+from app.core.jsonresp import FastJSONResponse
+from app.core.ratelimit import adb_slot, command_poll_rate_limit
+from app.core.security import device_id_dep
+from app.repos import device_commands as repo
+from app.services import ws_manager
+
+router = APIRouter(prefix="/devices", tags=["commands:devices"])
+
+MAX_WAIT_SEC = 60
+MIN_WAIT_SEC = float(os.getenv("COMMAND_POLL_MIN_WAIT_SEC", "5"))
+_db_slot = asynccontextmanager(adb_slot)
+
+
+@router.get("/{device_id}/commands/next", dependencies=[Depends(command_poll_rate_limit)])
+async def next_commands(
+    request: Request,
+    device_id: str,
+    wait: float = Query(30, ge=MIN_WAIT_SEC, le=MAX_WAIT_SEC, description="s máximos de espera sin comandos"),
+    limit: int = Query(10, ge=1, le=100),
+    tank_id: Optional[List[int]] = Query(None, description="assets que atiende el device (si no, los que reportó último)"),
+    pump_id: Optional[List[int]] = Query(None),
+    auth=Depends(device_id_dep),
+):
+    if device_id != auth.get("device_id"):
+        metrics.inc("device_commands_longpoll_total", result="forbidden")
+        raise HTTPException(403, "device_id does not match the authenticated device")
+    tanks, pumps = tank_id or [], pump_id or []
+    t0 = time.monotonic()
+    deadline = t0 + wait
+    # El waiter se registra ANTES del primer intento: un comando que entra
+    # entre el UPDATE vacío y la espera no se pierde
+    waiter = ws_manager.add_waiter(device_id, [("tank", i) for i in tanks] + [("pump", i) for i in pumps])
+    try:
+        while True:
+            async with _db_slot(request):
+                cmds = await repo.claim_next(device_id, tanks, pumps, limit)
+            if cmds:
+                metrics.inc("device_commands_longpoll_total", result="commands")
+                metrics.observe("device_commands_longpoll_seconds", time.monotonic() - t0)
+                return FastJSONResponse(cmds)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await waiter.wait(remaining)
+            if await request.is_disconnected():
+                break  # sin cliente: no reclamar comandos que nadie va a recibir
+    finally:
+        ws_manager.remove_waiter(waiter)
+    metrics.inc("device_commands_longpoll_total", result="timeout")
+    return Response(status_code=204)
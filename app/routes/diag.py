@@ -0,0 +1,111 @@
+# app/routes/diag.py
+"""
+Rutas de test / diagnóstico: solo se montan con DIAG_ROUTES=1 (ver main.py).
+
+No hacen falta para servir tráfico y algunas publican eventos o muestran
+config sensible, así que en producción quedan afuera y tampoco se importan
+(arranque más rápido). Los endpoints de estado (/__metrics, /__db_pools,
+/__ingest_queue, ...) siguen siempre en main.py.
+"""
+from __future__ import annotations
+
+import os
+
+from fastapi import APIRouter, Body, FastAPI, HTTPException
+
+router = APIRouter(tags=["diag"])
+
+# Routers de test que viven en su propio módulo (import perezoso: si uno
+# falla, se avisa y se sigue con el resto)
+_OPTIONAL_ROUTERS = (
+    "app.routes.diag_listener",
+    "app.routes.test_telegram",
+    "app.routes.test_alarm",
+    "app.routes.debug_alarm",
+)
+
+
+def include_diag_routes(app: FastAPI) -> None:
+    import importlib
+    for name in _OPTIONAL_ROUTERS:
+        try:
+            app.include_router(importlib.import_module(name).router)
+        except Exception as e:
+            print(f"⚠️ {name.rsplit('.', 1)[-1]} router no disponible: {e}")
+    app.include_router(router)
+
+
+@router.get("/__tg_env")
+def tg_env():
+    token = os.getenv("TELEGRAM_BOT_TOKEN", "")
+    return {
+        "ENABLED": os.getenv("TELEGRAM_ENABLED", ""),
+        "BOT_head": (token[:8] + "...") if token else "",
+        "CHAT": os.getenv("TELEGRAM_CHAT_ID", ""),
+    }
+
+
+@router.post("/__alarm_poller_stop")
+def poller_stop():
+    try:
+        from app.services.alarm_poller import stop_alarm_poller
+    except Exception as e:
+        return {"stopped": False, "error": f"poller no disponible: {e}"}
+    try:
+        stop_alarm_poller()
+        return {"stopped": True}
+    except Exception as e:
+        return {"stopped": False, "error": str(e)}
+
+
+# ===== Qué versión de alarms_eval está cargada =====
+@router.get("/__which_alarms_eval")
+def which_alarms_eval():
+    import importlib
+    try:
+        mod = importlib.import_module("app.services.alarms_eval")
+        return {
+            "file": getattr(mod, "__file__", None),
+            "version": getattr(mod, "__VERSION__", None),
+            "has_eval": hasattr(mod, "eval_tank_alarm"),
+            "is_callable": callable(getattr(mod, "eval_tank_alarm", None)),
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# ===== Qué versión de alarm_events está cargada =====
+@router.get("/__which_alarm_events")
+def which_alarm_events():
+    import importlib, inspect
+    try:
+        mod = importlib.import_module("app.services.alarm_events")
+        try:
+            src = inspect.getsource(mod._notify)
+            uses_pg = "pg_notify(" in src
+            preview = src.strip().splitlines()[:5]
+        except Exception:
+            uses_pg = None
+            preview = ["<no source>"]
+        return {
+            "file": getattr(mod, "__file__", None),
+            "version": getattr(mod, "__VERSION__", None),
+            "uses_pg_notify": uses_pg,
+            "notify_src_preview": preview
+        }
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@router.post("/__diag_publish")
+def __diag_publish(payload: dict = Body(...)):
+    """
+    Empuja un evento a alarm_events._notify(payload).
+    Útil para probar el template de Telegram sin depender de otros módulos.
+    """
+    try:
+        from app.services import alarm_events
+        alarm_events._notify(payload)
+        return {"ok": True, "published": payload}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"publish failed: {e}")
@@ -1,31 +1,83 @@
 # app/routes/history.py
+import asyncio
 from fastapi import APIRouter, Depends, Path, Query
 from typing import Optional, Dict, Any, List, Literal
-from decimal import Decimal
 
-from app.repos import tanks as repo
+try:
+    import numpy as np  # opcional: estimación de volumen vectorizada
+except ImportError:
+    np = None
+
+from app.core.jsonresp import FastJSONResponse
+from app.repos import tanks_async as repo
 from app.core.security import device_id_dep
 
 router = APIRouter(prefix="/tanks", tags=["history"])
 
-def _to_float(v: Optional[Any]) -> Optional[float]:
-    if v is None:
-        return None
-    if isinstance(v, Decimal):
-        return float(v)
-    try:
-        return float(v)
-    except Exception:
-        return None
-
 def _estimate_volume_l(capacity_m3: Optional[float], level_percent: Optional[float]) -> Optional[float]:
     if capacity_m3 is None or level_percent is None:
         return None
     pct = max(0.0, min(100.0, float(level_percent)))
     return round(capacity_m3 * 1000.0 * (pct / 100.0), 3)
 
-@router.get("/{tank_id}/history")
-def history_tank(
+def _estimate_volume_column(
+    capacity_m3: Optional[float], level: List[Optional[float]], volume: List[Optional[float]]
+) -> List[int]:
+    """
+    Igual que _estimate_volume_l pero sobre la columna entera: completa en
+    `volume` (in place) los huecos con nivel conocido. Devuelve los índices
+    estimados.
+    """
+    if capacity_m3 is None or not volume:
+        return []
+    factor = capacity_m3 * 10.0  # litros por punto porcentual
+    if np is not None:
+        lv = np.array(level, dtype=float)    # None → nan
+        vol = np.array(volume, dtype=float)
+        idx = np.flatnonzero(np.isnan(vol) & ~np.isnan(lv))
+        est = np.round(np.clip(lv[idx], 0.0, 100.0) * factor, 3)
+        idx_l = idx.tolist()
+        for i, v in zip(idx_l, est.tolist()):
+            volume[i] = v
+        return idx_l
+    idx_l = [i for i, (v, lv) in enumerate(zip(volume, level)) if v is None and lv is not None]
+    for i in idx_l:
+        volume[i] = round(max(0.0, min(100.0, level[i])) * factor, 3)
+    return idx_l
+
+async def _history_columns(
+    tank_id: int, df: Optional[str], dt: Optional[str], limit: int, offset: int,
+    order: str, include_capacity: bool, estimate_missing_volume: bool,
+) -> FastJSONResponse:
+    """
+    Forma columnar para gráficos: una lista por serie, ts en epoch ms. Sin
+    dict por fila ni raw_json/device_id: menos CPU y ~la mitad de bytes.
+    """
+    cols_q = repo.history_tank_columns(tank_id=tank_id, date_from=df, date_to=dt, limit=limit, offset=offset)
+    if include_capacity or estimate_missing_volume:
+        cols, capacity_m3 = await asyncio.gather(cols_q, repo.get_tank_capacity_m3(tank_id))
+    else:
+        cols, capacity_m3 = await cols_q, None
+    if order == "asc":
+        for v in cols.values():
+            v.reverse()
+    estimated = _estimate_volume_column(capacity_m3, cols["level_percent"], cols["volume_l"]) \
+        if estimate_missing_volume else []
+
+    out: Dict[str, Any] = {
+        "tank_id": tank_id,
+        "count": len(cols["ts"]),
+        "order": order,
+        "ts_unit": "ms",
+        **cols,
+        "volume_estimated": estimated,  # índices de volume_l estimados (resto: medidos)
+    }
+    if include_capacity:
+        out["capacity_m3"] = capacity_m3
+    return FastJSONResponse(out)
+
+@router.get("/{tank_id}/history", response_class=FastJSONResponse)
+async def history_tank(
     tank_id: int = Path(..., ge=1),
 
     # Aceptamos ambas variantes para compatibilidad:
@@ -41,6 +93,8 @@ def history_tank(
     include_capacity: bool = Query(True, description="Incluir capacity_m3 en la respuesta"),
     estimate_missing_volume: bool = Query(True, description="Estimar volume_l cuando no hay medición"),
     flat: bool = Query(True, description="Si true, devuelve solo el array de lecturas (compat con front)"),
+    shape: Literal["rows", "columns"] = Query(
+        "rows", description="columns: {ts:[...], level_percent:[...], ...} (gráficos; ignora flat)"),
 
     _=Depends(device_id_dep),
 ):
@@ -48,27 +102,35 @@ def history_tank(
     df = since or date_from
     dt = until or date_to
 
-    # Traer filas desde el repo (el repo hoy ordena DESC por defecto)
-    rows = repo.history_tank_rows(
+    if shape == "columns":
+        return await _history_columns(tank_id, df, dt, limit, offset, order,
+                                      include_capacity, estimate_missing_volume)
+
+    # Traer filas desde el repo (el repo hoy ordena DESC por defecto) y capacity en paralelo
+    rows_q = repo.history_tank_rows(
         tank_id=tank_id,
         date_from=df,
         date_to=dt,
         limit=limit,
         offset=offset,
-    ) or []
+    )
+    if include_capacity:
+        rows, capacity_m3 = await asyncio.gather(rows_q, repo.get_tank_capacity_m3(tank_id))
+    else:
+        rows, capacity_m3 = await rows_q, None
+    rows = rows or []
 
     # Si piden asc y el repo entregó desc, invertimos acá
     # (Si más adelante actualizás el repo para soportar 'order', podés quitar este reverse)
     if order == "asc":
         rows = list(reversed(rows))
 
-    capacity_m3 = repo.get_tank_capacity_m3(tank_id) if include_capacity else None
-
     items: List[Dict[str, Any]] = []
     for r in rows:
-        lvl = _to_float(r.get("level_percent"))
-        vol_measured = _to_float(r.get("volume_l"))
-        tmp = _to_float(r.get("temperature_c"))
+        # real/double en la DB + loader numeric→float (core/db): ya llegan como float
+        lvl = r.get("level_percent")
+        vol_measured = r.get("volume_l")
+        tmp = r.get("temperature_c")
 
         vol = vol_measured
         vsrc = "measured" if vol_measured is not None else None
@@ -90,9 +152,10 @@ def history_tank(
             "raw_json": r.get("raw_json"),
         })
 
-    # flat=true → devolvemos array directo (lo que espera api.tankHistory)
+    # flat=true → devolvemos array directo (lo que espera api.tankHistory).
+    # Respuesta armada: filas de la DB ya serializables, sin jsonable_encoder
     if flat:
-        return items
+        return FastJSONResponse(items)
 
     # flat=false → devolvemos metadatos y items
     out: Dict[str, Any] = {
@@ -109,4 +172,4 @@ def history_tank(
         out["since"] = df
     if dt:
         out["until"] = dt
-    return out
+    return FastJSONResponse(out)
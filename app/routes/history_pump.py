@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Query
+from app.core.jsonresp import FastJSONResponse
 from app.repos import pumps as repo
 
 router = APIRouter(tags=["history"])
 
-@router.get("/pumps/{pump_id}/history")
+@router.get("/pumps/{pump_id}/history", response_class=FastJSONResponse)
 def pump_history(pump_id: int, limit: int = Query(200, ge=1, le=5000)):
-    return repo.pump_history_rows(pump_id, limit)
+    return FastJSONResponse(repo.pump_history_rows(pump_id, limit))
@@ -3,13 +3,19 @@ from typing import Any, Optional
 import logging
 import importlib
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 from psycopg import errors as psy_errors
 
 from app.schemas.ingest import TankIngestIn, TankIngestOut
-from app.repos import tanks as repo
+from app.repos import tanks_async as repo
 from app.core.security import device_id_dep
 from app.repos.presence import bump_presence  # ✅ presencia online/offline
+from app.core.idempotency import client_scope, dedupe_key_for
+from app.core.reading_ts import check_reading_ts
+from app.core import metrics, profiler
+from app.services import ingest_queue
 
 log = logging.getLogger("ingest")
 
@@ -26,34 +32,92 @@ def _get_level_percent(saved: Any) -> Optional[float]:
     return getattr(saved, "level_percent", None)
 
 
-def _get_eval_fn():
+_eval_fn = None
+
+
+def bind_eval_fn():
     """
-    Import perezoso para no tumbar la app si app.services.alarms_eval tiene un error.
-    Loguea el problema real si falla.
+    Resuelve app.services.alarms_eval.eval_tank_alarm una sola vez (en el
+    lifespan, o en el primer ingest si no se llamó). Import perezoso para no
+    tumbar la app si alarms_eval tiene un error: loguea el problema real y
+    devuelve None; el próximo ingest lo vuelve a intentar.
     """
+    global _eval_fn
+    if _eval_fn is not None:
+        return _eval_fn
     try:
         mod = importlib.import_module("app.services.alarms_eval")
         fn = getattr(mod, "eval_tank_alarm", None)
         if not callable(fn):
             raise AttributeError("eval_tank_alarm no encontrado/callable")
-        # Log de versión si el módulo la expone
-        ver = getattr(mod, "__VERSION__", None)
-        if ver:
-            log.info("alarms-eval module loaded version=%s", ver)
+        log.info("alarms-eval module bound version=%s", getattr(mod, "__VERSION__", None))
+        _eval_fn = fn
         return fn
     except Exception as e:
         log.exception("import eval_tank_alarm failed err=%s", e)
         return None
 
 
+def _after_ingest(device_id: Optional[str], tank_id: int, saved: Any, state: Any = None,
+                  late: bool = False) -> None:
+    """
+    Presencia + alarmas, después de responder (BackgroundTasks → threadpool):
+    son sync y tocan la DB; no tienen por qué demorar al device. `state` son
+    los umbrales/alarmas activas leídos junto con el insert (repos/hot).
+    `late`: el tanque ya tiene una lectura más nueva (llegó un buffer offline
+    atrasado); el estado de alarmas lo define esa, no se evalúa esta.
+    """
+    # Bump de presencia (no crítico)
+    try:
+        if device_id:
+            bump_presence(device_id)
+    except Exception as e:
+        log.warning("[presence] bump failed err=%s", e)
+
+    if late:
+        metrics.inc("alarm_eval_skipped_total", reason="late_reading")
+        return
+
+    # Evaluación de alarmas (best-effort)
+    try:
+        lvl = _get_level_percent(saved)
+        log.debug("[ingest] eval_tank_alarm tank=%s lvl=%s", tank_id, lvl)
+
+        eval_fn = bind_eval_fn()
+        if not eval_fn:
+            log.warning("[ingest] eval_tank_alarm no disponible; ver logs de 'ingest'")
+        else:
+            with profiler.phase("alarm_eval"):
+                eval_fn(tank_id, lvl, state=state)
+    except Exception as e:
+        log.warning("[WARN] alarm eval failed: %s", e)
+
+
 @router.post("/tank", response_model=TankIngestOut, status_code=status.HTTP_201_CREATED)
-def ingest_tank(payload: TankIngestIn, auth=Depends(device_id_dep)):
+async def ingest_tank(
+    payload: TankIngestIn,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    auth=Depends(device_id_dep),
+    idempotency_key: Optional[str] = Header(None),
+    prefer: Optional[str] = Header(None),
+    async_: Optional[bool] = Query(None, alias="async"),
+):
     """
     - Prioriza el device_id resuelto por API Key; si no hay, usa el del payload.
-    - Inserta (tank_id, level_percent, volume_l, temperature_c, raw_json, device_id).
+    - Inserta (tank_id, level_percent, ts, volume_l, temperature_c, raw_json, device_id);
+      ts es la hora del device si viene (lecturas guardadas offline), si no now().
+      Fuera de [retención / partición más vieja, now + margen] → 400, antes de
+      insertar o encolar (app/core/reading_ts.py).
+    - Idempotente con header Idempotency-Key o (device_id, boot_id|ts, seq): un
+      reintento devuelve 200 con la lectura original (Idempotent-Replayed: true)
+      sin insertar; 409 si la original ya se borró (retención).
+    - Modo asíncrono (?async=1, 'Prefer: respond-async' o INGEST_ASYNC=1): encola
+      y responde 202 sin tocar la DB; 503 + Retry-After si la cola está llena.
     - Mapea errores de DB a 400 (FK/Checks) o 500 (otros).
-    - Evalúa alarmas en best-effort (no bloquea la respuesta).
-    - Hace bump de presencia del device.
+    - Evalúa alarmas en best-effort y hace bump de presencia del device, ambos
+      en background (después de responder).
     """
     # 1) Elegir device_id (preferimos el autenticado para evitar spoof)
     dev_from_auth = (auth or {}).get("device_id")
@@ -66,17 +130,44 @@ def ingest_tank(payload: TankIngestIn, auth=Depends(device_id_dep)):
     volume_l = getattr(payload, "volume_l", None)
     temperature_c = getattr(payload, "temperature_c", None)
     raw_json = getattr(payload, "extra", None)
+    dedupe_key = dedupe_key_for(idempotency_key, device_id_db, getattr(payload, "seq", None),
+                                boot_id=getattr(payload, "boot_id", None), ts=payload.ts,
+                                client=client_scope(auth, request.client.host if request.client else None))
+    ts_error = await check_reading_ts(payload.ts, "tank")
+    if ts_error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ts_error)
+
+    if ingest_queue.wants_async(prefer, async_):
+        accepted = ingest_queue.submit("tank", {
+            "tank_id": payload.tank_id,
+            "level_percent": payload.level_percent,
+            "ts": payload.ts,
+            "device_id": device_id_db,
+            "volume_l": volume_l,
+            "temperature_c": temperature_c,
+            "raw_json": raw_json,
+            "dedupe_key": dedupe_key,
+        })
+        if not accepted:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="ingest queue full or draining",
+                headers={"Retry-After": "1"},
+            )
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED,
+                            content={"accepted": True, "queued": ingest_queue.depth()})
 
     # 3) Insert con manejo de errores fino
     try:
-        saved = repo.insert_tank_reading(
+        saved, eval_state, newest_ts = await repo.insert_tank_reading_with_state(
             tank_id=payload.tank_id,
             level_percent=payload.level_percent,
-            ts=None,  # NOW() en DB
+            ts=payload.ts,  # hora del device (store-and-forward); si no viene, NOW() en DB
             device_id=device_id_db,
             volume_l=volume_l,
             temperature_c=temperature_c,
             raw_json=raw_json,
+            dedupe_key=dedupe_key,
         )
     except psy_errors.ForeignKeyViolation:
         # p.ej. tank_id no existe
@@ -97,24 +188,30 @@ def ingest_tank(payload: TankIngestIn, auth=Depends(device_id_dep)):
             detail="ingest failed",
         )
 
-    # 4) Bump de presencia (no crítico)
-    try:
-        if device_id_db:
-            bump_presence(device_id_db)
-    except Exception as e:
-        log.warning("[presence] bump failed err=%s", e)
-
-    # 5) Evaluación de alarmas (best-effort)
-    try:
-        lvl = _get_level_percent(saved)
-        log.info("[ingest] eval_tank_alarm tank=%s lvl=%s", payload.tank_id, lvl)
-
-        eval_fn = _get_eval_fn()
-        if not eval_fn:
-            log.warning("[ingest] eval_tank_alarm no disponible; ver logs de 'ingest'")
-        else:
-            eval_fn(payload.tank_id, lvl)
-    except Exception as e:
-        log.warning("[WARN] alarm eval failed: %s", e)
-
+    if not saved and dedupe_key:
+        # Reintento: ya la teníamos. No se re-evalúan alarmas ni presencia.
+        metrics.inc("ingest_duplicates_total", kind="tank")
+        response.status_code = status.HTTP_200_OK
+        response.headers["Idempotent-Replayed"] = "true"
+        original = await repo.get_tank_reading_by_key(dedupe_key)
+        if not original:
+            # La clave sigue en el ledger pero la lectura ya no (retención):
+            # no hay nada que reenviar, y no se vuelve a insertar
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="duplicate of a reading that is no longer stored",
+                headers={"Idempotent-Replayed": "true"},
+            )
+        return original
+
+    metrics.inc("ingest_readings_total", kind="tank")
+    metrics.inc("ingest_asset_readings_total", kind="tank", asset_id=payload.tank_id)
+
+    # 4) Presencia + alarmas fuera del camino de la respuesta (con X-Profile,
+    #    antes de responder: así alarm_eval sale en el Server-Timing)
+    late = newest_ts is not None and saved["ts"] < newest_ts
+    if profiler.debugging():
+        await run_in_threadpool(_after_ingest, device_id_db, payload.tank_id, saved, eval_state, late)
+    else:
+        background_tasks.add_task(_after_ingest, device_id_db, payload.tank_id, saved, eval_state, late)
     return saved
@@ -1,11 +1,68 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+import logging
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse
+from psycopg import errors as psy_errors
 from app.core.security import device_id_dep
+from app.core.idempotency import client_scope, dedupe_key_for
+from app.core.reading_ts import check_reading_ts
+from app.core import metrics
 from app.schemas.pumps import PumpPayload
-from app.repos import pumps as repo
+from app.repos import pumps_async as repo
+from app.services import ingest_queue
+
+log = logging.getLogger("ingest")
 
 router = APIRouter(prefix="/ingest", tags=["ingest"])
 
 @router.post("/pump", status_code=201)
-def ingest_pump(payload: PumpPayload, device_id: int = Depends(device_id_dep)):
-    new_id = repo.insert_pump_reading(device_id, payload)
+async def ingest_pump(
+    payload: PumpPayload,
+    request: Request,
+    response: Response,
+    auth=Depends(device_id_dep),
+    idempotency_key: Optional[str] = Header(None),
+    prefer: Optional[str] = Header(None),
+    async_: Optional[bool] = Query(None, alias="async"),
+):
+    device_id = (auth or {}).get("device_id")
+    dedupe_key = dedupe_key_for(idempotency_key, device_id, payload.seq,
+                                boot_id=payload.boot_id, ts=payload.ts,
+                                client=client_scope(auth, request.client.host if request.client else None))
+    # Mismo rango de ts que /ingest/tank, antes de encolar o insertar
+    ts_error = await check_reading_ts(payload.ts, "pump")
+    if ts_error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, ts_error)
+    if ingest_queue.wants_async(prefer, async_):
+        if not ingest_queue.submit("pump", {"device_id": device_id, "payload": payload, "dedupe_key": dedupe_key}):
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "ingest queue full or draining", headers={"Retry-After": "1"})
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED,
+                            content={"accepted": True, "queued": ingest_queue.depth()})
+    # Mismo mapeo que /ingest/tank: un ts fuera de las particiones existentes
+    # ("no partition of relation ... found for row") es un CheckViolation
+    try:
+        new_id = await repo.insert_pump_reading(device_id, payload, dedupe_key=dedupe_key)
+    except psy_errors.ForeignKeyViolation:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "invalid pump_id or device_id (foreign key)")
+    except psy_errors.CheckViolation as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"payload violates constraint: {e}")
+    except Exception as e:
+        log.exception("[ingest/pump] DB insert failed err=%s", e)
+        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, "ingest failed")
+    if new_id is None and dedupe_key:
+        metrics.inc("ingest_duplicates_total", kind="pump")
+        original_id = await repo.get_pump_reading_id_by_key(dedupe_key)
+        if original_id is None:
+            # Igual que /ingest/tank: la clave sigue en el ledger pero la lectura ya no
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="duplicate of a reading that is no longer stored",
+                headers={"Idempotent-Replayed": "true"},
+            )
+        response.status_code = status.HTTP_200_OK
+        response.headers["Idempotent-Replayed"] = "true"
+        return {"ok": True, "reading_id": original_id, "duplicate": True}
+    metrics.inc("ingest_readings_total", kind="pump")
+    metrics.inc("ingest_asset_readings_total", kind="pump", asset_id=payload.pump_id)
     return {"ok": True, "reading_id": new_id}
@@ -1,23 +1,14 @@
 # app/routes/latest.py
-from fastapi import APIRouter, Depends, Path, Query
+import asyncio
+from fastapi import APIRouter, Depends, Path, Query, Request, Response
 from typing import Optional, Dict, Any
-from decimal import Decimal
 
-from app.repos import tanks as repo
+from app.repos import tanks_async as repo, versions
+from app.core.conditional import conditional
 from app.core.security import device_id_dep
 
 router = APIRouter(prefix="/tanks", tags=["latest"])
 
-def _to_float(v: Optional[Any]) -> Optional[float]:
-    if v is None:
-        return None
-    if isinstance(v, Decimal):
-        return float(v)
-    try:
-        return float(v)
-    except Exception:
-        return None
-
 def _estimate_volume_l(capacity_m3: Optional[float], level_percent: Optional[float]) -> Optional[float]:
     if capacity_m3 is None or level_percent is None:
         return None
@@ -26,16 +17,24 @@ def _estimate_volume_l(capacity_m3: Optional[float], level_percent: Optional[flo
     return round(capacity_m3 * 1000.0 * (pct / 100.0), 3)
 
 @router.get("/{tank_id}/latest")
-def latest_tank(
+async def latest_tank(
+    request: Request,
+    response: Response,
     tank_id: int = Path(..., ge=1),
     include_capacity: bool = Query(True, description="Incluir capacity_m3 en la respuesta"),
     _=Depends(device_id_dep),
 ):
-    # Intentamos traer la última lectura
-    row = repo.latest_tank_row(tank_id)
+    # Token (id de la última lectura + versión de tanks) antes que los datos
+    if (nm := conditional(request, response, await versions.latest_tank(tank_id))) is not None:
+        return nm
 
-    # Traemos capacity una sola vez (sirve para estimar volumen y para el front)
-    capacity_m3 = repo.get_tank_capacity_m3(tank_id) if include_capacity else None
+    # Última lectura y capacity (sirve para estimar volumen y para el front) en paralelo
+    if include_capacity:
+        row, capacity_m3 = await asyncio.gather(
+            repo.latest_tank_row(tank_id), repo.get_tank_capacity_m3(tank_id)
+        )
+    else:
+        row, capacity_m3 = await repo.latest_tank_row(tank_id), None
 
     # Si no hay lecturas, devolvemos payload vacío y has_data=false (200 OK)
     if not row:
@@ -56,9 +55,10 @@ def latest_tank(
         return out
 
     # Hay lectura: normalizamos y calculamos volumen si es necesario
-    level_percent = _to_float(row.get("level_percent"))
-    volume_l_measured = _to_float(row.get("volume_l"))
-    temperature_c = _to_float(row.get("temperature_c"))
+    # real/double en la DB + loader numeric→float (core/db): ya llegan como float
+    level_percent = row.get("level_percent")
+    volume_l_measured = row.get("volume_l")
+    temperature_c = row.get("temperature_c")
 
     volume_l = volume_l_measured
     volume_source = "measured" if volume_l_measured is not None else None
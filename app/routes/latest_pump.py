@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException
-from app.repos import pumps as repo
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.core.conditional import conditional
+from app.repos import pumps as repo, versions
 
 router = APIRouter(tags=["latest"])
 
 @router.get("/pumps/{pump_id}/latest")
-def latest_pump(pump_id: int):
+def latest_pump(pump_id: int, request: Request, response: Response):
+    if (nm := conditional(request, response, versions.latest_pump(pump_id))) is not None:
+        return nm
     row = repo.latest_pump_row(pump_id)
     if not row:
         raise HTTPException(404, "Sin lecturas")
@@ -1,11 +1,12 @@
 # app/routes/tanks.py
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from psycopg import errors as psy_errors
 
 from app.schemas.tanks import TankOut, TankCreate, TankUpdate
-from app.repos import tanks as repo
+from app.repos import tanks as repo, versions
+from app.core.conditional import conditional
 from app.core.security import device_id_dep  # auth por API key
 
 router = APIRouter(prefix="/tanks", tags=["tanks"])
@@ -18,7 +19,11 @@ def _to_dict(model):
 
 
 @router.get("", response_model=List[TankOut])
-def list_tanks(user_id: Optional[int] = None, _=Depends(device_id_dep)):
+def list_tanks(request: Request, response: Response, user_id: Optional[int] = None,
+               _=Depends(device_id_dep)):
+    # token antes que los datos: una carrera da un 200 de más, nunca un 304 viejo
+    if (nm := conditional(request, response, versions.counters(["tanks"]))) is not None:
+        return nm
     return repo.list_tanks(user_id)
 
 
@@ -21,6 +21,12 @@ class TankIngestIn(BaseModel):
     volume_l: Optional[NonNegFloat] = Field(None, description="Volumen en litros (opcional)")
     temperature_c: Optional[float] = Field(None, ge=-50, le=150, description="Temperatura en °C (opcional)")
     raw_json: Optional[Dict[str, Any]] = Field(None, description="Payload bruto opcional")
+    seq: Optional[int] = Field(
+        None, ge=0, description="Nº de secuencia del device; con boot_id o ts hace idempotente el POST"
+    )
+    boot_id: Optional[str] = Field(
+        None, max_length=64, description="Id del arranque del device (se regenera en cada boot; acompaña a seq)"
+    )
 
     model_config = {
         "extra": "ignore",  # ignora campos desconocidos en el POST
@@ -15,6 +15,8 @@ class PumpPayload(BaseModel):
     manual_lockout: Optional[bool] = None
     extra: Optional[dict] = None
     ts: Optional[datetime] = None
+    seq: Optional[int] = Field(None, ge=0)  # (device_id, boot_id|ts, seq) → ingest idempotente
+    boot_id: Optional[str] = Field(None, max_length=64)
 
 class PumpConfigIn(BaseModel):
     remote_enabled: bool | None = None
@@ -27,6 +29,7 @@ class PumpCommandIn(BaseModel):
     cmd: CmdLit
     user: str = Field(..., description="Quién disparó el comando")
     speed_pct: conint(ge=0, le=100) | None = None  # solo SPEED
+    ttl_sec: conint(ge=1, le=86400) | None = None  # default COMMAND_TTL_SEC
 
     class Config:
         extra = "ignore"
@@ -41,6 +41,7 @@ class TankCommandIn(BaseModel):
     cmd: CmdLiteral = Field(..., description="Tipo de comando")
     payload: Optional[Dict[str, Any]] = Field(None, description="JSON opcional con parámetros")
     requested_by: str = Field(..., min_length=1, max_length=64, description="Usuario o sistema que solicita")
+    ttl_sec: Optional[int] = Field(None, ge=1, le=86400, description="Vence si no se entrega y confirma en estos s (default COMMAND_TTL_SEC)")
 
 class TankCommandOut(BaseModel):
     id: int
@@ -51,5 +52,6 @@ class TankCommandOut(BaseModel):
     ts_created: datetime
     ts_sent: Optional[datetime] = None
     ts_acked: Optional[datetime] = None
+    expires_at: Optional[datetime] = None
     status: StatusLiteral
     error: Optional[str] = None
@@ -9,11 +9,6 @@ from app.core.db import get_events_conn as get_conn
 
 __VERSION__ = "ae-2025-09-10T14:10Z"
 
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s",
-)
 log = logging.getLogger("alarm-events")
 
 CHANNEL = os.getenv("ALARM_NOTIFY_CHANNEL", "alarm_events")
@@ -6,11 +6,6 @@ from typing import Optional, Dict, Any
 from app.core.db import get_events_conn  # ⬅️ usar la conexión directa
 from app.services import notify_alarm
 
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s",
-)
 log = logging.getLogger("alarm-listener")
 
 CHAN = os.getenv("ALARM_NOTIFY_CHANNEL", "alarm_events")
@@ -85,15 +80,23 @@ def _listen_loop() -> None:
                 time.sleep(0.1)
     log.info("loop stopped")
 
-def start_alarm_listener() -> None:
+def start_alarm_listener() -> bool:
     global _thread
     if _thread and _thread.is_alive():
-        log.info("already running")
-        return
+        if not _stop.is_set():
+            log.info("already running")
+            return True
+        # stop anterior todavía saliendo: espera acotada; si sigue, el líder
+        # reintenta en la próxima vuelta (ver leader._start_jobs)
+        _thread.join(timeout=2)
+        if _thread.is_alive():
+            log.info("previous thread still exiting; start deferred")
+            return False
     _stop.clear()
     _thread = threading.Thread(target=_listen_loop, name="alarm-listener", daemon=True)
     _thread.start()
     log.info("thread started")
+    return True
 
 def stop_alarm_listener() -> None:
     global _thread
@@ -3,12 +3,8 @@ from __future__ import annotations
 import os, time, threading, logging
 from typing import Optional, Dict, Any
 from app.core.db import get_conn
+from app.repos.alarms import pending_sql
 
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s",
-)
 log = logging.getLogger("alarm-poller")
 
 DEBUG_TG = os.getenv("TELEGRAM_DEBUG", "false").lower() in ("1", "true", "yes")
@@ -40,19 +36,23 @@ except Exception:
         if DEBUG_TG:
             log.info("tg_send(urllib) url=%s chat=%s len=%s", url, chat, len(text))
 
+        from app.core import metrics
         try:
             with urlopen(req, timeout=12) as resp:
                 status = resp.getcode()
                 body = resp.read(1000).decode("utf-8", "replace")
             if DEBUG_TG or status != 200:
                 log.info("tg_send(urllib) status=%s body=%s", status, body)
+            metrics.inc("telegram_sends_total", sender="urllib", result="ok" if status == 200 else "http_error")
             if status != 200:
                 raise RuntimeError(f"Telegram fail status={status} body={body}")
         except HTTPError as he:
+            metrics.inc("telegram_sends_total", sender="urllib", result="http_error")
             b = he.read(1000).decode("utf-8", "replace") if he.fp else ""
             log.info("tg_send(urllib) HTTPError code=%s body=%s", he.code, b)
             raise
         except URLError as ue:
+            metrics.inc("telegram_sends_total", sender="urllib", result="exception")
             log.info("tg_send(urllib) URLError reason=%s", ue.reason)
             raise
 
@@ -64,6 +64,7 @@ BATCH = int(os.getenv("ALARM_POLL_BATCH", "50"))
 SLEEP_EMPTY = float(os.getenv("ALARM_POLL_SLEEP_EMPTY", "1.0"))
 SLEEP_BUSY  = float(os.getenv("ALARM_POLL_SLEEP_BUSY",  "0.2"))
 ONLY_ACTIVE = os.getenv("ALARM_POLL_ONLY_ACTIVE", "true").lower() == "true"
+PENDING_SQL = pending_sql(ONLY_ACTIVE)
 
 def _fmt_alarm(a: Dict[str, Any]) -> str:
     sev  = (a.get("severity") or "").upper()
@@ -80,17 +81,7 @@ def _fmt_alarm(a: Dict[str, Any]) -> str:
 
 def _process_once() -> int:
     with get_conn() as conn, conn.cursor() as cur:
-        sql = f"""
-            select id, asset_type, asset_id, code, severity, message, ts_raised
-            from public.alarms
-            where telegram = true
-              and {"is_active = true and" if ONLY_ACTIVE else ""}
-                  tg_notified_at is null
-            order by ts_raised asc
-            limit %s
-            for update skip locked
-        """
-        cur.execute(sql, (BATCH,))
+        cur.execute(PENDING_SQL, (BATCH,))
         rows = cur.fetchall()
         if not rows:
             if DEBUG_TG:
@@ -130,15 +121,23 @@ def _loop():
             time.sleep(2.0)
     log.info("poller stopped")
 
-def start_alarm_poller():
+def start_alarm_poller() -> bool:
     global _thread
     if _thread and _thread.is_alive():
-        log.info("already running")
-        return
+        if not _stop.is_set():
+            log.info("already running")
+            return True
+        # stop anterior todavía saliendo: espera acotada; si sigue, el líder
+        # reintenta en la próxima vuelta (ver leader._start_jobs)
+        _thread.join(timeout=2)
+        if _thread.is_alive():
+            log.info("previous thread still exiting; start deferred")
+            return False
     _stop.clear()
     _thread = threading.Thread(target=_loop, name="alarm-poller", daemon=True)
     _thread.start()
     log.info("thread started")
+    return True
 
 def stop_alarm_poller():
     global _thread
@@ -7,7 +7,7 @@ def raise_alarm(conn, *, asset_type: str, asset_id: int,
                 enable_telegram: bool | None = None) -> int:
     """
     Crea una alarma y, si corresponde, publica evento a Telegram vía listener.
-    Retorna alarm_id.
+    Retorna alarm_id (el de la activa si ya había una con el mismo code).
     """
     telegram = True if enable_telegram is None else bool(enable_telegram)
 
@@ -18,9 +18,20 @@ def raise_alarm(conn, *, asset_type: str, asset_id: int,
             VALUES (%s,%s,%s,%s,%s,
                     jsonb_build_object('value', %s, 'threshold', %s),
                     %s)
+            ON CONFLICT (asset_type, asset_id, code) WHERE is_active DO NOTHING
             RETURNING id, COALESCE(telegram, true) AS telegram;
         """, (asset_type, asset_id, code, severity, message, value, threshold, telegram))
-        alarm_id, telegram = cur.fetchone()
+        row = cur.fetchone()
+        if row is None:
+            # Ya había una activa con ese code: se devuelve esa, sin volver a notificar
+            cur.execute("""
+                SELECT id FROM public.alarms
+                 WHERE asset_type = %s AND asset_id = %s AND code = %s AND is_active
+            """, (asset_type, asset_id, code))
+            existing = cur.fetchone()
+            conn.commit()
+            return existing[0] if existing else None
+        alarm_id, telegram = row
     conn.commit()
 
     # Si está habilitado Telegram para esta alarma, publicamos el evento RAISED
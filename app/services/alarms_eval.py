@@ -1,22 +1,15 @@
 # app/services/alarms_eval.py
 from __future__ import annotations
 
-import os
 import logging
 from datetime import datetime, timezone, date
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from decimal import Decimal
 
-from psycopg.types.json import Json  # psycopg v3
 
 # -----------------------------------------------------------------------------
 # Logging / banner
 # -----------------------------------------------------------------------------
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s",
-)
 log = logging.getLogger("alarms-eval")
 __VERSION__ = "aeval-2025-09-10T13:20Z"
 __all__ = ["eval_tank_alarm"]  # 👈 export explícito
@@ -25,8 +18,9 @@ log.info("alarms-eval loaded file=%s version=%s", __file__, __VERSION__)
 # -----------------------------------------------------------------------------
 # Repos / servicios
 # -----------------------------------------------------------------------------
-from app.repos import tanks as tanks_repo
-from app.repos import alarms as alarms_repo
+from app.core import metrics
+from app.core.db import get_conn
+from app.repos import hot
 # audit es opcional; si no existe, no lo usamos
 try:
     from app.repos import audit as audit_repo  # noqa: F401
@@ -74,12 +68,23 @@ def _utcnow() -> datetime:
 def _iso(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
 
+# Mismos defaults que tanks_repo.get_config_by_id
+_DEFAULT_THRESHOLDS = {
+    "low_low_pct": 10.0,
+    "low_pct": 20.0,
+    "high_pct": 80.0,
+    "high_high_pct": 90.0,
+}
+
+# (fila cruda de tank_config o {}, alarmas activas del tanque); ver repos/hot
+EvalState = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
 def _coerce_cfg_to_float(cfg: dict) -> dict:
-    # por si vienen Decimal desde DB
+    # por si vienen Decimal desde DB; faltantes → defaults
     out = {}
-    for k in ("low_low_pct", "low_pct", "high_pct", "high_high_pct"):
-        v = cfg[k]
-        out[k] = float(v)
+    for k, default in _DEFAULT_THRESHOLDS.items():
+        v = cfg.get(k)
+        out[k] = float(v) if v is not None else default
     return out
 
 def _decide_state(level_pct: float, cfg: dict) -> Optional[Tuple[str, str, str]]:
@@ -102,18 +107,8 @@ def _decide_state(level_pct: float, cfg: dict) -> Optional[Tuple[str, str, str]]
         code, sev_db = _THRESHOLD_MAP["high"];     log.debug("state=high");     return (code, sev_db, "high")
     log.debug("state=normal"); return None
 
-def _clear_one(alarm_id: int, *, asset_type: str, asset_id: int, code: str,
-               severity_db: str, message: str, value: float) -> None:
-    log.info("clear_one start alarm_id=%s asset=%s-%s code=%s value=%.3f",
-             alarm_id, asset_type, asset_id, code, value)
-    try:
-        cleared = alarms_repo.clear(alarm_id, ts_cleared=_utcnow())
-        log.debug("clear_one repo.clear cleared=%s", bool(cleared))
-    except Exception as e:
-        log.exception("clear_one repo.clear error err=%s alarm_id=%s", e, alarm_id);  return
-    if not cleared:
-        log.info("clear_one skip reason=already_cleared alarm_id=%s", alarm_id);  return
-
+def _publish_cleared(alarm_id: int, *, asset_type: str, asset_id: int, code: str,
+                     severity_db: str, message: str, value: float) -> None:
     ts = _iso(_utcnow())
     try:
         publish_cleared(
@@ -121,51 +116,57 @@ def _clear_one(alarm_id: int, *, asset_type: str, asset_id: int, code: str,
             message=message or "", severity=severity_db, value=value,
             threshold=None,
         )
-        log.info("clear_one published op=CLEARED asset=%s-%s code=%s ts=%s",
-                 asset_type, asset_id, code, ts)
+        log.info("clear_one published op=CLEARED asset=%s-%s code=%s alarm_id=%s ts=%s",
+                 asset_type, asset_id, code, alarm_id, ts)
     except Exception as e:
         log.exception("clear_one publish error err=%s code=%s", e, code)
 
-def _clear_all_for_tank(tank_id: int, *, value: float) -> None:
-    from psycopg.rows import dict_row
-    from app.core.db import get_conn
-    log.info("clear_all_for_tank start tank_id=%s value=%.3f", tank_id, value)
-    sql = """
-      SELECT id, code, severity, COALESCE(message,'') AS message
-        FROM public.alarms
-       WHERE asset_type='tank' AND asset_id=%s AND is_active=true
-    """
+def _clear_all_for_tank(tank_id: int, *, value: float, active_rows: List[dict]) -> None:
+    """Limpia todas las activas en un round trip (pipeline) y publica las que limpió."""
+    log.debug("clear_all_for_tank start tank_id=%s value=%.3f active_count=%d",
+             tank_id, value, len(active_rows))
+    if not active_rows:
+        return
     try:
-        with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
-            cur.execute(sql, (tank_id,))
-            rows = cur.fetchall()
-        log.debug("clear_all_for_tank fetched active_count=%d", len(rows))
+        with get_conn() as conn:
+            cleared = set(hot.clear_alarms(conn, [r["id"] for r in active_rows], _utcnow()))
     except Exception as e:
-        log.exception("clear_all_for_tank fetch error err=%s tank_id=%s", e, tank_id);  return
-
-    for row in rows:
-        _clear_one(
-            alarm_id=row["id"], asset_type="tank", asset_id=tank_id,
+        log.exception("clear_all_for_tank error err=%s tank_id=%s", e, tank_id);  return
+
+    for row in active_rows:
+        if row["id"] not in cleared:
+            log.info("clear_one skip reason=already_cleared alarm_id=%s", row["id"]);  continue
+        metrics.inc("alarms_cleared_total", asset_type="tank", code=row["code"])
+        _publish_cleared(
+            row["id"], asset_type="tank", asset_id=tank_id,
             code=row["code"], severity_db=row["severity"], message=row["message"],
             value=value,
         )
 
+def _load_state(tank_id: int) -> EvalState:
+    """(umbrales, alarmas activas) en un solo round trip."""
+    with get_conn() as conn:
+        return hot.eval_state(conn, tank_id)
+
 # -----------------------------------------------------------------------------
 # API principal: ESTA es la función que importa ingest.py
 # -----------------------------------------------------------------------------
-def eval_tank_alarm(tank_id: int, level_pct: Optional[float]) -> Optional[int]:
+def eval_tank_alarm(tank_id: int, level_pct: Optional[float], *,
+                    state: Optional[EvalState] = None) -> Optional[int]:
     """
     Evalúa una lectura de tanque contra thresholds y levanta/limpia alarmas.
     Retorna alarm_id si levantó nueva; None si no levantó o si limpió.
+    `state` = (umbrales, alarmas activas) ya leídos en el mismo round trip del
+    insert (hot.ingest_with_eval_state); si no viene, se lee acá.
     """
-    log.info("eval start tank_id=%s level_pct=%s", tank_id, level_pct)
+    log.debug("eval start tank_id=%s level_pct=%s", tank_id, level_pct)
     if level_pct is None:
         log.warning("eval skip reason=level_none tank_id=%s", tank_id)
         return None
 
-    # 1) Config (a float)
+    # 1) Config (a float) + activas
     try:
-        raw_cfg = tanks_repo.get_config_by_id(tank_id)
+        raw_cfg, active_rows = state if state is not None else _load_state(tank_id)
         cfg = _coerce_cfg_to_float(raw_cfg)
         log.debug("cfg loaded tank_id=%s low_low=%.3f low=%.3f high=%.3f high_high=%.3f",
                   tank_id, cfg["low_low_pct"], cfg["low_pct"], cfg["high_pct"], cfg["high_high_pct"])
@@ -175,30 +176,26 @@ def eval_tank_alarm(tank_id: int, level_pct: Optional[float]) -> Optional[int]:
     # 2) Estado
     try:
         level_f = float(level_pct)
-        state = _decide_state(level_f, cfg)
+        decision = _decide_state(level_f, cfg)
     except Exception as e:
         log.exception("decide_state error err=%s tank_id=%s", e, tank_id);  return None
 
-    if state is None:
-        log.info("eval normal -> clear_all tank_id=%s level=%.3f", tank_id, level_f)
-        _clear_all_for_tank(tank_id, value=level_f)
+    if decision is None:
+        log.debug("eval normal -> clear_all tank_id=%s level=%.3f", tank_id, level_f)
+        _clear_all_for_tank(tank_id, value=level_f, active_rows=active_rows)
         return None
 
-    alarm_code_upper, severity_db_lower, threshold_key = state
+    alarm_code_upper, severity_db_lower, threshold_key = decision
     threshold_alias = _THRESH_ALIAS.get(alarm_code_upper, threshold_key)
-    log.info("eval out_of_range code=%s severity=%s alias=%s level=%.3f",
+    log.debug("eval out_of_range code=%s severity=%s alias=%s level=%.3f",
              alarm_code_upper, severity_db_lower, threshold_alias, level_f)
 
     # 3) Dedupe
-    try:
-        active = alarms_repo.get_active(asset_type="tank", asset_id=tank_id, code=alarm_code_upper)
-        log.debug("active_lookup exists=%s", bool(active))
-    except Exception as e:
-        log.exception("active_lookup error err=%s tank_id=%s code=%s", e, tank_id, alarm_code_upper)
-        active = None
+    active = next((r for r in active_rows if r["code"] == alarm_code_upper), None)
+    log.debug("active_lookup exists=%s", bool(active))
     if active:
-        log.info("eval dedupe reason=already_active alarm_id=%s", getattr(active, "id", None))
-        return active.id
+        log.debug("eval dedupe reason=already_active alarm_id=%s", active["id"])
+        return active["id"]
 
     # 4) Insert DB
     message = f"Tank {tank_id} {alarm_code_upper}"
@@ -206,17 +203,24 @@ def eval_tank_alarm(tank_id: int, level_pct: Optional[float]) -> Optional[int]:
     extra_jsonable = _to_jsonable(extra_dict)
     log.debug("db_create extra_jsonable=%s", extra_jsonable)
     try:
-        created = alarms_repo.create(
-            asset_type="tank",
-            asset_id=tank_id,
-            code=alarm_code_upper,
-            severity=severity_db_lower,
-            message=message,
-            ts_raised=_utcnow(),
-            is_active=True,
-            extra=Json(extra_jsonable),
-        )
-        alarm_id = created.id
+        with get_conn() as conn:
+            created = hot.create_alarm(
+                conn,
+                asset_id=tank_id,
+                code=alarm_code_upper,
+                severity=severity_db_lower,
+                message=message,
+                ts_raised=_utcnow(),
+                extra=extra_jsonable,
+            )
+        if not created:
+            # Otra lectura (u otro worker) la levantó entre que leímos las
+            # activas y este INSERT: ya está notificada por ese camino
+            metrics.inc("alarms_raise_conflict_total", asset_type="tank", code=alarm_code_upper)
+            log.info("eval dedupe reason=concurrent_raise tank_id=%s code=%s", tank_id, alarm_code_upper)
+            return None
+        alarm_id = created["id"]
+        metrics.inc("alarms_raised_total", asset_type="tank", code=alarm_code_upper, severity=severity_db_lower)
         log.info("db_create ok alarm_id=%s tank_id=%s code=%s", alarm_id, tank_id, alarm_code_upper)
     except Exception as e:
         log.exception("db_create error err=%s tank_id=%s code=%s", e, tank_id, alarm_code_upper)
@@ -240,10 +244,8 @@ def eval_tank_alarm(tank_id: int, level_pct: Optional[float]) -> Optional[int]:
 
     # 6) tg_notified_at (best effort)
     try:
-        from app.core.db import get_conn
-        with get_conn() as conn, conn.cursor() as cur:
-            cur.execute("UPDATE public.alarms SET tg_notified_at = now() WHERE id=%s", (alarm_id,))
-            conn.commit()
+        with get_conn() as conn:
+            hot.mark_notified(conn, alarm_id)
         log.debug("tg_notified_at updated alarm_id=%s", alarm_id)
     except Exception as e:
         log.warning("tg_notified_at update skipped err=%s alarm_id=%s", e, alarm_id)
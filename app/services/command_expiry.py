@@ -0,0 +1,129 @@
+# app/services/command_expiry.py
+"""
+Vencimiento de comandos: pasa a 'expired' los queued/sent con expires_at ya
+pasado (columna de la migración 0011), en tank_commands y pump_commands.
+
+  - TTL por comando: POST /tanks|pumps/{id}/command acepta ttl_sec; si no
+    viene, COMMAND_TTL_SEC (default 600). Cubre entrega + confirmación: un
+    comando 'sent' que el device no confirma a tiempo también vence.
+  - Cada COMMAND_SWEEP_SEC, por tabla, UN UPDATE por lote de
+    COMMAND_SWEEP_BATCH filas (FOR UPDATE SKIP LOCKED: no espera a un
+    reclamo o ack en curso) hasta que no queden vencidos. El índice parcial
+    *_expiry lo hace proporcional a lo vencido, no al histórico.
+  - Corre solo en el líder (services/leader.py).
+
+El push por WebSocket y el long-poll ya no reclaman comandos vencidos, aunque
+el barrido todavía no haya pasado.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+from app.core.db import get_conn
+
+log = logging.getLogger("command-expiry")
+
+ENABLED = os.getenv("COMMAND_EXPIRY_ENABLED", "1").lower() in ("1", "true", "yes")
+DEFAULT_TTL_SEC = int(os.getenv("COMMAND_TTL_SEC", "600"))
+EVERY_SEC = float(os.getenv("COMMAND_SWEEP_SEC", "30"))
+BATCH_ROWS = int(os.getenv("COMMAND_SWEEP_BATCH", "1000"))
+
+TABLES = {"tank": "tank_commands", "pump": "pump_commands"}
+
+_EXPIRE_SQL = """
+    WITH doomed AS (
+        SELECT id FROM public.{table}
+         WHERE status IN ('queued', 'sent') AND expires_at <= now()
+         ORDER BY expires_at
+         LIMIT %s
+           FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.{table} c SET status = 'expired', error = coalesce(c.error, 'ttl expired')
+      FROM doomed
+     WHERE c.id = doomed.id
+"""
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_state: Dict[str, Any] = {"cycles": 0, "last_run": None, "last_cycle_sec": None, "last_error": None,
+                          "expired": {k: 0 for k in TABLES}}
+
+
+def run_once() -> Dict[str, int]:
+    """Vence todo lo vencido, de a BATCH_ROWS por transacción. Devuelve filas por tipo."""
+    t0 = time.perf_counter()
+    out = {k: 0 for k in TABLES}
+    with get_conn() as conn:
+        for kind, table in TABLES.items():
+            sql = _EXPIRE_SQL.format(table=table)
+            while not _stop.is_set():
+                n = conn.execute(sql, (BATCH_ROWS,)).rowcount
+                conn.commit()
+                out[kind] += n
+                if n < BATCH_ROWS:
+                    break
+            if out[kind]:
+                metrics.inc("commands_expired_total", value=out[kind], kind=kind)
+                _state["expired"][kind] += out[kind]
+                log.info("expired kind=%s rows=%s", kind, out[kind])
+    _state.update(cycles=_state["cycles"] + 1, last_run=time.time(),
+                  last_cycle_sec=round(time.perf_counter() - t0, 3))
+    return out
+
+
+def _loop() -> None:
+    log.info("command expiry start every=%.0fs ttl=%ss batch=%s", EVERY_SEC, DEFAULT_TTL_SEC, BATCH_ROWS)
+    while not _stop.is_set():
+        try:
+            run_once()
+            _state["last_error"] = None
+        except Exception as e:
+            _state["last_error"] = str(e)
+            log.warning("sweep failed err=%s", e)
+        _stop.wait(EVERY_SEC)
+    log.info("command expiry stopped")
+
+
+def start_command_expiry() -> bool:
+    global _thread
+    if not ENABLED:
+        log.info("disabled (COMMAND_EXPIRY_ENABLED=0)")
+        return True
+    if _thread and _thread.is_alive():
+        if not _stop.is_set():
+            log.info("already running")
+            return True
+        # stop anterior todavía saliendo: espera acotada; si sigue, el líder
+        # reintenta en la próxima vuelta (ver leader._start_jobs)
+        _thread.join(timeout=2)
+        if _thread.is_alive():
+            log.info("previous thread still exiting; start deferred")
+            return False
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="command-expiry", daemon=True)
+    _thread.start()
+    log.info("thread started")
+    return True
+
+
+def stop_command_expiry() -> None:
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=10)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "alive": bool(_thread and _thread.is_alive()),
+        "default_ttl_sec": DEFAULT_TTL_SEC,
+        "every_sec": EVERY_SEC,
+        "batch_rows": BATCH_ROWS,
+        **_state,
+    }
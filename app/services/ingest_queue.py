@@ -0,0 +1,294 @@
+# app/services/ingest_queue.py
+"""
+Ingest asíncrono (fire-and-forget):
+  - el handler valida, encola y responde 202 (503 si la cola está llena)
+  - un hilo writer drena la cola en batches: una transacción por batch,
+    después bump de presencia y evaluación de alarmas
+  - al apagar, primero se deja de aceptar (submit → False → 503, el device
+    reintenta contra otro worker o después) y el writer drena lo pendiente
+    antes de salir (INGEST_QUEUE_DRAIN_SEC). Lo que no llega a escribirse en
+    ese plazo se cuenta en ingest_queue_dropped_total y se loguea
+
+La alarma se evalúa con la lectura más NUEVA (por ts) de cada tanque dentro
+del batch (la evaluación es por estado, no por evento): un pico que entra y
+sale del umbral dentro de un mismo batch no levanta alarma. Si el tanque ya
+tiene una lectura más nueva en la DB (buffer offline que llegó tarde), no se
+evalúa.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg import errors as psy_errors
+
+from app.core import metrics, profiler
+from app.core.db import get_conn
+from app.repos import hot
+from app.repos import tanks as tanks_repo
+from app.repos import pumps as pumps_repo
+
+log = logging.getLogger("ingest-queue")
+
+ASYNC_DEFAULT = os.getenv("INGEST_ASYNC", "0").lower() in ("1", "true", "yes")
+QUEUE_MAX = int(os.getenv("INGEST_QUEUE_MAX", "10000"))
+BATCH = int(os.getenv("INGEST_QUEUE_BATCH", "500"))
+FLUSH_SEC = float(os.getenv("INGEST_QUEUE_FLUSH_SEC", "0.2"))
+DRAIN_SEC = float(os.getenv("INGEST_QUEUE_DRAIN_SEC", "15"))
+RETRY_MAX_SEC = 10.0
+
+_q: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=QUEUE_MAX)
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_drain_deadline: float = 0.0
+# submit() y stop_ingest_writer() se serializan acá: una vez que empieza el
+# drenaje no entra nada más a la cola
+_accept_lock = threading.Lock()
+_accepting = False
+_inflight = 0  # lecturas del batch que el writer está escribiendo
+
+
+def wants_async(prefer: Optional[str], async_param: Optional[bool]) -> bool:
+    """Modo por request: ?async=1 o 'Prefer: respond-async'; si no, INGEST_ASYNC."""
+    if async_param is not None:
+        return bool(async_param)
+    if prefer and "respond-async" in prefer.lower():
+        return True
+    return ASYNC_DEFAULT
+
+
+def submit(kind: str, item: Dict[str, Any]) -> bool:
+    """
+    Encola una lectura ya validada. kind: 'tank' | 'pump'.
+    Si no trae ts se estampa ahora (hora de aceptación, no de escritura).
+    Devuelve False si la cola está llena, el writer no corre o ya se está
+    drenando para apagar (→ 503).
+    """
+    if item.get("ts") is None:
+        item["ts"] = datetime.now(timezone.utc)
+    with _accept_lock:
+        if not (_accepting and _thread and _thread.is_alive()):
+            metrics.inc("ingest_queue_rejected_total", kind=kind, reason="writer_down")
+            return False
+        try:
+            _q.put_nowait((kind, item))
+        except queue.Full:
+            metrics.inc("ingest_queue_rejected_total", kind=kind, reason="full")
+            return False
+    metrics.inc("ingest_queue_accepted_total", kind=kind)
+    return True
+
+
+def depth() -> int:
+    return _q.qsize()
+
+
+# -----------------------------
+# Writer
+# -----------------------------
+def _collect() -> List[Tuple[str, Dict[str, Any]]]:
+    try:
+        first = _q.get(timeout=FLUSH_SEC)
+    except queue.Empty:
+        return []
+    batch = [first]
+    while len(batch) < BATCH:
+        try:
+            batch.append(_q.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _insert(kind: str, rows: List[Dict[str, Any]], done: List[Dict[str, Any]]) -> None:
+    """
+    Escribe `rows` y agrega a `done` lo insertado. Lo que se escribe (o se
+    descarta por inválido) sale de `rows`: si un error transitorio corta el
+    fallback de a una, el reintento sigue con el resto y no duplica lo ya
+    commiteado.
+    """
+    fn = tanks_repo.insert_tank_readings_batch if kind == "tank" else pumps_repo.insert_pump_readings_batch
+    try:
+        done.extend(fn(rows))
+        rows.clear()
+        return
+    except (psy_errors.IntegrityError, psy_errors.DataError) as e:
+        # Alguna fila es inválida (FK, check...): de a una para no perder el resto
+        log.warning("batch rejected kind=%s size=%s err=%s; retrying row by row", kind, len(rows), e)
+    while rows:
+        r = rows[0]
+        try:
+            done.extend(fn([r]))
+        except (psy_errors.IntegrityError, psy_errors.DataError) as e1:
+            metrics.inc("ingest_queue_dropped_total", kind=kind)
+            log.error("drop reading kind=%s err=%s row=%r", kind, e1, {k: r.get(k) for k in ("tank_id", "device_id")})
+        rows.pop(0)
+
+
+def _insert_with_retry(kind: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Errores transitorios (DB caída, pool agotado): reintenta lo pendiente hasta poder escribir."""
+    pending, done = list(rows), []
+    attempt = 0
+    while True:
+        try:
+            _insert(kind, pending, done)
+            return done
+        except Exception as e:
+            attempt += 1
+            if _stop.is_set() and time.monotonic() > _drain_deadline:
+                metrics.inc("ingest_queue_dropped_total", value=len(pending), kind=kind)
+                log.error("drain timeout; dropping %s %s readings err=%s", len(pending), kind, e)
+                return done
+            wait_s = min(RETRY_MAX_SEC, 0.5 * 2 ** attempt)
+            log.warning("batch write failed kind=%s size=%s attempt=%s retry_in=%.1fs err=%s",
+                        kind, len(pending), attempt, wait_s, e)
+            time.sleep(wait_s)
+
+
+def _utc(ts: datetime) -> datetime:
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def _after_write(tanks: List[Dict[str, Any]]) -> None:
+    from app.repos.presence import bump_presence
+    try:
+        from app.services.alarms_eval import eval_tank_alarm
+    except Exception as e:
+        log.exception("import eval_tank_alarm failed err=%s", e)
+        eval_tank_alarm = None
+
+    for dev in {r.get("device_id") for r in tanks if r.get("device_id")}:
+        try:
+            bump_presence(dev)
+        except Exception as e:
+            log.warning("[presence] bump failed err=%s", e)
+
+    if eval_tank_alarm is None:
+        return
+    newest: Dict[int, Dict[str, Any]] = {}
+    for r in tanks:  # la más nueva por ts (no por llegada: hay buffers offline)
+        cur = newest.get(r["tank_id"])
+        if cur is None or _utc(r["ts"]) >= _utc(cur["ts"]):
+            newest[r["tank_id"]] = r
+    try:
+        with get_conn() as conn:
+            late = set(hot.late_tanks(conn, {tid: r["ts"] for tid, r in newest.items()}))
+    except Exception as e:
+        log.warning("late readings check failed err=%s", e)
+        late = set()
+    for tank_id, r in newest.items():
+        if tank_id in late:
+            # Ya hay una lectura más nueva (de otro batch o del camino sync):
+            # el estado de alarmas lo define esa
+            metrics.inc("alarm_eval_skipped_total", reason="late_reading")
+            continue
+        try:
+            with profiler.phase("alarm_eval"):
+                eval_tank_alarm(tank_id, r["level_percent"])
+        except Exception as e:
+            log.warning("alarm eval failed tank_id=%s err=%s", tank_id, e)
+
+
+def _write(batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+    by_kind: Dict[str, List[Dict[str, Any]]] = {"tank": [], "pump": []}
+    for kind, item in batch:
+        by_kind[kind].append(item)
+
+    for kind, rows in by_kind.items():
+        if not rows:
+            continue
+        done = _insert_with_retry(kind, rows)
+        metrics.inc("ingest_readings_total", value=len(done), kind=kind)
+        # Sin label device: lo manda el payload (cardinalidad sin límite). asset_id
+        # sí: la lectura ya se insertó, así que es un activo existente (FK)
+        per_asset = Counter(r["tank_id"] if kind == "tank" else r["payload"].pump_id for r in done)
+        for asset_id, n in per_asset.items():
+            metrics.inc("ingest_asset_readings_total", value=n, kind=kind, asset_id=asset_id)
+        dups = sum(1 for r in rows if r.get("dedupe_key")) - sum(1 for r in done if r.get("dedupe_key"))
+        if dups > 0:
+            metrics.inc("ingest_duplicates_total", value=dups, kind=kind)
+        if kind == "tank" and done:
+            _after_write(done)
+
+
+def _loop() -> None:
+    global _inflight
+    log.info("writer start max=%s batch=%s flush=%.2fs", QUEUE_MAX, BATCH, FLUSH_SEC)
+    while not (_stop.is_set() and _q.empty()):
+        batch = _collect()
+        if not batch:
+            continue
+        _inflight = len(batch)
+        try:
+            _write(batch)
+        except Exception as e:
+            log.exception("writer loop error err=%s", e)
+        finally:
+            _inflight = 0
+            for _ in batch:
+                _q.task_done()
+    log.info("writer stopped pending=%s", _q.qsize())
+
+
+def start_ingest_writer() -> None:
+    global _thread, _accepting
+    if _thread and _thread.is_alive():
+        log.info("already running")
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="ingest-writer", daemon=True)
+    _thread.start()
+    with _accept_lock:
+        _accepting = True
+    log.info("thread started")
+
+
+def _discard_pending() -> Counter:
+    """Vacía la cola sin escribir (el writer no llegó a tiempo). Devuelve cuántas por tipo."""
+    left: Counter = Counter()
+    while True:
+        try:
+            kind, _ = _q.get_nowait()
+        except queue.Empty:
+            return left
+        _q.task_done()
+        left[kind] += 1
+
+
+def stop_ingest_writer() -> None:
+    """Deja de aceptar y drena lo encolado (hasta INGEST_QUEUE_DRAIN_SEC)."""
+    global _accepting, _drain_deadline
+    with _accept_lock:
+        _accepting = False
+    _drain_deadline = time.monotonic() + DRAIN_SEC
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=DRAIN_SEC + 1)
+    left = _discard_pending()
+    for kind, n in left.items():
+        metrics.inc("ingest_queue_dropped_total", value=n, kind=kind)
+    if left:
+        log.error("drain timeout; %s accepted readings not written %s", sum(left.values()), dict(left))
+    if _thread and _thread.is_alive():
+        # Sigue reintentando un batch: se pierde si el proceso sale antes
+        log.error("drain timeout; writer still busy with %s readings", _inflight)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "alive": bool(_thread and _thread.is_alive()),
+        "accepting": _accepting,
+        "async_default": ASYNC_DEFAULT,
+        "depth": _q.qsize(),
+        "inflight": _inflight,
+        "max": QUEUE_MAX,
+        "batch": BATCH,
+        "flush_sec": FLUSH_SEC,
+    }
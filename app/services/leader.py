@@ -0,0 +1,244 @@
+# app/services/leader.py
+"""
+Elección de líder entre procesos (workers de uvicorn, réplicas del contenedor)
+para los jobs de fondo que tienen que correr UNA sola vez: alarm poller,
+alarm listener, retención/rollups y mantenimiento de particiones.
+
+Cómo funciona:
+  - Cada proceso abre una conexión dedicada (autocommit, fuera del pool) y
+    cada LEADER_RETRY_SEC intenta pg_try_advisory_lock(LEADER_LOCK_KEY).
+  - El que lo consigue es líder: arranca los jobs registrados (register()).
+    Mientras lo sea, cada LEADER_CHECK_SEC verifica en pg_locks que el lock
+    sigue siendo suyo.
+  - El lock es de sesión: si el líder muere o pierde la conexión, Postgres lo
+    libera y otro proceso lo toma en el próximo intento (failover ≈
+    LEADER_RETRY_SEC). Del lado del líder, un error en la conexión o el lock
+    ausente lo degradan: para sus jobs antes de reconectar. Keepalives TCP y
+    tcp_user_timeout acotan cuánto tarda en enterarse de una red caída.
+
+La conexión usa EVENTS_DB_URL si está (igual que LISTEN/NOTIFY): un lock de
+sesión NO funciona detrás de PgBouncer en modo transaction.
+
+LEADER_ELECTION=0 vuelve al comportamiento anterior: cada proceso corre todos
+los jobs (solo tiene sentido con un único worker).
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg
+
+from app.core import metrics
+from app.core.db import CONNECT_TIMEOUT, EVENTS_DSN
+
+log = logging.getLogger("leader")
+
+ENABLED = os.getenv("LEADER_ELECTION", "1").lower() in ("1", "true", "yes", "on")
+LOCK_KEY = int(os.getenv("LEADER_LOCK_KEY", str(0x6C656164)))  # 'lead'
+RETRY_SEC = float(os.getenv("LEADER_RETRY_SEC", "5"))
+CHECK_SEC = float(os.getenv("LEADER_CHECK_SEC", "5"))
+TCP_TIMEOUT_MS = int(os.getenv("LEADER_TCP_TIMEOUT_MS", "10000"))
+
+_HELD_SQL = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_locks
+         WHERE locktype = 'advisory' AND granted AND pid = pg_backend_pid()
+           AND objsubid = 1 AND ((classid::bigint << 32) | objid::bigint) = %s
+    )
+"""
+
+_HOLDER_SQL = """
+    SELECT l.pid, a.application_name FROM pg_locks l
+      LEFT JOIN pg_stat_activity a ON a.pid = l.pid
+     WHERE l.locktype = 'advisory' AND l.granted
+       AND l.objsubid = 1 AND ((l.classid::bigint << 32) | l.objid::bigint) = %s
+     LIMIT 1
+"""
+
+
+@dataclass
+class _Job:
+    name: str
+    start: Callable[[], None]
+    stop: Callable[[], None]
+    running: bool = False
+
+
+_jobs: List[_Job] = []
+_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_state: Dict[str, Any] = {"is_leader": False, "since": None, "holder": None, "error": None}
+
+
+def register(name: str, start: Callable[[], None], stop: Callable[[], None]) -> None:
+    """
+    Job que corre solo en el líder. Registrar antes de start_leader_election().
+    Si start() devuelve False (el thread de un stop anterior todavía no salió)
+    el job queda sin arrancar y se reintenta en cada vuelta de la elección.
+    """
+    _jobs[:] = [j for j in _jobs if j.name != name]
+    _jobs.append(_Job(name, start, stop))
+
+
+def is_leader() -> bool:
+    return bool(_state["is_leader"])
+
+
+def _start_jobs() -> None:
+    for job in _jobs:
+        if job.running:
+            continue
+        try:
+            if job.start() is False:
+                log.info("job start deferred name=%s", job.name)
+                continue
+            job.running = True
+            log.info("job started name=%s", job.name)
+        except Exception as e:
+            log.exception("job start failed name=%s err=%s", job.name, e)
+
+
+def _stop_jobs() -> None:
+    for job in reversed(_jobs):
+        if not job.running:
+            continue
+        try:
+            job.stop()
+            log.info("job stopped name=%s", job.name)
+        except Exception as e:
+            log.exception("job stop failed name=%s err=%s", job.name, e)
+        job.running = False
+
+
+def _promote(holder: Dict[str, Any]) -> None:
+    # Si el demote fue hace poco, el stop de cada job pudo volver por timeout
+    # con el thread todavía terminando su vuelta (una sentencia larga de la
+    # retención, por ejemplo). Los start_* lo esperan un rato acotado y, si
+    # sigue vivo, devuelven False: el job queda sin arrancar y _loop lo
+    # reintenta en cada chequeo, sin bloquear la elección con el _lock tomado.
+    with _lock:
+        _state.update(is_leader=True, since=time.time(), holder=holder, error=None)
+        metrics.inc("leader_transitions_total", to="leader", reason="acquired")
+        log.info("became leader pid=%s jobs=%s", os.getpid(), [j.name for j in _jobs])
+        _start_jobs()
+
+
+def _demote(reason: str) -> None:
+    with _lock:
+        if not _state["is_leader"]:
+            return
+        log.warning("leadership lost pid=%s reason=%s", os.getpid(), reason)
+        _stop_jobs()
+        _state.update(is_leader=False, since=time.time(), holder=None)
+        metrics.inc("leader_transitions_total", to="follower", reason=reason)
+
+
+def _connect() -> psycopg.Connection:
+    return psycopg.connect(
+        EVENTS_DSN, autocommit=True, connect_timeout=CONNECT_TIMEOUT,
+        application_name=f"leader-{os.getpid()}",
+        keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3,
+        tcp_user_timeout=TCP_TIMEOUT_MS,
+    )
+
+
+def _close(conn: Optional[psycopg.Connection]) -> None:
+    if conn is None:
+        return
+    try:
+        conn.close()  # cerrar la sesión libera el lock
+    except Exception:
+        pass
+
+
+def _loop() -> None:
+    log.info("election start key=%s retry=%.1fs check=%.1fs", LOCK_KEY, RETRY_SEC, CHECK_SEC)
+    conn: Optional[psycopg.Connection] = None
+    while not _stop.is_set():
+        wait = RETRY_SEC
+        try:
+            if conn is None or conn.closed:
+                conn = _connect()
+            if not _state["is_leader"]:
+                if conn.execute("SELECT pg_try_advisory_lock(%s)", (LOCK_KEY,)).fetchone()[0]:
+                    _promote({"pid": conn.info.backend_pid, "application_name": f"leader-{os.getpid()}"})
+                    wait = CHECK_SEC
+                else:
+                    row = conn.execute(_HOLDER_SQL, (LOCK_KEY,)).fetchone()
+                    _state["holder"] = {"pid": row[0], "application_name": row[1]} if row else None
+            else:
+                if conn.execute(_HELD_SQL, (LOCK_KEY,)).fetchone()[0]:
+                    wait = CHECK_SEC
+                    if any(not j.running for j in _jobs):
+                        with _lock:
+                            _start_jobs()
+                else:
+                    _demote("lock_missing")
+            _state["error"] = None
+        except Exception as e:
+            log.warning("election error err=%s", e)
+            _state["error"] = str(e)
+            _demote("connection")
+            _close(conn)
+            conn = None
+        _stop.wait(wait)
+    _demote("shutdown")
+    _close(conn)
+    log.info("election stopped")
+
+
+def start_leader_election() -> None:
+    global _thread
+    if not ENABLED:
+        log.info("disabled (LEADER_ELECTION=0): running all jobs in this process")
+        with _lock:
+            _state.update(is_leader=True, since=time.time(), holder=None)
+            _start_jobs()
+        return
+    if _thread and _thread.is_alive():
+        log.info("already running")
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="leader-election", daemon=True)
+    _thread.start()
+    log.info("thread started")
+
+
+def stop_leader_election() -> None:
+    """Para los jobs (si es líder) y suelta el lock: otro proceso toma el relevo."""
+    if not ENABLED:
+        with _lock:
+            _stop_jobs()
+            _state.update(is_leader=False, holder=None)
+        return
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=30)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "pid": os.getpid(),
+        "alive": bool(_thread and _thread.is_alive()) if ENABLED else None,
+        "lock_key": LOCK_KEY,
+        "is_leader": _state["is_leader"],
+        "since": _state["since"],
+        "holder": _state["holder"],
+        "error": _state["error"],
+        "jobs": {j.name: j.running for j in _jobs},
+    }
+
+
+def _leader_gauges():
+    yield "leader_is_leader", {}, 1 if _state["is_leader"] else 0
+
+
+metrics.register_collector(_leader_gauges)
@@ -1,7 +1,6 @@
 # app/services/notify_alarm.py
 from __future__ import annotations
 
-import os
 import logging
 
 from ..core.telegram import send_telegram  # sender asíncrono existente
@@ -9,11 +8,6 @@ from ..core.telegram import send_telegram  # sender asíncrono existente
 # -----------------------------------------------------------------------------
 # Logging
 # -----------------------------------------------------------------------------
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL, logging.INFO),
-    format="ts=%(asctime)s level=%(levelname)s module=%(name)s msg=%(message)s",
-)
 log = logging.getLogger("notify-alarm")
 
 __all__ = ["notify_alarm", "notify_ack"]  # para que quede claro qué exportamos
@@ -0,0 +1,135 @@
+# app/services/partitions.py
+"""
+Mantenimiento de las particiones mensuales de tank_readings / pump_readings
+(ver app/migrations/0003 y 0004):
+
+  - al arrancar y cada PARTITION_MAINT_SEC crea los meses que faltan hasta
+    PARTITION_MONTHS_AHEAD hacia adelante (no hay partición DEFAULT: un insert
+    fuera de rango falla, así que siempre tiene que existir el mes actual y
+    los próximos)
+
+La retención (DROP de meses vencidos) la hace app/services/retention.py, que
+antes verifica que el mes ya esté compactado en los rollups.
+
+Si la tabla todavía no está particionada (falta la migración 0004) no hace nada.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core import metrics
+from app.core.db import get_conn
+
+log = logging.getLogger("partitions")
+
+TABLES = ("tank_readings", "pump_readings")
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+MAINT_SEC = float(os.getenv("PARTITION_MAINT_SEC", "21600"))  # 6 h
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_last: Dict[str, Any] = {}
+
+_IS_PARTITIONED_SQL = """
+    SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+     WHERE n.nspname = 'public' AND c.relname = %s;
+"""
+
+_PARTITIONS_SQL = """
+    SELECT c.relname AS name,
+           pg_get_expr(c.relpartbound, c.oid) AS bounds,
+           GREATEST(c.reltuples, 0)::bigint AS est_rows,
+           pg_total_relation_size(c.oid) AS bytes
+      FROM pg_inherits i
+      JOIN pg_class c ON c.oid = i.inhrelid
+     WHERE i.inhparent = %s::regclass
+     ORDER BY c.relname;
+"""
+
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute(_IS_PARTITIONED_SQL, (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def run_once(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """Crea los meses faltantes. Devuelve cuántos creó por tabla."""
+    now = now or datetime.now(timezone.utc)
+    until = (now + timedelta(days=31 * MONTHS_AHEAD)).date()
+    out: Dict[str, Any] = {}
+    with get_conn() as conn, conn.cursor() as cur:
+        for table in TABLES:
+            if not _is_partitioned(cur, table):
+                out[table] = {"partitioned": False}
+                continue
+            cur.execute("SELECT public.ensure_monthly_partitions(%s::regclass, %s, %s);",
+                        (f"public.{table}", now.date(), until))
+            created = cur.fetchone()[0]
+            conn.commit()
+            if created:
+                metrics.inc("partitions_created_total", value=created, table=table)
+            out[table] = {"partitioned": True, "created": created}
+    _last.update({"ts": now.isoformat(), "result": out})
+    return out
+
+
+def list_partitions() -> Dict[str, List[Dict[str, Any]]]:
+    from psycopg.rows import dict_row
+    out: Dict[str, List[Dict[str, Any]]] = {}
+    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+        for table in TABLES:
+            cur.execute(_PARTITIONS_SQL, (f"public.{table}",))
+            out[table] = cur.fetchall()
+    return out
+
+
+def _loop() -> None:
+    log.info("maintenance start every=%.0fs ahead=%s", MAINT_SEC, MONTHS_AHEAD)
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception as e:
+            log.exception("maintenance error err=%s", e)
+            _last.update({"error": str(e)})
+        _stop.wait(MAINT_SEC)
+    log.info("maintenance stopped")
+
+
+def start_partition_maintenance() -> bool:
+    global _thread
+    if _thread and _thread.is_alive():
+        if not _stop.is_set():
+            log.info("already running")
+            return True
+        # stop anterior todavía saliendo: espera acotada; si sigue, el líder
+        # reintenta en la próxima vuelta (ver leader._start_jobs)
+        _thread.join(timeout=2)
+        if _thread.is_alive():
+            log.info("previous thread still exiting; start deferred")
+            return False
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="partition-maint", daemon=True)
+    _thread.start()
+    log.info("thread started")
+    return True
+
+
+def stop_partition_maintenance() -> None:
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=5)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "alive": bool(_thread and _thread.is_alive()),
+        "months_ahead": MONTHS_AHEAD,
+        "every_sec": MAINT_SEC,
+        "last": dict(_last),
+    }
@@ -0,0 +1,316 @@
+# app/services/presence_store.py
+"""
+Presencia de devices por WebSocket compartida entre workers e instancias.
+
+El dict en memoria de cada proceso es un cache write-back delante de un
+backend compartido:
+
+  - Escribir (conexión, beat, desconexión) solo toca el dict y marca la
+    entrada como sucia: sin I/O en el socket.
+  - Un thread por proceso (PRESENCE_FLUSH_SEC, default 1 s) sube las sucias
+    en UN upsert por lote (gana el last_seen más nuevo; la desconexión lleva
+    el last_seen del último mensaje, no la hora del cierre: un worker que
+    cierra tarde no pisa la reconexión en otro) y baja lo que cambiaron los demás
+    (updated_at > marca de agua, con solapamiento por commits tardíos).
+  - Leer (presence_snapshot, /tanks/{id}/conn) es siempre un lookup en el
+    dict: sub-milisegundo, atrasado como mucho un flush respecto de otros
+    workers.
+  - Barrido TTL: una entrada online sin beats en PRESENCE_TTL_SEC pasa a
+    offline (el worker murió sin avisar) y las de más de PRESENCE_PURGE_SEC
+    se borran. En Postgres lo hace solo el líder (services/leader.py).
+
+Backends (PRESENCE_BACKEND):
+  postgres  tabla UNLOGGED device_presence (migración 0009), pool de escritura
+  memory    dict del proceso: para tests o un único worker
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core import metrics
+from app.core.db import get_conn
+from app.core.metrics import db_timed
+
+log = logging.getLogger("presence")
+
+BACKEND = os.getenv("PRESENCE_BACKEND", "postgres").lower()
+FLUSH_SEC = float(os.getenv("PRESENCE_FLUSH_SEC", "1"))
+TTL_SEC = int(os.getenv("PRESENCE_TTL_SEC", os.getenv("TELEMETRY_TTL_SECONDS", "30")))
+PURGE_SEC = int(os.getenv("PRESENCE_PURGE_SEC", "86400"))
+SWEEP_SEC = float(os.getenv("PRESENCE_SWEEP_SEC", "15"))
+PULL_OVERLAP_SEC = 2.0  # re-leer un poco para atrás: commits con now() anterior a la marca
+
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+# (online, last_seen, worker, updated_at)
+Entry = Tuple[bool, datetime, Optional[str], datetime]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# -----------------------------
+# Backends
+# -----------------------------
+class MemoryBackend:
+    """Stand-in en proceso con la misma semántica que el de Postgres."""
+
+    def __init__(self) -> None:
+        self._rows: Dict[str, Entry] = {}
+        self._lock = threading.Lock()
+
+    def upsert_many(self, rows: List[Tuple[str, bool, datetime, Optional[str]]]) -> None:
+        now = _now()
+        with self._lock:
+            for dev, online, last_seen, worker in rows:
+                cur = self._rows.get(dev)
+                if cur is None or cur[1] <= last_seen:
+                    self._rows[dev] = (online, last_seen, worker, now)
+
+    def changed_since(self, since: Optional[datetime]) -> List[Tuple[str, Entry]]:
+        with self._lock:
+            return [(d, e) for d, e in self._rows.items() if since is None or e[3] > since]
+
+    def sweep(self, ttl_sec: int, purge_sec: int) -> Tuple[int, int]:
+        now = _now()
+        expired, purged = 0, 0
+        with self._lock:
+            for dev, (online, last_seen, worker, _) in list(self._rows.items()):
+                if now - last_seen > timedelta(seconds=purge_sec):
+                    del self._rows[dev]
+                    purged += 1
+                elif online and now - last_seen > timedelta(seconds=ttl_sec):
+                    self._rows[dev] = (False, last_seen, worker, now)
+                    expired += 1
+        return expired, purged
+
+
+_UPSERT_SQL = """
+    INSERT INTO public.device_presence AS p (device_id, online, last_seen, worker, updated_at)
+    SELECT d, o, s, w, now()
+      FROM unnest(%s::text[], %s::boolean[], %s::timestamptz[], %s::text[]) AS t(d, o, s, w)
+    ON CONFLICT (device_id) DO UPDATE
+       SET online = EXCLUDED.online, last_seen = EXCLUDED.last_seen,
+           worker = EXCLUDED.worker, updated_at = now()
+     WHERE p.last_seen <= EXCLUDED.last_seen
+"""
+
+_CHANGED_SQL = """
+    SELECT device_id, online, last_seen, worker, updated_at
+      FROM public.device_presence
+     WHERE updated_at > %s
+"""
+
+_SWEEP_SQL = """
+    UPDATE public.device_presence SET online = false, updated_at = now()
+     WHERE online AND last_seen < now() - make_interval(secs => %s)
+"""
+
+_PURGE_SQL = "DELETE FROM public.device_presence WHERE last_seen < now() - make_interval(secs => %s)"
+
+
+class PostgresBackend:
+    @db_timed
+    def upsert_many(self, rows: List[Tuple[str, bool, datetime, Optional[str]]]) -> None:
+        cols = list(zip(*rows))
+        with get_conn() as conn:
+            conn.execute(_UPSERT_SQL, [list(c) for c in cols])
+            conn.commit()
+
+    @db_timed
+    def changed_since(self, since: Optional[datetime]) -> List[Tuple[str, Entry]]:
+        with get_conn() as conn:
+            rows = conn.execute(_CHANGED_SQL, (since or datetime.min.replace(tzinfo=timezone.utc),)).fetchall()
+            conn.commit()
+        return [(d, (o, s, w, u)) for d, o, s, w, u in rows]
+
+    @db_timed
+    def sweep(self, ttl_sec: int, purge_sec: int) -> Tuple[int, int]:
+        with get_conn() as conn:
+            expired = conn.execute(_SWEEP_SQL, (ttl_sec,)).rowcount
+            purged = conn.execute(_PURGE_SQL, (purge_sec,)).rowcount
+            conn.commit()
+        return expired, purged
+
+
+# -----------------------------
+# Cache write-back
+# -----------------------------
+class PresenceStore:
+    def __init__(self, backend: Any) -> None:
+        self.backend = backend
+        self._cache: Dict[str, Entry] = {}
+        self._dirty: Dict[str, Tuple[bool, datetime]] = {}
+        self._lock = threading.Lock()
+        self._watermark: Optional[datetime] = None
+        self._last_sweep = 0.0
+        self.stats: Dict[str, Any] = {"flushes": 0, "flushed_rows": 0, "pulled_rows": 0, "errors": 0,
+                                      "expired": 0, "purged": 0, "last_error": None}
+
+    # --- escrituras (desde el socket: sin I/O) ---
+    def mark(self, device_id: str, online: bool, ts: Optional[datetime] = None) -> datetime:
+        """
+        Estado del device a la hora `ts` (default: ahora); devuelve esa hora.
+        Un offline tiene que llevar la hora del último mensaje de la conexión
+        que se cierra, no la del cierre: así la reconexión (en este worker o en
+        otro, con un last_seen posterior) gana en el upsert y en el merge.
+        """
+        ts = ts or _now()
+        with self._lock:
+            cur = self._cache.get(device_id)
+            if cur is not None and cur[1] > ts:
+                return ts  # ya hay algo más nuevo
+            self._cache[device_id] = (online, ts, WORKER, ts)
+            self._dirty[device_id] = (online, ts)
+        return ts
+
+    def touch(self, device_id: str) -> datetime:
+        return self.mark(device_id, True)
+
+    # --- lecturas ---
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        e = self._cache.get(device_id)
+        if e is None:
+            return None
+        return {"online": e[0], "last_seen": e[1], "worker": e[2]}
+
+    # --- sincronización con el backend ---
+    def _merge(self, rows: Iterable[Tuple[str, Entry]]) -> int:
+        n = 0
+        with self._lock:
+            for dev, e in rows:
+                n += 1
+                if self._watermark is None or e[3] > self._watermark:
+                    self._watermark = e[3]
+                cur = self._cache.get(dev)
+                if dev in self._dirty and self._dirty[dev][1] >= e[1]:
+                    continue  # lo local todavía no subió y es más nuevo
+                if cur is None or cur[1] <= e[1]:
+                    self._cache[dev] = e
+        return n
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if dirty:
+            rows = [(d, o, ts, WORKER) for d, (o, ts) in dirty.items()]
+            t0 = time.perf_counter()
+            try:
+                self.backend.upsert_many(rows)
+            except Exception:
+                with self._lock:  # devolverlas sin pisar escrituras más nuevas
+                    for d, v in dirty.items():
+                        if d not in self._dirty:
+                            self._dirty[d] = v
+                raise
+            metrics.observe("presence_flush_seconds", time.perf_counter() - t0)
+            metrics.inc("presence_flushed_rows_total", value=len(rows))
+            self.stats["flushed_rows"] += len(rows)
+        self.stats["flushes"] += 1
+
+    def pull(self) -> None:
+        since = self._watermark - timedelta(seconds=PULL_OVERLAP_SEC) if self._watermark else None
+        self.stats["pulled_rows"] += self._merge(self.backend.changed_since(since))
+
+    def sweep(self) -> None:
+        expired, purged = self.backend.sweep(TTL_SEC, PURGE_SEC)
+        self.stats["expired"] += expired
+        self.stats["purged"] += purged
+        if purged:
+            cutoff = _now() - timedelta(seconds=PURGE_SEC)
+            with self._lock:
+                for dev in [d for d, e in self._cache.items() if e[1] < cutoff and d not in self._dirty]:
+                    del self._cache[dev]
+
+    def sync(self, sweep_allowed: bool) -> None:
+        self.flush()
+        self.pull()
+        if sweep_allowed and time.monotonic() - self._last_sweep >= SWEEP_SEC:
+            self._last_sweep = time.monotonic()
+            self.sweep()
+
+    def status(self) -> Dict[str, Any]:
+        online_cutoff = _now() - timedelta(seconds=TTL_SEC)
+        return {
+            "backend": type(self.backend).__name__,
+            "worker": WORKER,
+            "cached": len(self._cache),
+            "online": sum(1 for e in self._cache.values() if e[0] and e[1] >= online_cutoff),
+            "local": sum(1 for e in self._cache.values() if e[2] == WORKER and e[0]),
+            "dirty": len(self._dirty),
+            "watermark": self._watermark.isoformat() if self._watermark else None,
+            **self.stats,
+        }
+
+
+store = PresenceStore(MemoryBackend() if BACKEND == "memory" else PostgresBackend())
+
+
+# -----------------------------
+# Thread de sincronización (uno por proceso)
+# -----------------------------
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+def _sweep_allowed() -> bool:
+    if isinstance(store.backend, MemoryBackend):
+        return True
+    from app.services import leader
+    return leader.is_leader()
+
+
+def _loop() -> None:
+    log.info("presence sync start backend=%s flush=%.1fs ttl=%ss worker=%s", BACKEND, FLUSH_SEC, TTL_SEC, WORKER)
+    while not _stop.is_set():
+        try:
+            store.sync(_sweep_allowed())
+        except Exception as e:
+            store.stats["errors"] += 1
+            store.stats["last_error"] = str(e)
+            log.warning("presence sync failed err=%s", e)
+        _stop.wait(FLUSH_SEC)
+    try:
+        store.flush()  # las desconexiones del apagado
+    except Exception as e:
+        log.warning("presence final flush failed err=%s", e)
+    log.info("presence sync stopped")
+
+
+def start_presence_sync() -> None:
+    global _thread
+    if _thread and _thread.is_alive():
+        log.info("already running")
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="presence-sync", daemon=True)
+    _thread.start()
+    log.info("thread started")
+
+
+def stop_presence_sync() -> None:
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=10)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {"alive": bool(_thread and _thread.is_alive()), **store.status()}
+
+
+def _presence_gauges():
+    s = store.status()
+    yield "presence_cached", {}, s["cached"]
+    yield "presence_online", {}, s["online"]
+    yield "presence_dirty", {}, s["dirty"]
+
+
+metrics.register_collector(_presence_gauges)
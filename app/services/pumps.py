@@ -1,6 +1,7 @@
 from fastapi import HTTPException
 from app.repos import pumps as repo
 from app.repos import pump_commands as cmd_repo
+from app.services.command_expiry import DEFAULT_TTL_SEC
 
 def _to_bool_loose(v):
     if isinstance(v, bool) or v is None:
@@ -12,7 +13,7 @@ def _to_bool_loose(v):
         return False
     return None
 
-def queue_command(pump_id: int, cmd: str, user: str, speed_pct: int | None):
+def queue_command(pump_id: int, cmd: str, user: str, speed_pct: int | None, ttl_sec: int | None = None):
     # 1) Config normalizada (vista)
     row = repo.get_normalized_pump_config(pump_id)
     if not row:
@@ -60,7 +61,7 @@ def queue_command(pump_id: int, cmd: str, user: str, speed_pct: int | None):
         payload = {"speed_pct": int(sp)}
 
     # 4) Encolar
-    return cmd_repo.enqueue_pump_command(pump_id, cmd, payload, user)
+    return cmd_repo.enqueue_pump_command(pump_id, cmd, payload, user, ttl_sec or DEFAULT_TTL_SEC)
 
 # Transiciones de estado (igual que tanques)
 VALID = {
@@ -0,0 +1,480 @@
+# app/services/retention.py
+"""
+Retención + compactación de telemetría (tablas en app/migrations/0005_rollups.sql).
+
+Cada ciclo (RETENTION_EVERY_SEC), en este orden:
+
+  1) rollups: crudo → *_1m → *_1h, avanzando una marca de agua por job
+     (retention_progress) de a ventanas acotadas. Cada ventana es una
+     transacción corta: agrega, hace upsert del bucket y mueve la marca.
+     Las lecturas que llegan tarde (ts ya detrás de la marca) dejan su hora
+     en rollup_dirty (trigger, migración 0013): el job re-agrega esas horas
+     y marca las mismas para el rollup 1h.
+  2) poda: borra lo vencido según la política de cada tabla, pero nunca más
+     allá de la marca de agua del rollup que la resume ni de una hora
+     marcada que todavía no se re-agregó (no se pierde nada sin compactar). El crudo particionado se poda con DROP de meses enteros;
+     el resto con DELETE por lotes de RETENTION_BATCH_ROWS.
+
+Todas las transacciones llevan lock_timeout / statement_timeout: si algo
+tiene la tabla tomada, el lote falla rápido y se reintenta el próximo ciclo.
+Un advisory lock por job evita que dos workers compacten lo mismo.
+Progreso en /__retention y en métricas retention_*.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from app.core import metrics
+from app.core.db import get_conn
+from app.core.reading_ts import MAX_AGE_DAYS as TS_MAX_AGE_DAYS
+
+log = logging.getLogger("retention")
+
+ENABLED = os.getenv("RETENTION_ENABLED", "1").lower() in ("1", "true", "yes")
+EVERY_SEC = float(os.getenv("RETENTION_EVERY_SEC", "600"))
+
+# Política (días; 0 = para siempre)
+RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "90"))
+M1_DAYS = int(os.getenv("RETENTION_1M_DAYS", "730"))
+H1_DAYS = int(os.getenv("RETENTION_1H_DAYS", "0"))
+AUDIT_DAYS = int(os.getenv("RETENTION_AUDIT_DAYS", "365"))
+AUDIT_HEARTBEAT_DAYS = int(os.getenv("RETENTION_AUDIT_HEARTBEAT_DAYS", "7"))
+# El ledger de dedupe cubre toda la edad de ts que acepta ingest
+# (app/core/reading_ts; sin tope de edad, la del crudo): un reenvío
+# store-and-forward más viejo que el ledger se insertaría de nuevo
+_TS_WINDOW_DAYS = TS_MAX_AGE_DAYS or RAW_DAYS
+DEDUPE_DAYS = int(os.getenv("RETENTION_DEDUPE_DAYS") or (max(14, _TS_WINDOW_DAYS) if _TS_WINDOW_DAYS else 0))
+
+# Tamaño de los lotes / ritmo
+WINDOW_MIN = int(os.getenv("RETENTION_WINDOW_MIN", "60"))        # crudo por lote de rollup 1m
+# Margen para lecturas tardías. Lo que llega más tarde que esto lo cubre
+# rollup_dirty, cuyo trigger marca lo que viene con más de 5 min de atraso:
+# con un delay menor quedaría una franja sin cubrir
+LATE_MARK_MIN = 5
+ROLLUP_DELAY_MIN = max(int(os.getenv("RETENTION_ROLLUP_DELAY_MIN", "15")), LATE_MARK_MIN)
+BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))
+MAX_BATCHES = int(os.getenv("RETENTION_MAX_BATCHES", "100"))     # por job y por ciclo
+PAUSE_SEC = float(os.getenv("RETENTION_PAUSE_SEC", "0.1"))
+LOCK_TIMEOUT_MS = int(os.getenv("RETENTION_LOCK_TIMEOUT_MS", "2000"))
+STATEMENT_TIMEOUT_MS = int(os.getenv("RETENTION_STATEMENT_TIMEOUT_MS", "60000"))
+
+# -----------------------------------------------------------------------------
+# Rollups
+# -----------------------------------------------------------------------------
+_TANK_1M_SQL = """
+    INSERT INTO public.tank_readings_1m
+        (tank_id, bucket, n, level_avg, level_min, level_max, volume_avg, temperature_avg)
+    SELECT tank_id, date_trunc('minute', ts), count(*),
+           avg(level_percent), min(level_percent), max(level_percent),
+           avg(volume_l), avg(temperature_c)
+      FROM public.tank_readings
+     WHERE ts >= %(lo)s AND ts < %(hi)s AND tank_id IS NOT NULL
+     GROUP BY 1, 2
+    ON CONFLICT (tank_id, bucket) DO UPDATE SET
+        n = EXCLUDED.n, level_avg = EXCLUDED.level_avg, level_min = EXCLUDED.level_min,
+        level_max = EXCLUDED.level_max, volume_avg = EXCLUDED.volume_avg,
+        temperature_avg = EXCLUDED.temperature_avg;
+"""
+
+_TANK_1H_SQL = """
+    INSERT INTO public.tank_readings_1h
+        (tank_id, bucket, n, level_avg, level_min, level_max, volume_avg, temperature_avg)
+    SELECT tank_id, date_trunc('hour', bucket), sum(n),
+           sum(level_avg * n) / nullif(sum(n) FILTER (WHERE level_avg IS NOT NULL), 0),
+           min(level_min), max(level_max),
+           sum(volume_avg * n) / nullif(sum(n) FILTER (WHERE volume_avg IS NOT NULL), 0),
+           sum(temperature_avg * n) / nullif(sum(n) FILTER (WHERE temperature_avg IS NOT NULL), 0)
+      FROM public.tank_readings_1m
+     WHERE bucket >= %(lo)s AND bucket < %(hi)s
+     GROUP BY 1, 2
+    ON CONFLICT (tank_id, bucket) DO UPDATE SET
+        n = EXCLUDED.n, level_avg = EXCLUDED.level_avg, level_min = EXCLUDED.level_min,
+        level_max = EXCLUDED.level_max, volume_avg = EXCLUDED.volume_avg,
+        temperature_avg = EXCLUDED.temperature_avg;
+"""
+
+_PUMP_1M_SQL = """
+    INSERT INTO public.pump_readings_1m
+        (pump_id, bucket, n, on_ratio, flow_avg, flow_max, pressure_avg, pressure_max,
+         voltage_avg, current_avg, current_max)
+    SELECT pump_id, date_trunc('minute', ts), count(*),
+           avg(is_on::int), avg(flow_lpm), max(flow_lpm), avg(pressure_bar), max(pressure_bar),
+           avg(voltage_v), avg(current_a), max(current_a)
+      FROM public.pump_readings
+     WHERE ts >= %(lo)s AND ts < %(hi)s AND pump_id IS NOT NULL
+     GROUP BY 1, 2
+    ON CONFLICT (pump_id, bucket) DO UPDATE SET
+        n = EXCLUDED.n, on_ratio = EXCLUDED.on_ratio, flow_avg = EXCLUDED.flow_avg,
+        flow_max = EXCLUDED.flow_max, pressure_avg = EXCLUDED.pressure_avg,
+        pressure_max = EXCLUDED.pressure_max, voltage_avg = EXCLUDED.voltage_avg,
+        current_avg = EXCLUDED.current_avg, current_max = EXCLUDED.current_max;
+"""
+
+_PUMP_1H_SQL = """
+    INSERT INTO public.pump_readings_1h
+        (pump_id, bucket, n, on_ratio, flow_avg, flow_max, pressure_avg, pressure_max,
+         voltage_avg, current_avg, current_max)
+    SELECT pump_id, date_trunc('hour', bucket), sum(n),
+           sum(on_ratio * n) / nullif(sum(n) FILTER (WHERE on_ratio IS NOT NULL), 0),
+           sum(flow_avg * n) / nullif(sum(n) FILTER (WHERE flow_avg IS NOT NULL), 0),
+           max(flow_max),
+           sum(pressure_avg * n) / nullif(sum(n) FILTER (WHERE pressure_avg IS NOT NULL), 0),
+           max(pressure_max),
+           sum(voltage_avg * n) / nullif(sum(n) FILTER (WHERE voltage_avg IS NOT NULL), 0),
+           sum(current_avg * n) / nullif(sum(n) FILTER (WHERE current_avg IS NOT NULL), 0),
+           max(current_max)
+      FROM public.pump_readings_1m
+     WHERE bucket >= %(lo)s AND bucket < %(hi)s
+     GROUP BY 1, 2
+    ON CONFLICT (pump_id, bucket) DO UPDATE SET
+        n = EXCLUDED.n, on_ratio = EXCLUDED.on_ratio, flow_avg = EXCLUDED.flow_avg,
+        flow_max = EXCLUDED.flow_max, pressure_avg = EXCLUDED.pressure_avg,
+        pressure_max = EXCLUDED.pressure_max, voltage_avg = EXCLUDED.voltage_avg,
+        current_avg = EXCLUDED.current_avg, current_max = EXCLUDED.current_max;
+"""
+
+# job, tabla fuente, columna de tiempo, granularidad, SQL, ventana por lote,
+# job del que depende (no pasa su marca de agua), tabla destino (la fuente del
+# rollup siguiente: ahí se propagan las horas re-agregadas)
+ROLLUPS: List[Dict[str, Any]] = [
+    {"job": "tank_readings:1m", "src": "tank_readings", "ts_col": "ts", "grain": "minute",
+     "sql": _TANK_1M_SQL, "window": timedelta(minutes=WINDOW_MIN), "after": None,
+     "dst": "tank_readings_1m"},
+    {"job": "pump_readings:1m", "src": "pump_readings", "ts_col": "ts", "grain": "minute",
+     "sql": _PUMP_1M_SQL, "window": timedelta(minutes=WINDOW_MIN), "after": None,
+     "dst": "pump_readings_1m"},
+    {"job": "tank_readings_1m:1h", "src": "tank_readings_1m", "ts_col": "bucket", "grain": "hour",
+     "sql": _TANK_1H_SQL, "window": timedelta(minutes=WINDOW_MIN * 24), "after": "tank_readings:1m",
+     "dst": None},
+    {"job": "pump_readings_1m:1h", "src": "pump_readings_1m", "ts_col": "bucket", "grain": "hour",
+     "sql": _PUMP_1H_SQL, "window": timedelta(minutes=WINDOW_MIN * 24), "after": "pump_readings:1m",
+     "dst": None},
+]
+
+# job, tabla, columna de tiempo, filtro extra, días, rollup que tiene que
+# haber pasado el corte antes de borrar
+PRUNES: List[Dict[str, Any]] = [
+    {"job": "tank_readings:prune", "table": "tank_readings", "ts_col": "ts", "where": None,
+     "days": RAW_DAYS, "guard": "tank_readings:1m"},
+    {"job": "pump_readings:prune", "table": "pump_readings", "ts_col": "ts", "where": None,
+     "days": RAW_DAYS, "guard": "pump_readings:1m"},
+    {"job": "tank_readings_1m:prune", "table": "tank_readings_1m", "ts_col": "bucket", "where": None,
+     "days": M1_DAYS, "guard": "tank_readings_1m:1h"},
+    {"job": "pump_readings_1m:prune", "table": "pump_readings_1m", "ts_col": "bucket", "where": None,
+     "days": M1_DAYS, "guard": "pump_readings_1m:1h"},
+    {"job": "tank_readings_1h:prune", "table": "tank_readings_1h", "ts_col": "bucket", "where": None,
+     "days": H1_DAYS, "guard": None},
+    {"job": "pump_readings_1h:prune", "table": "pump_readings_1h", "ts_col": "bucket", "where": None,
+     "days": H1_DAYS, "guard": None},
+    {"job": "audit_events:heartbeat", "table": "audit_events", "ts_col": "ts", "where": "domain = 'PRESENCE'",
+     "days": AUDIT_HEARTBEAT_DAYS, "guard": None},
+    {"job": "audit_events:prune", "table": "audit_events", "ts_col": "ts", "where": None,
+     "days": AUDIT_DAYS, "guard": None},
+    {"job": "ingest_dedupe:prune", "table": "ingest_dedupe", "ts_col": "ts_first", "where": None,
+     "days": DEDUPE_DAYS, "guard": None},
+]
+
+_GET_WM_SQL = "SELECT watermark FROM public.retention_progress WHERE job = %s;"
+_SET_WM_SQL = """
+    INSERT INTO public.retention_progress (job, watermark, rows_total, updated_at)
+    VALUES (%s, %s, %s, now())
+    ON CONFLICT (job) DO UPDATE
+       SET watermark = EXCLUDED.watermark,
+           rows_total = retention_progress.rows_total + EXCLUDED.rows_total,
+           updated_at = now();
+"""
+
+# Horas marcadas por lecturas tardías (migración 0013). El DELETE toma el lock
+# de la marca: un INSERT tardío concurrente espera y la vuelve a crear; una
+# marca que tiene tomada un ingest en curso se saltea hasta el próximo ciclo
+_DIRTY_TAKE_SQL = """
+    DELETE FROM public.rollup_dirty
+     WHERE (src, bucket) = (
+        SELECT src, bucket FROM public.rollup_dirty
+         WHERE src = %s AND bucket < %s
+         ORDER BY bucket LIMIT 1 FOR UPDATE SKIP LOCKED)
+    RETURNING bucket;
+"""
+_DIRTY_FORWARD_SQL = """
+    INSERT INTO public.rollup_dirty (src, bucket) VALUES (%s, %s)
+    ON CONFLICT (src, bucket) DO UPDATE SET marked_at = EXCLUDED.marked_at;
+"""
+# Marcas delante de la marca de agua: el avance normal ya va a leer esas filas
+_DIRTY_AHEAD_SQL = "DELETE FROM public.rollup_dirty WHERE src = %s AND bucket >= %s;"
+_DIRTY_OLDEST_SQL = "SELECT min(bucket) FROM public.rollup_dirty WHERE src = %s;"
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_jobs: Dict[str, Dict[str, Any]] = {}
+_cycle: Dict[str, Any] = {"cycles": 0}
+
+
+def _job(name: str) -> Dict[str, Any]:
+    return _jobs.setdefault(name, {"rows": 0, "batches": 0})
+
+
+def _begin(cur, job: str) -> bool:
+    """Timeouts de la transacción + advisory lock del job (False = otro worker lo tiene)."""
+    cur.execute(f"SET LOCAL lock_timeout = {LOCK_TIMEOUT_MS}")
+    cur.execute(f"SET LOCAL statement_timeout = {STATEMENT_TIMEOUT_MS}")
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s));", ("retention:" + job,))
+    return bool(cur.fetchone()[0])
+
+
+def _watermark(cur, job: str) -> Optional[datetime]:
+    cur.execute(_GET_WM_SQL, (job,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+# -----------------------------------------------------------------------------
+# 1) Rollups
+# -----------------------------------------------------------------------------
+def _run_rollup(conn, spec: Dict[str, Any], now: datetime) -> None:
+    job, st = spec["job"], _job(spec["job"])
+    with conn.cursor() as cur:
+        lo = _watermark(cur, job)
+        if lo is None:
+            cur.execute(f"SELECT date_trunc(%s, min({spec['ts_col']})) FROM public.{spec['src']};",
+                        (spec["grain"],))
+            lo = cur.fetchone()[0]
+        cur.execute("SELECT date_trunc(%s, %s::timestamptz);",
+                    (spec["grain"], now - timedelta(minutes=ROLLUP_DELAY_MIN)))
+        horizon = cur.fetchone()[0]
+        if spec["after"]:
+            upstream = _watermark(cur, spec["after"])
+            if upstream is None:
+                horizon = None
+            else:
+                cur.execute("SELECT date_trunc(%s, %s::timestamptz);", (spec["grain"], upstream))
+                horizon = min(horizon, cur.fetchone()[0])
+        conn.commit()
+
+    if lo is None or horizon is None:
+        st.update({"watermark": None, "caught_up": True})
+        return
+
+    for _ in range(MAX_BATCHES):
+        hi = min(lo + spec["window"], horizon)
+        if hi <= lo or _stop.is_set():
+            break
+        with conn.cursor() as cur:
+            if not _begin(cur, job):
+                conn.rollback()
+                st["skipped"] = "locked by another worker"
+                return
+            cur.execute(spec["sql"], {"lo": lo, "hi": hi})
+            n = max(cur.rowcount, 0)
+            cur.execute(_SET_WM_SQL, (job, hi, n))
+            conn.commit()
+        lo = hi
+        st["rows"] += n
+        st["batches"] += 1
+        metrics.inc("retention_rows_total", value=n, job=job)
+        metrics.inc("retention_batches_total", job=job)
+        time.sleep(PAUSE_SEC)
+
+    st.update({
+        "watermark": lo.isoformat(),
+        "lag_sec": round((now - lo).total_seconds(), 1),
+        "caught_up": lo >= horizon,
+    })
+    _run_dirty(conn, spec, lo)
+
+
+def _run_dirty(conn, spec: Dict[str, Any], watermark: datetime) -> None:
+    """Re-agrega las horas que marcaron lecturas tardías (detrás de `watermark`)."""
+    job, st = spec["job"], _job(spec["job"])
+    redone = 0
+    for _ in range(MAX_BATCHES):
+        if _stop.is_set():
+            break
+        with conn.cursor() as cur:
+            if not _begin(cur, job):
+                conn.rollback()
+                return
+            cur.execute(_DIRTY_TAKE_SQL, (spec["src"], watermark))
+            row = cur.fetchone()
+            if row is None:
+                cur.execute(_DIRTY_AHEAD_SQL, (spec["src"], watermark))
+                conn.commit()
+                break
+            hour = row[0]
+            # Nadie tenía la marca tomada (SKIP LOCKED): las lecturas que la
+            # crearon ya commitearon y este statement las ve (READ COMMITTED)
+            cur.execute(spec["sql"], {"lo": hour, "hi": hour + timedelta(hours=1)})
+            n = max(cur.rowcount, 0)
+            if spec["dst"]:
+                cur.execute(_DIRTY_FORWARD_SQL, (spec["dst"], hour))
+            conn.commit()
+        redone += 1
+        st["rows"] += n
+        metrics.inc("retention_rows_total", value=n, job=job)
+        metrics.inc("retention_late_hours_total", job=job)
+    if redone:
+        log.info("rollup late hours job=%s hours=%s", job, redone)
+        st["late_hours"] = st.get("late_hours", 0) + redone
+
+
+# -----------------------------------------------------------------------------
+# 2) Poda
+# -----------------------------------------------------------------------------
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (f"public.{table}",))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _run_prune(conn, spec: Dict[str, Any], now: datetime) -> None:
+    job, st = spec["job"], _job(spec["job"])
+    if spec["days"] <= 0:
+        st.update({"policy": "keep forever"})
+        return
+    cutoff = now - timedelta(days=spec["days"])
+    with conn.cursor() as cur:
+        if spec["guard"]:
+            guard_wm = _watermark(cur, spec["guard"])
+            if guard_wm is None:
+                conn.commit()
+                st.update({"cutoff": None, "waiting_for": spec["guard"]})
+                return
+            cutoff = min(cutoff, guard_wm)
+            # Una hora marcada que todavía no se re-agregó tampoco se poda
+            cur.execute(_DIRTY_OLDEST_SQL, (spec["table"],))
+            oldest_dirty = cur.fetchone()[0]
+            if oldest_dirty is not None:
+                cutoff = min(cutoff, oldest_dirty)
+        partitioned = _is_partitioned(cur, spec["table"])
+        conn.commit()
+    st.update({"cutoff": cutoff.isoformat(), "days": spec["days"]})
+
+    if partitioned:
+        # meses enteros: DETACH + DROP, sin tocar filas
+        with conn.cursor() as cur:
+            if not _begin(cur, job):
+                conn.rollback()
+                return
+            cur.execute("SELECT public.drop_monthly_partitions_before(%s::regclass, %s);",
+                        (f"public.{spec['table']}", cutoff))
+            dropped = [r[0] for r in cur.fetchall()]
+            conn.commit()
+        if dropped:
+            log.info("prune dropped table=%s partitions=%s", spec["table"], ",".join(dropped))
+            st.setdefault("dropped_partitions", []).extend(dropped)
+            metrics.inc("retention_partitions_dropped_total", value=len(dropped), job=job)
+        return
+
+    extra = f" AND {spec['where']}" if spec["where"] else ""
+    sql = f"""
+        DELETE FROM public.{spec['table']}
+         WHERE ctid = ANY(ARRAY(
+            SELECT ctid FROM public.{spec['table']}
+             WHERE {spec['ts_col']} < %s{extra}
+             LIMIT %s))
+    """
+    for _ in range(MAX_BATCHES):
+        if _stop.is_set():
+            break
+        with conn.cursor() as cur:
+            if not _begin(cur, job):
+                conn.rollback()
+                return
+            cur.execute(sql, (cutoff, BATCH_ROWS))
+            n = max(cur.rowcount, 0)
+            conn.commit()
+        st["rows"] += n
+        st["batches"] += 1
+        metrics.inc("retention_rows_total", value=n, job=job)
+        metrics.inc("retention_batches_total", job=job)
+        if n < BATCH_ROWS:
+            break
+        time.sleep(PAUSE_SEC)
+
+
+# -----------------------------------------------------------------------------
+# Ciclo / thread
+# -----------------------------------------------------------------------------
+def run_once(now: Optional[datetime] = None) -> Dict[str, Any]:
+    now = now or datetime.now(timezone.utc)
+    t0 = time.perf_counter()
+    with get_conn() as conn:
+        for spec in ROLLUPS + PRUNES:
+            if _stop.is_set():
+                break
+            run = _run_rollup if spec in ROLLUPS else _run_prune
+            try:
+                run(conn, spec, now)
+                _job(spec["job"]).pop("last_error", None)
+            except Exception as e:
+                log.exception("job failed job=%s err=%s", spec["job"], e)
+                _job(spec["job"])["last_error"] = str(e)
+                metrics.inc("retention_errors_total", job=spec["job"])
+                try:
+                    conn.rollback()
+                except Exception:
+                    break  # conexión rota: el pool la descarta
+    _cycle.update({
+        "last_run": now.isoformat(),
+        "last_cycle_sec": round(time.perf_counter() - t0, 3),
+        "cycles": _cycle["cycles"] + 1,
+    })
+    return status()
+
+
+def _loop() -> None:
+    log.info("retention start every=%.0fs raw=%sd 1m=%sd 1h=%sd", EVERY_SEC, RAW_DAYS, M1_DAYS, H1_DAYS)
+    while not _stop.is_set():
+        try:
+            run_once()
+        except Exception as e:
+            log.exception("retention loop error err=%s", e)
+        _stop.wait(EVERY_SEC)
+    log.info("retention stopped")
+
+
+def start_retention() -> bool:
+    global _thread
+    if not ENABLED:
+        log.info("disabled (RETENTION_ENABLED=0)")
+        return True
+    if _thread and _thread.is_alive():
+        if not _stop.is_set():
+            log.info("already running")
+            return True
+        # stop anterior todavía saliendo: espera acotada; si sigue, el líder
+        # reintenta en la próxima vuelta (ver leader._start_jobs)
+        _thread.join(timeout=2)
+        if _thread.is_alive():
+            log.info("previous thread still exiting; start deferred")
+            return False
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="retention", daemon=True)
+    _thread.start()
+    log.info("thread started")
+    return True
+
+
+def stop_retention() -> None:
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=10)
+    log.info("thread stopped")
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "enabled": ENABLED,
+        "alive": bool(_thread and _thread.is_alive()),
+        "every_sec": EVERY_SEC,
+        "policy_days": {
+            "raw": RAW_DAYS, "1m": M1_DAYS, "1h": H1_DAYS,
+            "audit": AUDIT_DAYS, "audit_heartbeat": AUDIT_HEARTBEAT_DAYS, "ingest_dedupe": DEDUPE_DAYS,
+        },
+        **_cycle,
+        "jobs": {k: dict(v) for k, v in _jobs.items()},
+    }
@@ -1,5 +1,6 @@
 # app/services/telegram.py
-import os, requests, json
+import os, json, time
+from app.core import metrics
 
 def _enabled() -> bool:
     return os.getenv("TELEGRAM_ENABLED", "").lower() in ("1","true","yes","on")
@@ -11,26 +12,35 @@ def send(text: str, chat_id: str | None = None, parse_mode: str = "HTML"):
     """
     if not _enabled():
         print("[telegram] disabled (TELEGRAM_ENABLED != true)")
+        metrics.inc("telegram_sends_total", sender="sync", result="disabled")
         return {"ok": False, "reason": "disabled"}
 
     token = os.getenv("TELEGRAM_BOT_TOKEN")
     chat  = chat_id or os.getenv("TELEGRAM_CHAT_ID")
     if not token or not chat:
         print("[telegram] missing token/chat")
+        metrics.inc("telegram_sends_total", sender="sync", result="misconfigured")
         return {"ok": False, "reason": "missing token/chat"}
 
+    import requests  # diferido al primer envío (arranque más rápido)
+
+    t0 = time.perf_counter()
     try:
         resp = requests.post(
             f"https://api.telegram.org/bot{token}/sendMessage",
             json={"chat_id": chat, "text": text, "parse_mode": parse_mode, "disable_web_page_preview": True},
             timeout=10,
         )
+        metrics.observe("telegram_send_seconds", time.perf_counter() - t0, sender="sync")
         if resp.status_code != 200:
+            metrics.inc("telegram_sends_total", sender="sync", result="http_error")
             print(f"[telegram] HTTP {resp.status_code}: {resp.text}")
             return {"ok": False, "status": resp.status_code, "body": resp.text}
         data = resp.json()
+        metrics.inc("telegram_sends_total", sender="sync", result="ok")
         print("[telegram] sent ok:", json.dumps({"to": str(chat), "len": len(text)}, ensure_ascii=False))
         return data
     except Exception as e:
+        metrics.inc("telegram_sends_total", sender="sync", result="exception")
         print(f"[telegram] send error: {e}")
         return {"ok": False, "exception": repr(e)}
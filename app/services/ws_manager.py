@@ -0,0 +1,576 @@
+# app/services/ws_manager.py
+"""
+Conexiones WebSocket de devices (/ws/telemetry) y push de comandos.
+
+Por proceso:
+  - Registro device_id → conexión, con los assets que el device declaró al
+    conectar (?tank_id=1,2&pump_id=3 o {"type": "hello", "tanks": [...],
+    "pumps": [...]}).
+  - Una sola rueda de timers (TimerWheel, tick de 1 s) para keepalives y
+    corte por inactividad de TODAS las conexiones, en lugar de una tarea
+    con sleep por socket.
+  - Cola de salida por conexión: todo lo que se manda al device (respuestas,
+    keepalives, comandos) pasa por Conn.send(), que no bloquea; una tarea de
+    drenado existe solo mientras haya algo en cola. Si la cola llega a
+    WS_SEND_QUEUE (device que no lee) se corta la conexión.
+  - Un LISTEN "device_commands" (trigger de la migración 0010): cada comando
+    nuevo de tank_commands / pump_commands avisa a todos los workers; el que
+    tiene conectado al device lo reclama (queued → sent, atómico: un solo
+    worker lo manda) y lo empuja. Destino: el último device que reportó
+    lecturas del asset (misma regla que el long-poll, repos/device_commands).
+    Declarar assets acota: un device que declaró assets solo recibe comandos
+    de esos, y solo de los que además reporta. Declarar un asset ajeno no
+    alcanza para llevarse sus comandos, y el destino es siempre uno.
+  - Al conectar un device se revisan los comandos que quedaron en 'queued'
+    (encolados con el device desconectado) de los assets que declaró; si no
+    declaró ninguno, todos los pendientes por último reporte. Al (re)conectar el
+    LISTEN, todos (lo encolado mientras no se escuchaba). Por páginas de
+    CATCH_UP_PAGE: ningún pendiente queda afuera por un tope.
+  - El mismo LISTEN despierta a los long-polls de GET
+    /devices/{id}/commands/next (Waiter): solo a los del device que reportó
+    último el asset, si no lo excluyen sus assets declarados.
+
+El device confirma con {"type": "command_ack", "kind", "id", "status":
+"acked"|"failed", "error"}; solo se aceptan acks de comandos que se le
+mandaron por esa conexión. Si el envío falla, o la conexión se corta con
+comandos mandados sin ack, vuelven a 'queued'; el trigger de la migración
+0015 avisa por el mismo canal y se reenvían a la conexión que esté.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import psycopg
+
+from app.core import metrics
+from app.core.db import CONNECT_TIMEOUT, EVENTS_DSN
+from app.core.db_async import get_aconn
+from app.core.jsonresp import dumps
+
+try:
+    import resource
+except ImportError:  # Windows: sin max_rss en status()
+    resource = None
+
+log = logging.getLogger("ws")
+
+KEEPALIVE_SEC = int(os.getenv("WS_KEEPALIVE_SEC", "15"))
+IDLE_TIMEOUT_SEC = int(os.getenv("WS_IDLE_TIMEOUT_SEC", "120"))  # 0 = sin corte
+SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE", "256"))
+LISTEN_RETRY_SEC = float(os.getenv("WS_LISTEN_RETRY_SEC", "5"))
+CATCH_UP_DELAY_SEC = 0.5  # junta las conexiones de una tormenta de reconexión en una sola revisión
+CATCH_UP_PAGE = 500
+CHANNEL = "device_commands"
+WHEEL_SLOTS = 64  # > KEEPALIVE_SEC: un giro completo de la rueda por período
+
+Asset = Tuple[str, int]  # ("tank" | "pump", id)
+
+_TABLES = {"tank": ("tank_commands", "tank_readings"), "pump": ("pump_commands", "pump_readings")}
+
+# Comandos en 'queued' con el último device que reportó el asset (índice
+# (asset_id, ts) de las lecturas: una búsqueda por comando pendiente), por
+# páginas de id
+_QUEUED_SQL = """
+    SELECT c.id, c.{kind}_id,
+           (SELECT r.device_id FROM {readings} r
+             WHERE r.{kind}_id = c.{kind}_id ORDER BY r.ts DESC LIMIT 1)
+      FROM {table} c
+     WHERE c.status = 'queued' AND (c.expires_at IS NULL OR c.expires_at > now())
+       AND c.id > %(after)s
+     ORDER BY c.id
+     LIMIT %(limit)s
+"""
+
+# Los de ciertos assets (los declarados por los devices que conectan)
+_QUEUED_BY_ASSET_SQL = """
+    SELECT c.id, c.{kind}_id,
+           (SELECT r.device_id FROM {readings} r
+             WHERE r.{kind}_id = c.{kind}_id ORDER BY r.ts DESC LIMIT 1)
+      FROM {table} c
+     WHERE c.status = 'queued' AND (c.expires_at IS NULL OR c.expires_at > now())
+       AND c.{kind}_id = ANY(%(assets)s) AND c.id > %(after)s
+     ORDER BY c.id
+     LIMIT %(limit)s
+"""
+
+_REPORTER_SQL = "SELECT device_id FROM {readings} WHERE {kind}_id = %s ORDER BY ts DESC LIMIT 1"
+
+_CLAIM_SQL = """
+    UPDATE {table} SET status = 'sent', ts_sent = now(), error = NULL
+     WHERE id = %s AND status = 'queued' AND (expires_at IS NULL OR expires_at > now())
+    RETURNING id, {kind}_id, cmd, payload, ts_created, expires_at
+"""
+
+_REQUEUE_SQL = "UPDATE {table} SET status = 'queued', ts_sent = NULL WHERE id = %s AND status = 'sent'"
+
+_ACK_SQL = """
+    UPDATE {table}
+       SET status = %(status)s, error = %(error)s,
+           ts_acked = CASE WHEN %(status)s = 'acked' THEN now() END
+     WHERE id = %(id)s AND status = 'sent'
+"""
+
+
+def _sql(tpl: str, kind: str, **kw: str) -> str:
+    table, readings = _TABLES[kind]
+    return tpl.format(kind=kind, table=table, readings=readings, **kw)
+
+
+# -----------------------------
+# Conexión
+# -----------------------------
+class Conn:
+    __slots__ = ("ws", "device_id", "assets", "connected_at", "last_rx", "last_tx",
+                 "closed", "slot", "inflight", "_out", "_drain")
+
+    def __init__(self, ws: Any, device_id: str, assets: Iterable[Asset] = ()) -> None:
+        now = time.monotonic()
+        self.ws = ws
+        self.device_id = device_id
+        self.assets: Set[Asset] = set(assets)
+        self.connected_at = now
+        self.last_rx = now
+        self.last_tx = now
+        self.closed = False
+        self.slot = -1
+        self.inflight: Set[Tuple[str, int]] = set()  # (kind, cmd_id) enviados sin ack
+        self._out: Deque[Dict[str, Any]] = deque()
+        self._drain: Optional[asyncio.Task] = None
+
+    def send(self, msg: Dict[str, Any]) -> bool:
+        """Encola sin bloquear. False si la conexión está cerrada o saturada."""
+        if self.closed:
+            return False
+        if len(self._out) >= SEND_QUEUE_MAX:
+            metrics.inc("ws_closed_total", reason="queue_full")
+            _spawn(self.close(1013, "send queue full"))
+            return False
+        self._out.append(msg)
+        if self._drain is None:
+            self._drain = asyncio.get_running_loop().create_task(self._drain_loop())
+        return True
+
+    async def _drain_loop(self) -> None:
+        try:
+            while self._out:
+                msg = self._out.popleft()
+                try:
+                    await self.ws.send_text(dumps(msg).decode())
+                except Exception:
+                    self.closed = True
+                    for m in (msg, *self._out):
+                        _undelivered(m)
+                    self._out.clear()
+                    return
+                self.last_tx = time.monotonic()
+                metrics.inc("ws_messages_out_total")
+        finally:
+            self._drain = None
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        if self.closed:
+            return
+        self.closed = True
+        for m in self._out:
+            _undelivered(m)
+        self._out.clear()
+        try:
+            await self.ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    def queued(self) -> int:
+        return len(self._out)
+
+
+# -----------------------------
+# Rueda de timers
+# -----------------------------
+class TimerWheel:
+    """
+    Rueda hasheada de `slots` casilleros de un tick: agendar y cancelar son
+    O(1) y cada tick solo toca las conexiones que vencen en él.
+    """
+
+    def __init__(self, slots: int) -> None:
+        self._slots: List[Set[Conn]] = [set() for _ in range(slots)]
+        self._pos = 0
+
+    def schedule(self, conn: Conn, ticks: int) -> None:
+        self.cancel(conn)
+        ticks = max(1, min(int(ticks), len(self._slots) - 1))
+        conn.slot = (self._pos + ticks) % len(self._slots)
+        self._slots[conn.slot].add(conn)
+
+    def cancel(self, conn: Conn) -> None:
+        if conn.slot >= 0:
+            self._slots[conn.slot].discard(conn)
+            conn.slot = -1
+
+    def advance(self) -> Set[Conn]:
+        self._pos = (self._pos + 1) % len(self._slots)
+        due, self._slots[self._pos] = self._slots[self._pos], set()
+        for conn in due:
+            conn.slot = -1
+        return due
+
+
+# -----------------------------
+# Estado del proceso
+# -----------------------------
+_conns: Dict[str, Conn] = {}
+_wheel = TimerWheel(WHEEL_SLOTS)
+_tasks: List[asyncio.Task] = []
+_bg: Set[asyncio.Task] = set()
+_catch_up_pending: Set[str] = set()
+_state: Dict[str, Any] = {"listening": False, "error": None, "pushed": 0, "acked": 0, "requeued": 0}
+
+
+def _spawn(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _bg.add(task)
+    task.add_done_callback(_bg.discard)
+
+
+def register(conn: Conn) -> None:
+    """Alta de una conexión ya aceptada. Si el device ya estaba conectado acá, la nueva reemplaza a la vieja."""
+    old = _conns.get(conn.device_id)
+    if old is not None and old is not conn:
+        _wheel.cancel(old)
+        metrics.inc("ws_closed_total", reason="replaced")
+        _spawn(old.close(4409, "replaced by a newer connection"))
+    _conns[conn.device_id] = conn
+    _wheel.schedule(conn, KEEPALIVE_SEC)
+    metrics.inc("ws_connections_total")
+    _schedule_catch_up(conn.device_id)
+
+
+def unregister(conn: Conn) -> bool:
+    """
+    Baja de una conexión. True si era la registrada del device; False si ya
+    la había reemplazado otra (reconexión): entonces el device sigue online.
+    Los comandos que se le mandaron y no confirmó vuelven a 'queued'.
+    """
+    conn.closed = True
+    _wheel.cancel(conn)
+    for kind, cmd_id in conn.inflight:
+        metrics.inc("ws_commands_requeued_total", kind=kind, reason="disconnect")
+        _spawn(_requeue(kind, cmd_id))
+    conn.inflight.clear()
+    if _conns.get(conn.device_id) is conn:
+        del _conns[conn.device_id]
+        return True
+    return False
+
+
+def declare(conn: Conn, assets: Iterable[Asset]) -> None:
+    """Assets que atiende el device (hello): acota los comandos que recibe esta conexión."""
+    if _conns.get(conn.device_id) is not conn:
+        return
+    conn.assets = set(assets)
+    _schedule_catch_up(conn.device_id)
+
+
+# -----------------------------
+# Keepalive / inactividad
+# -----------------------------
+async def _wheel_loop() -> None:
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+        next_tick += 1.0
+        await asyncio.sleep(max(0.0, next_tick - loop.time()))
+        now = time.monotonic()
+        for conn in _wheel.advance():
+            if conn.closed:
+                continue
+            if IDLE_TIMEOUT_SEC and now - conn.last_rx > IDLE_TIMEOUT_SEC:
+                metrics.inc("ws_closed_total", reason="idle")
+                _spawn(conn.close(4408, "idle timeout"))
+                continue
+            if now - conn.last_tx >= KEEPALIVE_SEC - 1:  # si ya salió algo en el período, no hace falta
+                conn.send({"type": "status", "payload": {"online": True, "device_id": conn.device_id},
+                           "ts": int(time.time() * 1000)})
+            _wheel.schedule(conn, KEEPALIVE_SEC)
+
+
+# -----------------------------
+# Comandos
+# -----------------------------
+def _serves(assets: Set[Asset], kind: str, asset_id: int) -> bool:
+    """Sin assets declarados, todos los que reporta; si no, solo los declarados."""
+    return not assets or (kind, asset_id) in assets
+
+
+def _target(kind: str, asset_id: int, reporter: Optional[str]) -> Optional[Conn]:
+    """La conexión del device que reportó último el asset, si lo atiende."""
+    conn = _conns.get(reporter) if reporter else None
+    if conn is None or not _serves(conn.assets, kind, asset_id):
+        return None
+    return conn
+
+
+async def _queued(kind: str, after: int, assets: Optional[List[int]] = None) -> List[Tuple[int, int, Optional[str]]]:
+    """Una página de pendientes con id > after; con `assets`, solo de esos."""
+    tpl = _QUEUED_SQL if assets is None else _QUEUED_BY_ASSET_SQL
+    async with get_aconn() as conn:
+        cur = await conn.execute(_sql(tpl, kind), {"after": after, "limit": CATCH_UP_PAGE, "assets": assets})
+        rows = await cur.fetchall()
+        await conn.commit()
+    return rows
+
+
+async def _deliver(kind: str, rows: Iterable[Tuple[int, int, Optional[str]]],
+                   only: Optional[Set[str]] = None) -> None:
+    for cmd_id, asset_id, reporter in rows:
+        conn = _target(kind, asset_id, reporter)
+        if conn is None or conn.closed or (only is not None and conn.device_id not in only):
+            continue
+        async with get_aconn() as db:
+            cur = await db.execute(_sql(_CLAIM_SQL, kind), (cmd_id,))
+            row = await cur.fetchone()
+            await db.commit()
+        if row is None:
+            continue  # lo reclamó otro worker / conexión
+        _, asset_id, cmd, payload, ts_created, expires_at = row
+        conn.inflight.add((kind, cmd_id))
+        if conn.send({"type": "command", "kind": kind, "id": cmd_id, "asset_id": asset_id,
+                      "cmd": cmd, "payload": payload, "ts_created": ts_created, "expires_at": expires_at}):
+            _state["pushed"] += 1
+            metrics.inc("ws_commands_pushed_total", kind=kind)
+            metrics.observe("ws_command_push_seconds",
+                            (datetime.now(timezone.utc) - ts_created).total_seconds(), kind=kind)
+        # si send() devolvió False, close() ya lo devolvió a 'queued'
+
+
+async def _reporter(kind: str, asset_id: int) -> Optional[str]:
+    async with get_aconn() as conn:
+        cur = await conn.execute(_sql(_REPORTER_SQL, kind), (asset_id,))
+        row = await cur.fetchone()
+        await conn.commit()
+    return row[0] if row else None
+
+
+async def _on_notify(payload: str) -> None:
+    if not _conns and not _waiters:
+        return
+    try:
+        ev = json.loads(payload)
+        kind, cmd_id, asset_id = ev["kind"], int(ev["id"]), int(ev["asset_id"])
+        if kind not in _TABLES:
+            return
+        reporter = await _reporter(kind, asset_id)
+        if reporter is None:
+            return  # asset sin lecturas: no es de nadie
+        _wake(kind, asset_id, reporter)
+        if reporter in _conns:
+            await _deliver(kind, [(cmd_id, asset_id, reporter)])
+    except Exception as e:
+        log.warning("command push failed payload=%s err=%s", payload, e)
+
+
+# -----------------------------
+# Long-poll (GET /devices/{id}/commands/next): el mismo LISTEN los despierta
+# -----------------------------
+class Waiter:
+    __slots__ = ("device_id", "assets", "event")
+
+    def __init__(self, device_id: str, assets: Iterable[Asset]) -> None:
+        self.device_id = device_id
+        self.assets: Set[Asset] = set(assets)
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        """True si llegó un comando que puede ser suyo. Sin LISTEN activo vuelve cada 1 s (polling)."""
+        if not _state["listening"]:
+            timeout = min(timeout, 1.0)
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+
+
+_waiters: Set[Waiter] = set()
+_waiters_by_device: Dict[str, Set[Waiter]] = {}
+
+
+def add_waiter(device_id: str, assets: Iterable[Asset] = ()) -> Waiter:
+    w = Waiter(device_id, assets)
+    _waiters.add(w)
+    _waiters_by_device.setdefault(device_id, set()).add(w)
+    return w
+
+
+def remove_waiter(w: Waiter) -> None:
+    _waiters.discard(w)
+    ws = _waiters_by_device.get(w.device_id)
+    if ws is not None:
+        ws.discard(w)
+        if not ws:
+            del _waiters_by_device[w.device_id]
+
+
+def _wake(kind: str, asset_id: int, reporter: str) -> None:
+    for w in _waiters_by_device.get(reporter, ()):
+        if _serves(w.assets, kind, asset_id):
+            w.event.set()
+
+
+def _catch_up_scans(kind: str, devices: Optional[Set[str]]) -> List[Optional[List[int]]]:
+    """
+    Qué revisar para `devices`: la lista de assets de `kind` que declararon y,
+    si alguno no declaró nada, None (todos los pendientes, por último reporte).
+    """
+    if devices is None:
+        return [None]
+    conns = [c for c in (_conns.get(d) for d in devices) if c is not None]
+    declared = sorted({i for c in conns for k, i in c.assets if k == kind})
+    scans: List[Optional[List[int]]] = [declared] if declared else []
+    if any(not c.assets for c in conns):
+        scans.append(None)
+    return scans
+
+
+async def _catch_up(devices: Optional[Set[str]] = None) -> None:
+    """Comandos pendientes para devices recién conectados (None: para todos)."""
+    try:
+        for kind in _TABLES:
+            for assets in _catch_up_scans(kind, devices):
+                after = 0
+                while True:
+                    rows = await _queued(kind, after, assets)
+                    await _deliver(kind, rows, only=devices)
+                    if len(rows) < CATCH_UP_PAGE:
+                        break
+                    after = rows[-1][0]
+    except Exception as e:
+        log.warning("command catch-up failed devices=%s err=%s", len(devices or ()), e)
+
+
+def _schedule_catch_up(device_id: str) -> None:
+    if not _catch_up_pending:
+        _spawn(_catch_up_batch())
+    _catch_up_pending.add(device_id)
+
+
+async def _catch_up_batch() -> None:
+    await asyncio.sleep(CATCH_UP_DELAY_SEC)
+    devices = set(_catch_up_pending)
+    _catch_up_pending.clear()
+    await _catch_up(devices)
+
+
+def _undelivered(msg: Dict[str, Any]) -> None:
+    if msg.get("type") == "command":
+        _spawn(_requeue(msg["kind"], msg["id"]))
+
+
+async def _requeue(kind: str, cmd_id: int) -> None:
+    try:
+        async with get_aconn() as conn:
+            await conn.execute(_sql(_REQUEUE_SQL, kind), (cmd_id,))
+            await conn.commit()
+        _state["requeued"] += 1
+    except Exception as e:
+        log.warning("requeue failed kind=%s id=%s err=%s", kind, cmd_id, e)
+
+
+async def command_ack(conn: Conn, obj: Dict[str, Any]) -> bool:
+    """Ack / fallo de un comando que se le mandó a esta conexión."""
+    try:
+        key = (str(obj.get("kind")), int(obj.get("id")))
+    except (TypeError, ValueError):
+        return False
+    status = "failed" if str(obj.get("status", "acked")).lower() == "failed" else "acked"
+    if key not in conn.inflight:
+        return False
+    try:
+        async with get_aconn() as db:
+            await db.execute(_sql(_ACK_SQL, key[0]), {"status": status, "error": obj.get("error"), "id": key[1]})
+            await db.commit()
+    except Exception as e:
+        # sigue en inflight: si la conexión se corta sin otro ack, vuelve a 'queued'
+        log.warning("command ack failed kind=%s id=%s err=%s", key[0], key[1], e)
+        metrics.inc("ws_command_ack_errors_total", kind=key[0])
+        return False
+    conn.inflight.discard(key)
+    _state["acked"] += 1
+    metrics.inc("ws_commands_acked_total", kind=key[0], status=status)
+    return True
+
+
+# -----------------------------
+# LISTEN
+# -----------------------------
+async def _listen_loop() -> None:
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                EVENTS_DSN, autocommit=True, connect_timeout=CONNECT_TIMEOUT,
+                application_name=f"ws-commands-{os.getpid()}",
+                keepalives=1, keepalives_idle=10, keepalives_interval=5, keepalives_count=3,
+            ) as conn:
+                await conn.execute(f'LISTEN "{CHANNEL}"')
+                _state.update(listening=True, error=None)
+                log.info("listening channel=%s", CHANNEL)
+                _spawn(_catch_up())  # lo que se encoló mientras no escuchábamos
+                async for n in conn.notifies():
+                    _spawn(_on_notify(n.payload))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _state["error"] = str(e)
+            log.warning("listen failed err=%s (retry in %.0fs)", e, LISTEN_RETRY_SEC)
+        finally:
+            _state["listening"] = False
+        await asyncio.sleep(LISTEN_RETRY_SEC)
+
+
+async def start() -> None:
+    if _tasks:
+        return
+    loop = asyncio.get_running_loop()
+    _tasks.append(loop.create_task(_wheel_loop(), name="ws-wheel"))
+    _tasks.append(loop.create_task(_listen_loop(), name="ws-commands-listen"))
+
+
+async def stop() -> None:
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    for conn in list(_conns.values()):
+        await conn.close(1001, "server shutdown")
+    if _bg:
+        await asyncio.wait(list(_bg), timeout=5)
+
+
+def status() -> Dict[str, Any]:
+    return {
+        "connections": len(_conns),
+        "declared_assets": sum(len(c.assets) for c in _conns.values()),
+        "send_queued": sum(c.queued() for c in _conns.values()),
+        "inflight": sum(len(c.inflight) for c in _conns.values()),
+        "long_polls": len(_waiters),
+        "keepalive_sec": KEEPALIVE_SEC,
+        "idle_timeout_sec": IDLE_TIMEOUT_SEC,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1) if resource else None,
+        **_state,
+    }
+
+
+def _ws_gauges():
+    yield "ws_connections", {}, len(_conns)
+
+
+metrics.register_collector(_ws_gauges)
@@ -3,13 +3,16 @@ from __future__ import annotations
 
 import os
 import json
-import asyncio, time  # ⬅️ NUEVO
+import time
 from typing import Dict, Any, Optional
 from datetime import datetime, timezone, timedelta
 from urllib.parse import urlparse, parse_qs
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
+from app.services import ws_manager
+from app.services.presence_store import store as presence_store
+
 router = APIRouter()
 
 PRESENCE_TTL_SEC = int(os.getenv("TELEMETRY_TTL_SECONDS", "30"))
@@ -22,7 +25,8 @@ _SINGLE = os.getenv("TELEMETRY_API_KEY", "").strip()
 if _SINGLE:
     _ALLOWED.add(_SINGLE)
 
-presence: Dict[str, Dict[str, Any]] = {}
+# Presencia compartida entre workers: dict local write-back + tabla
+# device_presence (services/presence_store.py). Escribir y leer no hacen I/O.
 
 def _now() -> datetime:
     return datetime.now(timezone.utc)
@@ -68,7 +72,7 @@ def _effective_online(info: Dict[str, Any]) -> bool:
     return online_flag and (_now() - last_seen <= timedelta(seconds=PRESENCE_TTL_SEC))
 
 def presence_snapshot(device_id: str) -> Optional[Dict[str, Any]]:
-    info = presence.get(device_id)
+    info = presence_store.get(device_id)
     if not info:
         return None
     return {
@@ -76,18 +80,25 @@ def presence_snapshot(device_id: str) -> Optional[Dict[str, Any]]:
         "last_seen": _iso(info.get("last_seen")),
     }
 
-# ⬇️ NUEVO: keepalive opcional del servidor
-async def _server_keepalive(ws: WebSocket, device_id: str, period_sec: int = 15):
-    while True:
-        await asyncio.sleep(period_sec)
-        try:
-            await ws.send_json({
-                "type": "status",
-                "payload": {"online": True, "device_id": device_id},
-                "ts": int(time.time() * 1000),
-            })
-        except Exception:
-            break
+def _ids(values) -> list[int]:
+    out = []
+    for v in values or ():
+        for part in str(v).split(","):
+            if part.strip().isdigit():
+                out.append(int(part))
+    return out
+
+def _declared_assets(ws: WebSocket, obj: Optional[Dict[str, Any]] = None) -> list[tuple[str, int]]:
+    """
+    Assets que atiende el device: ?tank_id=1,2&pump_id=3 al conectar o {"tanks": [...], "pumps": [...]}
+    en el hello. Solo acotan los comandos que recibe a los de assets que además reporta (ws_manager._target).
+    """
+    if obj is not None:
+        tanks, pumps = obj.get("tanks"), obj.get("pumps")
+    else:
+        q = parse_qs(urlparse(str(ws.url)).query)
+        tanks, pumps = q.get("tank_id"), q.get("pump_id")
+    return [("tank", i) for i in _ids(tanks)] + [("pump", i) for i in _ids(pumps)]
 
 @router.websocket("/ws/telemetry")
 async def ws_telemetry(ws: WebSocket):
@@ -102,52 +113,56 @@ async def ws_telemetry(ws: WebSocket):
         await ws.close(code=4400, reason="device_id required")
         return
 
-    presence[device_id] = {"online": True, "last_seen": _now()}
-
-    # status inicial (lo tuyo ya estaba bien)
-    try:
-        await ws.send_json({"type": "status", "payload": {"online": True, "device_id": device_id}})
-    except RuntimeError:
-        presence[device_id] = {"online": False, "last_seen": _now()}
-        return
-
-    # ⬇️ NUEVO: keepalive del server (opcional)
-    ka_task = asyncio.create_task(_server_keepalive(ws, device_id, period_sec=15))
+    # Registro + keepalive/inactividad en la rueda de timers + cola de salida
+    # (services/ws_manager.py): acá solo queda el loop de lectura
+    conn = ws_manager.Conn(ws, device_id, _declared_assets(ws))
+    ws_manager.register(conn)
+    last_seen = presence_store.mark(device_id, True)
+    conn.send({"type": "status", "payload": {"online": True, "device_id": device_id}})
 
     try:
         while True:
             msg = await ws.receive_text()
 
             # actualizo last_seen siempre que llega algo
-            presence[device_id]["last_seen"] = _now()
+            conn.last_rx = time.monotonic()
+            last_seen = presence_store.touch(device_id)
 
             # intento parsear; si no es JSON, igual sirve como actividad
             try:
                 obj = json.loads(msg)
             except Exception:
+                obj = None
+            if not isinstance(obj, dict):
                 obj = {"type": "message", "raw": msg}
 
             t = (obj.get("type") or "").lower()
 
-            # ⬇️ NUEVO: eco de beats/hello/status para que el front vea “actividad”
+            if t == "hello" and ("tanks" in obj or "pumps" in obj):
+                ws_manager.declare(conn, _declared_assets(ws, obj))
+            elif t == "command_ack":
+                await ws_manager.command_ack(conn, obj)
+
+            # eco de beats/hello/status para que el front vea “actividad”
             if t in ("beat", "hello", "heartbeat", "status"):
-                await ws.send_json({
+                conn.send({
                     "type": "heartbeat",
                     "device_id": device_id,
                     "ts": int(time.time() * 1000),
                 })
             else:
-                # opcional: ACK genérico (útil para debug)
-                await ws.send_json({
+                # ACK genérico (útil para debug)
+                conn.send({
                     "type": "ack",
                     "device_id": device_id,
                     "ts": int(time.time() * 1000),
                 })
 
     except WebSocketDisconnect:
-        presence[device_id] = {"online": False, "last_seen": _now()}
+        pass
     finally:
-        try:
-            ka_task.cancel()
-        except Exception:
-            pass
+        # Si esta conexión ya fue reemplazada (el device reconectó antes de que
+        # se cerrara la vieja), el offline pisaría a la nueva
+        if ws_manager.unregister(conn):
+            # offline a la hora del último mensaje recibido, no a la del cierre
+            presence_store.mark(device_id, False, last_seen)
@@ -0,0 +1,134 @@
+# bench/async_db.py
+"""
+Benchmark: ruta sync (threadpool + ConnectionPool) vs ruta async
+(event loop + AsyncConnectionPool) con la MISMA query que /tanks/{id}/latest.
+
+Monta una app mínima con dos endpoints y la golpea in-process (httpx +
+ASGITransport), así la única diferencia es la capa de DB:
+
+    GET /sync/{tank_id}   def        → app.core.db.get_conn()
+    GET /async/{tank_id}  async def  → app.core.db_async.get_aconn()
+
+Ambos pools se dimensionan igual (--pool) y se usan de a uno (se cierra el sync
+antes de abrir el async, para no pasar max_connections). --latency-ms agrega
+pg_sleep a la query para simular RTT/consultas lentas. Con --pool > 40 se ve el
+techo del threadpool de Starlette (~40 threads) del lado sync: el async escala
+con el pool, el sync no.
+
+Uso:
+    python -m bench.async_db --tank-id 1 --requests 2000 --concurrency 200 --pool 80 --latency-ms 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI
+from psycopg.rows import dict_row
+
+from app.core import db, db_async
+from app.repos.tanks import LATEST_READING_SQL
+
+SLEEP_SQL = "SELECT pg_sleep(%s);"
+
+
+def build_app(latency_s: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync/{tank_id}")
+    def sync_latest(tank_id: int) -> Dict[str, Any]:
+        with db.get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            if latency_s:
+                cur.execute(SLEEP_SQL, (latency_s,))
+            cur.execute(LATEST_READING_SQL, (tank_id,))
+            return cur.fetchone() or {}
+
+    @app.get("/async/{tank_id}")
+    async def async_latest(tank_id: int) -> Dict[str, Any]:
+        async with db_async.get_aconn() as conn, conn.cursor(row_factory=dict_row) as cur:
+            if latency_s:
+                await cur.execute(SLEEP_SQL, (latency_s,))
+            await cur.execute(LATEST_READING_SQL, (tank_id,))
+            return await cur.fetchone() or {}
+
+    return app
+
+
+async def run(client: httpx.AsyncClient, path: str, n: int, concurrency: int) -> Dict[str, Any]:
+    lat: List[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal errors
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.get(path)
+            lat.append(time.perf_counter() - t0)
+            if r.status_code != 200:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "path": path.split("/")[1],
+        "requests": n,
+        "concurrency": concurrency,
+        "errors": errors,
+        "rps": round(n / wall, 1),
+        "p50_ms": round(statistics.median(lat) * 1000, 2),
+        "p95_ms": round(lat[int(len(lat) * 0.95) - 1] * 1000, 2),
+        "p99_ms": round(lat[int(len(lat) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tank-id", type=int, default=1)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=200)
+    ap.add_argument("--pool", type=int, default=80, help="max_size de AMBOS pools")
+    ap.add_argument("--latency-ms", type=float, default=50.0, help="pg_sleep extra por request")
+    ap.add_argument("--json", action="store_true", help="salida JSON (una línea)")
+    args = ap.parse_args()
+
+    if db.pool is None or db_async.apool is None:
+        raise SystemExit("psycopg_pool no disponible")
+
+    app = build_app(args.latency_ms / 1000.0)
+    warmup = min(args.requests, 2 * args.pool)
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # 1) sync
+        db.pool.resize(min_size=args.pool, max_size=args.pool)
+        await run(client, f"/sync/{args.tank_id}", warmup, args.concurrency)
+        results.append(await run(client, f"/sync/{args.tank_id}", args.requests, args.concurrency))
+        db.pool.close()
+
+        # 2) async
+        await db_async.open_async_pool()
+        await db_async.apool.resize(min_size=args.pool, max_size=args.pool)
+        await run(client, f"/async/{args.tank_id}", warmup, args.concurrency)
+        results.append(await run(client, f"/async/{args.tank_id}", args.requests, args.concurrency))
+        await db_async.close_async_pool()
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}))
+        return
+    print(f"pool={args.pool} concurrency={args.concurrency} latency={args.latency_ms}ms requests={args.requests}")
+    print(f"{'path':<6} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'errors':>6}")
+    for r in results:
+        print(f"{r['path']:<6} {r['rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['errors']:>6}")
+    s, a = results
+    print(f"async/sync throughput: x{a['rps'] / s['rps']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+# bench/history_shape.py
+"""
+Benchmark: GET /tanks/{id}/history en forma de filas (default) vs columnar
+(?shape=columns). Llama a la ruta real (routes/history.history_tank) contra
+la DB, con el pool async abierto, y mide por request:
+
+  - tiempo total y CPU del proceso (fetch + armado + serialización)
+  - bytes del JSON y gzip (GZIP_LEVEL)
+
+Uso:
+    python -m bench.history_shape --tank-id 1 --limit 5000 --requests 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+from app.core.db_async import close_async_pool, open_async_pool
+from app.core.jsonresp import GZIP_LEVEL
+from app.routes import history
+
+
+async def _call(tank_id: int, limit: int, shape: str):
+    return await history.history_tank(
+        tank_id=tank_id, date_from=None, date_to=None, since=None, until=None,
+        limit=limit, offset=0, order="asc", include_capacity=True,
+        estimate_missing_volume=True, flat=True, shape=shape, _=None,
+    )
+
+
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(s) * 1000, 2),
+        "p99_ms": round(s[max(int(len(s) * 0.99) - 1, 0)] * 1000, 2),
+    }
+
+
+async def run(tank_id: int, limit: int, requests: int) -> Dict[str, Any]:
+    await open_async_pool()
+    shapes = ("rows", "columns")
+    wall: Dict[str, List[float]] = {s: [] for s in shapes}
+    cpu: Dict[str, List[float]] = {s: [] for s in shapes}
+    body: Dict[str, bytes] = {}
+    try:
+        for s in shapes:
+            body[s] = (await _call(tank_id, limit, s)).body
+        for _ in range(requests):
+            for s in shapes:
+                t0, c0 = time.perf_counter(), time.process_time()
+                await _call(tank_id, limit, s)
+                wall[s].append(time.perf_counter() - t0)
+                cpu[s].append(time.process_time() - c0)
+    finally:
+        await close_async_pool()
+
+    out: Dict[str, Any] = {"tank_id": tank_id, "limit": limit, "requests": requests,
+                           "numpy": history.np is not None}
+    for s in shapes:
+        out[s] = {
+            **_pcts(wall[s]),
+            "cpu_p50_ms": round(statistics.median(cpu[s]) * 1000, 2),
+            "json_bytes": len(body[s]),
+            "gzip_bytes": len(gzip.compress(body[s], GZIP_LEVEL)),
+        }
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tank-id", type=int, default=1)
+    ap.add_argument("--limit", type=int, default=5000)
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    res = asyncio.run(run(args.tank_id, args.limit, args.requests))
+    if args.json:
+        print(json.dumps(res))
+        return
+    print(f"tank {res['tank_id']}, {res['limit']} filas x {res['requests']} requests (numpy: {res['numpy']})")
+    print(f"{'shape':<9}{'p50 ms':>9}{'p99 ms':>9}{'cpu p50':>9}{'json KB':>9}{'gzip KB':>9}")
+    for s in ("rows", "columns"):
+        v = res[s]
+        print(f"{s:<9}{v['p50_ms']:>9}{v['p99_ms']:>9}{v['cpu_p50_ms']:>9}"
+              f"{v['json_bytes'] / 1024:>9.0f}{v['gzip_bytes'] / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# bench/hot_ingest.py
+"""
+Benchmark: ingest de tanque + lecturas para evaluar alarmas, flujo "legacy"
+(SQL armado en cada llamada, un statement por round trip) vs repos/hot
+(statements fijos preparados + pipeline).
+
+    legacy: reserve_key → INSERT dinámico → COMMIT → config → alarmas activas
+    hot:    hot.ingest_with_eval_state (1 pipeline: insert+dedupe, commit,
+            config, activas)
+
+Las dos variantes usan UNA conexión que pasa por un proxy TCP local que suma
+--rtt-ms a cada ráfaga cliente→server (simula la red app↔DB) y cuenta los
+round trips: cada vez que el cliente vuelve a escribir después de haber
+recibido datos del server.
+
+Uso:
+    python -m bench.hot_ingest --tank-id 1 --requests 300 --rtt-ms 2
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+from urllib.parse import urlparse
+
+import psycopg
+from psycopg.rows import dict_row
+
+from app.core.db import DSN
+from app.core.idempotency import reserve_key
+from app.repos import hot
+from app.repos.tanks import reading_cols_vals, reading_insert_sql
+
+LEGACY_CONFIG_SQL = """
+    SELECT tank_id, low_pct, low_low_pct, high_pct, high_high_pct, updated_by, updated_at
+    FROM public.tank_config
+    WHERE tank_id = %s;
+"""
+LEGACY_ACTIVE_SQL = """
+    SELECT id, code, severity, COALESCE(message,'') AS message
+      FROM public.alarms
+     WHERE asset_type='tank' AND asset_id=%s AND is_active=true
+"""
+
+
+class DelayProxy:
+    """Proxy TCP en un thread propio: demora cliente→server y cuenta round trips."""
+
+    def __init__(self, target_host: str, target_port: int, delay_s: float):
+        self.target = (target_host, target_port)
+        self.delay_s = delay_s
+        self.round_trips = 0
+        self.port = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _handle(self, c_reader, c_writer) -> None:
+        s_reader, s_writer = await asyncio.open_connection(*self.target)
+        last = {"dir": "server"}
+        pending: asyncio.Queue = asyncio.Queue()
+
+        async def up() -> None:
+            # cada ráfaga sale delay_s después de llegar (latencia, no serialización)
+            while data := await c_reader.read(65536):
+                if last["dir"] == "server":
+                    self.round_trips += 1
+                last["dir"] = "client"
+                await pending.put((self._loop.time() + self.delay_s, data))
+            await pending.put((0.0, b""))
+
+        async def forward() -> None:
+            while True:
+                due, data = await pending.get()
+                if not data:
+                    break
+                await asyncio.sleep(max(0.0, due - self._loop.time()))
+                s_writer.write(data)
+                await s_writer.drain()
+            s_writer.close()
+
+        async def down() -> None:
+            while data := await s_reader.read(65536):
+                last["dir"] = "server"
+                c_writer.write(data)
+                await c_writer.drain()
+            c_writer.close()
+
+        await asyncio.gather(up(), forward(), down(), return_exceptions=True)
+
+
+def legacy_ingest(conn, tank_id: int, level: float, key: str):
+    cols, vals = reading_cols_vals(tank_id, level, device_id="bench")
+    with conn.cursor(row_factory=dict_row) as cur:
+        reading_id = reserve_key(cur, "tank", key, "public.tank_readings")
+        cols.insert(0, "id")
+        vals.insert(0, reading_id)
+        cur.execute(reading_insert_sql(cols), tuple(vals))
+        saved = cur.fetchone()
+        conn.commit()
+        cur.execute(LEGACY_CONFIG_SQL, (tank_id,))
+        cfg = cur.fetchone() or {}
+        cur.execute(LEGACY_ACTIVE_SQL, (tank_id,))
+        active = cur.fetchall()
+        conn.commit()
+    return saved, cfg, active
+
+
+def hot_ingest(conn, tank_id: int, level: float, key: str):
+    return hot.ingest_with_eval_state(
+        conn, hot.reading_params(tank_id, level, device_id="bench", dedupe_key=key)
+    )
+
+
+def run(proxy: DelayProxy, conninfo: str, fn: Callable, name: str, args) -> Dict[str, Any]:
+    lat: List[float] = []
+    with psycopg.connect(conninfo) as conn:
+        for i in range(args.warmup):
+            fn(conn, args.tank_id, 50.0, f"bench:{name}:{uuid.uuid4()}")
+        rt0 = proxy.round_trips
+        for i in range(args.requests):
+            t0 = time.perf_counter()
+            fn(conn, args.tank_id, 50.0, f"bench:{name}:{uuid.uuid4()}")
+            lat.append(time.perf_counter() - t0)
+        rts = proxy.round_trips - rt0
+    lat.sort()
+    return {
+        "flow": name,
+        "requests": args.requests,
+        "round_trips_per_ingest": round(rts / args.requests, 2),
+        "p50_ms": round(statistics.median(lat) * 1000, 2),
+        "p95_ms": round(lat[int(len(lat) * 0.95) - 1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(lat) * 1000, 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tank-id", type=int, default=1)
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--rtt-ms", type=float, default=2.0, help="latencia agregada por round trip")
+    ap.add_argument("--keep", action="store_true", help="no borrar las lecturas de prueba")
+    ap.add_argument("--json", action="store_true", help="salida JSON (una línea)")
+    args = ap.parse_args()
+
+    info = psycopg.conninfo.conninfo_to_dict(DSN)
+    if "://" in DSN:
+        u = urlparse(DSN)
+        info.setdefault("host", u.hostname)
+        info.setdefault("port", u.port)
+    host = info.get("host") or "localhost"
+    port = int(info.get("port") or 5432)
+    proxy = DelayProxy(host, port, args.rtt_ms / 1000.0)
+    info.update(host="127.0.0.1", port=proxy.port, sslmode="disable")
+    conninfo = psycopg.conninfo.make_conninfo(**{k: v for k, v in info.items() if v is not None})
+
+    results = [
+        run(proxy, conninfo, legacy_ingest, "legacy", args),
+        run(proxy, conninfo, hot_ingest, "hot", args),
+    ]
+
+    if not args.keep:
+        with psycopg.connect(DSN) as conn:
+            conn.execute("DELETE FROM public.tank_readings WHERE device_id = 'bench'")
+            conn.execute("DELETE FROM public.ingest_dedupe WHERE dedupe_key LIKE 'bench:%'")
+
+    if args.json:
+        print(json.dumps({"params": vars(args), "results": results}))
+        return
+    print(f"rtt={args.rtt_ms}ms requests={args.requests} prepare={hot.PREPARE}")
+    print(f"{'flow':<7} {'rt/ingest':>9} {'p50_ms':>8} {'p95_ms':>8} {'mean_ms':>8}")
+    for r in results:
+        print(f"{r['flow']:<7} {r['round_trips_per_ingest']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['mean_ms']:>8}")
+    lg, ht = results
+    print(f"latencia p50 legacy/hot: x{lg['p50_ms'] / ht['p50_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+# bench/json_response.py
+"""
+Benchmark: respuesta de history de 5000 filas, camino completo de FastAPI
+(ruta → serialización → GZipMiddleware) en proceso, vía httpx ASGITransport.
+
+Variantes (se intercalan request a request):
+  legacy        la ruta devuelve la lista: jsonable_encoder + json stdlib, gzip nivel 9
+  orjson/gzN    la ruta devuelve FastJSONResponse(lista): orjson sin
+                jsonable_encoder, gzip nivel N (--levels)
+
+Las filas son sintéticas con la forma de routes/history (datetime con tz,
+floats, strings, None): no hace falta DB.
+
+Uso:
+    python -m bench.json_response --rows 5000 --requests 200
+    python -m bench.json_response --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
+
+from app.core.jsonresp import FastJSONResponse
+
+
+def make_rows(n: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(42)
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(n):
+        lvl = rnd.uniform(10, 90)
+        rows.append({
+            "id": 1_000_000 + i,
+            "tank_id": 1,
+            "ts": t0 + timedelta(minutes=i, microseconds=rnd.randrange(1_000_000)),
+            "level_percent": lvl,
+            "volume_l": round(lvl * 50, 3),
+            "volume_source": "measured",
+            "temperature_c": rnd.uniform(15, 25),
+            "device_id": "esp32-tank-1",
+            "raw_json": None,
+        })
+    return rows
+
+
+def legacy_app(rows, level: int) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=level)
+
+    @app.get("/history")
+    async def history():
+        return rows
+
+    return app
+
+
+def fast_app(rows, level: int) -> FastAPI:
+    app = FastAPI(default_response_class=FastJSONResponse)
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=level)
+
+    @app.get("/history", response_class=FastJSONResponse)
+    async def history():
+        return FastJSONResponse(rows)
+
+    return app
+
+
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(s) * 1000, 2),
+        "p99_ms": round(s[max(int(len(s) * 0.99) - 1, 0)] * 1000, 2),
+        "mean_ms": round(statistics.fmean(s) * 1000, 2),
+    }
+
+
+async def run(rows_n: int, requests: int, levels: List[int]) -> Dict[str, Any]:
+    rows = make_rows(rows_n)
+    variants = {"legacy": legacy_app(rows, 9)}
+    for lvl in levels:
+        variants[f"orjson/gz{lvl}"] = fast_app(rows, lvl)
+
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+        for name, app in variants.items()
+    }
+    headers = {"accept-encoding": "gzip"}
+    samples: Dict[str, List[float]] = {name: [] for name in clients}
+    sizes: Dict[str, Dict[str, int]] = {}
+    bodies: Dict[str, Any] = {}
+    try:
+        for name, c in clients.items():  # calentar + validar que devuelven lo mismo
+            r = await c.get("/history", headers=headers)
+            sizes[name] = {"wire_bytes": int(r.headers.get("content-length", len(r.content))),
+                           "json_bytes": len(r.content)}
+            bodies[name] = r.json()
+        for _ in range(requests):
+            for name, c in clients.items():
+                t0 = time.perf_counter()
+                r = await c.get("/history", headers=headers)
+                r.raise_for_status()
+                samples[name].append(time.perf_counter() - t0)
+    finally:
+        for c in clients.values():
+            await c.aclose()
+
+    same = all(b == bodies["legacy"] for b in bodies.values())
+    return {
+        "rows": rows_n,
+        "requests": requests,
+        "same_payload": same,
+        "variants": {name: {**sizes[name], **_pcts(samples[name])} for name in clients},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=5000)
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--levels", default="9,5,1", help="niveles de gzip para la variante orjson")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    res = asyncio.run(run(args.rows, args.requests, [int(x) for x in args.levels.split(",")]))
+    if args.json:
+        print(json.dumps(res))
+        return
+    print(f"{res['rows']} filas x {res['requests']} requests (payload idéntico: {res['same_payload']})")
+    print(f"{'variante':<14}{'p50 ms':>9}{'p99 ms':>9}{'mean ms':>9}{'gzip KB':>9}{'json KB':>9}")
+    base = res["variants"]["legacy"]["p50_ms"]
+    for name, v in res["variants"].items():
+        print(f"{name:<14}{v['p50_ms']:>9}{v['p99_ms']:>9}{v['mean_ms']:>9}"
+              f"{v['wire_bytes'] / 1024:>9.0f}{v['json_bytes'] / 1024:>9.0f}   x{base / v['p50_ms']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
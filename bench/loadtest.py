@@ -0,0 +1,408 @@
+# bench/loadtest.py
+"""
+Load test reproducible de los caminos de ingest y dashboard, contra una API
+levantada (--url) o lanzada por el propio script (--spawn) y la Postgres local.
+
+Escenario (asyncio + httpx, un proceso):
+  - N devices (--devices): cada uno postea a /ingest/tank y /ingest/pump cada
+    --interval s (con jitter). El nivel sigue una senoidal 5..95 % con período
+    --crossing-period s, así cruza los umbrales (10/20/80/90) y levanta y limpia
+    alarmas de forma determinística (--seed).
+  - M dashboards (--dashboards): cada --poll-interval s piden /tanks/{id}/latest,
+    /tanks/{id}/history?limit=--history-limit y /alarms, con If-None-Match como
+    un navegador (--no-etag para pedir siempre el cuerpo).
+  - Los tanques/bombas del test ("loadtest tank N", "loadtest pump N") y sus
+    umbrales se crean si faltan (idempotente). --cleanup borra sus lecturas y
+    alarmas al final.
+
+Reporta por operación: requests, errores, throughput, p50/p95/p99/max; status;
+alarmas levantadas durante la corrida; conexiones a la DB (pg_stat_activity
+muestreado cada 0.5 s: máx y media, por estado) y, si la API expone /metrics,
+los gauges de los pools. Todo va a un JSON (--out) con commit y parámetros,
+y --compare contra una corrida anterior sale con 1 si p95 o throughput
+empeoran más que --tolerance.
+
+Uso:
+    python -m bench.loadtest --spawn --devices 50 --dashboards 10 --duration 60 \\
+        --out bench/results/$(git rev-parse --short HEAD).json
+    python -m bench.loadtest --url http://127.0.0.1:8000 --duration 30 \\
+        --out /tmp/after.json --compare /tmp/before.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import psycopg
+
+from app.core.db import DSN
+
+THRESHOLDS = {"low_low_pct": 10, "low_pct": 20, "high_pct": 80, "high_high_pct": 90}
+OPS = ("ingest_tank", "ingest_pump", "latest", "history", "alarms")
+
+
+# -----------------------------
+# Fixture en la DB
+# -----------------------------
+def _ensure(cur, table: str, name: str) -> int:
+    cur.execute(f"SELECT id FROM public.{table} WHERE name = %s ORDER BY id LIMIT 1", (name,))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    if table == "tanks":
+        cur.execute("INSERT INTO public.tanks (name, capacity_m3, location_text) VALUES (%s, 10, 'loadtest') RETURNING id",
+                    (name,))
+    else:
+        cur.execute("INSERT INTO public.pumps (name, model, max_flow_lpm) VALUES (%s, 'loadtest', 60) RETURNING id",
+                    (name,))
+    return cur.fetchone()[0]
+
+
+def setup(dsn: str, tanks: int, pumps: int) -> Tuple[List[int], List[int]]:
+    with psycopg.connect(dsn) as conn, conn.cursor() as cur:
+        tank_ids = [_ensure(cur, "tanks", f"loadtest tank {i + 1}") for i in range(tanks)]
+        pump_ids = [_ensure(cur, "pumps", f"loadtest pump {i + 1}") for i in range(pumps)]
+        cur.executemany(
+            """
+            INSERT INTO public.tank_config (tank_id, low_low_pct, low_pct, high_pct, high_high_pct)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (tank_id) DO UPDATE
+               SET low_low_pct = EXCLUDED.low_low_pct, low_pct = EXCLUDED.low_pct,
+                   high_pct = EXCLUDED.high_pct, high_high_pct = EXCLUDED.high_high_pct
+            """,
+            [(t, *THRESHOLDS.values()) for t in tank_ids],
+        )
+        conn.commit()
+    return tank_ids, pump_ids
+
+
+def alarms_raised(dsn: str, tank_ids: List[int], since: datetime) -> int:
+    with psycopg.connect(dsn) as conn:
+        return conn.execute(
+            "SELECT count(*) FROM public.alarms WHERE asset_type = 'tank' AND asset_id = ANY(%s) AND ts_raised >= %s",
+            (tank_ids, since),
+        ).fetchone()[0]
+
+
+def cleanup(dsn: str, tank_ids: List[int], pump_ids: List[int]) -> None:
+    with psycopg.connect(dsn) as conn:
+        conn.execute("DELETE FROM public.tank_readings WHERE tank_id = ANY(%s)", (tank_ids,))
+        conn.execute("DELETE FROM public.pump_readings WHERE pump_id = ANY(%s)", (pump_ids,))
+        conn.execute("DELETE FROM public.alarms WHERE asset_type = 'tank' AND asset_id = ANY(%s)", (tank_ids,))
+        conn.commit()
+
+
+# -----------------------------
+# Muestreo de conexiones
+# -----------------------------
+CONN_SQL = """
+    SELECT state, count(*) FROM pg_stat_activity
+     WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+     GROUP BY state
+"""
+
+
+async def sample_connections(dsn: str, stop: asyncio.Event, out: List[Dict[str, int]]) -> None:
+    async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+        while not stop.is_set():
+            cur = await conn.execute(CONN_SQL)
+            out.append({(s or "unknown"): n for s, n in await cur.fetchall()})
+            try:
+                await asyncio.wait_for(stop.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+
+# -----------------------------
+# Carga
+# -----------------------------
+class Recorder:
+    def __init__(self) -> None:
+        self.lat: Dict[str, List[float]] = {op: [] for op in OPS}
+        self.status: Dict[str, Dict[str, int]] = {op: {} for op in OPS}
+        self.errors: Dict[str, int] = {op: 0 for op in OPS}
+        self.recording = False
+
+    async def call(self, client: httpx.AsyncClient, op: str, method: str, url: str, **kw) -> Optional[httpx.Response]:
+        t0 = time.perf_counter()
+        try:
+            r = await client.request(method, url, **kw)
+            code = str(r.status_code)
+        except httpx.HTTPError as e:
+            r, code = None, type(e).__name__
+        if self.recording:
+            self.lat[op].append(time.perf_counter() - t0)
+            self.status[op][code] = self.status[op].get(code, 0) + 1
+            if r is None or r.status_code >= 400:
+                self.errors[op] += 1
+        return r
+
+
+def level_at(t: float, phase: float, period: float) -> float:
+    return round(50 + 45 * math.sin(2 * math.pi * (t / period) + phase), 2)
+
+
+async def device(i: int, client, rec: Recorder, tank_id: int, pump_id: int, args, stop: asyncio.Event) -> None:
+    rnd = random.Random(args.seed * 1000 + i)
+    phase = rnd.uniform(0, 2 * math.pi)
+    dev = f"loadtest-{i}"
+    params = {"async": "1"} if args.async_ingest else None
+    # boot_id por corrida: (device, boot_id, seq) no choca con la dedupe de corridas anteriores
+    boot_id, seq, t_start = uuid.uuid4().hex[:12], 0, time.monotonic()
+    await asyncio.sleep(rnd.uniform(0, args.interval))  # repartir los devices en el intervalo
+    while not stop.is_set():
+        t0 = time.monotonic()
+        seq += 1
+        lvl = level_at(t0 - t_start, phase, args.crossing_period)
+        await rec.call(client, "ingest_tank", "POST", "/ingest/tank", params=params, headers={"X-Device-Id": dev},
+                       json={"tank_id": tank_id, "level_percent": lvl, "seq": seq, "boot_id": boot_id,
+                             "temperature_c": round(rnd.uniform(15, 25), 2)})
+        await rec.call(client, "ingest_pump", "POST", "/ingest/pump", params=params, headers={"X-Device-Id": dev},
+                       json={"pump_id": pump_id, "is_on": lvl < 50, "flow_lpm": round(rnd.uniform(0, 60), 2),
+                             "pressure_bar": round(rnd.uniform(1, 4), 2), "seq": seq,
+                             "boot_id": boot_id})
+        sleep = args.interval * rnd.uniform(0.9, 1.1) - (time.monotonic() - t0)
+        if sleep > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), sleep)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def dashboard(j: int, client, rec: Recorder, tank_ids: List[int], args, stop: asyncio.Event) -> None:
+    rnd = random.Random(args.seed * 7919 + j)
+    etags: Dict[str, str] = {}
+    await asyncio.sleep(rnd.uniform(0, args.poll_interval))
+    while not stop.is_set():
+        t0 = time.monotonic()
+        tank_id = rnd.choice(tank_ids)
+        for op, url in (("latest", f"/tanks/{tank_id}/latest"),
+                        ("history", f"/tanks/{tank_id}/history?limit={args.history_limit}"),
+                        ("alarms", "/alarms")):
+            headers = {"Accept-Encoding": "gzip"}
+            if args.etag and url in etags:
+                headers["If-None-Match"] = etags[url]
+            r = await rec.call(client, op, "GET", url, headers=headers)
+            if r is not None and r.headers.get("etag"):
+                etags[url] = r.headers["etag"]
+        sleep = args.poll_interval - (time.monotonic() - t0)
+        if sleep > 0:
+            try:
+                await asyncio.wait_for(stop.wait(), sleep)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def scrape_pool_gauges(client: httpx.AsyncClient) -> Dict[str, Dict[str, float]]:
+    """db_pool_* de /metrics (si la API lo expone)."""
+    out: Dict[str, Dict[str, float]] = {}
+    try:
+        r = await client.get("/metrics")
+    except httpx.HTTPError:
+        return out
+    if r.status_code != 200:
+        return out
+    for line in r.text.splitlines():
+        if line.startswith("db_pool_") and "{" in line and not line.startswith("db_pool_wait"):
+            name, rest = line.split("{", 1)
+            labels, value = rest.rsplit("} ", 1)
+            pool = labels.split('pool="', 1)[1].split('"', 1)[0]
+            out.setdefault(pool, {})[name[len("db_pool_"):]] = float(value)
+    return out
+
+
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    s = sorted(samples)
+
+    def q(p: float) -> float:
+        return round(s[min(len(s) - 1, max(int(math.ceil(len(s) * p)) - 1, 0))] * 1000, 2)
+
+    return {"p50_ms": round(statistics.median(s) * 1000, 2), "p95_ms": q(0.95), "p99_ms": q(0.99),
+            "max_ms": round(s[-1] * 1000, 2)}
+
+
+async def run(args, tank_ids: List[int], pump_ids: List[int]) -> Dict[str, Any]:
+    rec = Recorder()
+    stop = asyncio.Event()
+    conns: List[Dict[str, int]] = []
+    limits = httpx.Limits(max_connections=args.devices + args.dashboards + 10)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        tasks = [asyncio.create_task(device(i, client, rec, tank_ids[i % len(tank_ids)], pump_ids[i % len(pump_ids)],
+                                            args, stop)) for i in range(args.devices)]
+        tasks += [asyncio.create_task(dashboard(j, client, rec, tank_ids, args, stop)) for j in range(args.dashboards)]
+        await asyncio.sleep(args.warmup)
+
+        rec.recording = True
+        started = datetime.now(timezone.utc)
+        sampler = asyncio.create_task(sample_connections(args.dsn, stop, conns))
+        t0 = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        pools = await scrape_pool_gauges(client)
+        rec.recording = False
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await asyncio.gather(*tasks, sampler)
+
+    ops = {}
+    for op in OPS:
+        n = len(rec.lat[op])
+        ops[op] = {"requests": n, "errors": rec.errors[op], "rps": round(n / elapsed, 2),
+                   **_pcts(rec.lat[op]), "status": rec.status[op]}
+    totals = [sum(c.values()) for c in conns] or [0]
+    states = sorted({s for c in conns for s in c})
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "started_at": started.isoformat(),
+        "ops": ops,
+        "total_rps": round(sum(o["requests"] for o in ops.values()) / elapsed, 2),
+        "db_connections": {
+            "max": max(totals), "mean": round(statistics.fmean(totals), 1), "samples": len(conns),
+            "max_by_state": {s: max(c.get(s, 0) for c in conns) for s in states},
+            "pools": pools,
+        },
+    }
+
+
+# -----------------------------
+# API lanzada por el script
+# -----------------------------
+def spawn_api(args) -> subprocess.Popen:
+    port = args.url.rsplit(":", 1)[-1].split("/")[0]
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port, "--workers", str(args.workers),
+           "--log-level", "warning"]
+    # Todos los devices salen de 127.0.0.1: sin API key compartirían el bucket por IP
+    env = {**os.environ, "INGEST_RATE_PER_IP": os.getenv("INGEST_RATE_PER_IP", "0")}
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{args.url}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            raise SystemExit(f"uvicorn salió con código {proc.returncode}")
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit("la API no respondió /health en 60 s")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+# -----------------------------
+# Comparación entre corridas
+# -----------------------------
+def compare(cur: Dict[str, Any], base: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regresiones: p95 sube o rps baja más que `tolerance` (fracción)."""
+    bad = []
+    for op, c in cur["results"]["ops"].items():
+        b = base["results"]["ops"].get(op)
+        if not b or not b["requests"] or not c["requests"]:
+            continue
+        if b["p95_ms"] and c["p95_ms"] > b["p95_ms"] * (1 + tolerance):
+            bad.append(f"{op}: p95 {b['p95_ms']} → {c['p95_ms']} ms")
+        if c["rps"] < b["rps"] * (1 - tolerance):
+            bad.append(f"{op}: rps {b['rps']} → {c['rps']}")
+        if c["errors"] > b["errors"]:
+            bad.append(f"{op}: errores {b['errors']} → {c['errors']}")
+    return bad
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--dsn", default=DSN, help="para el fixture y pg_stat_activity (default: DATABASE_URL)")
+    ap.add_argument("--spawn", action="store_true", help="lanzar uvicorn app.main:app en el puerto de --url")
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--devices", type=int, default=20)
+    ap.add_argument("--dashboards", type=int, default=5)
+    ap.add_argument("--tanks", type=int, default=10)
+    ap.add_argument("--pumps", type=int, default=5)
+    ap.add_argument("--interval", type=float, default=1.0, help="s entre lecturas de cada device")
+    ap.add_argument("--poll-interval", type=float, default=2.0, help="s entre refrescos de cada dashboard")
+    ap.add_argument("--crossing-period", type=float, default=30.0, help="período de la senoidal de nivel (s)")
+    ap.add_argument("--history-limit", type=int, default=500)
+    ap.add_argument("--duration", type=float, default=30.0)
+    ap.add_argument("--warmup", type=float, default=3.0)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--async-ingest", action="store_true", help="postear con ?async=1 (cola de ingest)")
+    ap.add_argument("--no-etag", dest="etag", action="store_false")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--cleanup", action="store_true")
+    ap.add_argument("--out", help="archivo JSON de resultados")
+    ap.add_argument("--compare", help="JSON de una corrida anterior")
+    ap.add_argument("--tolerance", type=float, default=0.2)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    tank_ids, pump_ids = setup(args.dsn, args.tanks, args.pumps)
+    proc = spawn_api(args) if args.spawn else None
+    try:
+        results = asyncio.run(run(args, tank_ids, pump_ids))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+    results["alarms_raised"] = alarms_raised(args.dsn, tank_ids, datetime.fromisoformat(results["started_at"]))
+    if args.cleanup:
+        cleanup(args.dsn, tank_ids, pump_ids)
+
+    doc = {
+        "commit": git_commit(),
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "params": {k: v for k, v in vars(args).items() if k not in ("dsn", "out", "compare", "json")},
+        "results": results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2)
+
+    regressions: List[str] = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(doc, json.load(f), args.tolerance)
+        doc["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(doc))
+    else:
+        r = results
+        print(f"commit {doc['commit']}  {args.devices} devices, {args.dashboards} dashboards, {r['elapsed_s']} s")
+        print(f"{'op':<13}{'req':>7}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+        for op, o in r["ops"].items():
+            print(f"{op:<13}{o['requests']:>7}{o['errors']:>6}{o['rps']:>9}"
+                  + "".join(f"{o[k] if o[k] is not None else '-':>9}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms")))
+        c = r["db_connections"]
+        print(f"total {r['total_rps']} rps | alarmas levantadas {r['alarms_raised']} | "
+              f"conexiones DB máx {c['max']} (media {c['mean']}) {c['max_by_state']}")
+        for msg in regressions:
+            print(f"REGRESIÓN {msg}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
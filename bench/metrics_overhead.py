@@ -0,0 +1,102 @@
+# bench/metrics_overhead.py
+"""
+Benchmark: costo de la instrumentación de app/core/metrics por evento.
+
+  inc / observe       contador / histograma con labels
+  db_timed            función sync vacía decorada vs sin decorar
+  middleware          request a una app FastAPI mínima (httpx ASGITransport)
+                      con y sin HTTPMetricsMiddleware, intercalados
+  render              render_prometheus() con las series que haya cargadas
+
+Uso:
+    python -m bench.metrics_overhead --n 200000 --requests 2000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI
+
+from app.core import metrics
+
+
+def _per_call_ns(fn, n: int) -> float:
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter_ns() - t0) / n
+
+
+def micro(n: int) -> Dict[str, float]:
+    def noop():
+        return None
+
+    timed = metrics.db_timed(noop)
+    base = _per_call_ns(noop, n)
+    return {
+        "inc_ns": round(_per_call_ns(lambda: metrics.inc("bench_total", kind="tank", asset_id=1), n), 1),
+        "observe_ns": round(_per_call_ns(lambda: metrics.observe("bench_seconds", 0.003, route="/x"), n), 1),
+        "db_timed_extra_ns": round(_per_call_ns(timed, n) - base, 1),
+    }
+
+
+def _app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    if instrumented:
+        app.add_middleware(metrics.HTTPMetricsMiddleware)
+
+    @app.get("/tanks/{tank_id}/latest")
+    async def latest(tank_id: int):
+        return {"tank_id": tank_id}
+
+    return app
+
+
+async def middleware(requests: int) -> Dict[str, Any]:
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=_app(name == "on")), base_url="http://bench")
+        for name in ("off", "on")
+    }
+    samples: Dict[str, List[float]] = {name: [] for name in clients}
+    try:
+        for i in range(requests):
+            for name, c in clients.items():
+                t0 = time.perf_counter()
+                await c.get(f"/tanks/{i % 50 + 1}/latest")
+                samples[name].append(time.perf_counter() - t0)
+    finally:
+        for c in clients.values():
+            await c.aclose()
+    p50 = {name: statistics.median(s) * 1e6 for name, s in samples.items()}
+    return {"off_p50_us": round(p50["off"], 1), "on_p50_us": round(p50["on"], 1),
+            "extra_us": round(p50["on"] - p50["off"], 1)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=200_000)
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    res: Dict[str, Any] = {"micro": micro(args.n), "middleware": asyncio.run(middleware(args.requests))}
+    t0 = time.perf_counter()
+    text = metrics.render_prometheus()
+    res["render"] = {"ms": round((time.perf_counter() - t0) * 1000, 2), "lines": text.count("\n")}
+    if args.json:
+        print(json.dumps(res))
+        return
+    m, mw, r = res["micro"], res["middleware"], res["render"]
+    print(f"inc {m['inc_ns']} ns | observe {m['observe_ns']} ns | db_timed +{m['db_timed_extra_ns']} ns")
+    print(f"request p50: sin middleware {mw['off_p50_us']} µs, con {mw['on_p50_us']} µs (+{mw['extra_us']} µs)")
+    print(f"render_prometheus: {r['ms']} ms, {r['lines']} líneas")
+
+
+if __name__ == "__main__":
+    main()
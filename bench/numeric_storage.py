@@ -0,0 +1,207 @@
+# bench/numeric_storage.py
+"""
+Benchmark: lecturas con columnas numeric vs real/double precision
+(migración 0007).
+
+Mide:
+  - tamaño de tank_readings / pump_readings (heap e índices, sumando
+    particiones) y bytes por fila
+  - fetch + decode de la consulta de history en proceso (lo que cuesta
+    construir Decimal / float por celda)
+  - latencia de GET /tanks/{id}/history contra una API levantada (--url)
+  - A/B en la misma corrida: copia --ab-rows lecturas a dos tablas temporales
+    (numeric vs real/double) y mide tamaño y fetch alternando una y otra, así
+    el ruido de la máquina afecta igual a las dos variantes
+
+Los tres primeros dependen del estado de la DB: se corre antes y después de
+migrar y se comparan los JSON:
+
+    python -m bench.numeric_storage --tank-id 1 --out /tmp/before.json
+    python -m app.core.migrate up
+    python -m bench.numeric_storage --tank-id 1 --out /tmp/after.json --compare /tmp/before.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import psycopg
+from psycopg.types.numeric import NumericLoader
+
+from app.core.db import DSN
+from app.repos.tanks import history_sql
+
+_SIZE_SQL = """
+    WITH fam AS (
+        SELECT c.oid FROM pg_class c WHERE c.oid = to_regclass(%(t)s)
+        UNION ALL
+        SELECT i.inhrelid FROM pg_inherits i WHERE i.inhparent = to_regclass(%(t)s)
+    )
+    SELECT COALESCE(sum(pg_table_size(oid)), 0)::bigint,
+           COALESCE(sum(pg_indexes_size(oid)), 0)::bigint,
+           COALESCE(sum(GREATEST(c.reltuples, 0)) FILTER (WHERE c.relkind = 'r'), 0)::bigint
+      FROM fam JOIN pg_class c USING (oid);
+"""
+
+_TYPES_SQL = """
+    SELECT column_name, data_type FROM information_schema.columns
+     WHERE table_schema = 'public' AND table_name = %s
+       AND column_name = ANY(%s) ORDER BY ordinal_position;
+"""
+
+_COLUMNS = {
+    "tank_readings": ["level_percent", "volume_l", "temperature_c"],
+    "pump_readings": ["flow_lpm", "pressure_bar", "voltage_v", "current_a"],
+}
+
+
+def _pcts(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(s) * 1000, 2),
+        "p95_ms": round(s[int(len(s) * 0.95) - 1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(s) * 1000, 2),
+    }
+
+
+def sizes(conn) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for table, cols in _COLUMNS.items():
+        conn.execute(f"ANALYZE public.{table}")
+        heap, idx, rows = conn.execute(_SIZE_SQL, {"t": f"public.{table}"}).fetchone()
+        types = dict(conn.execute(_TYPES_SQL, (table, cols)).fetchall())
+        out[table] = {
+            "types": types,
+            "rows": rows,
+            "heap_bytes": heap,
+            "index_bytes": idx,
+            "heap_bytes_per_row": round(heap / rows, 1) if rows else None,
+        }
+    return out
+
+
+def decode(conn, tank_id: int, limit: int, n: int) -> Dict[str, Any]:
+    """fetchall() de la consulta de history: incluye armar los valores Python."""
+    sql, params = history_sql(tank_id, None, None, limit, 0)
+    conn.execute(sql, params).fetchall()  # calentar caché / plan
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        samples.append(time.perf_counter() - t0)
+    sample = next((r for r in rows if r), None)
+    return {"rows": len(rows), "value_type": type(sample[4]).__name__ if sample else None, **_pcts(samples)}
+
+
+_AB_TYPES = {
+    "numeric": ("numeric", "numeric", "numeric"),
+    "float": ("real", "double precision", "real"),
+}
+
+
+def ab(conn, rows: int, fetch: int, rounds: int) -> Dict[str, Any]:
+    """
+    Misma data en numeric (con los ~15 dígitos que mandan los devices) y en
+    real/double; fetch intercalado. `conn` carga numeric como Decimal, como
+    era antes del loader de core/db.
+    """
+    out: Dict[str, Any] = {}
+    for name, (lvl, vol, tmp) in _AB_TYPES.items():
+        conn.execute(f"DROP TABLE IF EXISTS _ab_{name}")
+        conn.execute(f"""
+            CREATE TEMP TABLE _ab_{name} AS
+            SELECT id, tank_id, ts, level_percent::float8::numeric::{lvl} AS level_percent,
+                   volume_l::float8::numeric::{vol} AS volume_l,
+                   temperature_c::float8::numeric::{tmp} AS temperature_c
+              FROM public.tank_readings ORDER BY ts DESC LIMIT %s
+        """, (rows,))
+        n = conn.execute(f"SELECT count(*) FROM _ab_{name}").fetchone()[0]
+        size = conn.execute(f"SELECT pg_table_size('_ab_{name}')").fetchone()[0]
+        out[name] = {"rows": n, "heap_bytes": size, "heap_bytes_per_row": round(size / n, 1) if n else None}
+
+    samples: Dict[str, List[float]] = {name: [] for name in _AB_TYPES}
+    for _ in range(rounds):
+        for name in _AB_TYPES:
+            q = f"SELECT level_percent, volume_l, temperature_c FROM _ab_{name} LIMIT {fetch}"
+            t0 = time.perf_counter()
+            conn.execute(q).fetchall()
+            samples[name].append(time.perf_counter() - t0)
+    for name in _AB_TYPES:
+        out[name].update({"fetch_rows": fetch, **_pcts(samples[name])})
+    return out
+
+
+def http(url: str, tank_id: int, limit: int, n: int) -> Optional[Dict[str, Any]]:
+    target = f"{url.rstrip('/')}/tanks/{tank_id}/history?limit={limit}&order=desc"
+    try:
+        urllib.request.urlopen(target, timeout=30).read()
+    except Exception as e:
+        print(f"[http] {target} no responde ({e}); se omite")
+        return None
+    samples = []
+    size = 0
+    for _ in range(n):
+        t0 = time.perf_counter()
+        size = len(urllib.request.urlopen(target, timeout=30).read())
+        samples.append(time.perf_counter() - t0)
+    return {"bytes": size, **_pcts(samples)}
+
+
+def _compare(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    def delta(a, b):
+        return f"{a} → {b} ({(b - a) / a * 100:+.1f}%)" if a and b is not None else f"{a} → {b}"
+
+    for table in _COLUMNS:
+        b, a = before["sizes"][table], after["sizes"][table]
+        print(f"{table}: heap {delta(b['heap_bytes'], a['heap_bytes'])} bytes, "
+              f"por fila {delta(b['heap_bytes_per_row'], a['heap_bytes_per_row'])}, "
+              f"índices {delta(b['index_bytes'], a['index_bytes'])}")
+    print(f"decode history p50 ms: {delta(before['decode']['p50_ms'], after['decode']['p50_ms'])} "
+          f"({before['decode']['value_type']} → {after['decode']['value_type']})")
+    ab_ = after.get("ab")
+    if ab_:
+        print(f"A/B misma corrida (numeric → real/double): por fila "
+              f"{delta(ab_['numeric']['heap_bytes_per_row'], ab_['float']['heap_bytes_per_row'])}, "
+              f"fetch {ab_['float']['fetch_rows']} filas p50 ms "
+              f"{delta(ab_['numeric']['p50_ms'], ab_['float']['p50_ms'])}")
+    if before.get("http") and after.get("http"):
+        print(f"GET history p50 ms: {delta(before['http']['p50_ms'], after['http']['p50_ms'])}, "
+              f"p95 ms: {delta(before['http']['p95_ms'], after['http']['p95_ms'])}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=DSN)
+    ap.add_argument("--tank-id", type=int, default=1)
+    ap.add_argument("--limit", type=int, default=5000)
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--ab-rows", type=int, default=100000, help="0 = sin A/B")
+    ap.add_argument("--out")
+    ap.add_argument("--compare", help="JSON de una corrida anterior")
+    args = ap.parse_args()
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn, \
+            psycopg.connect(args.dsn, autocommit=True) as ab_conn:
+        ab_conn.adapters.register_loader("numeric", NumericLoader)
+        result = {
+            "sizes": sizes(conn),
+            "decode": decode(conn, args.tank_id, args.limit, args.requests),
+            "http": http(args.url, args.tank_id, args.limit, args.requests),
+            "ab": ab(ab_conn, args.ab_rows, args.limit, args.requests) if args.ab_rows else None,
+        }
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# bench/plan_check.py
+"""
+Chequeo de regresión de planes: corre EXPLAIN (FORMAT JSON) de las consultas
+calientes, con el SQL real importado de los módulos que las ejecutan, y falla
+si alguna lee su tabla con Seq Scan, deja de usar el índice pensado para ella
+(app/migrations/0006_indexes.py y siguientes) o vuelve a ordenar en memoria.
+
+No se fuerza nada (enable_seqscan queda como está): se verifica el plan que
+el planner elegiría de verdad. En una DB chica (dev/CI) el Seq Scan es lo
+correcto, así que --seed carga dentro de una transacción un volumen realista
+(seed(): ~300k lecturas de tanque, 100k de bomba, 20k alarmas, 50k eventos de
+auditoría), corre ANALYZE, explica y hace ROLLBACK: no queda nada, ni las
+estadísticas. tests/test_query_plans.py hace lo mismo con pytest.
+
+Uso:
+    python -m bench.plan_check --seed        # DB de dev: exit 1 si falla
+    python -m bench.plan_check               # DB con datos reales
+    python -m bench.plan_check --seed --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+import psycopg
+
+from app.core.db import DSN
+from app.repos import hot
+from app.repos.alarms import LIST_BY_STATE_SQL, pending_sql
+from app.repos.audit import list_audit_sql
+from app.repos.pumps import LATEST_PUMP_SQL, PUMP_HISTORY_SQL
+from app.repos.tanks import LATEST_READING_SQL, history_columns_sql, history_sql
+from app.repos.versions import LATEST_PUMP_TOKEN_SQL
+from app.services import retention
+
+Params = Callable[[Dict[str, Any]], Any]
+
+
+def _history(ctx: Dict[str, Any]):
+    now = ctx["now"]
+    return history_sql(ctx["tank_id"], (now - timedelta(days=7)).isoformat(), now.isoformat(), 500, 0)
+
+
+def _rollup_window(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    hi = ctx["now"].replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+    return {"lo": hi - timedelta(minutes=retention.WINDOW_MIN), "hi": hi}
+
+
+# name, sql, params (de ctx: tank_id, pump_id, now), tabla que no se puede
+# leer con Seq Scan, índice esperado, tipos de nodo prohibidos, máximo de
+# particiones leídas (None = sin control) e index_only (el índice cubre todo
+# lo que lee: Index Only Scan, sin ir al heap)
+CHECKS: List[Dict[str, Any]] = [
+    {
+        "name": "tank latest",
+        "sql": lambda ctx: LATEST_READING_SQL,
+        "params": lambda ctx: (ctx["tank_id"],),
+        "table": "tank_readings",
+        "index": "idx_tank_readings_latest_cov",
+        "forbid": {"Sort", "Incremental Sort"},
+    },
+    {
+        "name": "tank history (7 días)",
+        "sql": lambda ctx: _history(ctx)[0],
+        "params": lambda ctx: _history(ctx)[1],
+        "table": "tank_readings",
+        "index": "idx_tank_readings_latest_cov",
+        "forbid": {"Sort", "Incremental Sort"},
+        "max_partitions": 2,
+    },
+    {
+        "name": "tank history columns",
+        "sql": lambda ctx: history_columns_sql(ctx["tank_id"], None, None, 500, 0)[0],
+        "params": lambda ctx: history_columns_sql(ctx["tank_id"], None, None, 500, 0)[1],
+        "table": "tank_readings",
+        "index": "idx_tank_readings_latest_cov",
+        "forbid": {"Sort", "Incremental Sort"},
+        "index_only": True,
+    },
+    {
+        "name": "pump latest",
+        "sql": lambda ctx: LATEST_PUMP_SQL,
+        "params": lambda ctx: (ctx["pump_id"],),
+        "table": "pump_readings",
+        "index": "idx_pump_readings_latest",
+        "forbid": {"Sort", "Incremental Sort"},
+    },
+    {
+        "name": "pump history",
+        "sql": lambda ctx: PUMP_HISTORY_SQL,
+        "params": lambda ctx: (ctx["pump_id"], 500),
+        "table": "pump_readings",
+        "index": "idx_pump_readings_latest",
+        "forbid": {"Sort", "Incremental Sort"},
+        "index_only": True,
+    },
+    {
+        "name": "pump latest token (ETag)",
+        "sql": lambda ctx: LATEST_PUMP_TOKEN_SQL,
+        "params": lambda ctx: (ctx["pump_id"],),
+        "table": "pump_readings",
+        "index": "idx_pump_readings_latest",
+        "forbid": {"Sort", "Incremental Sort"},
+        "index_only": True,
+    },
+    {
+        "name": "tank rollup 1m (retention)",
+        "sql": lambda ctx: retention._TANK_1M_SQL,
+        "params": _rollup_window,
+        "table": "tank_readings",
+        "index": "brin_tank_readings_ts",
+        "max_partitions": 1,
+    },
+    {
+        "name": "pump rollup 1m (retention)",
+        "sql": lambda ctx: retention._PUMP_1M_SQL,
+        "params": _rollup_window,
+        "table": "pump_readings",
+        "index": "brin_pump_readings_ts",
+        "max_partitions": 1,
+    },
+    {
+        "name": "active alarms of tank (ingest)",
+        "sql": lambda ctx: hot.ACTIVE_ALARMS_SQL,
+        "params": lambda ctx: (ctx["tank_id"],),
+        "table": "alarms",
+        "index": "idx_alarms_asset_active",
+        "forbid": {"Sort"},
+    },
+    {
+        "name": "GET /alarms (active)",
+        "sql": lambda ctx: LIST_BY_STATE_SQL,
+        "params": lambda ctx: (True,),
+        "table": "alarms",
+        "index": "idx_alarms_active_ts",
+        "forbid": {"Sort"},
+    },
+    {
+        "name": "alarm poller pending",
+        "sql": lambda ctx: pending_sql(True),
+        "params": lambda ctx: (50,),
+        "table": "alarms",
+        "index": "idx_alarms_tg_pending",
+        "forbid": {"Sort"},
+    },
+    {
+        "name": "audit by asset",
+        "sql": lambda ctx: list_audit_sql(asset_type="tank", asset_id=ctx["tank_id"], limit=200)[0],
+        "params": lambda ctx: list_audit_sql(asset_type="tank", asset_id=ctx["tank_id"], limit=200)[1],
+        "table": "audit_events",
+        "index": "idx_audit_events_asset_ts",
+        "forbid": {"Sort", "Incremental Sort"},
+    },
+    {
+        "name": "audit by code",
+        "sql": lambda ctx: list_audit_sql(code="LOW", limit=200)[0],
+        "params": lambda ctx: list_audit_sql(code="LOW", limit=200)[1],
+        "table": "audit_events",
+        "index": "idx_audit_events_code_ts_id",
+        "forbid": {"Sort", "Incremental Sort"},
+    },
+]
+
+
+# -----------------------------
+# Volumen sintético (en la transacción del llamador)
+# -----------------------------
+_SEED_SQL = [
+    """CREATE TEMP TABLE _pc_tanks ON COMMIT DROP AS
+       WITH t AS (INSERT INTO public.tanks(name)
+                  SELECT 'plan_check tank ' || g FROM generate_series(1, %(tanks)s) g RETURNING id)
+       SELECT id FROM t""",
+    """CREATE TEMP TABLE _pc_pumps ON COMMIT DROP AS
+       WITH p AS (INSERT INTO public.pumps(name)
+                  SELECT 'plan_check pump ' || g FROM generate_series(1, %(pumps)s) g RETURNING id)
+       SELECT id FROM p""",
+    # En orden de ts (como llegan): el orden físico sigue al temporal (BRIN)
+    """INSERT INTO public.tank_readings(tank_id, level_percent, ts)
+       SELECT t.id, 50 + 40 * sin(g / 50.0), %(now)s - (%(per_asset)s - g) * interval '144 seconds'
+         FROM generate_series(1, %(per_asset)s) g CROSS JOIN _pc_tanks t
+        ORDER BY 3""",
+    """INSERT INTO public.pump_readings(pump_id, is_on, flow_lpm, ts)
+       SELECT p.id, g %% 2 = 0, 30, %(now)s - (%(per_asset)s - g) * interval '144 seconds'
+         FROM generate_series(1, %(per_asset)s) g CROSS JOIN _pc_pumps p
+        ORDER BY 4""",
+    # Histórico de alarmas limpias y notificadas + una activa por tanque
+    """INSERT INTO public.alarms(asset_type, asset_id, code, severity, ts_raised, ts_cleared,
+                                 is_active, tg_notified_at)
+       SELECT 'tank', t.id, 'LOW', 'warning', %(now)s - g * interval '1 hour',
+              %(now)s - g * interval '1 hour' + interval '10 minutes', false, %(now)s
+         FROM generate_series(1, %(alarms_per_tank)s) g CROSS JOIN _pc_tanks t""",
+    """INSERT INTO public.alarms(asset_type, asset_id, code, severity, ts_raised, is_active)
+       SELECT 'tank', id, 'HIGH', 'warning', %(now)s, true FROM _pc_tanks""",
+    # Auditoría: un code frecuente y uno raro (el filtro por code es selectivo)
+    """INSERT INTO public.audit_events(ts, domain, asset_type, asset_id, code, state)
+       SELECT %(now)s - g * interval '1 minute', 'ALARM', 'tank', t.id,
+              CASE WHEN g %% 50 = 0 THEN 'LOW' ELSE 'HIGH' END, 'RAISED'
+         FROM generate_series(1, %(audit_per_tank)s) g CROSS JOIN _pc_tanks t""",
+]
+_SEED_TABLES = ("tanks", "pumps", "tank_readings", "pump_readings", "alarms", "audit_events")
+
+
+def seed(conn: psycopg.Connection, *, tanks: int = 50, pumps: int = 20, per_asset: int = 6000,
+         alarms_per_tank: int = 400, audit_per_tank: int = 1000) -> Dict[str, Any]:
+    """
+    Carga el volumen en la transacción abierta de `conn` y corre ANALYZE.
+    El llamador hace ROLLBACK. Devuelve el ctx de los params (tank_id, pump_id, now).
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    args = {"now": now, "tanks": tanks, "pumps": pumps, "per_asset": per_asset,
+            "alarms_per_tank": alarms_per_tank, "audit_per_tank": audit_per_tank}
+    with conn.cursor() as cur:
+        for q in _SEED_SQL:
+            cur.execute(q, args)
+        for table in _SEED_TABLES:
+            cur.execute(f"ANALYZE public.{table}")
+        cur.execute("SELECT (SELECT min(id) FROM _pc_tanks), (SELECT min(id) FROM _pc_pumps)")
+        tank_id, pump_id = cur.fetchone()
+    return {"tank_id": tank_id, "pump_id": pump_id, "now": now}
+
+
+def real_ctx(conn: psycopg.Connection) -> Dict[str, Any]:
+    """ctx para una DB con datos: el tanque y la bomba con la última lectura."""
+    with conn.cursor() as cur:
+        cur.execute("""SELECT (SELECT tank_id FROM public.tank_readings ORDER BY ts DESC LIMIT 1),
+                              (SELECT pump_id FROM public.pump_readings ORDER BY ts DESC LIMIT 1)""")
+        tank_id, pump_id = cur.fetchone()
+    return {"tank_id": tank_id or 1, "pump_id": pump_id or 1, "now": datetime.now(timezone.utc)}
+
+
+# -----------------------------
+# Chequeo
+# -----------------------------
+def _walk(node: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+
+def _index_family(cur, index: str) -> Set[str]:
+    """El índice y sus copias en cada partición (pg_inherits de índices)."""
+    cur.execute("""
+        WITH RECURSIVE fam(oid) AS (
+            SELECT to_regclass(%s)::oid
+            UNION ALL
+            SELECT i.inhrelid FROM pg_inherits i JOIN fam ON i.inhparent = fam.oid
+        )
+        SELECT c.relname FROM fam JOIN pg_class c ON c.oid = fam.oid;
+    """, (f"public.{index}",))
+    return {r[0] for r in cur.fetchall()}
+
+
+def check(conn: psycopg.Connection, spec: Dict[str, Any], ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """EXPLAIN de una consulta de CHECKS. No cierra la transacción de `conn`."""
+    out: Dict[str, Any] = {"name": spec["name"], "index": spec["index"]}
+    with conn.cursor() as cur:
+        family = _index_family(cur, spec["index"])
+        if not family:
+            return {**out, "ok": False, "problems": [f"índice {spec['index']} no existe"]}
+        cur.execute("EXPLAIN (FORMAT JSON) " + spec["sql"](ctx), spec["params"](ctx))
+        plan = cur.fetchone()[0][0]["Plan"]
+
+    table = spec["table"]
+    nodes = list(_walk(plan))
+    used = {n.get("Index Name") for n in nodes if n.get("Index Name")}
+    on_table = [n for n in nodes
+                if n.get("Relation Name") == table or n.get("Relation Name", "").startswith(table + "_y")]
+    partitions = {n["Relation Name"] for n in on_table if n["Relation Name"] != table}
+    problems: List[str] = []
+    seq = sorted({n["Relation Name"] for n in on_table if n["Node Type"] == "Seq Scan"})
+    if seq:
+        problems.append("Seq Scan sobre " + ", ".join(seq))
+    if not used & family:
+        problems.append(f"no usa {spec['index']} (usa: {sorted(used) or 'ningún índice'})")
+    bad = sorted({n["Node Type"] for n in nodes if n["Node Type"] in spec.get("forbid", set())})
+    if bad:
+        problems.append("ordena en memoria: " + ", ".join(bad))
+    if spec.get("index_only"):
+        heap = sorted({n["Relation Name"] for n in on_table if n["Node Type"] != "Index Only Scan"})
+        if heap:
+            problems.append("va al heap (no Index Only Scan) en " + ", ".join(heap))
+    maxp: Optional[int] = spec.get("max_partitions")
+    if maxp is not None and len(partitions) > maxp:
+        problems.append(f"lee {len(partitions)} particiones (máx {maxp}): sin pruning")
+    return {
+        **out,
+        "ok": not problems,
+        "nodes": [n["Node Type"] + (f" [{n['Index Name']}]" if n.get("Index Name") else "") for n in nodes],
+        "problems": problems,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--dsn", default=DSN)
+    ap.add_argument("--seed", action="store_true", help="cargar volumen sintético (con ROLLBACK al final)")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    with psycopg.connect(args.dsn) as conn:
+        try:
+            ctx = seed(conn) if args.seed else real_ctx(conn)
+            results = [check(conn, spec, ctx) for spec in CHECKS]
+        finally:
+            conn.rollback()
+
+    failed = [r for r in results if not r["ok"]]
+    if args.json:
+        print(json.dumps({"ok": not failed, "results": results}, default=str))
+    else:
+        for r in results:
+            print(f"{'OK  ' if r['ok'] else 'FAIL'} {r['name']}")
+            for p in r["problems"]:
+                print(f"       - {p}")
+        print(f"{len(results) - len(failed)}/{len(results)} planes OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
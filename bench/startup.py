@@ -0,0 +1,144 @@
+# bench/startup.py
+"""
+Tiempo de arranque en frío de la API (lo que tarda un contenedor nuevo del
+autoscaler en poder recibir tráfico).
+
+Mide, en procesos nuevos (--runs veces, reporta mediana/mín/máx):
+  import   `import app.main` solo (intérprete ya levantado)
+  ready    desde lanzar `uvicorn app.main:app` hasta el primer 200 de /health
+           (import + lifespan: migraciones, pools, servicios de fondo)
+  db       hasta el primer 200 de /health/db (pool sync con una conexión)
+
+--importtime lista los módulos más caros (`python -X importtime`, tiempo
+acumulado propio + hijos) para ver qué conviene diferir.
+
+Uso:
+    python -m bench.startup --runs 5
+    python -m bench.startup --importtime 15
+    DIAG_ROUTES=1 python -m bench.startup --json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import() -> float:
+    out = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET], stderr=subprocess.DEVNULL, text=True)
+    return float(out.strip().splitlines()[-1])
+
+
+def _wait_200(url: str, proc: subprocess.Popen, t0: float, deadline: float) -> Optional[float]:
+    while time.perf_counter() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return time.perf_counter() - t0
+        except httpx.HTTPError:
+            pass
+        if proc.poll() is not None:
+            return None
+        time.sleep(0.01)
+    return None
+
+
+def measure_ready(timeout: float) -> Dict[str, Optional[float]]:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = t0 + timeout
+        ready = _wait_200(f"{base}/health", proc, t0, deadline)
+        db = _wait_200(f"{base}/health/db", proc, t0, deadline) if ready is not None else None
+        return {"ready": ready, "db": db}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def importtime(top: int) -> List[Dict[str, Any]]:
+    """Módulos con mayor tiempo acumulado según -X importtime."""
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                       capture_output=True, text=True)
+    rows = []
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cum_us, name = (p.strip() for p in line.split(":", 1)[1].split("|"))
+            rows.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cum_us) / 1000})
+        except ValueError:
+            continue  # encabezado
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def _summary(xs: List[Optional[float]]) -> Dict[str, Optional[float]]:
+    vals = [x * 1000 for x in xs if x is not None]
+    if not vals:
+        return {"median_ms": None, "min_ms": None, "max_ms": None, "failed": len(xs)}
+    return {"median_ms": round(statistics.median(vals), 1), "min_ms": round(min(vals), 1),
+            "max_ms": round(max(vals), 1), "failed": len(xs) - len(vals)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=60.0, help="s máx esperando /health por corrida")
+    ap.add_argument("--no-server", action="store_true", help="solo medir el import")
+    ap.add_argument("--importtime", type=int, default=0, metavar="N", help="top N módulos por tiempo de import")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    ready: List[Dict[str, Optional[float]]] = []
+    if not args.no_server:
+        ready = [measure_ready(args.timeout) for _ in range(args.runs)]
+
+    out: Dict[str, Any] = {
+        "runs": args.runs,
+        "env": {k: os.environ[k] for k in ("DIAG_ROUTES", "MIGRATE_ON_STARTUP", "LOG_LEVEL") if k in os.environ},
+        "import": _summary(imports),
+    }
+    if ready:
+        out["ready"] = _summary([r["ready"] for r in ready])
+        out["db"] = _summary([r["db"] for r in ready])
+    if args.importtime:
+        out["importtime"] = importtime(args.importtime)
+
+    if args.json:
+        print(json.dumps(out))
+        return
+    for k in ("import", "ready", "db"):
+        if k in out:
+            s = out[k]
+            print(f"{k:<7} mediana {s['median_ms']} ms  (mín {s['min_ms']}, máx {s['max_ms']}, fallidas {s['failed']})")
+    for r in out.get("importtime", []):
+        print(f"  {r['cumulative_ms']:>8.1f} ms  {r['self_ms']:>7.1f} ms  {r['module']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# bench/ws_conns.py
+"""
+Muchas conexiones /ws/telemetry contra una API levantada (--url), desde un
+solo proceso asyncio.
+
+  - Abre --connections sockets (device_id "bench-ws-N") de a --concurrency
+    handshakes en paralelo; cada uno manda un beat cada --beat-period s (con
+    jitter) y lee todo lo que llega (heartbeats, keepalives, comandos).
+  - Con todo conectado, encola --commands comandos (POST /tanks/{id}/command)
+    para tanques que declararon los primeros devices (?tank_id=) y mide desde
+    el POST hasta que el comando llega por el socket; el device lo confirma
+    con command_ack.
+  - Al final lee /__ws (conexiones y max RSS del worker que lo atiende: con
+    --workers N son por worker).
+
+Reporta tiempos de conexión, conexiones vivas/caídas/cerradas por el server,
+latencia de push p50/p95/p99 y mensajes recibidos.
+
+El cliente comparte CPU con la API si corren en la misma máquina: para 10k+
+sockets subir `ulimit -n` en los dos lados.
+
+Uso:
+    python -m bench.ws_conns --connections 10000 --hold 60
+    python -m bench.ws_conns --connections 2000 --commands 200 --json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+from websockets.asyncio.client import connect as ws_connect
+
+
+class Stats:
+    def __init__(self) -> None:
+        self.connect_s: List[float] = []
+        self.connect_errors = 0
+        self.server_closed = 0
+        self.received = 0
+        self.push_s: List[float] = []
+        self.arrived: Dict[int, float] = {}  # el push puede llegar antes que la respuesta del POST
+        self.pushed: Dict[int, asyncio.Event] = {}
+
+
+def _pcts(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    s = sorted(samples)
+
+    def q(p: float) -> float:
+        return round(s[min(len(s) - 1, max(int(math.ceil(len(s) * p)) - 1, 0))] * 1000, 2)
+
+    return {"p50_ms": round(statistics.median(s) * 1000, 2), "p95_ms": q(0.95), "p99_ms": q(0.99),
+            "max_ms": round(s[-1] * 1000, 2)}
+
+
+async def device(i: int, url: str, tank_id: Optional[int], args, st: Stats, sem: asyncio.Semaphore,
+                 ready: asyncio.Event, stop: asyncio.Event) -> None:
+    qs = f"device_id=bench-ws-{i}" + (f"&tank_id={tank_id}" if tank_id else "")
+    async with sem:
+        t0 = time.perf_counter()
+        try:
+            ws = await ws_connect(f"{url}/ws/telemetry?{qs}", open_timeout=60, ping_interval=None)
+        except Exception:
+            st.connect_errors += 1
+            return
+        st.connect_s.append(time.perf_counter() - t0)
+
+    async def reader() -> None:
+        try:
+            async for raw in ws:
+                st.received += 1
+                if '"command"' not in raw:
+                    continue
+                msg = json.loads(raw)
+                if msg.get("type") != "command":
+                    continue
+                st.arrived[msg["id"]] = time.perf_counter()
+                st.pushed.setdefault(msg["id"], asyncio.Event()).set()
+                await ws.send(json.dumps({"type": "command_ack", "kind": msg["kind"], "id": msg["id"]}))
+        except Exception:
+            pass
+        if not stop.is_set():
+            st.server_closed += 1
+
+    rd = asyncio.create_task(reader())
+    await ready.wait()
+    try:
+        await asyncio.sleep(random.uniform(0, args.beat_period))
+        while not stop.is_set() and not rd.done():
+            await ws.send('{"type":"beat"}')
+            try:
+                await asyncio.wait_for(stop.wait(), args.beat_period * random.uniform(0.9, 1.1))
+            except asyncio.TimeoutError:
+                pass
+    except Exception:
+        pass
+    finally:
+        await ws.close()
+        rd.cancel()
+
+
+async def push_commands(client: httpx.AsyncClient, tank_ids: List[int], n: int, st: Stats) -> int:
+    sent = 0
+    for k in range(n):
+        tank_id = tank_ids[k % len(tank_ids)]
+        t0 = time.perf_counter()
+        r = await client.post(f"/tanks/{tank_id}/command",
+                              json={"cmd": "SET_VALVE", "payload": {"bench": k}, "requested_by": "bench.ws_conns"})
+        if r.status_code != 201:
+            continue
+        cmd_id = r.json()["id"]
+        sent += 1
+        try:
+            # de a uno: la latencia no incluye la cola de los anteriores
+            await asyncio.wait_for(st.pushed.setdefault(cmd_id, asyncio.Event()).wait(), 10)
+            st.push_s.append(st.arrived[cmd_id] - t0)
+        except asyncio.TimeoutError:
+            pass
+    return sent
+
+
+async def run(args) -> Dict[str, Any]:
+    base = args.url.rstrip("/")
+    ws_url = "ws" + base[4:]
+    st = Stats()
+    async with httpx.AsyncClient(base_url=base, timeout=30) as client:
+        tanks = [t["id"] for t in (await client.get("/tanks")).json()][: max(args.commands, 1)]
+        sem = asyncio.Semaphore(args.concurrency)
+        ready, stop = asyncio.Event(), asyncio.Event()
+        t0 = time.perf_counter()
+        tasks = [asyncio.create_task(device(i, ws_url, tanks[i] if i < len(tanks) and args.commands else None,
+                                            args, st, sem, ready, stop))
+                 for i in range(args.connections)]
+        while len(st.connect_s) + st.connect_errors < args.connections:
+            await asyncio.sleep(0.2)
+        connect_wall = time.perf_counter() - t0
+        ready.set()
+        await asyncio.sleep(1.0)  # catch-up de conexión del lado del server
+        sent = await push_commands(client, tanks, args.commands, st) if args.commands and tanks else 0
+        await asyncio.sleep(args.hold)
+        server = (await client.get("/__ws")).json()
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return {
+        "connections": args.connections,
+        "connected": len(st.connect_s),
+        "connect_errors": st.connect_errors,
+        "server_closed": st.server_closed,
+        "connect_wall_s": round(connect_wall, 2),
+        "connect": _pcts(st.connect_s),
+        "commands_sent": sent,
+        "commands_pushed": len(st.push_s),
+        "push": _pcts(st.push_s),
+        "messages_received": st.received,
+        "server": {k: server.get(k) for k in ("connections", "max_rss_mb", "pushed", "acked", "send_queued")},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--connections", type=int, default=10000)
+    ap.add_argument("--concurrency", type=int, default=200, help="handshakes en paralelo")
+    ap.add_argument("--beat-period", type=float, default=30.0)
+    ap.add_argument("--hold", type=float, default=30.0, help="s con todo conectado después del push")
+    ap.add_argument("--commands", type=int, default=50)
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    out = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(out))
+        return
+    print(f"conectadas {out['connected']}/{out['connections']} en {out['connect_wall_s']} s "
+          f"(errores {out['connect_errors']}, cerradas por el server {out['server_closed']})")
+    c, p = out["connect"], out["push"]
+    print(f"handshake  p50 {c['p50_ms']} ms  p99 {c['p99_ms']} ms  máx {c['max_ms']} ms")
+    print(f"push       {out['commands_pushed']}/{out['commands_sent']}  p50 {p['p50_ms']} ms  "
+          f"p95 {p['p95_ms']} ms  p99 {p['p99_ms']} ms")
+    print(f"mensajes   {out['messages_received']}   server {out['server']}")
+
+
+if __name__ == "__main__":
+    main()
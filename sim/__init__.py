@@ -0,0 +1,2 @@
+# sim/__init__.py
+"""Simulador de flota de devices (física de tanques + oráculo de alarmas). Ver sim/fleet.py."""
@@ -0,0 +1,4 @@
+# sim/__main__.py
+from sim.fleet import main
+
+main()
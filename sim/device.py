@@ -0,0 +1,232 @@
+# sim/device.py
+"""
+Un device simulado (ESP32 de un tanque + su bomba) como corrutina.
+
+Cada tick (--period s reales, con jitter) avanza la física `period * speed`
+segundos simulados, toma una lectura y:
+
+  - online: manda primero lo que tenga guardado (store-and-forward, en orden
+    y con su `ts` original) y después la lectura nueva, a /ingest/tank y
+    /ingest/pump con (device_id, boot_id, seq) para que los reintentos sean idempotentes.
+    Si un POST falla (5xx, timeout) la lectura vuelve al buffer y se corta la
+    ráfaga hasta el próximo tick.
+  - offline: guarda la lectura (buffer acotado: se descarta la más vieja).
+
+La conectividad es un proceso on/off: en cada tick online hay `drop_rate` de
+probabilidad de caerse, y la caída dura en promedio `outage_ticks` ticks.
+Opcionalmente el device mantiene /ws/telemetry abierto y manda un beat por
+tick (se cierra durante las caídas).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+
+from sim.oracle import AlarmOracle
+from sim.physics import Reading, TankSim
+
+try:
+    from websockets.asyncio.client import connect as ws_connect
+except ImportError:  # opcional: solo para --ws
+    ws_connect = None
+
+
+@dataclass
+class Stats:
+    lat: Dict[str, List[float]] = field(default_factory=lambda: {"tank": [], "pump": []})
+    status: Dict[str, Dict[str, int]] = field(default_factory=lambda: {"tank": {}, "pump": {}})
+    readings: int = 0
+    buffered: int = 0
+    dropped: int = 0
+    bursts: int = 0
+    burst_sizes: List[int] = field(default_factory=list)
+    outages: int = 0
+    ws_connects: int = 0
+    ws_errors: int = 0
+    ws_sent: int = 0
+    ws_recv: int = 0
+
+    def count(self, kind: str, code: str) -> None:
+        self.status[kind][code] = self.status[kind].get(code, 0) + 1
+
+
+@dataclass
+class Context:
+    client: httpx.AsyncClient
+    stats: Stats
+    oracle: AlarmOracle
+    stop: asyncio.Event
+    period: float
+    speed: float
+    drop_rate: float
+    outage_ticks: float
+    buffer_max: int
+    ingest_params: Optional[Dict[str, str]] = None
+    ws_url: Optional[str] = None
+    api_key: Optional[str] = None
+
+
+@dataclass
+class _Pending:
+    ts: datetime
+    seq: int
+    reading: Reading
+
+
+class Device:
+    def __init__(self, idx: int, tank_id: int, pump_id: int, sim: TankSim, rnd: random.Random, ws: bool = False):
+        self.idx = idx
+        self.device_id = f"sim-{idx}"
+        self.tank_id = tank_id
+        self.pump_id = pump_id
+        self.sim = sim
+        self.rnd = rnd
+        self.use_ws = ws
+        # Como un ESP32: seq vuelve a 0 en cada arranque y boot_id lo distingue
+        # de las corridas anteriores en la dedupe
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.online = True
+        self.outage_left = 0
+        self.buffer: Deque[_Pending] = deque()
+        self._ws = None
+        self._ws_reader: Optional[asyncio.Task] = None
+
+    # -----------------------------
+    # HTTP
+    # -----------------------------
+    async def _post(self, ctx: Context, kind: str, body: Dict[str, Any]) -> Optional[httpx.Response]:
+        t0 = time.perf_counter()
+        try:
+            r = await ctx.client.post(f"/ingest/{kind}", json=body, params=ctx.ingest_params,
+                                      headers={"X-Device-Id": self.device_id})
+        except httpx.HTTPError as e:
+            ctx.stats.count(kind, type(e).__name__)
+            return None
+        ctx.stats.lat[kind].append(time.perf_counter() - t0)
+        ctx.stats.count(kind, str(r.status_code))
+        return r
+
+    async def _send(self, ctx: Context, p: _Pending) -> bool:
+        r, ts = p.reading, p.ts.isoformat()
+        tank = await self._post(ctx, "tank", {
+            "tank_id": self.tank_id, "level_percent": r.level_percent, "temperature_c": r.temperature_c,
+            "ts": ts, "seq": p.seq, "boot_id": self.boot_id,
+        })
+        if tank is None or tank.status_code >= 300:
+            return False
+        if tank.headers.get("idempotent-replayed") != "true":
+            ctx.oracle.accept(self.tank_id, r.level_percent)
+        pump = await self._post(ctx, "pump", {
+            "pump_id": self.pump_id, "is_on": r.is_on, "flow_lpm": r.flow_lpm, "pressure_bar": r.pressure_bar,
+            "current_a": r.current_a, "control_mode": "auto", "ts": ts, "seq": p.seq,
+            "boot_id": self.boot_id,
+        })
+        # si falla la de bomba se reintenta el par: la de tanque vuelve como replay (200)
+        return pump is not None and pump.status_code < 300
+
+    async def _flush(self, ctx: Context) -> None:
+        n = len(self.buffer)
+        if n > 1:
+            ctx.stats.bursts += 1
+            ctx.stats.burst_sizes.append(n)
+        while self.buffer and not ctx.stop.is_set():
+            if not await self._send(ctx, self.buffer[0]):
+                return
+            self.buffer.popleft()
+
+    # -----------------------------
+    # WebSocket (presencia)
+    # -----------------------------
+    async def _ws_open(self, ctx: Context) -> None:
+        try:
+            qs = {"device_id": self.device_id, **({"api_key": ctx.api_key} if ctx.api_key else {})}
+            self._ws = await ws_connect(f"{ctx.ws_url}?{urlencode(qs)}", open_timeout=10)
+        except Exception:
+            ctx.stats.ws_errors += 1
+            self._ws = None
+            return
+        ctx.stats.ws_connects += 1
+        self._ws_reader = asyncio.create_task(self._ws_read(ctx, self._ws))
+
+    async def _ws_read(self, ctx: Context, ws) -> None:
+        try:
+            async for _ in ws:
+                ctx.stats.ws_recv += 1
+        except Exception:
+            pass
+
+    async def _ws_close(self) -> None:
+        if self._ws is not None:
+            try:
+                await self._ws.close()
+            except Exception:
+                pass
+            self._ws = None
+        if self._ws_reader is not None:
+            self._ws_reader.cancel()
+            self._ws_reader = None
+
+    async def _ws_beat(self, ctx: Context) -> None:
+        if self._ws is None:
+            await self._ws_open(ctx)
+        if self._ws is None:
+            return
+        try:
+            await self._ws.send(json.dumps({"type": "beat", "ts": int(time.time() * 1000)}))
+            ctx.stats.ws_sent += 1
+        except Exception:
+            ctx.stats.ws_errors += 1
+            await self._ws_close()
+
+    # -----------------------------
+    def _connectivity(self, ctx: Context) -> None:
+        if self.online:
+            if self.rnd.random() < ctx.drop_rate:
+                self.online = False
+                self.outage_left = max(1, round(self.rnd.expovariate(1.0 / ctx.outage_ticks)))
+                ctx.stats.outages += 1
+        else:
+            self.outage_left -= 1
+            if self.outage_left <= 0:
+                self.online = True
+
+    async def run(self, ctx: Context) -> None:
+        await asyncio.sleep(self.rnd.uniform(0, ctx.period))  # repartir la flota en el período
+        while not ctx.stop.is_set():
+            t0 = time.monotonic()
+            self.sim.step(ctx.period * ctx.speed)
+            self.seq += 1
+            self.buffer.append(_Pending(datetime.now(timezone.utc), self.seq, self.sim.read()))
+            ctx.stats.readings += 1
+            if len(self.buffer) > ctx.buffer_max:
+                self.buffer.popleft()
+                ctx.stats.dropped += 1
+
+            self._connectivity(ctx)
+            if self.online:
+                if self.use_ws:
+                    await self._ws_beat(ctx)
+                await self._flush(ctx)
+            else:
+                ctx.stats.buffered += 1
+                if self.use_ws:
+                    await self._ws_close()
+
+            sleep = ctx.period * self.rnd.uniform(0.9, 1.1) - (time.monotonic() - t0)
+            if sleep > 0:
+                try:
+                    await asyncio.wait_for(ctx.stop.wait(), sleep)
+                except asyncio.TimeoutError:
+                    pass
+        await self._ws_close()
@@ -0,0 +1,275 @@
+# sim/fleet.py
+"""
+Simulador de flota: N devices (tanque + bomba) con física de tanque, ruido de
+sensor y cortes de conectividad con store-and-forward, todos en un proceso
+asyncio contra la API real (HTTP + opcionalmente /ws/telemetry).
+
+Sirve para dos cosas:
+  - generador de carga realista: ráfagas al reconectar, lecturas con `ts`
+    atrasado, duplicados por reintento, miles de devices (--devices 10000);
+  - oráculo de alarmas: reproduce las reglas de alarms_eval sobre las lecturas
+    que la API aceptó (sim/oracle.py) y al final compara contra public.alarms
+    (activas por tanque/código, duplicadas, levantadas durante la corrida).
+
+Tiempo: cada device lee cada --period s reales y la física avanza
+--period * --speed s simulados por lectura (con --speed 60, 10 s reales son
+10 min de tanque), así en pocos minutos hay vaciados, rebalses y cruces de
+umbral (ver sim/physics.py).
+
+Fixture: "sim tank N" / "sim pump N" (se crean si faltan, en bloque), umbrales
+10/20/80/90 en tank_config y se limpian las alarmas activas de esos tanques al
+arrancar para que el oráculo parta del mismo estado que la DB.
+
+Con muchos devices: subir `ulimit -n` si se usa --ws-fraction, y --connections
+acota las conexiones HTTP simultáneas (el resto espera en el pool de httpx).
+
+Uso:
+    python -m sim --devices 200 --duration 120 --speed 60
+    python -m sim --devices 10000 --period 30 --connections 400 --async-ingest \\
+        --duration 300 --out /tmp/sim.json
+    python -m sim --devices 500 --ws-fraction 0.2 --drop-rate 0.05 --strict
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import httpx
+import psycopg
+
+from app.core.db import DSN
+from sim import oracle as oracle_mod
+from sim.device import Context, Device, Stats, ws_connect
+from sim.oracle import THRESHOLDS, AlarmOracle
+from sim.physics import TankSim
+
+
+# -----------------------------
+# Fixture en la DB
+# -----------------------------
+def _ids(cur, table: str, prefix: str) -> Dict[int, int]:
+    cur.execute(
+        f"""
+        SELECT DISTINCT ON (n) n, id FROM (
+            SELECT id, substring(name FROM %s)::int AS n FROM public.{table} WHERE name ~ %s
+        ) s ORDER BY n, id
+        """,
+        (f"^{prefix} ([0-9]+)$", f"^{prefix} [0-9]+$"),
+    )
+    return dict(cur.fetchall())
+
+
+def setup(dsn: str, sims: List[TankSim]) -> Tuple[List[int], List[int]]:
+    n = len(sims)
+    with psycopg.connect(dsn) as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.tanks (name, capacity_m3, location_text)
+            SELECT 'sim tank ' || g, 10, 'sim' FROM generate_series(1, %s) g
+             WHERE NOT EXISTS (SELECT 1 FROM public.tanks t WHERE t.name = 'sim tank ' || g)
+            """,
+            (n,),
+        )
+        cur.execute(
+            """
+            INSERT INTO public.pumps (name, model, max_flow_lpm)
+            SELECT 'sim pump ' || g, 'sim', 60 FROM generate_series(1, %s) g
+             WHERE NOT EXISTS (SELECT 1 FROM public.pumps p WHERE p.name = 'sim pump ' || g)
+            """,
+            (n,),
+        )
+        tanks, pumps = _ids(cur, "tanks", "sim tank"), _ids(cur, "pumps", "sim pump")
+        tank_ids = [tanks[i + 1] for i in range(n)]
+        pump_ids = [pumps[i + 1] for i in range(n)]
+
+        # capacidad/caudal según la física de esta corrida (la semilla decide)
+        cur.executemany("UPDATE public.tanks SET capacity_m3 = %s WHERE id = %s",
+                        [(s.params.capacity_l / 1000, t) for s, t in zip(sims, tank_ids)])
+        cur.executemany("UPDATE public.pumps SET max_flow_lpm = %s WHERE id = %s",
+                        [(round(s.params.pump_lpm, 1), p) for s, p in zip(sims, pump_ids)])
+        cur.executemany(
+            """
+            INSERT INTO public.tank_config (tank_id, low_low_pct, low_pct, high_pct, high_high_pct)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (tank_id) DO UPDATE
+               SET low_low_pct = EXCLUDED.low_low_pct, low_pct = EXCLUDED.low_pct,
+                   high_pct = EXCLUDED.high_pct, high_high_pct = EXCLUDED.high_high_pct
+            """,
+            [(t, *THRESHOLDS.values()) for t in tank_ids],
+        )
+        cur.execute(
+            """
+            UPDATE public.alarms SET is_active = false, ts_cleared = now()
+             WHERE asset_type = 'tank' AND is_active AND asset_id = ANY(%s)
+            """,
+            (tank_ids,),
+        )
+        conn.commit()
+    return tank_ids, pump_ids
+
+
+# -----------------------------
+# Settle + chequeo
+# -----------------------------
+async def settle_and_check(dsn: str, orc: AlarmOracle, tank_ids: List[int], since: datetime,
+                           timeout: float) -> Dict[str, Any]:
+    """Espera a que las alarmas activas dejen de cambiar (eval en background) y compara."""
+    async with await psycopg.AsyncConnection.connect(dsn, autocommit=True) as conn:
+        deadline = time.monotonic() + timeout
+        prev, stable = None, 0
+        while True:
+            active, raised = await oracle_mod.db_state(conn, tank_ids, since)
+            key = sorted((a["asset_id"], a["code"], a["n"]) for a in active)
+            stable = stable + 1 if key == prev else 0
+            prev = key
+            if stable >= 2 or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(1.0)
+    result = orc.check(active, raised, tank_ids)
+    result["settled"] = stable >= 2
+    return result
+
+
+# -----------------------------
+# Corrida
+# -----------------------------
+def _pcts(samples: List[float]) -> Dict[str, Any]:
+    if not samples:
+        return {"requests": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    s = sorted(samples)
+
+    def q(p: float) -> float:
+        return round(s[min(len(s) - 1, max(int(math.ceil(len(s) * p)) - 1, 0))] * 1000, 2)
+
+    return {"requests": len(s), "p50_ms": round(statistics.median(s) * 1000, 2), "p95_ms": q(0.95),
+            "p99_ms": q(0.99), "max_ms": round(s[-1] * 1000, 2)}
+
+
+async def run(args, sims: List[TankSim], tank_ids: List[int], pump_ids: List[int]) -> Dict[str, Any]:
+    stats, orc, stop = Stats(), AlarmOracle(), asyncio.Event()
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    headers = {"X-API-Key": args.api_key} if args.api_key else None
+    ws_url = args.url.replace("http", "ws", 1) + "/ws/telemetry"
+    n_ws = int(round(args.devices * args.ws_fraction))
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits,
+                                 timeout=httpx.Timeout(args.timeout, pool=None)) as client:
+        ctx = Context(client=client, stats=stats, oracle=orc, stop=stop, period=args.period, speed=args.speed,
+                      drop_rate=args.drop_rate, outage_ticks=args.outage_ticks, buffer_max=args.buffer,
+                      ingest_params={"async": "1"} if args.async_ingest else None,
+                      ws_url=ws_url, api_key=args.api_key)
+        devices = [Device(i, tank_ids[i], pump_ids[i], sims[i], random.Random(args.seed * 7919 + i), ws=i < n_ws)
+                   for i in range(args.devices)]
+        started = datetime.now(timezone.utc)
+        t0 = time.perf_counter()
+        tasks = [asyncio.create_task(d.run(ctx)) for d in devices]
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+
+    oracle_result = None
+    if not args.no_oracle:
+        oracle_result = await settle_and_check(args.dsn, orc, tank_ids, started, args.settle)
+
+    pending = sum(len(d.buffer) for d in devices)
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "started_at": started.isoformat(),
+        "readings": stats.readings,
+        "ingest": {k: {**_pcts(stats.lat[k]), "rps": round(len(stats.lat[k]) / elapsed, 2),
+                       "status": stats.status[k]} for k in ("tank", "pump")},
+        "connectivity": {
+            "outages": stats.outages, "buffered": stats.buffered, "dropped": stats.dropped,
+            "bursts": stats.bursts, "burst_max": max(stats.burst_sizes, default=0),
+            "burst_mean": round(statistics.fmean(stats.burst_sizes), 1) if stats.burst_sizes else 0,
+            "pending_at_stop": pending,
+        },
+        "ws": {"devices": n_ws, "connects": stats.ws_connects, "errors": stats.ws_errors,
+               "sent": stats.ws_sent, "received": stats.ws_recv},
+        "physics": {"sim_hours": round(elapsed * args.speed / 3600, 1),
+                    "faults_now": sum(1 for s in sims if s.state.fault)},
+        "oracle": oracle_result,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--dsn", default=DSN, help="fixture y chequeo del oráculo (default: DATABASE_URL)")
+    ap.add_argument("--api-key", default=os.getenv("SIM_API_KEY"))
+    ap.add_argument("--devices", type=int, default=100)
+    ap.add_argument("--duration", type=float, default=60.0, help="s reales de corrida")
+    ap.add_argument("--period", type=float, default=5.0, help="s reales entre lecturas de cada device")
+    ap.add_argument("--speed", type=float, default=60.0, help="s simulados por s real")
+    ap.add_argument("--drop-rate", type=float, default=0.02, help="prob. de cortarse por lectura")
+    ap.add_argument("--outage-ticks", type=float, default=6.0, help="duración media del corte, en lecturas")
+    ap.add_argument("--buffer", type=int, default=500, help="lecturas guardadas por device durante un corte")
+    ap.add_argument("--ws-fraction", type=float, default=0.0, help="fracción de devices con /ws/telemetry")
+    ap.add_argument("--connections", type=int, default=200, help="conexiones HTTP simultáneas")
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--async-ingest", action="store_true", help="postear con ?async=1 (cola de ingest)")
+    ap.add_argument("--settle", type=float, default=30.0, help="s máx esperando que las alarmas se estabilicen")
+    ap.add_argument("--no-oracle", action="store_true", help="solo carga, sin chequeo de alarmas")
+    ap.add_argument("--strict", action="store_true", help="salir con 1 si el oráculo encuentra diferencias")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="archivo JSON de resultados")
+    ap.add_argument("--json", action="store_true")
+    args = ap.parse_args()
+
+    if args.ws_fraction > 0 and ws_connect is None:
+        raise SystemExit("--ws-fraction necesita el paquete websockets")
+
+    sims = [TankSim.random(random.Random(args.seed * 104729 + i)) for i in range(args.devices)]
+    tank_ids, pump_ids = setup(args.dsn, sims)
+    results = asyncio.run(run(args, sims, tank_ids, pump_ids))
+
+    doc = {
+        "ts": datetime.now(timezone.utc).isoformat(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("dsn", "api_key", "out", "json")},
+        "results": results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2)
+
+    o = results["oracle"]
+    if args.json:
+        print(json.dumps(doc))
+    else:
+        r = results
+        print(f"{args.devices} devices, {r['elapsed_s']} s reales (~{r['physics']['sim_hours']} h simuladas), "
+              f"{r['readings']} lecturas")
+        for k, v in r["ingest"].items():
+            print(f"ingest {k:<5} req {v['requests']:>7}  rps {v['rps']:>8}  p50 {v['p50_ms']}  p95 {v['p95_ms']}  "
+                  f"p99 {v['p99_ms']}  max {v['max_ms']} ms  {v['status']}")
+        c = r["connectivity"]
+        print(f"cortes {c['outages']} | guardadas {c['buffered']} | descartadas {c['dropped']} | "
+              f"ráfagas {c['bursts']} (media {c['burst_mean']}, máx {c['burst_max']}) | pendientes {c['pending_at_stop']}")
+        if r["ws"]["devices"]:
+            w = r["ws"]
+            print(f"ws: {w['devices']} devices, {w['connects']} conexiones, {w['errors']} errores, "
+                  f"{w['sent']} beats, {w['received']} mensajes")
+        if o is not None:
+            print(f"oráculo: {'OK' if o['ok'] else 'DIFERENCIAS'}{'' if o['settled'] else ' (sin estabilizar)'} | "
+                  f"activas esperadas {o['expected_active']} / DB {o['db_active']} | "
+                  f"levantadas esperadas {o['raised']['expected']} / DB {o['raised']['db']}")
+            for kind in ("missing", "unexpected", "duplicated"):
+                if o[kind]:
+                    print(f"  {kind} ({len(o[kind])}): {o[kind][:10]}")
+    if args.strict and o is not None and not o["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# sim/oracle.py
+"""
+Oráculo de alarmas: reproduce las reglas de app/services/alarms_eval sobre las
+lecturas que la API aceptó y compara con lo que quedó en public.alarms.
+
+Reglas (las mismas que alarms_eval._decide_state + eval_tank_alarm):
+  nivel <= low_low → LOW_LOW, <= low → LOW, >= high_high → HIGH_HIGH,
+  >= high → HIGH; en rango normal se limpian TODAS las activas del tanque;
+  fuera de rango se levanta el código si no está activo (los otros quedan).
+
+El estado esperado es el de la última lectura aceptada de cada tanque en el
+orden en que se mandaron (un device manda de a una, así que el orden de
+llegada es el de envío). La evaluación en la API corre en background, así que
+el chequeo se hace después de que las alarmas dejan de cambiar (settle).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+THRESHOLDS = {"low_low_pct": 10.0, "low_pct": 20.0, "high_pct": 80.0, "high_high_pct": 90.0}
+
+
+def decide(level: float, cfg: Dict[str, float] = THRESHOLDS) -> Optional[str]:
+    if level <= cfg["low_low_pct"]:
+        return "LOW_LOW"
+    if level <= cfg["low_pct"]:
+        return "LOW"
+    if level >= cfg["high_high_pct"]:
+        return "HIGH_HIGH"
+    if level >= cfg["high_pct"]:
+        return "HIGH"
+    return None
+
+
+class AlarmOracle:
+    def __init__(self, cfg: Dict[str, float] = THRESHOLDS):
+        self.cfg = cfg
+        self.active: Dict[int, Set[str]] = defaultdict(set)
+        self.raised: Dict[int, int] = defaultdict(int)
+        self.cleared: Dict[int, int] = defaultdict(int)
+        self.readings = 0
+
+    def accept(self, tank_id: int, level: float) -> None:
+        """Una lectura aceptada por la API (2xx que no es replay de duplicado)."""
+        self.readings += 1
+        code = decide(level, self.cfg)
+        active = self.active[tank_id]
+        if code is None:
+            self.cleared[tank_id] += len(active)
+            active.clear()
+        elif code not in active:
+            active.add(code)
+            self.raised[tank_id] += 1
+
+    # -----------------------------
+    def check(self, db_active: Iterable[Dict[str, Any]], db_raised: Dict[int, int],
+              tank_ids: List[int]) -> Dict[str, Any]:
+        """
+        db_active: filas {asset_id, code, n} de alarmas activas en la DB.
+        db_raised: alarmas levantadas por tanque durante la corrida.
+        """
+        got: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for r in db_active:
+            got[r["asset_id"]][r["code"]] = r["n"]
+
+        missing, unexpected, duplicated = [], [], []
+        for t in tank_ids:
+            exp, have = self.active.get(t, set()), got.get(t, {})
+            missing += [{"tank_id": t, "code": c} for c in sorted(exp - set(have))]
+            unexpected += [{"tank_id": t, "code": c} for c in sorted(set(have) - exp)]
+            duplicated += [{"tank_id": t, "code": c, "active": n} for c, n in sorted(have.items()) if n > 1]
+
+        exp_raised = sum(self.raised.get(t, 0) for t in tank_ids)
+        got_raised = sum(db_raised.get(t, 0) for t in tank_ids)
+        return {
+            "ok": not (missing or unexpected or duplicated),
+            "readings": self.readings,
+            "expected_active": sum(len(self.active.get(t, ())) for t in tank_ids),
+            "db_active": sum(sum(v.values()) for v in got.values()),
+            "missing": missing,
+            "unexpected": unexpected,
+            "duplicated": duplicated,
+            "raised": {"expected": exp_raised, "db": got_raised},
+            "cleared_expected": sum(self.cleared.get(t, 0) for t in tank_ids),
+        }
+
+
+ACTIVE_SQL = """
+    SELECT asset_id, code, count(*) AS n
+      FROM public.alarms
+     WHERE asset_type = 'tank' AND is_active AND asset_id = ANY(%s)
+     GROUP BY asset_id, code
+"""
+
+RAISED_SQL = """
+    SELECT asset_id, count(*) FROM public.alarms
+     WHERE asset_type = 'tank' AND asset_id = ANY(%s) AND ts_raised >= %s
+     GROUP BY asset_id
+"""
+
+
+async def db_state(aconn, tank_ids: List[int], since: datetime):
+    cur = await aconn.execute(ACTIVE_SQL, (tank_ids,))
+    active = [{"asset_id": a, "code": c, "n": n} for a, c, n in await cur.fetchall()]
+    cur = await aconn.execute(RAISED_SQL, (tank_ids, since))
+    raised = {a: n for a, n in await cur.fetchall()}
+    return active, raised
@@ -0,0 +1,138 @@
+# sim/physics.py
+"""
+Modelo físico de un tanque con su bomba de llenado.
+
+Balance de volumen por paso (dt en segundos simulados):
+
+    V += (Q_bomba - Q_consumo) * dt / 60          [L, caudales en L/min]
+
+- Consumo: base por tanque con perfil diario (pico a la mañana y a la tarde)
+  y ruido multiplicativo.
+- Bomba: control por histéresis de nivel (arranca en `start_pct`, corta en
+  `stop_pct`), caudal nominal ~2x el pico de consumo, con rampa de arranque.
+- Fallas (las que generan cruces de umbral realistas):
+    trip       la bomba no arranca durante un rato → el tanque se vacía (LOW, LOW_LOW)
+    stuck_on   el corte por nivel no actúa → rebalsa (HIGH, HIGH_HIGH)
+- Sensor: nivel real + ruido gaussiano, cuantizado a 0.1 % y acotado a 0..100.
+
+Todo sale de un random.Random por tanque: con la misma semilla la corrida es
+reproducible.
+"""
+from __future__ import annotations
+
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class TankParams:
+    capacity_l: float
+    demand_lpm: float          # consumo medio
+    pump_lpm: float            # caudal nominal de la bomba
+    start_pct: float = 35.0
+    stop_pct: float = 75.0
+    noise_pct: float = 0.3     # desvío del sensor de nivel
+    trip_rate_h: float = 0.1   # fallas "trip" por hora simulada
+    stuck_rate_h: float = 0.05  # fallas "stuck_on" por hora simulada
+    fault_minutes: float = 180.0  # duración media de una falla
+
+
+@dataclass
+class TankState:
+    volume_l: float
+    pump_on: bool = False
+    pump_flow_lpm: float = 0.0
+    fault: Optional[str] = None
+    fault_left_s: float = 0.0
+    t_s: float = 0.0           # tiempo simulado desde el arranque
+
+
+@dataclass
+class Reading:
+    level_percent: float
+    temperature_c: float
+    is_on: bool
+    flow_lpm: float
+    pressure_bar: float
+    current_a: float
+
+
+@dataclass
+class TankSim:
+    params: TankParams
+    state: TankState
+    rnd: random.Random = field(repr=False)
+    hour0: float = 0.0         # hora del día al arrancar (perfil de consumo)
+
+    @classmethod
+    def random(cls, rnd: random.Random) -> "TankSim":
+        capacity = rnd.choice((5_000, 10_000, 20_000, 50_000))
+        demand = capacity * rnd.uniform(0.0008, 0.002)  # vacía el tanque en ~8-20 h
+        params = TankParams(capacity_l=capacity, demand_lpm=demand, pump_lpm=demand * rnd.uniform(2.5, 3.5))
+        state = TankState(volume_l=capacity * rnd.uniform(0.4, 0.7))
+        return cls(params=params, state=state, rnd=rnd, hour0=rnd.uniform(0, 24))
+
+    # -----------------------------
+    @property
+    def level_pct(self) -> float:
+        return 100.0 * self.state.volume_l / self.params.capacity_l
+
+    def _demand_lpm(self) -> float:
+        h = (self.hour0 + self.state.t_s / 3600.0) % 24
+        # dos picos (7 h y 20 h) sobre una base del 40 %
+        profile = 0.4 + 0.9 * math.exp(-((h - 7) ** 2) / 4) + 0.7 * math.exp(-((h - 20) ** 2) / 6)
+        return self.params.demand_lpm * profile * self.rnd.uniform(0.85, 1.15)
+
+    def _faults(self, dt: float) -> None:
+        s, p = self.state, self.params
+        if s.fault:
+            s.fault_left_s -= dt
+            if s.fault_left_s <= 0:
+                s.fault = None
+            return
+        for kind, rate in (("trip", p.trip_rate_h), ("stuck_on", p.stuck_rate_h)):
+            if self.rnd.random() < rate * dt / 3600.0:
+                s.fault = kind
+                s.fault_left_s = self.rnd.expovariate(1.0 / (p.fault_minutes * 60))
+                return
+
+    def _control(self) -> None:
+        s, p, lvl = self.state, self.params, self.level_pct
+        if s.fault == "trip":
+            s.pump_on = False
+        elif s.fault == "stuck_on":
+            s.pump_on = True
+        elif lvl <= p.start_pct:
+            s.pump_on = True
+        elif lvl >= p.stop_pct:
+            s.pump_on = False
+
+    def step(self, dt: float) -> None:
+        """Avanza `dt` segundos simulados (sub-pasos de 60 s para que la histéresis no se saltee)."""
+        while dt > 0:
+            h = min(dt, 60.0)
+            self._faults(h)
+            self._control()
+            s, p = self.state, self.params
+            target = p.pump_lpm if s.pump_on else 0.0
+            s.pump_flow_lpm += (target - s.pump_flow_lpm) * min(1.0, h / 30.0)  # rampa ~30 s
+            s.volume_l += (s.pump_flow_lpm - self._demand_lpm()) * h / 60.0
+            s.volume_l = min(max(s.volume_l, 0.0), p.capacity_l * 1.02)  # rebalse por el venteo
+            s.t_s += h
+            dt -= h
+
+    def read(self) -> Reading:
+        s, p = self.state, self.params
+        lvl = self.level_pct + self.rnd.gauss(0, p.noise_pct)
+        flow = max(0.0, s.pump_flow_lpm * self.rnd.uniform(0.97, 1.03))
+        return Reading(
+            level_percent=round(min(max(lvl, 0.0), 100.0), 1),
+            temperature_c=round(18 + 4 * math.sin(2 * math.pi * ((self.hour0 + s.t_s / 3600) % 24 - 9) / 24)
+                                + self.rnd.gauss(0, 0.2), 2),
+            is_on=s.pump_on,
+            flow_lpm=round(flow, 2),
+            pressure_bar=round(1.2 + 2.0 * (flow / p.pump_lpm) + self.rnd.gauss(0, 0.05), 2) if s.pump_on else 0.0,
+            current_a=round(4.0 * (flow / p.pump_lpm) + self.rnd.gauss(0, 0.1), 2) if s.pump_on else 0.0,
+        )
@@ -0,0 +1,41 @@
+# tests/test_idempotency.py
+"""Claves de deduplicación de ingest (app/core/idempotency.dedupe_key_for)."""
+from datetime import datetime, timezone
+
+from app.core.idempotency import MAX_KEY_LEN, client_scope, dedupe_key_for
+
+
+def test_idempotency_key_is_scoped_by_device():
+    assert dedupe_key_for("k1", "dev-a", None) == "idem:dev-a:k1"
+    assert dedupe_key_for("k1", "dev-a", None) != dedupe_key_for("k1", "dev-b", None)
+
+
+def test_idempotency_key_without_device_uses_the_client():
+    a = dedupe_key_for("1", None, None, client="ip:10.0.0.1")
+    b = dedupe_key_for("1", None, None, client="ip:10.0.0.2")
+    assert a == "idem:@ip:10.0.0.1:1"
+    assert a != b
+
+
+def test_idempotency_key_without_device_or_client_disables_dedupe():
+    assert dedupe_key_for("1", None, None) is None
+
+
+def test_idempotency_key_is_truncated():
+    key = dedupe_key_for("x" * (MAX_KEY_LEN + 50), "d", None)
+    assert key == "idem:d:" + "x" * MAX_KEY_LEN
+
+
+def test_seq_needs_boot_id_or_ts():
+    ts = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert dedupe_key_for(None, "d", 7, boot_id="b1") == "seq:d:b1:7"
+    assert dedupe_key_for(None, "d", 7, ts=ts) == f"seq:d:{int(ts.timestamp() * 1000)}:7"
+    assert dedupe_key_for(None, "d", 7) is None  # seq se reinicia al rebootear
+    assert dedupe_key_for(None, None, 7, boot_id="b1") is None
+
+
+def test_client_scope_hashes_the_api_key():
+    scope = client_scope({"api_key": "secret-key"}, "10.0.0.1")
+    assert scope.startswith("key:") and "secret" not in scope
+    assert client_scope({"api_key": None}, "10.0.0.1") == "ip:10.0.0.1"
+    assert client_scope(None, None) is None
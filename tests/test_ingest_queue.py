@@ -0,0 +1,45 @@
+# tests/test_ingest_queue.py
+"""Reintentos del writer de services/ingest_queue, con el INSERT reemplazado."""
+import pytest
+from psycopg import errors as psy_errors
+
+from app.services import ingest_queue
+
+
+def test_transient_error_in_row_fallback_does_not_duplicate(monkeypatch):
+    written, failed_once = [], set()
+
+    def insert_batch(rows):
+        if len(rows) > 1:
+            raise psy_errors.IntegrityError("bad row in batch")
+        tank_id = rows[0]["tank_id"]
+        if tank_id == 3:
+            raise psy_errors.IntegrityError("fk")
+        if tank_id == 2 and tank_id not in failed_once:
+            failed_once.add(tank_id)
+            raise psy_errors.OperationalError("connection lost")
+        written.append(tank_id)
+        return rows
+
+    monkeypatch.setattr(ingest_queue.tanks_repo, "insert_tank_readings_batch", insert_batch)
+    monkeypatch.setattr(ingest_queue.time, "sleep", lambda s: None)
+    done = ingest_queue._insert_with_retry("tank", [{"tank_id": i} for i in range(1, 6)])
+    assert written == [1, 2, 4, 5]
+    assert [r["tank_id"] for r in done] == [1, 2, 4, 5]
+
+
+def test_batch_insert_returns_all_rows(monkeypatch):
+    monkeypatch.setattr(ingest_queue.tanks_repo, "insert_tank_readings_batch", lambda rows: list(rows))
+    rows = [{"tank_id": 1}, {"tank_id": 2}]
+    assert ingest_queue._insert_with_retry("tank", rows) == rows
+
+
+@pytest.mark.parametrize("kind", ["tank", "pump"])
+def test_invalid_rows_are_dropped_not_retried(monkeypatch, kind):
+    def reject(rows):
+        raise psy_errors.DataError("bad value")
+
+    target = "insert_tank_readings_batch" if kind == "tank" else "insert_pump_readings_batch"
+    repo = ingest_queue.tanks_repo if kind == "tank" else ingest_queue.pumps_repo
+    monkeypatch.setattr(repo, target, reject)
+    assert ingest_queue._insert_with_retry(kind, [{"tank_id": 1}, {"tank_id": 2}]) == []
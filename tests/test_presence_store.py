@@ -0,0 +1,51 @@
+# tests/test_presence_store.py
+"""
+Orden de las escrituras de presencia (services/presence_store) con el backend
+en memoria: el offline de una conexión vieja lleva la hora de su último
+mensaje y no pisa una reconexión posterior, ni en este worker ni en otro.
+"""
+from datetime import datetime, timedelta, timezone
+
+from app.services.presence_store import MemoryBackend, PresenceStore
+
+T0 = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def test_late_offline_does_not_override_a_reconnect():
+    store = PresenceStore(MemoryBackend())
+    store.mark("d", True, T0 + timedelta(seconds=10))  # conexión nueva
+    store.mark("d", False, T0)  # la vieja cierra con su último mensaje
+    assert store.get("d")["online"] is True
+
+
+def test_offline_after_the_last_message_applies():
+    store = PresenceStore(MemoryBackend())
+    store.mark("d", True, T0)
+    store.mark("d", False, T0 + timedelta(seconds=1))
+    assert store.get("d")["online"] is False
+
+
+def test_reconnect_on_another_worker_wins_in_the_backend():
+    backend = MemoryBackend()
+    a, b = PresenceStore(backend), PresenceStore(backend)
+    a.mark("d", True, T0 + timedelta(seconds=10))
+    a.flush()
+    b.mark("d", False, T0)  # b cerró tarde la conexión vieja
+    b.flush()
+    b.pull()
+    assert b.get("d")["online"] is True
+    assert b.get("d")["last_seen"] == T0 + timedelta(seconds=10)
+
+
+def test_merge_keeps_newer_local_writes_not_yet_flushed():
+    store = PresenceStore(MemoryBackend())
+    store.mark("d", True, T0 + timedelta(seconds=5))
+    store._merge([("d", (False, T0, "other", T0))])
+    assert store.get("d")["online"] is True
+
+
+def test_merge_takes_newer_remote_state():
+    store = PresenceStore(MemoryBackend())
+    store.mark("d", True, T0)
+    store._merge([("d", (False, T0 + timedelta(seconds=9), "other", T0 + timedelta(seconds=9)))])
+    assert store.get("d") == {"online": False, "last_seen": T0 + timedelta(seconds=9), "worker": "other"}
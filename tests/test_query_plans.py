@@ -0,0 +1,32 @@
+# tests/test_query_plans.py
+"""
+Regresión de planes de las consultas calientes (bench/plan_check.py).
+
+Necesita un Postgres migrado (DATABASE_URL / DSN de app.core.db); sin él se
+saltea. El volumen sintético se carga en una transacción y se deshace al final.
+"""
+import psycopg
+import pytest
+
+from app.core.db import DSN
+from bench import plan_check
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    try:
+        conn = psycopg.connect(DSN, connect_timeout=3)
+    except psycopg.OperationalError as e:
+        pytest.skip(f"Postgres no disponible: {e}")
+    try:
+        yield conn, plan_check.seed(conn)
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+@pytest.mark.parametrize("spec", plan_check.CHECKS, ids=[c["name"] for c in plan_check.CHECKS])
+def test_plan_uses_index(seeded, spec):
+    conn, ctx = seeded
+    result = plan_check.check(conn, spec, ctx)
+    assert result["ok"], f"{spec['name']}: {result['problems']} -> {result.get('nodes')}"
@@ -0,0 +1,67 @@
+# tests/test_ratelimit.py
+"""Token bucket e identidades del rate limit de ingest (app/core/ratelimit)."""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.core import ratelimit
+from app.core.ratelimit import TokenBucket
+
+
+def test_bucket_allows_the_burst_then_throttles():
+    b = TokenBucket(rate=1.0, burst=2.0)
+    now = b.last
+    assert b.take(now) == (True, 0.0)
+    assert b.take(now) == (True, 0.0)
+    ok, wait = b.take(now)
+    assert not ok
+    assert wait == pytest.approx(1.0)
+
+
+def test_bucket_refills_at_rate_up_to_burst():
+    b = TokenBucket(rate=2.0, burst=3.0)
+    now = b.last
+    for _ in range(3):
+        b.take(now)
+    assert b.take(now + 0.5)[0]  # 0.5 s × 2/s = 1 token
+    assert not b.take(now + 0.5)[0]
+    assert not b.idle_full(now + 1.0)
+    assert b.idle_full(now + 60)
+
+
+def _request(ip):
+    return Request({"type": "http", "method": "POST", "path": "/ingest/tank", "headers": [], "client": (ip, 1234)})
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    monkeypatch.setattr(ratelimit, "_buckets", {})
+    monkeypatch.setattr(ratelimit, "INGEST_RATE_PER_DEVICE", 1.0)
+    monkeypatch.setattr(ratelimit, "INGEST_BURST_PER_DEVICE", 2.0)
+    monkeypatch.setattr(ratelimit, "INGEST_RATE_PER_IP", 100.0)
+    monkeypatch.setattr(ratelimit, "INGEST_BURST_PER_IP", 100.0)
+
+
+def _ingest(ip, device):
+    auth = {"api_key": None, "device_id": device, "strict": False}
+    asyncio.run(ratelimit.ingest_rate_limit(_request(ip), auth))
+
+
+def test_permissive_mode_throttles_a_single_device(buckets):
+    _ingest("10.0.0.1", "esp32")
+    _ingest("10.0.0.1", "esp32")
+    with pytest.raises(HTTPException) as exc:
+        _ingest("10.0.0.1", "esp32")
+    assert exc.value.status_code == 429
+    assert "ip_device" in exc.value.detail
+
+
+def test_devices_behind_one_nat_have_their_own_budget(buckets):
+    for _ in range(2):
+        _ingest("10.0.0.1", "noisy")
+    with pytest.raises(HTTPException):
+        _ingest("10.0.0.1", "noisy")
+    _ingest("10.0.0.1", "quiet")  # mismo NAT, otro device
+
@@ -0,0 +1,66 @@
+# tests/test_reading_ts.py
+"""Rango aceptado para el ts de las lecturas (app/core/reading_ts)."""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import reading_ts
+
+
+@pytest.fixture
+def floor(monkeypatch):
+    """Partición más vieja fija, sin ir al catálogo."""
+    value = {"floor": None}
+
+    async def fake_floor(table):
+        return value["floor"]
+
+    monkeypatch.setattr(reading_ts, "partition_floor", fake_floor)
+    monkeypatch.setattr(reading_ts, "MAX_FUTURE_SEC", 120.0)
+    monkeypatch.setattr(reading_ts, "MAX_AGE_DAYS", 90)
+    return value
+
+
+def _check(ts, kind="tank"):
+    return asyncio.run(reading_ts.check_reading_ts(ts, kind))
+
+
+def test_accepts_missing_and_recent_ts(floor):
+    now = datetime.now(timezone.utc)
+    assert _check(None) is None
+    assert _check(now - timedelta(days=3)) is None
+    assert _check(now + timedelta(seconds=60)) is None
+
+
+def test_rejects_future_ts(floor):
+    assert "future" in _check(datetime.now(timezone.utc) + timedelta(minutes=10))
+
+
+def test_rejects_ts_older_than_max_age(floor):
+    assert "older" in _check(datetime.now(timezone.utc) - timedelta(days=91))
+
+
+def test_partition_floor_tightens_the_age_limit(floor):
+    now = datetime.now(timezone.utc)
+    floor["floor"] = now - timedelta(days=10)
+    assert _check(now - timedelta(days=11), "pump") is not None
+    assert _check(now - timedelta(days=9), "pump") is None
+
+
+def test_naive_ts_is_utc(floor):
+    naive = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=10)
+    assert "future" in _check(naive)
+
+
+def test_partition_floor_falls_back_to_the_cached_value(monkeypatch):
+    def broken_aconn():
+        raise RuntimeError("pool timeout")
+
+    cached = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    monkeypatch.setattr(reading_ts, "get_aconn", broken_aconn)
+    monkeypatch.setattr(reading_ts, "_floor", {"tank_readings": (time.monotonic() - 10_000, cached)})
+    assert asyncio.run(reading_ts.partition_floor("tank_readings")) == cached
+    monkeypatch.setattr(reading_ts, "_floor", {})
+    assert asyncio.run(reading_ts.partition_floor("tank_readings")) is None
@@ -0,0 +1,143 @@
+# tests/test_ws_manager.py
+"""
+services/ws_manager sin Postgres: rueda de timers, destino de los comandos
+(el último device que reportó el asset, acotado por lo que declaró la
+conexión), reemplazo de conexiones en una reconexión y comandos sin ack.
+"""
+import asyncio
+
+import pytest
+
+from app.services import ws_manager as wm
+
+
+class FakeWS:
+    def __init__(self):
+        self.sent = []
+        self.closed = None
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def close(self, code=1000, reason=""):
+        self.closed = code
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    requeued = []
+
+    async def fake_requeue(kind, cmd_id):
+        requeued.append((kind, cmd_id))
+
+    monkeypatch.setattr(wm, "_conns", {})
+    monkeypatch.setattr(wm, "_wheel", wm.TimerWheel(8))
+    monkeypatch.setattr(wm, "_bg", set())
+    monkeypatch.setattr(wm, "_schedule_catch_up", lambda device_id: None)
+    monkeypatch.setattr(wm, "_requeue", fake_requeue)
+    return requeued
+
+
+def _conn(device_id, assets=()):
+    return wm.Conn(FakeWS(), device_id, assets)
+
+
+# -----------------------------
+# TimerWheel
+# -----------------------------
+def test_wheel_fires_on_the_scheduled_tick():
+    wheel, c = wm.TimerWheel(8), _conn("d1")
+    wheel.schedule(c, 3)
+    assert wheel.advance() == set()
+    assert wheel.advance() == set()
+    assert wheel.advance() == {c}
+    assert c.slot == -1
+
+
+def test_wheel_cancel_and_reschedule():
+    wheel, c = wm.TimerWheel(8), _conn("d1")
+    wheel.schedule(c, 1)
+    wheel.cancel(c)
+    assert wheel.advance() == set()
+    wheel.schedule(c, 2)
+    wheel.schedule(c, 1)  # reagendar saca la entrada anterior
+    assert wheel.advance() == {c}
+    assert wheel.advance() == set()
+
+
+def test_wheel_clamps_to_less_than_a_full_turn():
+    wheel, c = wm.TimerWheel(4), _conn("d1")
+    wheel.schedule(c, 100)
+    fired = [wheel.advance() for _ in range(4)]
+    assert fired.index({c}) == 2  # len(slots) - 1 ticks
+
+
+# -----------------------------
+# Destino de los comandos
+# -----------------------------
+def test_target_is_the_reporting_device():
+    wm._conns.update({"a": _conn("a"), "b": _conn("b")})
+    assert wm._target("tank", 1, "a") is wm._conns["a"]
+    assert wm._target("tank", 1, None) is None
+    assert wm._target("tank", 1, "offline-device") is None
+
+
+def test_declaring_an_asset_does_not_take_its_commands():
+    wm._conns.update({"owner": _conn("owner"), "intruder": _conn("intruder", [("tank", 1)])})
+    assert wm._target("tank", 1, "owner") is wm._conns["owner"]
+
+
+def test_declared_assets_narrow_the_reporter():
+    wm._conns["d"] = _conn("d", [("tank", 2)])
+    assert wm._target("tank", 2, "d") is wm._conns["d"]
+    assert wm._target("tank", 1, "d") is None
+    assert wm._target("pump", 2, "d") is None
+
+
+# -----------------------------
+# Reconexión / desconexión
+# -----------------------------
+def test_replaced_connection_does_not_unregister_the_new_one():
+    async def run():
+        old, new = _conn("d"), _conn("d")
+        wm.register(old)
+        wm.register(new)
+        await asyncio.sleep(0)  # close() de la vieja
+        assert old.ws.closed == 4409
+        assert wm.unregister(old) is False  # cierre tardío de la vieja: sigue online
+        assert wm._conns["d"] is new
+        assert wm.unregister(new) is True
+        assert "d" not in wm._conns
+
+    asyncio.run(run())
+
+
+def test_unacked_commands_are_requeued_on_disconnect(isolated):
+    async def run():
+        c = _conn("d")
+        wm.register(c)
+        c.inflight.update({("tank", 5), ("pump", 9)})
+        wm.unregister(c)
+        await asyncio.sleep(0)
+        return c
+
+    c = asyncio.run(run())
+    assert sorted(isolated) == [("pump", 9), ("tank", 5)]
+    assert not c.inflight
+
+
+def test_failed_ack_keeps_the_command_in_flight(monkeypatch):
+    def broken_aconn():
+        raise RuntimeError("pool timeout")
+
+    monkeypatch.setattr(wm, "get_aconn", broken_aconn)
+    c = _conn("d")
+    c.inflight.add(("tank", 7))
+    assert asyncio.run(wm.command_ack(c, {"kind": "tank", "id": 7, "status": "acked"})) is False
+    assert ("tank", 7) in c.inflight
+
+
+def test_ack_of_a_command_not_sent_on_this_connection_is_ignored():
+    c = _conn("d")
+    assert asyncio.run(wm.command_ack(c, {"kind": "tank", "id": 1})) is False
+    assert asyncio.run(wm.command_ack(c, {"kind": "tank", "id": "x"})) is False